@@ -3,7 +3,10 @@ from fastapi.middleware.cors import CORSMiddleware
 import logging
 import os
 from .models import Base, engine
+from .models.migrations import create_price_indexes, backfill_latest_prices, backfill_price_rollups
 from .routers import search_router, products_router, alerts_router, users_router
+from .routers import search as search_module, products as products_module
+from .tasks.alert import install_alert_trigger
 
 # ロギングの設定
 logging.basicConfig(
@@ -14,6 +17,9 @@ logger = logging.getLogger(__name__)
 
 # データベースの初期化（開発環境）
 Base.metadata.create_all(bind=engine)
+create_price_indexes(engine)
+backfill_latest_prices(engine)
+backfill_price_rollups(engine)
 
 # アプリケーションの作成
 app = FastAPI(
@@ -37,6 +43,21 @@ app.include_router(products_router)
 app.include_router(alerts_router)
 app.include_router(users_router)
 
+@app.on_event("startup")
+def start_alert_trigger():
+    """
+    価格の挿入時にアラートを即時発火させるフックを登録する
+    """
+    install_alert_trigger()
+
+@app.on_event("shutdown")
+async def close_scraper_connections():
+    """
+    スクレイパーが保持するコネクションプールを閉じる
+    """
+    await search_module.scraper_manager.aclose()
+    await products_module.scraper_manager.aclose()
+
 @app.get("/")
 async def root():
     """
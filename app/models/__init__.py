@@ -1,5 +1,6 @@
 from .database import Base, engine, get_db
-from .models import User, Product, Price, Favorite, SearchHistory, PriceAlert
+from .models import User, Product, Price, ProductLatestPrice, PriceRollup, Favorite, SearchHistory, PriceAlert, TaskCheckpoint
+from . import latest_price, rollups  # 価格の挿入時に最新価格・集計を更新するイベントを登録
 
 __all__ = [
     'Base',
@@ -8,7 +9,10 @@ __all__ = [
     'User',
     'Product',
     'Price',
+    'ProductLatestPrice',
+    'PriceRollup',
     'Favorite',
     'SearchHistory',
     'PriceAlert',
+    'TaskCheckpoint',
 ]
@@ -0,0 +1,117 @@
+from sqlalchemy import bindparam, delete, event, func, insert, or_, select, update
+from .models import Price, ProductLatestPrice
+
+# 最新価格テーブルに書き込む列
+LATEST_PRICE_COLUMNS = ('product_id', 'price', 'shipping_fee', 'total_price', 'currency', 'timestamp')
+
+# 1文で書き込む最大行数（SQLiteのパラメータ数制限に収める）
+UPSERT_BATCH_SIZE = 1000
+
+def latest_rows(rows):
+    """商品ごとに timestamp が最も新しい行だけを残す（同時刻の場合は後の行）"""
+    latest = {}
+    for row in rows:
+        current = latest.get(row['product_id'])
+        if current is None or row['timestamp'] >= current['timestamp']:
+            latest[row['product_id']] = row
+    return list(latest.values())
+
+def dialect_insert(conn, table):
+    """ON CONFLICT DO UPDATE を使える方言ごとのINSERT文（PostgreSQL・SQLite。それ以外の方言では None）"""
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif conn.dialect.name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert(table)
+
+def upsert_rows(conn, table, key_columns, rows, merge):
+    """ON CONFLICT を使えない方言でのUPSERT（既存の行を1回のSELECTで読み、INSERT と UPDATE に振り分ける）
+
+    rows はキーが重複しない行（辞書）。merge(existing, row) は既存の行に書き込む列の辞書を返す
+    （更新しない場合は None）。同じキーの同時INSERTは一意制約の違反になり、トランザクションごと失敗する。
+    """
+    if not rows:
+        return
+    keys = [table.c[column] for column in key_columns]
+    query = select(table)
+    for column in keys:
+        query = query.where(column.in_({row[column.key] for row in rows}))
+    existing = {
+        tuple(row[column] for column in key_columns): row
+        for row in conn.execute(query).mappings()
+    }
+    inserts, updates = [], []
+    for row in rows:
+        current = existing.get(tuple(row[column] for column in key_columns))
+        if current is None:
+            inserts.append(row)
+            continue
+        values = merge(current, row)
+        if values is not None:
+            updates.append({**values, **{f'key_{column}': row[column] for column in key_columns}})
+    if inserts:
+        conn.execute(insert(table), inserts)
+    if updates:
+        conn.execute(update(table).where(*[column == bindparam(f'key_{column.key}') for column in keys]), updates)
+
+def _merge_latest_price(existing, row):
+    # 記録済みより古い価格（遅れて届いた再取得結果など）では上書きしない
+    if existing['timestamp'] is not None and row['timestamp'] < existing['timestamp']:
+        return None
+    return {column: row[column] for column in LATEST_PRICE_COLUMNS[1:]}
+
+def _upsert(conn, rows):
+    statement = dialect_insert(conn, ProductLatestPrice)
+    if statement is None:
+        upsert_rows(conn, ProductLatestPrice.__table__, ['product_id'], rows, _merge_latest_price)
+        return
+    statement = statement.values(rows)
+    conn.execute(statement.on_conflict_do_update(
+        index_elements=[ProductLatestPrice.product_id],
+        set_={column: statement.excluded[column] for column in LATEST_PRICE_COLUMNS[1:]},
+        # 記録済みより古い価格（遅れて届いた再取得結果など）では上書きしない
+        where=or_(
+            ProductLatestPrice.timestamp.is_(None),
+            statement.excluded.timestamp >= ProductLatestPrice.timestamp,
+        ),
+    ))
+
+def upsert_latest_prices(conn, rows):
+    """挿入した価格の行（辞書）で最新価格テーブルを更新する（呼び出し側のトランザクション内で実行）"""
+    rows = latest_rows([
+        {
+            'product_id': row['product_id'],
+            'price': row.get('price'),
+            'shipping_fee': row.get('shipping_fee'),
+            'total_price': row.get('total_price'),
+            'currency': row.get('currency') or 'JPY',
+            'timestamp': row['timestamp'],
+        }
+        for row in rows
+    ])
+    for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+        _upsert(conn, rows[start:start + UPSERT_BATCH_SIZE])
+
+def latest_prices_from_history():
+    """価格履歴から商品ごとの最新価格を求めるSELECT（ウィンドウ関数で1商品1行に絞る）"""
+    ranked = select(
+        *[getattr(Price, column) for column in LATEST_PRICE_COLUMNS],
+        func.row_number().over(
+            partition_by=Price.product_id,
+            order_by=(Price.timestamp.desc(), Price.id.desc()),
+        ).label('rank'),
+    ).subquery()
+    return select(*[ranked.c[column] for column in LATEST_PRICE_COLUMNS]).where(ranked.c.rank == 1)
+
+def rebuild_latest_prices(conn):
+    """最新価格テーブルを価格履歴から作り直し、行数を返す（修復用。呼び出し側のトランザクション内で実行）"""
+    conn.execute(delete(ProductLatestPrice))
+    conn.execute(insert(ProductLatestPrice).from_select(list(LATEST_PRICE_COLUMNS), latest_prices_from_history()))
+    return conn.execute(select(func.count()).select_from(ProductLatestPrice)).scalar()
+
+@event.listens_for(Price, 'after_insert')
+def _update_latest_price(mapper, connection, target):
+    """ORMで価格を追加したとき、同じトランザクションで最新価格を更新する"""
+    upsert_latest_prices(connection, [{column: getattr(target, column) for column in LATEST_PRICE_COLUMNS}])
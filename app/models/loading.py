@@ -0,0 +1,20 @@
+"""
+読み取り系エンドポイントのクエリで先に読み込む関連
+
+レスポンスのスキーマが参照する関連をクエリと一緒に読み込み、シリアライズ中に
+行ごとのSELECT（N+1）が発行されないようにする。結果の件数によらずクエリ数は一定になる。
+多対一の関連は joinedload（同じSELECTで結合）、一対多の関連は selectinload（IN で1回）を使う。
+"""
+from sqlalchemy.orm import joinedload
+
+from .models import Favorite, PriceAlert
+
+# FavoriteResponse（product）
+FAVORITE_RESPONSE = (joinedload(Favorite.product),)
+
+# PriceAlertResponse（product）
+PRICE_ALERT_RESPONSE = (joinedload(PriceAlert.product),)
+
+def shape(query, loads):
+    """レスポンスのスキーマに必要な関連を先に読み込むクエリにする"""
+    return query.options(*loads)
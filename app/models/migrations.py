@@ -0,0 +1,159 @@
+import logging
+from datetime import datetime, date
+from sqlalchemy import select, text
+from .database import engine as default_engine
+from .latest_price import rebuild_latest_prices
+from .models import Price, PriceRollup, ProductLatestPrice
+from .rollups import rebuild_price_rollups
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# 月ごとのパーティションを何か月先まで作成しておくか
+DEFAULT_MONTHS_AHEAD = 3
+
+def create_price_indexes(engine=default_engine):
+    """prices テーブルのインデックス（(product_id, timestamp) の複合インデックスなど）を作成
+
+    create_all は既存のテーブルにインデックスを追加しないため、既存のDBではこの関数で追加する。
+    """
+    created = []
+    with engine.begin() as conn:
+        for index in sorted(Price.__table__.indexes, key=lambda index: index.name):
+            if conn.dialect.has_index(conn, Price.__tablename__, index.name):
+                continue
+            index.create(bind=conn)
+            created.append(index.name)
+    for name in created:
+        logger.info(f"Created index {name}")
+    return created
+
+def backfill_latest_prices(engine=default_engine):
+    """最新価格テーブルが空で価格履歴がある場合（テーブル追加直後の既存DB）に履歴から作成する"""
+    with engine.begin() as conn:
+        if conn.execute(select(ProductLatestPrice.product_id).limit(1)).first() is not None:
+            return 0
+        if conn.execute(select(Price.id).limit(1)).first() is None:
+            return 0
+        count = rebuild_latest_prices(conn)
+    logger.info(f"Backfilled latest prices for {count} products")
+    return count
+
+def backfill_price_rollups(engine=default_engine):
+    """価格の集計テーブルが空で価格履歴がある場合（テーブル追加直後の既存DB）に履歴から作成する"""
+    with engine.begin() as conn:
+        if conn.execute(select(PriceRollup.product_id).limit(1)).first() is not None:
+            return 0
+        if conn.execute(select(Price.id).limit(1)).first() is None:
+            return 0
+        count = rebuild_price_rollups(conn)
+    logger.info(f"Backfilled {count} price rollups")
+    return count
+
+def add_months(day, months):
+    """月初の日付に months か月を足す"""
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+def month_partitions(first_month, last_month):
+    """first_month から last_month までの月ごとのパーティション (名前, 開始日, 終了日) のリスト"""
+    partitions = []
+    month = date(first_month.year, first_month.month, 1)
+    while month <= last_month:
+        next_month = add_months(month, 1)
+        partitions.append((f"prices_{month:%Y_%m}", month, next_month))
+        month = next_month
+    return partitions
+
+def is_prices_partitioned(conn):
+    """prices テーブルがパーティションテーブルになっているか（PostgreSQL）"""
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p "
+        "JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = 'prices')"
+    )).scalar()
+
+def create_month_partitions(conn, partitions):
+    """月ごとのパーティションを作成（作成済みのものは飛ばす）"""
+    for name, start, end in partitions:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF prices "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+
+def partition_prices_by_month(engine=default_engine, months_ahead=DEFAULT_MONTHS_AHEAD, now=None):
+    """PostgreSQL の prices テーブルを timestamp の月ごとのレンジパーティションに移行する
+
+    既存の行は新しいパーティションテーブルに1トランザクションでコピーする（移行中は prices をロックする）。
+    範囲外の行は prices_default に入る。以降のパーティションは ensure_price_partitions() で作成する。
+    """
+    if engine.dialect.name != 'postgresql':
+        raise RuntimeError("Partitioning of prices is only supported on PostgreSQL")
+
+    now = now or datetime.utcnow()
+    with engine.begin() as conn:
+        if is_prices_partitioned(conn):
+            logger.info("prices is already partitioned")
+            return False
+
+        conn.execute(text("LOCK TABLE prices IN ACCESS EXCLUSIVE MODE"))
+        oldest = conn.execute(text('SELECT min("timestamp") FROM prices')).scalar() or now
+
+        conn.execute(text("ALTER TABLE prices RENAME TO prices_unpartitioned"))
+        # 主キーにはパーティションキーを含める必要がある
+        conn.execute(text(
+            "CREATE TABLE prices (LIKE prices_unpartitioned INCLUDING DEFAULTS) "
+            'PARTITION BY RANGE ("timestamp")'
+        ))
+        conn.execute(text('ALTER TABLE prices ALTER COLUMN "timestamp" SET NOT NULL'))
+        conn.execute(text('ALTER TABLE prices ADD PRIMARY KEY (id, "timestamp")'))
+        conn.execute(text("ALTER TABLE prices ADD FOREIGN KEY (product_id) REFERENCES products (id)"))
+        conn.execute(text("ALTER SEQUENCE IF EXISTS prices_id_seq OWNED BY prices.id"))
+
+        create_month_partitions(conn, month_partitions(oldest, add_months(now.date(), months_ahead)))
+        conn.execute(text("CREATE TABLE prices_default PARTITION OF prices DEFAULT"))
+
+        conn.execute(text(
+            'INSERT INTO prices SELECT * FROM prices_unpartitioned WHERE "timestamp" IS NOT NULL'
+        ))
+        conn.execute(text("DROP TABLE prices_unpartitioned"))
+
+        # 親テーブルに作成したインデックスは全パーティションに作成される
+        for index in Price.__table__.indexes:
+            index.create(bind=conn)
+
+    logger.info("Converted prices to a monthly partitioned table")
+    return True
+
+def ensure_price_partitions(engine=default_engine, months_ahead=DEFAULT_MONTHS_AHEAD, now=None):
+    """当月から months_ahead か月先までのパーティションを作成（パーティション化していない場合は何もしない）"""
+    if engine.dialect.name != 'postgresql':
+        return []
+
+    now = now or datetime.utcnow()
+    partitions = month_partitions(now.date(), add_months(now.date(), months_ahead))
+    with engine.begin() as conn:
+        if not is_prices_partitioned(conn):
+            return []
+        create_month_partitions(conn, partitions)
+    return [name for name, _, _ in partitions]
+
+if __name__ == "__main__":
+    # スクリプトとして実行された場合
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else None
+    if command == "indexes":
+        print(f"作成したインデックス: {create_price_indexes()}")
+    elif command == "partition":
+        partition_prices_by_month()
+        print("prices テーブルを月ごとのパーティションに移行しました。")
+    elif command == "latest-prices":
+        with default_engine.begin() as conn:
+            print(f"最新価格を作り直しました: {rebuild_latest_prices(conn)}件")
+    elif command == "rollups":
+        with default_engine.begin() as conn:
+            print(f"価格の集計を作り直しました: {rebuild_price_rollups(conn)}件")
+    elif command == "ensure-partitions":
+        print(f"パーティション: {ensure_price_partitions()}")
+    else:
+        print("使用法: python -m app.models.migrations [indexes|latest-prices|rollups|partition|ensure-partitions]")
@@ -1,9 +1,7 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, Index
 from sqlalchemy.orm import relationship
-
-Base = declarative_base()
+from .database import Base
 
 class User(Base):
     """ユーザーモデル"""
@@ -34,6 +32,7 @@ class Product(Base):
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     prices = relationship("Price", back_populates="product")
+    latest_price = relationship("ProductLatestPrice", back_populates="product", uselist=False)
     favorites = relationship("Favorite", back_populates="product")
     price_alerts = relationship("PriceAlert", back_populates="product")
 
@@ -50,6 +49,40 @@ class Price(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     
     product = relationship("Product", back_populates="prices")
+    
+    # 価格履歴・最新価格の参照はすべて商品IDで絞り込んで時刻で並べる・範囲指定するため
+    __table_args__ = (
+        Index("ix_prices_product_id_timestamp", "product_id", "timestamp"),
+    )
+
+class ProductLatestPrice(Base):
+    """商品ごとの最新価格（prices への挿入と同じトランザクションで更新する）"""
+    __tablename__ = "product_latest_price"
+    
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    price = Column(Float)
+    shipping_fee = Column(Float, nullable=True)
+    total_price = Column(Float)
+    currency = Column(String(10), default="JPY")
+    timestamp = Column(DateTime)
+    
+    product = relationship("Product", back_populates="latest_price")
+
+class PriceRollup(Base):
+    """商品ごとの日次・週次の価格集計（OHLC）。価格の挿入と同じトランザクションで更新する"""
+    __tablename__ = "price_rollups"
+    
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    resolution = Column(String(10), primary_key=True)  # day, week
+    bucket_start = Column(DateTime, primary_key=True)  # 集計期間の開始時刻（日の0時・週の月曜0時）
+    open_price = Column(Float)
+    open_at = Column(DateTime)
+    high_price = Column(Float)
+    low_price = Column(Float)
+    close_price = Column(Float)
+    close_at = Column(DateTime)
+    count = Column(Integer)
+    price_sum = Column(Float)  # 平均の計算用
 
 class Favorite(Base):
     """お気に入り商品モデル"""
@@ -88,3 +121,12 @@ class PriceAlert(Base):
     
     user = relationship("User", back_populates="price_alerts")
     product = relationship("Product", back_populates="price_alerts")
+
+class TaskCheckpoint(Base):
+    """バッチ処理の進捗（中断したバッチを途中から再開するためのチェックポイント）"""
+    __tablename__ = "task_checkpoints"
+    
+    name = Column(String(100), primary_key=True)  # バッチ処理名
+    last_id = Column(Integer, default=0)  # 処理済みの最後のID
+    started_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -0,0 +1,121 @@
+from datetime import datetime, time, timedelta
+from sqlalchemy import case, delete, event, func, select
+from .latest_price import dialect_insert, upsert_rows
+from .models import Price, PriceRollup
+
+# 集計の解像度（細かい順）
+RESOLUTIONS = ('day', 'week')
+
+# 1文で書き込む最大行数（SQLiteのパラメータ数制限に収める）
+UPSERT_BATCH_SIZE = 500
+
+def bucket_start(timestamp, resolution):
+    """時刻が属する集計期間の開始時刻（日は0時、週は月曜0時）"""
+    day = datetime.combine(timestamp.date(), time.min)
+    if resolution == 'week':
+        return day - timedelta(days=timestamp.weekday())
+    return day
+
+def aggregate_prices(rows):
+    """価格の行（product_id, price, timestamp を持つ辞書）を商品・解像度・期間ごとの部分集計にまとめる"""
+    buckets = {}
+    for row in rows:
+        price, timestamp = row['price'], row['timestamp']
+        if price is None or timestamp is None:
+            continue
+        for resolution in RESOLUTIONS:
+            key = (row['product_id'], resolution, bucket_start(timestamp, resolution))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = {
+                    'product_id': key[0],
+                    'resolution': resolution,
+                    'bucket_start': key[2],
+                    'open_price': price,
+                    'open_at': timestamp,
+                    'high_price': price,
+                    'low_price': price,
+                    'close_price': price,
+                    'close_at': timestamp,
+                    'count': 1,
+                    'price_sum': price,
+                }
+                continue
+            # 同時刻の場合、始値は先の行、終値は後の行（IDの順）を採用する
+            if timestamp < bucket['open_at']:
+                bucket['open_price'], bucket['open_at'] = price, timestamp
+            if timestamp >= bucket['close_at']:
+                bucket['close_price'], bucket['close_at'] = price, timestamp
+            bucket['high_price'] = max(bucket['high_price'], price)
+            bucket['low_price'] = min(bucket['low_price'], price)
+            bucket['count'] += 1
+            bucket['price_sum'] += price
+    return list(buckets.values())
+
+# 集計のキー
+ROLLUP_KEY_COLUMNS = ('product_id', 'resolution', 'bucket_start')
+
+def _merge_bucket(existing, new):
+    """部分集計を既存の集計に合算した列（ON CONFLICT を使えない方言用。_upsert と同じ規則）"""
+    merged = {}
+    if new['open_at'] < existing['open_at']:
+        merged['open_price'], merged['open_at'] = new['open_price'], new['open_at']
+    else:
+        merged['open_price'], merged['open_at'] = existing['open_price'], existing['open_at']
+    if new['close_at'] >= existing['close_at']:
+        merged['close_price'], merged['close_at'] = new['close_price'], new['close_at']
+    else:
+        merged['close_price'], merged['close_at'] = existing['close_price'], existing['close_at']
+    merged['high_price'] = max(existing['high_price'], new['high_price'])
+    merged['low_price'] = min(existing['low_price'], new['low_price'])
+    merged['count'] = existing['count'] + new['count']
+    merged['price_sum'] = existing['price_sum'] + new['price_sum']
+    return merged
+
+def _upsert(conn, rows):
+    """部分集計を既存の集計に合算する"""
+    statement = dialect_insert(conn, PriceRollup)
+    if statement is None:
+        upsert_rows(conn, PriceRollup.__table__, ROLLUP_KEY_COLUMNS, rows, _merge_bucket)
+        return
+    statement = statement.values(rows)
+    new = statement.excluded
+    conn.execute(statement.on_conflict_do_update(
+        index_elements=[PriceRollup.product_id, PriceRollup.resolution, PriceRollup.bucket_start],
+        set_={
+            'open_price': case((new.open_at < PriceRollup.open_at, new.open_price), else_=PriceRollup.open_price),
+            'open_at': case((new.open_at < PriceRollup.open_at, new.open_at), else_=PriceRollup.open_at),
+            'high_price': case((new.high_price > PriceRollup.high_price, new.high_price), else_=PriceRollup.high_price),
+            'low_price': case((new.low_price < PriceRollup.low_price, new.low_price), else_=PriceRollup.low_price),
+            'close_price': case((new.close_at >= PriceRollup.close_at, new.close_price), else_=PriceRollup.close_price),
+            'close_at': case((new.close_at >= PriceRollup.close_at, new.close_at), else_=PriceRollup.close_at),
+            'count': PriceRollup.count + new.count,
+            'price_sum': PriceRollup.price_sum + new.price_sum,
+        },
+    ))
+
+def upsert_price_rollups(conn, rows):
+    """挿入した価格の行（辞書）を日次・週次の集計に反映する（呼び出し側のトランザクション内で実行）"""
+    buckets = aggregate_prices(rows)
+    for start in range(0, len(buckets), UPSERT_BATCH_SIZE):
+        _upsert(conn, buckets[start:start + UPSERT_BATCH_SIZE])
+
+def rebuild_price_rollups(conn, chunk_size=10000):
+    """集計を価格履歴から作り直し、集計の行数を返す（バックフィル・修復用。呼び出し側のトランザクション内で実行）
+
+    価格履歴は chunk_size 行ずつ読み込んで集計に合算するため、履歴全体をメモリに載せない。
+    """
+    conn.execute(delete(PriceRollup))
+    history = conn.execution_options(yield_per=chunk_size).execute(
+        select(Price.product_id, Price.price, Price.timestamp).order_by(Price.product_id, Price.timestamp, Price.id)
+    )
+    for rows in history.mappings().partitions():
+        upsert_price_rollups(conn, rows)
+    return conn.execute(select(func.count()).select_from(PriceRollup)).scalar()
+
+@event.listens_for(Price, 'after_insert')
+def _update_price_rollups(mapper, connection, target):
+    """ORMで価格を追加したとき、同じトランザクションで集計を更新する"""
+    upsert_price_rollups(connection, [
+        {'product_id': target.product_id, 'price': target.price, 'timestamp': target.timestamp}
+    ])
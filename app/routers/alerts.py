@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 import logging
 from ..models import get_db, Product, PriceAlert, User
+from ..models import loading
 from ..schemas import PriceAlertCreate, PriceAlertResponse
 
 router = APIRouter(
@@ -68,7 +69,8 @@ async def get_user_alerts(
     """
     ユーザーの価格アラート一覧を取得
     """
-    query = db.query(PriceAlert).filter(PriceAlert.user_id == user_id)
+    # 商品は同じクエリで読み込む（アラートの件数によらずクエリ1回）
+    query = loading.shape(db.query(PriceAlert), loading.PRICE_ALERT_RESPONSE).filter(PriceAlert.user_id == user_id)
     
     if active_only:
         query = query.filter(PriceAlert.is_active == True)
@@ -1,13 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, Path, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Path, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from typing import List, Optional, Dict, Any
 import logging
 from datetime import datetime, timedelta
-import statistics
-from ..models import get_db, Product, Price, Favorite, User
-from ..schemas import ProductResponse, PriceHistoryResponse, FavoriteCreate, FavoriteResponse, PriceAnalysisResponse
-from ...scraping import ScraperManager
+import os
+from ..models import get_db, Product, Price, ProductLatestPrice, Favorite, User
+from ..models.database import SessionLocal
+from ..models import loading
+from ..services import PriceRefreshScheduler
+from ..services.price_history import (
+    prices_between, rollups_between, day_bounds, choose_resolution, summarize_prices, summarize_rollups,
+    analysis_result, APPROXIMATED_FIELDS,
+)
+from ..services.batch_analysis import analyze_products
+from ..schemas import (
+    ProductResponse, PriceHistoryResponse, FavoriteCreate, FavoriteResponse, PriceAnalysisResponse,
+    PriceAnalysisBatchRequest, PriceAnalysisBatchResponse,
+)
+from scraping import ScraperManager
 
 router = APIRouter(
     prefix="/products",
@@ -18,7 +28,13 @@ router = APIRouter(
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
-@router.get("/{product_id}", response_model=ProductResponse)
+# スクレイパーマネージャーのインスタンス（コネクションプールをリクエスト間で共有）
+scraper_manager = ScraperManager()
+
+# 一括の価格分析で一度に受け付ける商品数の上限
+BATCH_ANALYSIS_MAX_PRODUCTS = int(os.getenv("BATCH_ANALYSIS_MAX_PRODUCTS", "10000"))
+
+@router.get("/{product_id:int}", response_model=ProductResponse)
 async def get_product(
     product_id: int = Path(..., description="商品ID"),
     db: Session = Depends(get_db)
@@ -36,37 +52,37 @@ async def get_price_history(
     product_id: int = Path(..., description="商品ID"),
     days: int = Query(30, description="取得する履歴の日数"),
     refresh: bool = Query(False, description="価格を再取得するかどうか"),
-    db: Session = Depends(get_db),
-    background_tasks: BackgroundTasks = BackgroundTasks()
+    db: Session = Depends(get_db)
 ):
     """
     特定の商品の価格履歴を取得
+
+    履歴は常に即座に返し、価格の再取得はバックグラウンドで行う（商品ごとに重複排除・最小間隔あり）
+    再取得を登録したかどうかを refresh_scheduled で返す（refresh=True でも最小間隔内なら登録しない）
+    RAW_MAX_DAYS（既定90日）より長い期間は生の価格の代わりに日次・週次の集計（resolution, rollups）を返す
+    （期間の途中から始まる先頭の集計は期間内の価格だけから求める）
     """
     product = db.query(Product).filter(Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="商品が見つかりませんでした")
     
     # 当日のデータがない場合、あるいは強制リフレッシュが指定された場合、バックグラウンドで価格を更新
-    today = datetime.now().date()
-    latest_price = db.query(Price).filter(
-        Price.product_id == product_id,
-        func.date(Price.timestamp) == today
-    ).first()
-    
-    if refresh or not latest_price:
-        background_tasks.add_task(
-            update_product_prices, 
-            product_id=product_id, 
-            db=db
-        )
+    today_start, _ = day_bounds(datetime.now().date())
+    latest_price = db.get(ProductLatestPrice, product_id)
+    refresh_scheduled = False
+    if refresh or latest_price is None or latest_price.timestamp < today_start:
+        refresh_scheduled = price_refresh_scheduler.request_refresh(product_id)
     
     from_date = datetime.utcnow() - timedelta(days=days)
-    prices = db.query(Price).filter(
-        Price.product_id == product_id,
-        Price.timestamp >= from_date
-    ).order_by(Price.timestamp).all()
+    resolution = choose_resolution(days)
+    if resolution == 'raw':
+        prices = prices_between(db, product_id, from_date).all()
+        return PriceHistoryResponse(product=product, resolution=resolution, prices=prices,
+                                    refresh_scheduled=refresh_scheduled)
     
-    return PriceHistoryResponse(product=product, prices=prices)
+    rollups = rollups_between(db, product_id, resolution, from_date)
+    return PriceHistoryResponse(product=product, resolution=resolution, rollups=rollups,
+                                refresh_scheduled=refresh_scheduled)
 
 @router.get("/price-analysis/{product_id}", response_model=PriceAnalysisResponse)
 async def analyze_price(  
@@ -76,69 +92,69 @@ async def analyze_price(
 ):
     """
     特定の商品の価格分析を行う
+
+    RAW_MAX_DAYS（既定90日）より長い期間は日次・週次の集計から求める。その場合、最安値・最高値・平均は
+    生の価格と一致し、中央値とトレンドは近似になる（approximated_fields に近似した項目を返す）
     """
     product = db.query(Product).filter(Product.id == product_id).first()
     if not product:
         raise HTTPException(status_code=404, detail="商品が見つかりませんでした")
     
-    # 指定された日数分の価格履歴を取得
+    # 指定された日数分の価格履歴を取得（長い期間は日次・週次の集計から求める）
     from_date = datetime.utcnow() - timedelta(days=days)
-    prices = db.query(Price).filter(
-        Price.product_id == product_id,
-        Price.timestamp >= from_date
-    ).order_by(Price.timestamp).all()
-    
-    if not prices:
-        raise HTTPException(status_code=404, detail="価格履歴が見つかりませんでした")
-    
-    # 価格データの分析
-    price_values = [p.price for p in prices]
-    min_price = min(price_values)
-    max_price = max(price_values)
-    avg_price = sum(price_values) / len(price_values)
-    median_price = statistics.median(price_values)
-    
-    # 価格変動率の計算
-    price_fluctuation = (max_price - min_price) / avg_price * 100
-    
-    # 価格トレンドの分析
-    first_prices = price_values[:len(price_values)//3]  # 最初の1/3
-    last_prices = price_values[-len(price_values)//3:]  # 最後の1/3
-    
-    first_avg = sum(first_prices) / len(first_prices)
-    last_avg = sum(last_prices) / len(last_prices)
-    
-    if last_avg < first_avg * 0.95:  # 5%以上下落
-        price_trend = "下落傾向"
-    elif last_avg > first_avg * 1.05:  # 5%以上上昇
-        price_trend = "上昇傾向"
+    resolution = choose_resolution(days)
+    if resolution == 'raw':
+        price_values = [price for price, in prices_between(db, product_id, from_date).with_entities(Price.price)]
+        stats = summarize_prices(price_values) if price_values else None
     else:
-        price_trend = "横這い"
+        rollups = rollups_between(db, product_id, resolution, from_date)
+        stats = summarize_rollups(rollups) if rollups else None
     
-    # 購入タイミングの推奨
-    if price_trend == "下落傾向":
-        best_time_to_buy = "下落傾向が続いているため、あと1-2週間待つのがお得です"
-    elif price_trend == "上昇傾向":
-        best_time_to_buy = "価格が上昇傾向のため、今が購入タイミングかもしれません"
-    else:
-        current_price = price_values[-1]
-        if current_price < avg_price * 0.95:
-            best_time_to_buy = "現在価格が平均よりも安いため、購入に適したタイミングです"
-        else:
-            best_time_to_buy = "価格が横這いため、大きな変動は期待できません"
+    if stats is None:
+        raise HTTPException(status_code=404, detail="価格履歴が見つかりませんでした")
     
+    # 価格データの分析（変動率、最初と最後の1/3の平均によるトレンド、購入タイミングの推奨）
     return PriceAnalysisResponse(
-        min_price=min_price,
-        max_price=max_price,
-        avg_price=avg_price,
-        median_price=median_price,
-        price_trend=price_trend,
-        best_time_to_buy=best_time_to_buy,
-        price_fluctuation=price_fluctuation,
+        **analysis_result(stats),
         price_history_days=days,
+        resolution=resolution,
+        approximated_fields=[] if resolution == 'raw' else APPROXIMATED_FIELDS,
         product=product
     )
 
+@router.post("/price-analysis:batch", response_model=PriceAnalysisBatchResponse)
+async def analyze_prices_batch(
+    request: PriceAnalysisBatchRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    複数の商品の価格分析をまとめて行う
+
+    全商品の価格履歴を1回のクエリで取得し、NumPyで商品ごとに集計する（期間によらず生の価格履歴を使う）
+    """
+    product_ids = list(dict.fromkeys(request.product_ids))
+    if len(product_ids) > BATCH_ANALYSIS_MAX_PRODUCTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"一度に分析できる商品は{BATCH_ANALYSIS_MAX_PRODUCTS}件までです"
+        )
+    
+    products = {product.id: product for product in db.query(Product).filter(Product.id.in_(product_ids))}
+    from_date = datetime.utcnow() - timedelta(days=request.days)
+    analyses = analyze_products(db, list(products), from_date)
+    
+    return PriceAnalysisBatchResponse(
+        results=[
+            PriceAnalysisResponse(
+                **analyses[product_id],
+                price_history_days=request.days,
+                product=products[product_id]
+            )
+            for product_id in product_ids if product_id in analyses
+        ],
+        missing_product_ids=[product_id for product_id in product_ids if product_id not in analyses]
+    )
+
 @router.post("/favorites", response_model=FavoriteResponse)
 async def add_favorite(
     favorite: FavoriteCreate,
@@ -185,7 +201,8 @@ async def get_favorites(
     """
     ユーザーのお気に入り商品一覧を取得
     """
-    favorites = db.query(Favorite).filter(Favorite.user_id == user_id).all()
+    # 商品は同じクエリで読み込む（お気に入りの件数によらずクエリ1回）
+    favorites = loading.shape(db.query(Favorite), loading.FAVORITE_RESPONSE).filter(Favorite.user_id == user_id).all()
     return favorites
 
 @router.delete("/favorites/{favorite_id}")
@@ -211,10 +228,12 @@ async def remove_favorite(
     return {"message": "お気に入りから削除されました", "favorite_id": favorite_id}
 
 # バックグラウンドで実行される価格更新関数
-async def update_product_prices(product_id: int, db: Session):
+async def update_product_prices(product_id: int):
     """商品の最新価格をスクレイピングして取得し、データベースを更新する"""
     logger.info(f"Updating prices for product ID: {product_id}")
     
+    # リクエストのセッションは応答後に閉じられるため、専用のセッションを使う
+    db = SessionLocal()
     try:
         # 商品情報の取得
         product = db.query(Product).filter(Product.id == product_id).first()
@@ -223,7 +242,6 @@ async def update_product_prices(product_id: int, db: Session):
             return
         
         # スクレイパーを使って最新価格を取得
-        scraper_manager = ScraperManager()
         source_site = product.source
         
         # 商品のURLからドメインを判定して適切なスクレイパーを選択
@@ -240,7 +258,7 @@ async def update_product_prices(product_id: int, db: Session):
             return
         
         # 商品名で検索して価格を取得
-        results = scraper_manager.search_site(
+        results = await scraper_manager.async_search_site(
             site_key, 
             product.name, 
             max_results=5,
@@ -287,3 +305,12 @@ async def update_product_prices(product_id: int, db: Session):
     except Exception as e:
         logger.error(f"Error updating prices for product ID {product_id}: {str(e)}")
         db.rollback()
+    
+    finally:
+        db.close()
+
+# 価格再取得のスケジューラ（同一商品の再取得は PRICE_REFRESH_INTERVAL 秒に1回まで）
+price_refresh_scheduler = PriceRefreshScheduler(
+    update_product_prices,
+    min_interval=int(os.getenv("PRICE_REFRESH_INTERVAL", "900")),
+)
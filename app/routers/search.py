@@ -4,7 +4,7 @@ from typing import List, Optional
 import logging
 from ..models import get_db, SearchHistory, User
 from ..schemas import SearchResponse, SearchResultItem, SearchHistoryCreate, BarcodeSearchRequest
-from ...scraping import ScraperManager
+from scraping import ScraperManager, SingleFlight, SearchResultCache, normalize_query
 
 router = APIRouter(
     prefix="/search",
@@ -15,8 +15,15 @@ router = APIRouter(
 # ロガーの設定
 logger = logging.getLogger(__name__)
 
-# スクレイパーマネージャーのインスタンス
-scraper_manager = ScraperManager()
+# スクレイパーマネージャーのインスタンス（検索結果はLRU + Redisでキャッシュ）
+scraper_manager = ScraperManager(cache=SearchResultCache.from_env())
+
+# 同一条件の同時検索をまとめ、スクレイピングを1回に抑える
+search_flight = SingleFlight()
+
+def _search_key(kind, query, site=None, max_results=10, include_shipping=True):
+    """検索条件を正規化してシングルフライトのキーを作成（site は小文字にしたものを渡す）"""
+    return (kind, normalize_query(query), site or '', int(max_results), bool(include_shipping))
 
 @router.get("/", response_model=SearchResponse)
 async def search_products(
@@ -44,10 +51,18 @@ async def search_products(
         }
         
         # 特定のサイトが指定された場合はそのサイトのみ検索
+        # 同じ条件の検索が実行中であれば、その結果を共有する
+        # （スクレイパーのサイト名は小文字のため、キーと検索に同じ小文字のサイト名を使う）
+        site = site.lower() if site else None
+        key = _search_key('search', q, site, max_results, include_shipping)
         if site:
-            results = scraper_manager.search_site(site, q, max_results, **search_params)
+            results = await search_flight.do(
+                key, lambda: scraper_manager.async_search_site(site, q, max_results, **search_params)
+            )
         else:
-            results = scraper_manager.search_all(q, max_results, **search_params)
+            results = await search_flight.do(
+                key, lambda: scraper_manager.async_search_all(q, max_results, **search_params)
+            )
         
         # 結果を適切な形式に変換
         search_results = [
@@ -93,7 +108,11 @@ async def search_by_barcode(
             db.commit()
         
         # バーコードから商品情報を検索
-        results = scraper_manager.search_by_barcode(barcode, barcode_request.max_results, include_shipping=barcode_request.include_shipping)
+        key = _search_key('barcode', barcode, None, barcode_request.max_results, barcode_request.include_shipping)
+        results = await search_flight.do(
+            key,
+            lambda: scraper_manager.async_search_by_barcode(barcode, barcode_request.max_results, include_shipping=barcode_request.include_shipping)
+        )
         
         # 結果を適切な形式に変換
         search_results = [
@@ -117,3 +136,14 @@ async def search_by_barcode(
     except Exception as e:
         logger.error(f"バーコード検索中にエラーが発生しました: {str(e)}")
         raise HTTPException(status_code=500, detail=f"バーコード検索中にエラーが発生しました: {str(e)}")
+
+
+@router.get("/stats")
+async def get_search_stats():
+    """
+    検索の同時実行集約（シングルフライト）とキャッシュの統計を返す
+    """
+    return {
+        "single_flight": search_flight.stats(),
+        "cache": scraper_manager.cache.stats(),
+    }
@@ -1,19 +1,21 @@
 from .schemas import (
     UserBase, UserCreate, UserResponse,
     ProductBase, ProductCreate, ProductResponse,
-    PriceBase, PriceCreate, PriceResponse, PriceHistoryResponse,
+    PriceBase, PriceCreate, PriceResponse, PriceRollupResponse, PriceHistoryResponse, PriceAnalysisResponse,
+    PriceAnalysisBatchRequest, PriceAnalysisBatchResponse,
     FavoriteCreate, FavoriteResponse,
     SearchHistoryCreate, SearchHistoryResponse,
     PriceAlertBase, PriceAlertCreate, PriceAlertResponse,
-    SearchResultItem, SearchResponse
+    SearchResultItem, SearchResponse, BarcodeSearchRequest
 )
 
 __all__ = [
     'UserBase', 'UserCreate', 'UserResponse',
     'ProductBase', 'ProductCreate', 'ProductResponse',
-    'PriceBase', 'PriceCreate', 'PriceResponse', 'PriceHistoryResponse',
+    'PriceBase', 'PriceCreate', 'PriceResponse', 'PriceRollupResponse', 'PriceHistoryResponse', 'PriceAnalysisResponse',
+    'PriceAnalysisBatchRequest', 'PriceAnalysisBatchResponse',
     'FavoriteCreate', 'FavoriteResponse',
     'SearchHistoryCreate', 'SearchHistoryResponse',
     'PriceAlertBase', 'PriceAlertCreate', 'PriceAlertResponse',
-    'SearchResultItem', 'SearchResponse',
+    'SearchResultItem', 'SearchResponse', 'BarcodeSearchRequest',
 ]
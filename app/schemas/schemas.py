@@ -54,10 +54,25 @@ class PriceResponse(PriceBase):
     class Config:
         orm_mode = True
 
-# 価格履歴のスキーマ
+# 価格の日次・週次集計のスキーマ
+class PriceRollupResponse(BaseModel):
+    bucket_start: datetime
+    open_price: float
+    high_price: float
+    low_price: float
+    close_price: float
+    count: int
+    
+    class Config:
+        orm_mode = True
+
+# 価格履歴のスキーマ（RAW_MAX_DAYS より長い期間は prices の代わりに resolution の集計 rollups を返す）
 class PriceHistoryResponse(BaseModel):
     product: ProductResponse
-    prices: List[PriceResponse]
+    resolution: str = "raw"
+    prices: List[PriceResponse] = []
+    rollups: List[PriceRollupResponse] = []
+    refresh_scheduled: bool = False  # 価格の再取得を登録したか（最小間隔内・実行中の場合はFalse）
     
     class Config:
         orm_mode = True
@@ -72,11 +87,22 @@ class PriceAnalysisResponse(BaseModel):
     best_time_to_buy: str
     price_fluctuation: float
     price_history_days: int
+    resolution: str = "raw"
+    approximated_fields: List[str] = []  # 集計から求めたため近似になった項目（resolution が raw なら空）
     product: ProductResponse
     
     class Config:
         orm_mode = True
 
+# 複数商品の価格分析のスキーマ
+class PriceAnalysisBatchRequest(BaseModel):
+    product_ids: List[int]
+    days: int = 90
+
+class PriceAnalysisBatchResponse(BaseModel):
+    results: List[PriceAnalysisResponse]
+    missing_product_ids: List[int] = []  # 商品または価格履歴が見つからなかった商品
+
 # お気に入り関連のスキーマ
 class FavoriteCreate(BaseModel):
     product_id: int
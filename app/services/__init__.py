@@ -0,0 +1,10 @@
+from .alert_index import AlertThresholdIndex, AlertTrigger
+from .price_refresh import PriceRefreshScheduler
+from .price_update_pipeline import PriceUpdatePipeline
+
+__all__ = [
+    'AlertThresholdIndex',
+    'AlertTrigger',
+    'PriceRefreshScheduler',
+    'PriceUpdatePipeline',
+]
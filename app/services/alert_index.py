@@ -0,0 +1,284 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from ..models.models import Price, PriceAlert
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+class AlertThresholdIndex:
+    """商品ごとにアクティブなアラートの目標価格を昇順で保持するインデックス
+
+    新しい価格に対して、目標価格がその価格以上のアラートを二分探索1回で取り出せる。
+    """
+
+    def __init__(self):
+        self._thresholds = {}  # product_id → [(target_price, alert_id), ...]（昇順）
+        self._alerts = {}      # alert_id → (product_id, target_price)
+        self._lock = threading.Lock()
+
+    def load(self, alerts):
+        """(alert_id, product_id, target_price) の並びからインデックスを作り直す"""
+        thresholds = {}
+        registered = {}
+        for alert_id, product_id, target_price in alerts:
+            thresholds.setdefault(product_id, []).append((target_price, alert_id))
+            registered[alert_id] = (product_id, target_price)
+        for entries in thresholds.values():
+            entries.sort()
+        with self._lock:
+            self._thresholds = thresholds
+            self._alerts = registered
+
+    def add(self, alert_id, product_id, target_price):
+        """アラートを登録（登録済みの場合は目標価格を更新）"""
+        with self._lock:
+            self._discard(alert_id)
+            insort(self._thresholds.setdefault(product_id, []), (target_price, alert_id))
+            self._alerts[alert_id] = (product_id, target_price)
+
+    def remove(self, alert_id):
+        """アラートを削除"""
+        with self._lock:
+            self._discard(alert_id)
+
+    def _discard(self, alert_id):
+        registered = self._alerts.pop(alert_id, None)
+        if registered is None:
+            return
+        product_id, target_price = registered
+        entries = self._thresholds[product_id]
+        del entries[bisect_left(entries, (target_price, alert_id))]
+        if not entries:
+            del self._thresholds[product_id]
+
+    def match(self, product_id, total_price):
+        """目標価格が total_price 以上のアラートIDを返す"""
+        with self._lock:
+            entries = self._thresholds.get(product_id)
+            if not entries:
+                return []
+            return [alert_id for _, alert_id in entries[bisect_left(entries, (total_price,)):]]
+
+    def pop_matches(self, product_id, total_price):
+        """一致したアラートを取り出してインデックスから削除（通知は1回のみのため）"""
+        with self._lock:
+            entries = self._thresholds.get(product_id)
+            if not entries:
+                return []
+            start = bisect_left(entries, (total_price,))
+            matched = [alert_id for _, alert_id in entries[start:]]
+            del entries[start:]
+            if not entries:
+                del self._thresholds[product_id]
+            for alert_id in matched:
+                del self._alerts[alert_id]
+            return matched
+
+    def __len__(self):
+        return len(self._alerts)
+
+class AlertTrigger:
+    """価格の挿入時にアラートインデックスを参照し、一致したアラートを即時に発火させる
+
+    install() を呼んだプロセスでは、ORMでの Price / PriceAlert の変更をセッションのコミット時に自動で反映する。
+    Core の一括INSERTで価格を書き込んだ場合は on_prices_inserted() を直接呼ぶ。
+    インデックスはプロセスごとに持つため、他プロセスでのアラートの変更は
+    refresh_interval 秒ごとの再読み込みと、定期的な照合タスクで反映される。
+    再読み込みはバックグラウンドのスレッドで行い、コミットしたリクエストを待たせない。
+    """
+
+    def __init__(self, dispatch=None, refresh_interval=300, clock=time.monotonic):
+        """
+        Args:
+            dispatch: 一致したアラートIDのリストを受け取って通知を依頼する関数
+            refresh_interval: DBからインデックスを再読み込みする間隔（秒）
+        """
+        self.index = AlertThresholdIndex()
+        self.dispatch = dispatch
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self.installed = False
+        self._loaded_at = None
+        self._load_lock = threading.Lock()
+        self._loader = None
+        # 初回の読み込みが終わるまで保留した価格・アラートの変更
+        self._pending_prices = []
+        self._pending_alerts = []
+
+        # 計測用カウンタ
+        self.prices_checked = 0
+        self.alerts_fired = 0
+
+    def invalidate(self):
+        """次の参照時にDBから再読み込みさせる"""
+        self._loaded_at = None
+
+    def _is_fresh(self):
+        return self._loaded_at is not None and self.clock() - self._loaded_at < self.refresh_interval
+
+    def refresh(self, bind):
+        """DBからの再読み込みをバックグラウンドのスレッドで始める（読み込み中はそのスレッドを返す）"""
+        with self._load_lock:
+            return self._start_loader(bind)
+
+    def _start_loader(self, bind):
+        # _load_lock を取得した状態で呼ぶ
+        if self._loader is None or not self._loader.is_alive():
+            self._loader = threading.Thread(
+                target=self._load, args=(bind,), name="alert-index-loader", daemon=True
+            )
+            self._loader.start()
+        return self._loader
+
+    def _load(self, bind):
+        """アクティブなアラートを読み込み、読み込み中に保留した変更を反映する"""
+        try:
+            with Session(bind=bind) as db:
+                rows = (
+                    db.query(PriceAlert.id, PriceAlert.product_id, PriceAlert.target_price)
+                    .filter(PriceAlert.is_active == True)
+                    .all()
+                )
+            self.index.load(rows)
+            with self._load_lock:
+                self._loaded_at = self.clock()
+                alerts, self._pending_alerts = self._pending_alerts, []
+                prices, self._pending_prices = self._pending_prices, []
+            logger.info(f"Loaded {len(rows)} active price alerts into the threshold index")
+            self.on_alerts_changed(alerts)
+            self._fire(prices)
+        except Exception as e:
+            logger.error(f"Error loading price alert index: {str(e)}")
+
+    def wait(self, timeout=None):
+        """実行中の再読み込み（と保留した価格の照合）の完了を待つ"""
+        loader = self._loader
+        if loader is not None:
+            loader.join(timeout)
+
+    def ensure_loaded(self, bind):
+        """インデックスが未読み込み・期限切れであればDBから読み込み、完了を待つ"""
+        if not self._is_fresh():
+            self.refresh(bind).join()
+
+    def on_prices_inserted(self, bind, prices):
+        """挿入された価格 (product_id, total_price) ごとに一致するアラートを発火させる
+
+        install() されていないプロセスでは何もしない（定期的な照合タスクで拾われる）。
+        """
+        if not self.installed:
+            return []
+        self.ensure_loaded(bind)
+        return self._fire(prices)
+
+    def _fire(self, prices):
+        fired = []
+        for product_id, total_price in prices:
+            self.prices_checked += 1
+            if total_price is None:
+                continue
+            fired.extend(self.index.pop_matches(product_id, total_price))
+        if not fired:
+            return []
+
+        self.alerts_fired += len(fired)
+        if self.dispatch is None:
+            logger.warning(f"No dispatcher for triggered price alerts: {fired}")
+            return fired
+        try:
+            self.dispatch(fired)
+        except Exception as e:
+            # 通知の依頼に失敗したアラートは定期的な照合タスクで拾われる
+            logger.error(f"Error dispatching triggered price alerts {fired}: {str(e)}")
+        return fired
+
+    def on_alerts_changed(self, alerts):
+        """アラートの作成・更新をインデックスに反映（alerts は (alert_id, product_id, target_price, is_active)）"""
+        for alert_id, product_id, target_price, is_active in alerts:
+            if is_active and target_price is not None:
+                self.index.add(alert_id, product_id, target_price)
+            else:
+                self.index.remove(alert_id)
+
+    def on_alerts_deactivated(self, alert_ids):
+        """一括UPDATEで非アクティブにしたアラートをインデックスから削除"""
+        for alert_id in alert_ids:
+            self.index.remove(alert_id)
+
+    def install(self, dispatch=None, bind=None):
+        """セッションのイベントに登録し、コミットされた変更をインデックスに反映させる
+
+        Args:
+            dispatch: 通知を依頼する関数（省略時は現在の設定のまま）
+            bind: 指定するとインデックスの読み込みをバックグラウンドで始める
+        """
+        if dispatch is not None:
+            self.dispatch = dispatch
+        if not event.contains(Session, 'after_flush', self._after_flush):
+            event.listen(Session, 'after_flush', self._after_flush)
+            event.listen(Session, 'after_commit', self._after_commit)
+            event.listen(Session, 'after_rollback', self._after_rollback)
+        self.installed = True
+        if bind is not None:
+            self.refresh(bind)
+
+    def uninstall(self):
+        """セッションのイベントから外す"""
+        if event.contains(Session, 'after_flush', self._after_flush):
+            event.remove(Session, 'after_flush', self._after_flush)
+            event.remove(Session, 'after_commit', self._after_commit)
+            event.remove(Session, 'after_rollback', self._after_rollback)
+        self.installed = False
+
+    def _after_flush(self, session, flush_context):
+        """フラッシュされた価格・アラートを記録（コミットされるまでは反映しない）"""
+        changes = session.info.setdefault('alert_trigger', {'prices': [], 'alerts': []})
+        for obj in session.new:
+            if isinstance(obj, Price):
+                changes['prices'].append((obj.product_id, obj.total_price))
+        for obj in list(session.new) + list(session.dirty):
+            if isinstance(obj, PriceAlert):
+                changes['alerts'].append((obj.id, obj.product_id, obj.target_price, obj.is_active))
+        for obj in session.deleted:
+            if isinstance(obj, PriceAlert):
+                changes['alerts'].append((obj.id, obj.product_id, obj.target_price, False))
+
+    def _after_commit(self, session):
+        changes = session.info.pop('alert_trigger', None)
+        if not changes:
+            return
+        try:
+            bind = session.get_bind()
+            with self._load_lock:
+                if self._loaded_at is None:
+                    # 読み込みが終わるまで保留し、読み込んだスレッドで照合する
+                    self._pending_alerts.extend(changes['alerts'])
+                    self._pending_prices.extend(changes['prices'])
+                    self._start_loader(bind)
+                    return
+            if not self._is_fresh():
+                # 再読み込みの間は読み込み済みのインデックスで照合を続ける
+                self.refresh(bind)
+            # アラートの変更を先に反映し、同じトランザクションの価格にも一致させる
+            self.on_alerts_changed(changes['alerts'])
+            self._fire(changes['prices'])
+        except Exception as e:
+            logger.error(f"Error updating price alert index: {str(e)}")
+
+    def _after_rollback(self, session):
+        session.info.pop('alert_trigger', None)
+
+    def stats(self):
+        """カウンタの現在値を返す"""
+        return {
+            'indexed_alerts': len(self.index),
+            'prices_checked': self.prices_checked,
+            'alerts_fired': self.alerts_fired,
+        }
+
+# プロセス全体で共有するインスタンス（アプリ・ワーカーの起動時に app.tasks.alert.install_alert_trigger() で登録する）
+alert_trigger = AlertTrigger()
@@ -0,0 +1,84 @@
+import numpy as np
+from sqlalchemy import select
+from ..models.models import Price
+from .price_history import analysis_result
+
+# 1回のクエリで IN に渡す商品IDの最大数（SQLiteのパラメータ数制限に収める）
+QUERY_BATCH_SIZE = 10000
+
+def load_price_arrays(db, product_ids, start):
+    """商品の start 以降の価格を (商品IDの配列, 価格の配列) として取得する（商品ID・時刻順）
+
+    ORMを介さず、セッションの接続で商品ID・価格の列だけを読み込む。
+    """
+    product_ids = sorted(set(product_ids))
+    conn = db.connection()
+    id_chunks, price_chunks = [], []
+    for offset in range(0, len(product_ids), QUERY_BATCH_SIZE):
+        rows = conn.execute(
+            select(Price.product_id, Price.price)
+            .where(
+                Price.product_id.in_(product_ids[offset:offset + QUERY_BATCH_SIZE]),
+                Price.timestamp >= start,
+                Price.price.isnot(None),
+            )
+            .order_by(Price.product_id, Price.timestamp, Price.id)
+        ).all()
+        id_chunks.append(np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)))
+        price_chunks.append(np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows)))
+    if not id_chunks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    return np.concatenate(id_chunks), np.concatenate(price_chunks)
+
+def _segment_sums(values, starts, ends):
+    """区間 [starts[i], ends[i]) ごとの合計（区間は重ならず昇順で、空でないこと）"""
+    # 末尾に番兵を足し、区間の始点と終点を交互に並べて reduceat すると偶数番目が区間の合計になる
+    bounds = np.empty(len(starts) * 2, dtype=np.int64)
+    bounds[0::2] = starts
+    bounds[1::2] = ends
+    return np.add.reduceat(np.append(values, 0.0), bounds)[0::2]
+
+def summarize_price_arrays(product_ids, prices):
+    """商品ID順に並んだ配列から、商品ごとの summarize_prices と同じ統計をまとめて求める
+
+    各商品の価格は時刻順に並んでいること。戻り値は統計名ごとの配列（product_id の昇順）。
+    """
+    if len(product_ids) == 0:
+        return {'product_id': np.empty(0, dtype=np.int64)}
+
+    starts = np.flatnonzero(np.r_[True, product_ids[1:] != product_ids[:-1]])
+    ends = np.r_[starts[1:], len(prices)]
+    counts = ends - starts
+
+    # 中央値は商品ごとに価格を並べ替え、中央の1〜2件の平均を取る
+    sorted_prices = prices[np.lexsort((prices, product_ids))]
+    median = (sorted_prices[starts + (counts - 1) // 2] + sorted_prices[starts + counts // 2]) / 2
+
+    # 最初の1/3（最低1件）と最後の1/3（切り上げ）
+    first_counts = np.maximum(counts // 3, 1)
+    last_counts = -(-counts // 3)
+
+    return {
+        'product_id': product_ids[starts],
+        'count': counts,
+        'min_price': np.minimum.reduceat(prices, starts),
+        'max_price': np.maximum.reduceat(prices, starts),
+        'avg_price': np.add.reduceat(prices, starts) / counts,
+        'median_price': median,
+        'first_avg': _segment_sums(prices, starts, starts + first_counts) / first_counts,
+        'last_avg': _segment_sums(prices, ends - last_counts, ends) / last_counts,
+        'current_price': prices[ends - 1],
+    }
+
+def analyze_products(db, product_ids, start):
+    """複数の商品の start 以降の価格を1回のクエリで取得して分析し、{商品ID: 分析結果} を返す
+
+    分析結果は analysis_result と同じ形式。価格履歴のない商品は含まない。
+    """
+    stats = summarize_price_arrays(*load_price_arrays(db, product_ids, start))
+    names = [name for name in stats if name != 'product_id']
+    columns = [stats[name].tolist() for name in names]
+    return {
+        product_id: analysis_result(dict(zip(names, values)))
+        for product_id, *values in zip(stats['product_id'].tolist(), *columns)
+    }
@@ -0,0 +1,461 @@
+import base64
+import heapq
+import itertools
+import logging
+import os
+import queue
+import smtplib
+import threading
+import time
+import uuid
+from collections import namedtuple
+from email.header import Header
+from email.utils import formatdate, make_msgid
+from string import Template
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+# メール本文のテンプレート（モジュール読み込み時に1回だけ解析する）
+TEXT_TEMPLATE = Template("""
+商品の価格が目標価格に達しました！
+
+商品名: $product_name
+現在価格: $current_price円
+目標価格: $target_price円
+確認日時: $checked_at
+
+商品を確認する: $product_url
+
+※このメールは自動送信されています。返信はできません。
+最安値検索アプリより
+""")
+
+HTML_TEMPLATE = Template("""
+<html>
+<head>
+    <style>
+        body { font-family: Arial, sans-serif; }
+        .container { padding: 20px; max-width: 600px; margin: 0 auto; }
+        .header { background-color: #4CAF50; color: white; padding: 10px; text-align: center; }
+        .content { padding: 20px; }
+        .price { font-size: 24px; color: #E53935; font-weight: bold; }
+        .button { background-color: #4CAF50; color: white; padding: 10px 15px; text-decoration: none; border-radius: 5px; }
+        .footer { font-size: 12px; color: #757575; margin-top: 30px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>最安値アラート</h1>
+        </div>
+        <div class="content">
+            <p>商品の価格が目標価格に達しました！</p>
+
+            <h2>$product_name</h2>
+
+            <p>現在価格: <span class="price">$current_price円</span></p>
+            <p>目標価格: $target_price円</p>
+            <p>確認日時: $checked_at</p>
+
+            <p style="margin-top: 30px;">
+                <a href="$product_url" class="button">商品を確認する</a>
+            </p>
+
+            <div class="footer">
+                <p>このメールは自動送信されています。返信はできません。<br>最安値検索アプリより</p>
+            </div>
+        </div>
+    </div>
+</body>
+</html>
+""")
+
+class AlertEmailRenderer:
+    """価格アラートのメールを送信用の文字列に組み立てるクラス
+
+    ヘッダーや multipart の区切りなど宛先によらない部分は初期化時に1回だけ生成し、
+    1通ごとには本文テンプレートの置換とエンコードだけを行う。
+    """
+
+    def __init__(self, sender):
+        self.sender = sender
+        boundary = f"===============alert-{uuid.uuid4().hex}=="
+        self._head = (
+            f"From: {sender}\n"
+            "MIME-Version: 1.0\n"
+            f'Content-Type: multipart/alternative; boundary="{boundary}"\n'
+        )
+        self._part_heads = {
+            subtype: (
+                f"--{boundary}\n"
+                f'Content-Type: text/{subtype}; charset="utf-8"\n'
+                "Content-Transfer-Encoding: base64\n\n"
+            )
+            for subtype in ('plain', 'html')
+        }
+        self._tail = f"--{boundary}--\n"
+
+    @staticmethod
+    def subject(product_name):
+        """件名"""
+        return f"【最安値アラート】{product_name}が目標価格に達しました"
+
+    def render(self, email, product_name, product_url, target_price, current_price, timestamp):
+        """1通分のメール（RFC 5322 形式の文字列）を返す"""
+        values = {
+            'product_name': product_name,
+            'product_url': product_url,
+            'target_price': target_price,
+            'current_price': current_price,
+            'checked_at': timestamp.strftime('%Y年%m月%d日 %H:%M'),
+        }
+        parts = [
+            self._head,
+            f"Subject: {Header(self.subject(product_name), 'utf-8').encode()}\n",
+            f"To: {email}\n",
+            f"Date: {formatdate(localtime=True)}\n",
+            f"Message-ID: {make_msgid()}\n\n",
+        ]
+        for subtype, template in (('plain', TEXT_TEMPLATE), ('html', HTML_TEMPLATE)):
+            body = template.substitute(values).encode('utf-8')
+            parts.append(self._part_heads[subtype])
+            parts.append(base64.encodebytes(body).decode('ascii'))
+        parts.append(self._tail)
+        return ''.join(parts)
+
+class PooledSMTPConnection:
+    """プール内のSMTP接続（最終使用時刻と送信件数を持つ）"""
+
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.last_used = time.monotonic()
+        self.sent = 0
+
+class SMTPConnectionPool:
+    """SMTP接続を使い回すプール
+
+    STARTTLS とログインは接続ごとに1回だけ行い、送信後の接続はプールに戻して再利用する。
+    一定時間使わなかった接続と、一定件数を送信した接続は閉じて作り直す。
+    """
+
+    def __init__(self, host, port, user=None, password=None, starttls=True, size=4, timeout=30,
+                 idle_timeout=60, max_messages_per_connection=100, factory=smtplib.SMTP):
+        """
+        Args:
+            size: 同時に開く接続数の上限
+            idle_timeout: この秒数より長く使わなかった接続は再利用せずに閉じる
+            max_messages_per_connection: 1接続で送信する件数の上限（サーバー側の制限に合わせる）
+            factory: SMTP接続を作成する呼び出し可能オブジェクト
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_messages_per_connection = max_messages_per_connection
+        self.factory = factory
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+
+        # 計測用カウンタ
+        self.connections_opened = 0
+
+    def acquire(self):
+        """接続を1つ取り出す（上限まで使用中の場合は空くまで待つ）"""
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    return self._connect()
+                if time.monotonic() - connection.last_used <= self.idle_timeout:
+                    return connection
+                self._quit(connection)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, connection, broken=False):
+        """接続をプールに戻す（broken の場合や送信件数の上限に達した場合は閉じる）"""
+        try:
+            if broken or connection.sent >= self.max_messages_per_connection:
+                self._quit(connection)
+            else:
+                connection.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(connection)
+        finally:
+            self._slots.release()
+
+    def send(self, connection, sender, recipient, message):
+        """接続を使って1通送信"""
+        connection.smtp.sendmail(sender, [recipient], message)
+        connection.sent += 1
+
+    def close(self):
+        """プール内の接続をすべて閉じる"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            self._quit(connection)
+
+    def _connect(self):
+        smtp = self.factory(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self.connections_opened += 1
+        return PooledSMTPConnection(smtp)
+
+    def _quit(self, connection):
+        try:
+            connection.smtp.quit()
+        except Exception:
+            connection.smtp.close()
+
+# 送信待ちのメール（attempts は失敗した回数）
+OutgoingMail = namedtuple('OutgoingMail', 'recipient message attempts')
+
+def classify_smtp_error(error, recipient):
+    """送信エラーを 'connection'（接続を作り直して再試行）・'temporary'（再試行）・'permanent' に分類"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        code = error.recipients.get(recipient, (550, b''))[0]
+        return 'temporary' if 400 <= code < 500 else 'permanent'
+    if isinstance(error, smtplib.SMTPResponseException):
+        if error.smtp_code == 421:
+            return 'connection'
+        return 'temporary' if 400 <= error.smtp_code < 500 else 'permanent'
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return 'connection'
+    if isinstance(error, smtplib.SMTPException):
+        return 'permanent'
+    if isinstance(error, OSError):
+        return 'connection'
+    return 'permanent'
+
+class NotificationDispatcher:
+    """メールの送信を有界キューで受け付け、ワーカースレッドがプールした接続でまとめて送信するクラス
+
+    ワーカーはキューから最大 batch_size 通を取り出し、1つの接続で続けて送信する。
+    一時的なエラーは宛先ごとに指数バックオフして再試行し、バックオフ中の宛先への
+    新しいメールもバックオフが明けるまで送信を遅らせる。
+    """
+
+    def __init__(self, pool, sender, workers=4, queue_size=1000, batch_size=50, max_attempts=3,
+                 backoff=1.0, poll_interval=0.2, clock=time.monotonic):
+        """
+        Args:
+            pool: SMTPConnectionPool
+            sender: エンベロープの送信元アドレス
+            workers: ワーカースレッド数
+            queue_size: キューに積める件数の上限（満杯の間は submit() が待つ）
+            batch_size: 1つの接続で続けて送信する最大件数
+            max_attempts: 1通あたりの最大試行回数
+            backoff: 再試行までの待ち時間の基準値（秒）。失敗が続くごとに倍にする
+        """
+        self.pool = pool
+        self.sender = sender
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._delayed = []  # (送信可能になる時刻, 連番, OutgoingMail)
+        self._sequence = itertools.count()
+        self._recipient_backoff = {}  # recipient → (連続失敗回数, 送信可能になる時刻)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._pending = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+        # 計測用カウンタ
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """環境変数 SMTP_* / NOTIFICATION_* から設定して作成"""
+        pool = SMTPConnectionPool(
+            os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+            int(os.getenv("SMTP_PORT", 587)),
+            user=os.getenv("SMTP_USER", "your-email@gmail.com"),
+            password=os.getenv("SMTP_PASSWORD", "your-app-password"),
+            starttls=os.getenv("SMTP_STARTTLS", "true").lower() == "true",
+            size=int(os.getenv("NOTIFICATION_WORKERS", "4")),
+        )
+        kwargs.setdefault('workers', int(os.getenv("NOTIFICATION_WORKERS", "4")))
+        kwargs.setdefault('queue_size', int(os.getenv("NOTIFICATION_QUEUE_SIZE", "1000")))
+        kwargs.setdefault('batch_size', int(os.getenv("NOTIFICATION_BATCH_SIZE", "50")))
+        return cls(pool, os.getenv("SENDER_EMAIL", "your-email@gmail.com"), **kwargs)
+
+    def submit(self, recipient, message, timeout=None):
+        """送信を依頼する（キューが満杯の場合は空くまで待ち、timeout を過ぎたら queue.Full）"""
+        self._start()
+        with self._lock:
+            self._pending += 1
+        try:
+            self._queue.put(OutgoingMail(recipient, message, 0), timeout=timeout)
+        except queue.Full:
+            self._finish()
+            raise
+
+    def flush(self, timeout=None):
+        """依頼済みのメールがすべて送信済み・失敗確定になるまで待つ（完了した場合はTrue）"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=None):
+        """残りを送信してからワーカーを止め、接続を閉じる"""
+        self.flush(timeout)
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.pool.close()
+
+    def _start(self):
+        if self._threads:
+            return
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'notification-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._next_batch()
+            if batch:
+                self._send_batch(batch)
+
+    def _next_batch(self):
+        """再試行待ちのうち送信可能になったものと、キューの先頭から最大 batch_size 通を取り出す"""
+        now = self.clock()
+        batch = []
+        wait = self.poll_interval
+        with self._lock:
+            while self._delayed and len(batch) < self.batch_size:
+                ready_at = self._delayed[0][0]
+                if ready_at > now:
+                    wait = min(wait, ready_at - now)
+                    break
+                batch.append(heapq.heappop(self._delayed)[2])
+
+        try:
+            if not batch:
+                batch.append(self._queue.get(timeout=wait))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _send_batch(self, batch):
+        """1つの接続でバッチを続けて送信する"""
+        now = self.clock()
+        sendable = []
+        for mail in batch:
+            backoff = self._recipient_backoff.get(mail.recipient)
+            if backoff is not None and backoff[1] > now:
+                self._delay(mail, backoff[1])
+            else:
+                sendable.append(mail)
+        if not sendable:
+            return
+
+        try:
+            connection = self.pool.acquire()
+        except Exception as e:
+            logger.error(f"Error connecting to SMTP server: {str(e)}")
+            for mail in sendable:
+                self._retry(mail, e, per_recipient=False)
+            return
+
+        broken = False
+        try:
+            for mail in sendable:
+                if broken:
+                    self._delay(mail, now)
+                    continue
+                try:
+                    self.pool.send(connection, self.sender, mail.recipient, mail.message)
+                except Exception as e:
+                    kind = classify_smtp_error(e, mail.recipient)
+                    if kind == 'permanent':
+                        self._fail(mail, e)
+                    else:
+                        broken = kind == 'connection'
+                        self._retry(mail, e, per_recipient=not broken)
+                else:
+                    self._done(mail)
+        finally:
+            self.pool.release(connection, broken=broken)
+
+    def _delay(self, mail, ready_at):
+        with self._lock:
+            heapq.heappush(self._delayed, (ready_at, next(self._sequence), mail))
+
+    def _retry(self, mail, error, per_recipient=True):
+        """失敗したメールを再試行待ちに入れる（試行回数の上限に達した場合は失敗確定）"""
+        attempts = mail.attempts + 1
+        if attempts >= self.max_attempts:
+            self._fail(mail, error)
+            return
+
+        with self._lock:
+            if per_recipient:
+                failures = self._recipient_backoff.get(mail.recipient, (0, 0))[0] + 1
+            else:
+                failures = attempts
+            ready_at = self.clock() + self.backoff * 2 ** (failures - 1)
+            if per_recipient:
+                self._recipient_backoff[mail.recipient] = (failures, ready_at)
+            self.retried += 1
+        logger.warning(f"Retrying email to {mail.recipient} (attempt {attempts}): {str(error)}")
+        self._delay(mail._replace(attempts=attempts), ready_at)
+
+    def _done(self, mail):
+        with self._lock:
+            self._recipient_backoff.pop(mail.recipient, None)
+            self.sent += 1
+        self._finish()
+
+    def _fail(self, mail, error):
+        logger.error(f"Giving up email to {mail.recipient}: {str(error)}")
+        with self._lock:
+            self.failed += 1
+        self._finish()
+
+    def _finish(self):
+        with self._idle:
+            self._pending -= 1
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def stats(self):
+        """カウンタの現在値を返す"""
+        return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'retried': self.retried,
+            'connections_opened': self.pool.connections_opened,
+        }
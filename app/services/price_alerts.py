@@ -0,0 +1,52 @@
+from datetime import datetime
+from sqlalchemy import update
+from ..models.models import User, Product, ProductLatestPrice, PriceAlert
+
+# 一括UPDATEの IN 句に渡すIDの最大数（SQLiteのパラメータ数制限に収める）
+UPDATE_BATCH_SIZE = 500
+
+def triggered_alerts_query(db):
+    """最新価格が目標価格以下になったアクティブなアラートを、通知に必要な情報と一緒に取得するクエリ
+
+    最新価格は価格の挿入時に更新される product_latest_price から主キーで引く。
+    """
+    return (
+        db.query(
+            PriceAlert.id.label('alert_id'),
+            PriceAlert.target_price,
+            User.id.label('user_id'),
+            User.email,
+            Product.id.label('product_id'),
+            Product.name.label('product_name'),
+            Product.url.label('product_url'),
+            ProductLatestPrice.total_price,
+            ProductLatestPrice.timestamp,
+        )
+        .join(ProductLatestPrice, ProductLatestPrice.product_id == PriceAlert.product_id)
+        .join(User, User.id == PriceAlert.user_id)
+        .join(Product, Product.id == PriceAlert.product_id)
+        .filter(PriceAlert.is_active == True)
+        .filter(ProductLatestPrice.total_price <= PriceAlert.target_price)
+        .order_by(PriceAlert.id)
+    )
+
+def claim_alerts(db, alert_ids):
+    """アラートをまとめて非アクティブにし、このトランザクションで非アクティブにできたIDを返す
+
+    即時発火と定期照合が同じアラートを同時に処理しても、通知するのは
+    is_active を切り替えられた側だけになる（コミットは呼び出し側で行う）。
+    """
+    now = datetime.utcnow()
+    alert_ids = list(alert_ids)
+    claimed = []
+    for start in range(0, len(alert_ids), UPDATE_BATCH_SIZE):
+        result = db.execute(
+            update(PriceAlert)
+            .where(PriceAlert.id.in_(alert_ids[start:start + UPDATE_BATCH_SIZE]))
+            .where(PriceAlert.is_active == True)
+            .values(is_active=False, updated_at=now)
+            .returning(PriceAlert.id)
+            .execution_options(synchronize_session=False)
+        )
+        claimed.extend(row[0] for row in result)
+    return claimed
@@ -0,0 +1,189 @@
+from datetime import datetime, time, timedelta
+import os
+import statistics
+from ..models.models import Price, PriceRollup
+from ..models.rollups import bucket_start
+
+# 価格履歴の参照は (product_id, timestamp) の複合インデックスで解決できるよう、
+# timestamp を関数で包まず半開区間 [start, end) で比較する。
+
+# 期間がこの日数以下なら生の価格、DAILY_MAX_DAYS 以下なら日次集計、それより長ければ週次集計を使う
+# （価格履歴・価格分析の既定の期間（30日・90日）は生の価格のまま返す）
+RAW_MAX_DAYS = int(os.getenv("PRICE_HISTORY_RAW_MAX_DAYS", "90"))
+DAILY_MAX_DAYS = int(os.getenv("PRICE_HISTORY_DAILY_MAX_DAYS", "120"))
+
+# 最初と最後の1/3の平均がこの割合以上変化したら上昇・下落傾向とみなす
+TREND_THRESHOLD = 0.05
+
+def day_bounds(day):
+    """日付の範囲 [当日0時, 翌日0時)"""
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+def prices_between(db, product_id, start, end=None):
+    """商品の価格履歴を [start, end) の範囲で時刻順に取得するクエリ（end 省略時は start 以降すべて）"""
+    query = db.query(Price).filter(Price.product_id == product_id, Price.timestamp >= start)
+    if end is not None:
+        query = query.filter(Price.timestamp < end)
+    return query.order_by(Price.timestamp)
+
+def has_price_on(db, product_id, day):
+    """指定した日の価格が記録されているか"""
+    start, end = day_bounds(day)
+    return db.query(Price.id).filter(
+        Price.product_id == product_id,
+        Price.timestamp >= start,
+        Price.timestamp < end,
+    ).first() is not None
+
+
+def choose_resolution(days):
+    """期間の日数に対して十分な細かさを保つ最も粗い解像度（raw, day, week）"""
+    if days <= RAW_MAX_DAYS:
+        return 'raw'
+    if days <= DAILY_MAX_DAYS:
+        return 'day'
+    return 'week'
+
+# 集計期間の長さ
+BUCKET_WIDTHS = {'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+
+# 集計から求めると近似になる価格分析の項目
+APPROXIMATED_FIELDS = ['median_price', 'price_trend', 'best_time_to_buy']
+
+def partial_rollup(db, product_id, resolution, start, end):
+    """[start, end) の生の価格から集計を作る（期間の途中から・途中までの集計用。価格がなければ None）"""
+    rows = (prices_between(db, product_id, start, end).order_by(Price.id)
+            .with_entities(Price.price, Price.timestamp).all())
+    if not rows:
+        return None
+    values = [price for price, _ in rows]
+    return PriceRollup(
+        product_id=product_id,
+        resolution=resolution,
+        bucket_start=start,
+        open_price=values[0],
+        open_at=rows[0].timestamp,
+        high_price=max(values),
+        low_price=min(values),
+        close_price=values[-1],
+        close_at=rows[-1].timestamp,
+        count=len(values),
+        price_sum=sum(values),
+    )
+
+def rollups_between(db, product_id, resolution, start, end=None):
+    """[start, end) の範囲の集計を時刻順に取得する
+
+    範囲に丸ごと含まれる期間は保存済みの集計を使い、start・end が期間の途中にある場合の
+    端の期間は範囲内の生の価格から集計する（範囲外の価格を含めないため、統計は生の価格と一致する）。
+    端の期間の bucket_start は start（先頭の場合）になる。
+    """
+    first = bucket_start(start, resolution)
+    if first < start:
+        first += BUCKET_WIDTHS[resolution]
+    last = None if end is None else bucket_start(end, resolution)
+    if last is not None and last < first:
+        head = partial_rollup(db, product_id, resolution, start, end)
+        return [head] if head is not None else []
+
+    query = db.query(PriceRollup).filter(
+        PriceRollup.product_id == product_id,
+        PriceRollup.resolution == resolution,
+        PriceRollup.bucket_start >= first,
+    )
+    if last is not None:
+        query = query.filter(PriceRollup.bucket_start < last)
+    rollups = query.order_by(PriceRollup.bucket_start).all()
+
+    head = partial_rollup(db, product_id, resolution, start, first) if first > start else None
+    tail = partial_rollup(db, product_id, resolution, last, end) if last is not None and last < end else None
+    return [rollup for rollup in (head, *rollups, tail) if rollup is not None]
+
+def summarize_prices(values):
+    """時刻順の価格のリストの統計（最安値・最高値・平均・中央値・最初と最後の1/3の平均・現在価格）"""
+    count = len(values)
+    first_prices = values[:max(count // 3, 1)]  # 最初の1/3
+    last_prices = values[-count // 3:]  # 最後の1/3
+    return {
+        'min_price': min(values),
+        'max_price': max(values),
+        'avg_price': sum(values) / count,
+        'median_price': statistics.median(values),
+        'first_avg': sum(first_prices) / len(first_prices),
+        'last_avg': sum(last_prices) / len(last_prices),
+        'current_price': values[-1],
+        'count': count,
+    }
+
+def _weighted_head_avg(buckets, count):
+    """(件数, 平均) のリストの先頭から count 件分の平均（期間内は平均値で近似）"""
+    total = remaining = count
+    price_sum = 0.0
+    for bucket_count, mean in buckets:
+        taken = min(bucket_count, remaining)
+        price_sum += taken * mean
+        remaining -= taken
+        if remaining == 0:
+            break
+    return price_sum / total
+
+def _weighted_median(buckets, count):
+    """(件数, 平均) のリストの件数で重み付けした中央値（期間内は平均値で近似）"""
+    positions = {(count - 1) // 2, count // 2}
+    values = []
+    seen = 0
+    for bucket_count, mean in sorted(buckets, key=lambda bucket: bucket[1]):
+        values.extend(mean for position in positions if seen <= position < seen + bucket_count)
+        seen += bucket_count
+    return sum(values) / len(values)
+
+def summarize_rollups(rollups):
+    """時刻順の集計から summarize_prices と同じ統計を求める
+
+    最安値・最高値・平均・件数・現在価格は生の価格と一致する。
+    中央値と最初・最後の1/3の平均は期間内の価格を期間の平均値とみなした近似になる。
+    """
+    count = sum(rollup.count for rollup in rollups)
+    buckets = [(rollup.count, rollup.price_sum / rollup.count) for rollup in rollups]
+    return {
+        'min_price': min(rollup.low_price for rollup in rollups),
+        'max_price': max(rollup.high_price for rollup in rollups),
+        'avg_price': sum(rollup.price_sum for rollup in rollups) / count,
+        'median_price': _weighted_median(buckets, count),
+        'first_avg': _weighted_head_avg(buckets, max(count // 3, 1)),
+        'last_avg': _weighted_head_avg(buckets[::-1], -(-count // 3)),
+        'current_price': rollups[-1].close_price,
+        'count': count,
+    }
+
+def price_trend(first_avg, last_avg):
+    """最初と最後の1/3の平均から価格トレンドを判定"""
+    if last_avg < first_avg * (1 - TREND_THRESHOLD):
+        return "下落傾向"
+    if last_avg > first_avg * (1 + TREND_THRESHOLD):
+        return "上昇傾向"
+    return "横這い"
+
+def purchase_advice(trend, current_price, avg_price):
+    """価格トレンドと現在価格から購入タイミングの推奨を作成"""
+    if trend == "下落傾向":
+        return "下落傾向が続いているため、あと1-2週間待つのがお得です"
+    if trend == "上昇傾向":
+        return "価格が上昇傾向のため、今が購入タイミングかもしれません"
+    if current_price < avg_price * (1 - TREND_THRESHOLD):
+        return "現在価格が平均よりも安いため、購入に適したタイミングです"
+    return "価格が横這いため、大きな変動は期待できません"
+
+def analysis_result(stats):
+    """summarize_prices / summarize_rollups の統計から価格分析の結果（PriceAnalysisResponse の分析項目）を作成"""
+    trend = price_trend(stats['first_avg'], stats['last_avg'])
+    return {
+        'min_price': stats['min_price'],
+        'max_price': stats['max_price'],
+        'avg_price': stats['avg_price'],
+        'median_price': stats['median_price'],
+        'price_trend': trend,
+        'best_time_to_buy': purchase_advice(trend, stats['current_price'], stats['avg_price']),
+        'price_fluctuation': (stats['max_price'] - stats['min_price']) / stats['avg_price'] * 100,
+    }
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+class PriceRefreshScheduler:
+    """商品価格のバックグラウンド再取得を管理するクラス
+
+    同じ商品の再取得は同時に1つまでとし、最小間隔内の再要求は無視する。
+    人気商品に多数の閲覧があっても、再取得は1ウィンドウにつき最大1回になる。
+    """
+
+    def __init__(self, refresh_func, min_interval=900, max_tracked=10000, clock=time.monotonic):
+        """
+        Args:
+            refresh_func: product_id を受け取るコルーチン関数
+            min_interval: 同一商品の再取得の最小間隔（秒）
+            max_tracked: 最終取得時刻を保持する商品数の上限
+        """
+        self.refresh_func = refresh_func
+        self.min_interval = min_interval
+        self.max_tracked = max_tracked
+        self.clock = clock
+        self._in_flight = {}
+        self._last_started = {}
+
+        # 計測用カウンタ
+        self.scheduled = 0
+        self.skipped_in_flight = 0
+        self.skipped_recent = 0
+
+    def request_refresh(self, product_id):
+        """再取得を要求する（実際に登録した場合はTrue）"""
+        if product_id in self._in_flight:
+            self.skipped_in_flight += 1
+            return False
+
+        now = self.clock()
+        last_started = self._last_started.get(product_id)
+        if last_started is not None and now - last_started < self.min_interval:
+            self.skipped_recent += 1
+            return False
+
+        self._last_started[product_id] = now
+        self._prune(now)
+        self.scheduled += 1
+        task = asyncio.ensure_future(self._run(product_id))
+        self._in_flight[product_id] = task
+        return True
+
+    async def _run(self, product_id):
+        try:
+            await self.refresh_func(product_id)
+        except Exception as e:
+            logger.error(f"Error refreshing prices for product ID {product_id}: {str(e)}")
+        finally:
+            self._in_flight.pop(product_id, None)
+
+    def _prune(self, now):
+        """最小間隔を過ぎた記録を破棄してメモリ使用量を抑える"""
+        if len(self._last_started) <= self.max_tracked:
+            return
+        expired = [
+            product_id for product_id, started in self._last_started.items()
+            if now - started >= self.min_interval
+        ]
+        for product_id in expired:
+            del self._last_started[product_id]
+
+    def stats(self):
+        """スケジューラの統計を返す"""
+        return {
+            'scheduled': self.scheduled,
+            'skipped_in_flight': self.skipped_in_flight,
+            'skipped_recent': self.skipped_recent,
+            'in_flight': len(self._in_flight),
+        }
@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import func, insert
+from ..models.database import SessionLocal
+from ..models.models import Product, Price, TaskCheckpoint
+from ..models.latest_price import upsert_latest_prices
+from ..models.rollups import upsert_price_rollups
+from .alert_index import alert_trigger
+from scraping import AsyncFetchEngine, AmazonScraper, RakutenScraper, YahooShoppingScraper
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+SCRAPER_CLASSES = (AmazonScraper, RakutenScraper, YahooShoppingScraper)
+
+# 商品のソース名 → 価格ページの抽出仕様
+PRICE_PAGE_SPECS = {cls.source_name: cls.price_page_spec for cls in SCRAPER_CLASSES}
+
+# 商品のソース名 → サイトキー（レート制限・同時実行数の設定に使う）
+SITE_KEYS = {cls.source_name: cls.site_key for cls in SCRAPER_CLASSES}
+
+# サイトごとの1秒あたりのリクエスト数（従来の1件ごとの1秒待機の代わり）
+DEFAULT_SITE_RATE_LIMITS = {
+    'amazon': 1.0,
+    'rakuten': 2.0,
+    'yahoo': 2.0,
+}
+
+# サイトごとの同時リクエスト数（AsyncFetchEngine の既定値）
+DEFAULT_REQUEST_CONCURRENCY = 4
+
+def lane_limits(site_key, lanes, site_rate_limits=None, request_concurrency=DEFAULT_REQUEST_CONCURRENCY):
+    """サイトのレート制限・同時リクエスト数をレーン数で割った、1レーンあたりの設定
+
+    dispatch_price_update はサイトごとに lanes 個のチャンクタスクを同時に動かし、
+    チャンクタスクはそれぞれ AsyncFetchEngine を持つ。各レーンを設定値の 1/lanes に
+    制限するため、サイトへの実効レートは設定値（例: Amazon 1件/秒）のままになる。
+    同時リクエスト数は1レーン1件を下限とするため、実効値は lanes 件を下回らない。
+
+    Returns:
+        dict: PriceUpdatePipeline に渡す site_rate_limits と site_concurrency
+    """
+    rate_limits = DEFAULT_SITE_RATE_LIMITS if site_rate_limits is None else site_rate_limits
+    lanes = max(1, lanes)
+    return {
+        'site_rate_limits': {site: rate / lanes for site, rate in rate_limits.items() if site == site_key},
+        'site_concurrency': {site_key: max(1, request_concurrency // lanes)},
+    }
+
+def extract_price_info(source, html):
+    """商品ページのHTMLから価格と送料を抽出（ワーカープールで実行する）"""
+    return PRICE_PAGE_SPECS[source].extract_document(html)
+
+def partition_products(db, chunk_size):
+    """商品をサイトごとに chunk_size 件ずつのID範囲に分割する
+
+    ウィンドウ関数でサイト内の連番を振り、連番を chunk_size で割った値でグループ化するため
+    商品IDをアプリケーション側に読み込まない。
+
+    Returns:
+        list: (source, first_id, last_id, count) のタプル（サイト・ID順）
+    """
+    bucket = (func.row_number().over(partition_by=Product.source, order_by=Product.id) - 1) // chunk_size
+    numbered = (
+        db.query(Product.id.label('id'), Product.source.label('source'), bucket.label('bucket'))
+        .filter(Product.source.in_(list(SITE_KEYS)))
+        .subquery()
+    )
+    rows = (
+        db.query(numbered.c.source, func.min(numbered.c.id), func.max(numbered.c.id), func.count())
+        .group_by(numbered.c.source, numbered.c.bucket)
+        .order_by(numbered.c.source, func.min(numbered.c.id))
+        .all()
+    )
+    return [tuple(row) for row in rows]
+
+def plan_lanes(partitions, site_concurrency=None, default_concurrency=2):
+    """チャンクをサイトごとの同時実行数の数だけのレーンに振り分ける
+
+    レーン内のチャンクは順番に実行するため、サイトごとに同時に動くチャンクは
+    site_concurrency（未指定のサイトは default_concurrency）個までになる。
+
+    Returns:
+        list: レーンのリスト（各レーンは (source, first_id, last_id) のリスト）
+    """
+    site_concurrency = site_concurrency or {}
+    lanes_by_source = {}
+    chunk_counts = {}
+    for source, first_id, last_id, _ in partitions:
+        concurrency = max(1, site_concurrency.get(SITE_KEYS[source], default_concurrency))
+        lanes = lanes_by_source.setdefault(source, [[] for _ in range(concurrency)])
+        index = chunk_counts.get(source, 0)
+        lanes[index % concurrency].append((source, first_id, last_id))
+        chunk_counts[source] = index + 1
+    return [lane for lanes in lanes_by_source.values() for lane in lanes if lane]
+
+class PriceUpdatePipeline:
+    """全商品の価格を一括更新するパイプライン
+
+    商品をID順のチャンクで読み込み、サイトごとのレート制限の範囲で並行に取得し、
+    パースはワーカープールで行い、価格はチャンク単位でまとめてINSERTする。
+    チャンクの書き込みと同じトランザクションでチェックポイントを更新するため、
+    中断した場合は次回の実行で最後に書き込んだチャンクの続きから再開する。
+    """
+
+    def __init__(self, session_factory=SessionLocal, chunk_size=500, site_rate_limits=None,
+                 site_concurrency=None, parse_executor=None, parse_workers=None, timeout=10,
+                 checkpoint_name='update_all_prices'):
+        """
+        Args:
+            session_factory: DBセッションを作成する呼び出し可能オブジェクト
+            chunk_size: 1チャンクあたりの商品数
+            site_rate_limits: サイトごとの1秒あたりのリクエスト数
+            site_concurrency: サイトごとの同時リクエスト数
+            parse_executor: パースに使うExecutor（省略時はスレッドプール）
+            parse_workers: parse_executor 省略時のワーカー数
+            checkpoint_name: チェックポイントの名前
+        """
+        self.session_factory = session_factory
+        self.chunk_size = chunk_size
+        self.site_rate_limits = site_rate_limits if site_rate_limits is not None else DEFAULT_SITE_RATE_LIMITS
+        self.site_concurrency = site_concurrency
+        self.parse_executor = parse_executor
+        self.parse_workers = parse_workers or os.cpu_count()
+        self.timeout = timeout
+        self.checkpoint_name = checkpoint_name
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """環境変数 PRICE_UPDATE_CHUNK_SIZE / PRICE_UPDATE_PARSE_WORKERS から設定して作成"""
+        kwargs.setdefault('chunk_size', int(os.getenv("PRICE_UPDATE_CHUNK_SIZE", "500")))
+        parse_workers = os.getenv("PRICE_UPDATE_PARSE_WORKERS")
+        if parse_workers:
+            kwargs.setdefault('parse_workers', int(parse_workers))
+        return cls(**kwargs)
+
+    def run(self, resume=True):
+        """パイプラインを実行して集計を返す（同期API）"""
+        return asyncio.run(self.async_run(resume=resume))
+
+    async def async_run(self, resume=True):
+        """全商品を対象にパイプラインを実行して集計を返す"""
+        last_id = await asyncio.to_thread(self._load_checkpoint, resume)
+        if last_id:
+            logger.info(f"Resuming price update after product {last_id}")
+
+        summary = await self._execute(last_id, checkpoint=True)
+        summary["resumed_from"] = last_id
+        await asyncio.to_thread(self._clear_checkpoint)
+        return summary
+
+    def run_range(self, source, first_id, last_id):
+        """指定したサイト・ID範囲の商品だけを更新（同期API）"""
+        return asyncio.run(self.async_run_range(source, first_id, last_id))
+
+    async def async_run_range(self, source, first_id, last_id):
+        """指定したサイト・ID範囲の商品だけを更新（チェックポイントは使わない）"""
+        return await self._execute(first_id - 1, source=source, upper_id=last_id, checkpoint=False)
+
+    async def _execute(self, last_id, source=None, upper_id=None, checkpoint=True):
+        """last_id より後の商品をチャンクごとに取得・パース・書き込みする"""
+        fetch_engine = AsyncFetchEngine(
+            timeout=self.timeout,
+            site_concurrency=self.site_concurrency,
+            site_rate_limits=self.site_rate_limits,
+        )
+        scrapers = {cls.source_name: cls(fetch_engine=fetch_engine) for cls in SCRAPER_CLASSES}
+        executor = self.parse_executor or ThreadPoolExecutor(
+            max_workers=self.parse_workers, thread_name_prefix='price-parse'
+        )
+
+        summary = {
+            "success": True,
+            "updated_count": 0,
+            "error_count": 0,
+            "skipped_count": 0,
+            "total_products": 0,
+        }
+
+        pending_write = None
+        try:
+            while True:
+                chunk = await asyncio.to_thread(self._load_chunk, last_id, source, upper_id)
+                if not chunk:
+                    break
+                summary["total_products"] += len(chunk)
+
+                outcomes = await asyncio.gather(*[
+                    self._refresh_product(scrapers, executor, product) for product in chunk
+                ])
+                rows = [outcome for outcome in outcomes if isinstance(outcome, dict)]
+                summary["updated_count"] += len(rows)
+                summary["error_count"] += outcomes.count('error')
+                summary["skipped_count"] += outcomes.count('skipped')
+
+                # 前のチャンクの書き込みを待ってから次を書き込む（チェックポイントを単調に進める）
+                if pending_write is not None:
+                    await pending_write
+                last_id = chunk[-1].id
+                pending_write = asyncio.ensure_future(
+                    asyncio.to_thread(self._write_chunk, rows, last_id if checkpoint else None)
+                )
+
+            if pending_write is not None:
+                await pending_write
+                pending_write = None
+        finally:
+            if pending_write is not None:
+                # 中断時も書き込み中のチャンクはチェックポイントまで反映させる
+                await asyncio.shield(pending_write)
+            await fetch_engine.aclose()
+            if self.parse_executor is None:
+                executor.shutdown(wait=False)
+
+        logger.info(
+            f"Price update completed. Updated: {summary['updated_count']}, "
+            f"Errors: {summary['error_count']}, Skipped: {summary['skipped_count']}"
+        )
+        return summary
+
+    async def _refresh_product(self, scrapers, executor, product):
+        """1商品分の取得とパース（成功時は価格の行、それ以外は 'error' / 'skipped'）"""
+        scraper = scrapers.get(product.source)
+        if scraper is None:
+            logger.warning(f"Unknown source for product {product.id}: {product.source}")
+            return 'skipped'
+
+        html = await scraper.async_get_html(product.url)
+        if not html:
+            logger.error(f"Failed to fetch page for product {product.id}: {product.url}")
+            return 'error'
+
+        try:
+            loop = asyncio.get_running_loop()
+            price_info = await loop.run_in_executor(executor, extract_price_info, product.source, html)
+        except Exception as e:
+            logger.error(f"Error extracting price info for product {product.id}: {str(e)}")
+            return 'error'
+
+        price = price_info['price']
+        if price is None:
+            logger.warning(f"Could not extract price for product {product.id}: {product.url}")
+            return 'skipped'
+
+        # 総額の計算（送料が不明な場合は価格のみ）
+        shipping_fee = price_info['shipping_fee']
+        total_price = price + shipping_fee if shipping_fee is not None else price
+        return {
+            "product_id": product.id,
+            "price": price,
+            "shipping_fee": shipping_fee,
+            "total_price": total_price,
+            "timestamp": datetime.utcnow(),
+        }
+
+    def _load_checkpoint(self, resume):
+        """前回中断した位置（処理済みの最後の商品ID）を読み込む"""
+        db = self.session_factory()
+        try:
+            checkpoint = db.get(TaskCheckpoint, self.checkpoint_name)
+            if checkpoint is None or not resume:
+                if checkpoint is None:
+                    db.add(TaskCheckpoint(name=self.checkpoint_name, last_id=0))
+                else:
+                    checkpoint.last_id = 0
+                    checkpoint.started_at = datetime.utcnow()
+                db.commit()
+                return 0
+            return checkpoint.last_id or 0
+        finally:
+            db.close()
+
+    def _load_chunk(self, last_id, source=None, upper_id=None):
+        """last_id より後の商品をID順に1チャンク分読み込む（source・upper_id で絞り込み可能）"""
+        db = self.session_factory()
+        try:
+            query = db.query(Product.id, Product.source, Product.url).filter(Product.id > last_id)
+            if source is not None:
+                query = query.filter(Product.source == source)
+            if upper_id is not None:
+                query = query.filter(Product.id <= upper_id)
+            return query.order_by(Product.id).limit(self.chunk_size).all()
+        finally:
+            db.close()
+
+    def _write_chunk(self, rows, last_id=None):
+        """価格をまとめてINSERTし、同じトランザクションでチェックポイントを進める"""
+        db = self.session_factory()
+        try:
+            if rows:
+                db.execute(insert(Price), rows)
+                # 一括INSERTではORMのイベントが発火しないため、最新価格と集計も同じトランザクションで更新する
+                upsert_latest_prices(db.connection(), rows)
+                upsert_price_rollups(db.connection(), rows)
+            if last_id is not None:
+                checkpoint = db.get(TaskCheckpoint, self.checkpoint_name)
+                checkpoint.last_id = last_id
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        # Core の一括INSERTはセッションのイベントで拾えないため、アラートの判定を直接依頼する
+        if rows:
+            try:
+                alert_trigger.on_prices_inserted(
+                    db.get_bind(), [(row["product_id"], row["total_price"]) for row in rows]
+                )
+            except Exception as e:
+                logger.error(f"Error checking price alerts for written chunk: {str(e)}")
+
+    def _clear_checkpoint(self):
+        """最後まで処理したらチェックポイントを削除する"""
+        db = self.session_factory()
+        try:
+            db.query(TaskCheckpoint).filter(TaskCheckpoint.name == self.checkpoint_name).delete()
+            db.commit()
+        finally:
+            db.close()
@@ -1,5 +1,6 @@
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_init
 import os
 from dotenv import load_dotenv
 
@@ -14,23 +15,43 @@ app = Celery(
     'cheapest_price_finder',
     broker=redis_url,
     backend=redis_url,
-    include=['app.tasks.price_update', 'app.tasks.alert']
+    include=['app.tasks.price_update', 'app.tasks.alert', 'app.tasks.maintenance']
 )
 
 # スケジュール設定
 app.conf.beat_schedule = {
     'update-prices-every-day': {
-        'task': 'app.tasks.price_update.update_all_prices',
+        'task': 'app.tasks.price_update.dispatch_price_update',
         'schedule': crontab(hour=3, minute=0),  # 毎日午前3時に実行
     },
     'check-price-alerts-every-hour': {
         'task': 'app.tasks.alert.check_price_alerts',
         'schedule': crontab(minute=0),  # 毎時0分に実行
     },
+    'ensure-price-partitions-every-day': {
+        'task': 'app.tasks.maintenance.ensure_price_partitions',
+        'schedule': crontab(hour=2, minute=30),  # 毎日午前2時30分に実行
+    },
+    'rebuild-latest-prices-every-week': {
+        'task': 'app.tasks.maintenance.rebuild_latest_prices',
+        'schedule': crontab(hour=4, minute=30, day_of_week='sunday'),  # 毎週日曜午前4時30分に実行
+    },
+}
+
+# チャンクタスクの優先度（priority）をRedisブローカーでも有効にする
+app.conf.broker_transport_options = {
+    'priority_steps': list(range(10)),
+    'queue_order_strategy': 'priority',
 }
 
 # タイムゾーン設定
 app.conf.timezone = 'Asia/Tokyo'
 
+@worker_process_init.connect
+def start_alert_trigger(**kwargs):
+    """ワーカープロセスごとに、価格の挿入時にアラートを即時発火させるフックを登録する"""
+    from .alert import install_alert_trigger
+    install_alert_trigger()
+
 if __name__ == '__main__':
     app.start()
@@ -1,14 +1,15 @@
 from celery import shared_task
 import logging
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import desc
+from sqlalchemy import func
 from ..models.database import engine
-from ..models.models import User, Product, Price, PriceAlert
+from ..models.models import PriceAlert
+from ..services.price_alerts import triggered_alerts_query, claim_alerts, UPDATE_BATCH_SIZE
+from ..services.alert_index import alert_trigger
+from ..services.notification import AlertEmailRenderer, NotificationDispatcher
 from datetime import datetime, timedelta
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
 import os
+import threading
 
 # ロガーの設定
 logger = logging.getLogger(__name__)
@@ -16,70 +17,40 @@ logger = logging.getLogger(__name__)
 # データベースセッションの作成
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# メール送信ディスパッチャー（本番環境で最初に通知するときに作成）
+_dispatcher = None
+_renderer = None
+_dispatcher_lock = threading.Lock()
+
 @shared_task(name="app.tasks.alert.check_price_alerts")
 def check_price_alerts():
-    """価格アラートをチェックして、条件を満たす場合は通知を送信するタスク"""
+    """価格アラートを照合して、条件を満たすのに通知されていないものを通知するタスク
+
+    通常は価格の挿入時に即時発火するため、ここでは即時発火で取りこぼしたもの
+    （通知の依頼失敗・他プロセスでのアラート変更の反映待ちなど）だけを拾う。
+    """
     logger.info("Starting price alert check...")
     
     # データベースセッションの作成
     db = SessionLocal()
     
     try:
-        # アクティブな価格アラートを取得
-        alerts = db.query(PriceAlert).filter(PriceAlert.is_active == True).all()
-        logger.info(f"Found {len(alerts)} active price alerts")
+        total_alerts = db.query(func.count(PriceAlert.id)).filter(PriceAlert.is_active == True).scalar()
+        logger.info(f"Found {total_alerts} active price alerts")
         
-        notification_count = 0
+        # 商品ごとの最新価格とアラート・ユーザー・商品を1つのクエリで結合し、条件を満たすものだけ取得
+        triggered = triggered_alerts_query(db).all()
+        notification_count = notify_triggered_alerts(db, triggered)
         
-        for alert in alerts:
-            try:
-                # 最新の価格情報を取得
-                latest_price = db.query(Price).filter(
-                    Price.product_id == alert.product_id
-                ).order_by(desc(Price.timestamp)).first()
-                
-                if not latest_price:
-                    logger.warning(f"No price information found for product {alert.product_id}")
-                    continue
-                
-                # ユーザーと商品情報を取得
-                user = db.query(User).filter(User.id == alert.user_id).first()
-                product = db.query(Product).filter(Product.id == alert.product_id).first()
-                
-                if not user or not product:
-                    logger.warning(f"User or product not found for alert {alert.id}")
-                    continue
-                
-                # 目標価格以下になったかチェック
-                if latest_price.total_price <= alert.target_price:
-                    logger.info(f"Price alert triggered for user {user.id} on product {product.id}")
-                    
-                    # 通知を送信
-                    send_alert_notification(
-                        user.email,
-                        product.name,
-                        product.url,
-                        alert.target_price,
-                        latest_price.total_price,
-                        latest_price.timestamp
-                    )
-                    
-                    # アラートを非アクティブに設定（一度通知したら終了）
-                    alert.is_active = False
-                    db.commit()
-                    
-                    notification_count += 1
-            
-            except Exception as e:
-                logger.error(f"Error processing alert {alert.id}: {str(e)}")
-                continue
+        # 照合後はこのプロセスのインデックスもDBから読み直す
+        alert_trigger.invalidate()
         
         logger.info(f"Price alert check completed. Notifications sent: {notification_count}")
         
         return {
             "success": True,
             "notifications_sent": notification_count,
-            "total_alerts": len(alerts)
+            "total_alerts": total_alerts
         }
     
     except Exception as e:
@@ -89,97 +60,101 @@ def check_price_alerts():
     finally:
         db.close()
 
-def send_alert_notification(email, product_name, product_url, target_price, current_price, timestamp):
-    """メールで価格アラート通知を送信"""
+@shared_task(name="app.tasks.alert.fire_price_alerts")
+def fire_price_alerts(alert_ids):
+    """価格の挿入時にインデックスで一致したアラートを最新価格で確認して通知するタスク"""
+    db = SessionLocal()
+    
     try:
-        # メール設定
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", 587))
-        smtp_user = os.getenv("SMTP_USER", "your-email@gmail.com")
-        smtp_password = os.getenv("SMTP_PASSWORD", "your-app-password")
-        
-        sender_email = os.getenv("SENDER_EMAIL", "your-email@gmail.com")
-        
-        # メールの作成
-        message = MIMEMultipart("alternative")
-        message["Subject"] = f"【最安値アラート】{product_name}が目標価格に達しました"
-        message["From"] = sender_email
-        message["To"] = email
-        
-        # テキスト形式の本文
-        text = f"""
-        商品の価格が目標価格に達しました！
+        triggered = triggered_alerts_query(db).filter(PriceAlert.id.in_(alert_ids)).all()
+        notification_count = notify_triggered_alerts(db, triggered)
+        return {"success": True, "notifications_sent": notification_count}
+    
+    except Exception as e:
+        logger.error(f"Error in fire_price_alerts task: {str(e)}")
+        return {"success": False, "error": str(e)}
+    
+    finally:
+        db.close()
 
-        商品名: {product_name}
-        現在価格: {current_price}円
-        目標価格: {target_price}円
-        確認日時: {timestamp.strftime('%Y年%m月%d日 %H:%M')}
+def dispatch_triggered_alerts(alert_ids):
+    """即時発火したアラートの通知をワーカーに依頼（IN句の上限に合わせて分割）"""
+    alert_ids = list(alert_ids)
+    for start in range(0, len(alert_ids), UPDATE_BATCH_SIZE):
+        fire_price_alerts.delay(alert_ids[start:start + UPDATE_BATCH_SIZE])
 
-        商品を確認する: {product_url}
+def notify_triggered_alerts(db, triggered):
+    """条件を満たしたアラートを非アクティブにしてから通知し、送信件数を返す
 
-        ※このメールは自動送信されています。返信はできません。
-        最安値検索アプリより
-        """
-        
-        # HTML形式の本文
-        html = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; }}
-                .container {{ padding: 20px; max-width: 600px; margin: 0 auto; }}
-                .header {{ background-color: #4CAF50; color: white; padding: 10px; text-align: center; }}
-                .content {{ padding: 20px; }}
-                .price {{ font-size: 24px; color: #E53935; font-weight: bold; }}
-                .button {{ background-color: #4CAF50; color: white; padding: 10px 15px; text-decoration: none; border-radius: 5px; }}
-                .footer {{ font-size: 12px; color: #757575; margin-top: 30px; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>最安値アラート</h1>
-                </div>
-                <div class="content">
-                    <p>商品の価格が目標価格に達しました！</p>
-                    
-                    <h2>{product_name}</h2>
-                    
-                    <p>現在価格: <span class="price">{current_price}円</span></p>
-                    <p>目標価格: {target_price}円</p>
-                    <p>確認日時: {timestamp.strftime('%Y年%m月%d日 %H:%M')}</p>
-                    
-                    <p style="margin-top: 30px;">
-                        <a href="{product_url}" class="button">商品を確認する</a>
-                    </p>
-                    
-                    <div class="footer">
-                        <p>このメールは自動送信されています。返信はできません。<br>最安値検索アプリより</p>
-                    </div>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        # テキストとHTMLパートの追加
-        part1 = MIMEText(text, "plain")
-        part2 = MIMEText(html, "html")
-        
-        message.attach(part1)
-        message.attach(part2)
+    先に非アクティブにできたアラートだけを通知するため、即時発火と定期照合が
+    同じアラートを同時に処理しても二重に通知しない。
+    """
+    # アラートを非アクティブに設定（一度通知したら終了）、まとめてUPDATEする
+    claimed = set(claim_alerts(db, [alert.alert_id for alert in triggered]))
+    db.commit()
+    alert_trigger.on_alerts_deactivated(claimed)
+    
+    notification_count = 0
+    for alert in triggered:
+        if alert.alert_id not in claimed:
+            continue
+        try:
+            logger.info(f"Price alert triggered for user {alert.user_id} on product {alert.product_id}")
+            
+            # 通知を送信
+            send_alert_notification(
+                alert.email,
+                alert.product_name,
+                alert.product_url,
+                alert.target_price,
+                alert.total_price,
+                alert.timestamp
+            )
+            notification_count += 1
         
+        except Exception as e:
+            logger.error(f"Error processing alert {alert.alert_id}: {str(e)}")
+            continue
+    
+    # キューに積んだメールの送信完了を待ってからタスクを終える
+    flush_notifications()
+    
+    return notification_count
+
+def install_alert_trigger():
+    """価格の挿入時にアラートを即時発火させる（アプリ・ワーカーの起動時に呼ぶ）"""
+    alert_trigger.install(dispatch=dispatch_triggered_alerts, bind=engine)
+
+def get_notification_dispatcher():
+    """プロセスで共有するメール送信ディスパッチャー（初回の呼び出し時に作成）"""
+    global _dispatcher, _renderer
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _renderer = AlertEmailRenderer(os.getenv("SENDER_EMAIL", "your-email@gmail.com"))
+                _dispatcher = NotificationDispatcher.from_env()
+    return _dispatcher
+
+def flush_notifications():
+    """依頼済みのメールの送信完了を待つ"""
+    if _dispatcher is not None:
+        timeout = float(os.getenv("NOTIFICATION_FLUSH_TIMEOUT", "300"))
+        if not _dispatcher.flush(timeout):
+            logger.warning("Timed out waiting for price alert emails to be sent")
+
+def send_alert_notification(email, product_name, product_url, target_price, current_price, timestamp):
+    """価格アラート通知のメールを送信キューに積む（送信はディスパッチャーのワーカーが行う）"""
+    try:
         # メール送信（開発環境ではログに出力するだけ）
         if os.getenv("ENVIRONMENT", "development") == "production":
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.starttls()
-                server.login(smtp_user, smtp_password)
-                server.sendmail(sender_email, email, message.as_string())
-                logger.info(f"Price alert email sent to {email}")
+            dispatcher = get_notification_dispatcher()
+            message = _renderer.render(email, product_name, product_url, target_price, current_price, timestamp)
+            dispatcher.submit(email, message)
+            logger.info(f"Price alert email queued for {email}")
         else:
             logger.info(f"[DEVELOPMENT] Would send price alert email to {email}")
-            logger.info(f"Email subject: {message['Subject']}")
-            logger.info(f"Email body: {text}")
+            logger.info(f"Email subject: {AlertEmailRenderer.subject(product_name)}")
+            logger.info(f"Product: {product_url} (current: {current_price}, target: {target_price})")
         
         return True
     
@@ -0,0 +1,48 @@
+from celery import shared_task
+import logging
+import os
+from ..models.database import engine
+from ..models.latest_price import rebuild_latest_prices
+from ..models.migrations import ensure_price_partitions
+from ..models.rollups import rebuild_price_rollups
+
+# ロガーの設定
+logger = logging.getLogger(__name__)
+
+@shared_task(name="app.tasks.maintenance.ensure_price_partitions")
+def ensure_price_partitions_task():
+    """prices テーブルの月ごとのパーティションを先の月まで作成しておくタスク（PostgreSQLでパーティション化している場合のみ）"""
+    try:
+        months_ahead = int(os.getenv("PRICE_PARTITION_MONTHS_AHEAD", "3"))
+        partitions = ensure_price_partitions(engine, months_ahead=months_ahead)
+        return {"success": True, "partitions": partitions}
+    
+    except Exception as e:
+        logger.error(f"Error in ensure_price_partitions task: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+@shared_task(name="app.tasks.maintenance.rebuild_latest_prices")
+def rebuild_latest_prices_task():
+    """商品ごとの最新価格テーブルを価格履歴から作り直すタスク（書き込み漏れの修復用）"""
+    try:
+        with engine.begin() as conn:
+            count = rebuild_latest_prices(conn)
+        logger.info(f"Rebuilt latest prices for {count} products")
+        return {"success": True, "products": count}
+    
+    except Exception as e:
+        logger.error(f"Error in rebuild_latest_prices task: {str(e)}")
+        return {"success": False, "error": str(e)}
+
+@shared_task(name="app.tasks.maintenance.rebuild_price_rollups")
+def rebuild_price_rollups_task():
+    """日次・週次の価格の集計を価格履歴から作り直すタスク（書き込み漏れの修復用）"""
+    try:
+        with engine.begin() as conn:
+            count = rebuild_price_rollups(conn)
+        logger.info(f"Rebuilt {count} price rollups")
+        return {"success": True, "rollups": count}
+    
+    except Exception as e:
+        logger.error(f"Error in rebuild_price_rollups task: {str(e)}")
+        return {"success": False, "error": str(e)}
@@ -1,10 +1,12 @@
-from celery import shared_task
+from celery import shared_task, chain, chord, group
 import logging
+import os
 from sqlalchemy.orm import sessionmaker
 from ..models.database import engine
 from ..models.models import Product, Price
-from ...scraping import AmazonScraper, RakutenScraper, YahooShoppingScraper
-import time
+from scraping import AmazonScraper, RakutenScraper, YahooShoppingScraper
+from collections import Counter
+from ..services.price_update_pipeline import PriceUpdatePipeline, SITE_KEYS, lane_limits, partition_products, plan_lanes
 from datetime import datetime
 
 # ロガーの設定
@@ -19,134 +21,126 @@ rakuten_scraper = RakutenScraper()
 yahoo_scraper = YahooShoppingScraper()
 
 @shared_task(name="app.tasks.price_update.update_all_prices")
-def update_all_prices():
-    """全商品の価格を更新するタスク"""
+def update_all_prices(resume=True):
+    """全商品の価格を更新するタスク（中断した場合は次回の実行で続きから再開）"""
     logger.info("Starting price update for all products...")
     
-    # データベースセッションの作成
-    db = SessionLocal()
-    
     try:
-        # 全商品を取得
-        products = db.query(Product).all()
-        logger.info(f"Found {len(products)} products to update")
-        
-        update_count = 0
-        error_count = 0
-        
-        for product in products:
-            try:
-                # 商品のソースに基づいて適切なスクレイパーを選択
-                if product.source == 'Amazon':
-                    scraper = amazon_scraper
-                elif product.source == '楽天市場':
-                    scraper = rakuten_scraper
-                elif product.source == 'Yahoo!ショッピング':
-                    scraper = yahoo_scraper
-                else:
-                    logger.warning(f"Unknown source for product {product.id}: {product.source}")
-                    continue
-                
-                # URLからページを取得
-                soup = scraper.get_page(product.url)
-                if not soup:
-                    logger.error(f"Failed to fetch page for product {product.id}: {product.url}")
-                    error_count += 1
-                    continue
-                
-                # 商品情報の抽出方法はソースによって異なる
-                # ここでは簡単なサンプルとして、直接product_infoを作成
-                # 実際には、各スクレイパークラスのメソッドを追加する必要がある
-                
-                # 商品ページから詳細情報を抽出
-                try:
-                    if product.source == 'Amazon':
-                        price_elem = soup.select_one('.a-price .a-offscreen')
-                        price_text = price_elem.text.strip() if price_elem else None
-                        price = float(price_text.replace('￥', '').replace(',', '')) if price_text else None
-                        
-                        shipping_elem = soup.select_one('#deliveryBlockMessage')
-                        shipping_text = shipping_elem.text.strip() if shipping_elem else None
-                        # 「無料配送」などのテキストから送料を解析
-                        shipping_fee = 0 if shipping_text and '無料' in shipping_text else None
-                    
-                    elif product.source == '楽天市場':
-                        price_elem = soup.select_one('.price')
-                        price_text = price_elem.text.strip() if price_elem else None
-                        price = float(price_text.replace('円', '').replace(',', '')) if price_text else None
-                        
-                        shipping_elem = soup.select_one('.shipping')
-                        shipping_text = shipping_elem.text.strip() if shipping_elem else None
-                        # 送料テキストから送料を解析
-                        shipping_fee = 0 if shipping_text and '無料' in shipping_text else None
-                    
-                    elif product.source == 'Yahoo!ショッピング':
-                        price_elem = soup.select_one('.elPriceNumber')
-                        price_text = price_elem.text.strip() if price_elem else None
-                        price = float(price_text.replace('円', '').replace(',', '')) if price_text else None
-                        
-                        shipping_elem = soup.select_one('.elShippingOptions')
-                        shipping_text = shipping_elem.text.strip() if shipping_elem else None
-                        # 送料テキストから送料を解析
-                        shipping_fee = 0 if shipping_text and '無料' in shipping_text else None
-                    
-                    else:
-                        logger.warning(f"No parsing logic for source: {product.source}")
-                        continue
-                    
-                    # 価格情報が取得できなかった場合はスキップ
-                    if price is None:
-                        logger.warning(f"Could not extract price for product {product.id}: {product.url}")
-                        continue
-                    
-                    # 総額の計算（送料が不明な場合は価格のみ）
-                    total_price = price
-                    if shipping_fee is not None:
-                        total_price += shipping_fee
-                    
-                    # 新しい価格情報をデータベースに保存
-                    new_price = Price(
-                        product_id=product.id,
-                        price=price,
-                        shipping_fee=shipping_fee,
-                        total_price=total_price,
-                        timestamp=datetime.utcnow()
-                    )
-                    
-                    db.add(new_price)
-                    db.commit()
-                    update_count += 1
-                    
-                    logger.info(f"Updated price for product {product.id}: {price} JPY (Total: {total_price} JPY)")
-                    
-                    # 負荷軽減のための短い待機
-                    time.sleep(1)
-                    
-                except Exception as e:
-                    logger.error(f"Error extracting price info for product {product.id}: {str(e)}")
-                    error_count += 1
-                    continue
-                
-            except Exception as e:
-                logger.error(f"Error updating product {product.id}: {str(e)}")
-                error_count += 1
-                continue
-        
-        logger.info(f"Price update completed. Updated: {update_count}, Errors: {error_count}")
-        
-        return {
-            "success": True,
-            "updated_count": update_count,
-            "error_count": error_count,
-            "total_products": len(products)
-        }
+        pipeline = PriceUpdatePipeline.from_env(session_factory=SessionLocal)
+        return pipeline.run(resume=resume)
     
     except Exception as e:
         logger.error(f"Error in update_all_prices task: {str(e)}")
         return {"success": False, "error": str(e)}
+
+def parse_site_settings(value):
+    """'amazon=2,rakuten=4' 形式の設定をサイトキー→整数の辞書に変換"""
+    settings = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            site, number = item.split('=', 1)
+            settings[site.strip()] = int(number)
+    return settings
+
+def empty_chunk_summary():
+    """チャンクタスクの集計の初期値"""
+    return {
+        "chunks": 0,
+        "updated_count": 0,
+        "error_count": 0,
+        "skipped_count": 0,
+        "total_products": 0,
+        "failed_chunks": [],
+    }
+
+@shared_task(name="app.tasks.price_update.dispatch_price_update")
+def dispatch_price_update(chunk_size=None, site_concurrency=None, priority=None):
+    """全商品の価格更新をサイト・ID範囲のチャンクに分割し、chordで並列実行するタスク
+    
+    設定は引数、省略時は環境変数から読み込む。
+        PRICE_UPDATE_CHUNK_SIZE: 1チャンクあたりの商品数
+        PRICE_UPDATE_SITE_CONCURRENCY: サイトごとに同時に実行するチャンク数（例: amazon=1,rakuten=4）
+        PRICE_UPDATE_DEFAULT_SITE_CONCURRENCY: 上記で指定しないサイトの同時実行チャンク数
+        PRICE_UPDATE_PRIORITY: チャンクタスクのメッセージ優先度
+    
+    チャンクタスクはそれぞれ取得エンジンを持つため、サイトのレート制限（DEFAULT_SITE_RATE_LIMITS）と
+    同時リクエスト数はそのサイトのレーン数で割って渡す。サイトへの実効レートはレーン数によらず設定値になる。
+    """
+    chunk_size = chunk_size or int(os.getenv("PRICE_UPDATE_CHUNK_SIZE", "500"))
+    if site_concurrency is None:
+        site_concurrency = parse_site_settings(os.getenv("PRICE_UPDATE_SITE_CONCURRENCY"))
+    default_concurrency = int(os.getenv("PRICE_UPDATE_DEFAULT_SITE_CONCURRENCY", "2"))
+    if priority is None and os.getenv("PRICE_UPDATE_PRIORITY"):
+        priority = int(os.getenv("PRICE_UPDATE_PRIORITY"))
+    options = {"priority": priority} if priority is not None else {}
     
+    db = SessionLocal()
+    try:
+        partitions = partition_products(db, chunk_size)
     finally:
         db.close()
+    
+    lanes = plan_lanes(partitions, site_concurrency, default_concurrency)
+    logger.info(f"Dispatching {len(partitions)} price update chunks in {len(lanes)} lanes")
+    if not lanes:
+        return {"success": True, "chunks": 0, "lanes": 0}
+    
+    # レーン内のチャンクは前のチャンクの集計を引き継ぎながら順番に実行する
+    lane_counts = Counter(lane[0][0] for lane in lanes)
+    header = group(
+        chain(*[
+            update_price_chunk.s(
+                *((None,) if index == 0 else ()), source, first_id, last_id, lanes=lane_counts[source]
+            ).set(**options)
+            for index, (source, first_id, last_id) in enumerate(lane)
+        ])
+        for lane in lanes
+    )
+    result = chord(header)(aggregate_price_update.s().set(**options))
+    
+    return {
+        "success": True,
+        "chunks": len(partitions),
+        "lanes": len(lanes),
+        "chord_id": result.id,
+    }
+
+@shared_task(name="app.tasks.price_update.update_price_chunk", acks_late=True)
+def update_price_chunk(previous, source, first_id, last_id, lanes=1):
+    """1チャンク（サイト・ID範囲）の価格を更新し、レーン内の集計に加算するタスク
+    
+    lanes は同じサイトのレーン数（サイトのレート制限・同時リクエスト数をこの数で割る）
+    """
+    summary = previous or empty_chunk_summary()
+    summary["chunks"] += 1
+    
+    try:
+        pipeline = PriceUpdatePipeline.from_env(session_factory=SessionLocal, **lane_limits(SITE_KEYS[source], lanes))
+        result = pipeline.run_range(source, first_id, last_id)
+        for key in ("updated_count", "error_count", "skipped_count", "total_products"):
+            summary[key] += result[key]
+    
+    except Exception as e:
+        # チャンクの失敗でレーンの残りが止まらないよう、失敗した範囲を記録して続ける
+        logger.error(f"Error updating prices for {source} {first_id}-{last_id}: {str(e)}")
+        summary["failed_chunks"].append([source, first_id, last_id])
+    
+    return summary
+
+@shared_task(name="app.tasks.price_update.aggregate_price_update")
+def aggregate_price_update(lane_summaries):
+    """全レーンの集計をまとめるchordのコールバック"""
+    total = empty_chunk_summary()
+    for lane_summary in lane_summaries:
+        for key in ("chunks", "updated_count", "error_count", "skipped_count", "total_products"):
+            total[key] += lane_summary[key]
+        total["failed_chunks"].extend(lane_summary["failed_chunks"])
+    
+    logger.info(
+        f"Price update completed. Chunks: {total['chunks']}, Updated: {total['updated_count']}, "
+        f"Errors: {total['error_count']}, Failed chunks: {len(total['failed_chunks'])}"
+    )
+    return {"success": not total["failed_chunks"], **total}
 
 @shared_task(name="app.tasks.price_update.update_product_price")
 def update_product_price(product_id):
@@ -175,44 +169,16 @@ def update_product_price(product_id):
             return {"success": False, "error": "Unknown product source"}
         
         # 商品URLからページを取得
-        soup = scraper.get_page(product.url)
-        if not soup:
+        html = scraper.get_html(product.url)
+        if not html:
             logger.error(f"Failed to fetch page for product {product.id}: {product.url}")
             return {"success": False, "error": "Failed to fetch product page"}
         
-        # 商品の価格情報を抽出（ソースに応じた処理）
-        # 実際の実装では、各スクレイパークラスに専用のメソッドを追加するべき
-        # この例では簡略化のため直接処理
+        # 商品の価格情報を抽出（抽出仕様は各スクレイパーで定義）
         try:
-            price = None
-            shipping_fee = None
-            
-            if product.source == 'Amazon':
-                price_elem = soup.select_one('.a-price .a-offscreen')
-                price_text = price_elem.text.strip() if price_elem else None
-                price = float(price_text.replace('￥', '').replace(',', '')) if price_text else None
-                
-                shipping_elem = soup.select_one('#deliveryBlockMessage')
-                shipping_text = shipping_elem.text.strip() if shipping_elem else None
-                shipping_fee = 0 if shipping_text and '無料' in shipping_text else None
-            
-            elif product.source == '楽天市場':
-                price_elem = soup.select_one('.price')
-                price_text = price_elem.text.strip() if price_elem else None
-                price = float(price_text.replace('円', '').replace(',', '')) if price_text else None
-                
-                shipping_elem = soup.select_one('.shipping')
-                shipping_text = shipping_elem.text.strip() if shipping_elem else None
-                shipping_fee = 0 if shipping_text and '無料' in shipping_text else None
-            
-            elif product.source == 'Yahoo!ショッピング':
-                price_elem = soup.select_one('.elPriceNumber')
-                price_text = price_elem.text.strip() if price_elem else None
-                price = float(price_text.replace('円', '').replace(',', '')) if price_text else None
-                
-                shipping_elem = soup.select_one('.elShippingOptions')
-                shipping_text = shipping_elem.text.strip() if shipping_elem else None
-                shipping_fee = 0 if shipping_text and '無料' in shipping_text else None
+            price_info = scraper.extract_price_info(html)
+            price = price_info['price']
+            shipping_fee = price_info['shipping_fee']
             
             # 価格情報が取得できなかった場合はエラー
             if price is None:
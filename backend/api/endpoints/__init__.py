@@ -1,10 +1,11 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
 # DB依存関係
 from database.base import get_db
 
 # 検索エンドポイント
+from services import product_suggest
 from services.product_service import ProductSearchService
 search_router = APIRouter(prefix="/search", tags=["検索"])
 
@@ -31,7 +32,23 @@ def search_products(
         category
     )
 
+@search_router.get("/suggest")
+def suggest_products(
+    q: str,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    """
+    入力補完エンドポイント（メモリ上の索引から候補の商品を返す）
+    """
+    return {
+        'query': q,
+        'suggestions': product_suggest.get_suggest_index(db).suggest(q, limit)
+    }
+
 # 価格履歴エンドポイント
+from uuid import UUID
+from services import price_analysis, price_forecast
 price_history_router = APIRouter(prefix="/price-history", tags=["価格履歴"])
 
 @price_history_router.get("/{product_id}")
@@ -41,6 +58,32 @@ def get_price_history(product_id: str, db: Session = Depends(get_db)):
     """
     return ProductSearchService.get_price_history(db, product_id)
 
+@price_history_router.get("/{product_id}/stats")
+def get_price_stats(product_id: UUID, db: Session = Depends(get_db)):
+    """
+    商品の価格統計取得エンドポイント（価格履歴を読み直さず、逐次統計を返す）
+    """
+    stats = price_analysis.get_price_stats(db, product_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="価格履歴が見つかりません")
+    return stats.summary()
+
+@price_history_router.get("/{product_id}/forecast")
+def get_price_forecast(product_id: UUID, db: Session = Depends(get_db)):
+    """
+    商品の予測価格取得エンドポイント（モデルを実行せず、一括予測ジョブの結果を返す）
+    """
+    forecast = price_forecast.get_price_forecast(db, product_id)
+    if forecast is None:
+        raise HTTPException(status_code=404, detail="予測価格が見つかりません")
+    return {
+        'product_id': forecast.product_id,
+        'predicted_price': forecast.predicted_price,
+        'current_price': forecast.current_price,
+        'horizon_days': forecast.horizon_days,
+        'generated_at': forecast.generated_at
+    }
+
 # 価格アラートエンドポイント
 from .price_alerts import router as price_alerts_router
 
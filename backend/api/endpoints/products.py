@@ -62,7 +62,9 @@ def search_products(
             query.query,
             min_price=query.min_price,
             max_price=query.max_price,
-            category=query.category
+            category=query.category,
+            limit=query.page_size,
+            offset=(query.page - 1) * query.page_size if query.page_size else 0
         )
         return results
     except Exception as e:
@@ -37,6 +37,8 @@ class ProductSearchRequest(BaseModel):
     category: Optional[str] = Field(default=None, example="エレクトロニクス", description="商品カテゴリ")
     min_price: Optional[float] = Field(default=None, example=10000, description="最小価格")
     max_price: Optional[float] = Field(default=None, example=100000, description="最大価格")
+    page: int = Field(default=1, ge=1, example=1, description="ページ番号")
+    page_size: Optional[int] = Field(default=None, ge=1, le=100, example=20, description="1ページの件数（省略時は全件）")
 
 class PriceHistoryEntry(BaseModel):
     """
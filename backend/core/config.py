@@ -27,6 +27,26 @@ class Settings(BaseSettings):
     # ロギング設定
     LOG_LEVEL: str = "INFO"
 
+    # 価格履歴のParquetエクスポート設定
+    PRICE_EXPORT_DIR: str = "data/price_history"
+    PRICE_EXPORT_BUCKETS: int = 64
+
+    # 学習済みモデルの設定
+    MODEL_REGISTRY_DIR: str = "data/models"
+    MODEL_CACHE_SIZE: int = 32
+    MODEL_RETRAIN_THRESHOLD: int = 50
+    PRICE_PREDICTOR_MODEL_PATH: str = "price_predictor_model.joblib"
+
+    # 一括価格予測ジョブの設定
+    PRICE_FORECAST_HORIZON_DAYS: int = 30
+    PRICE_FORECAST_CHUNK_SIZE: int = 10000
+    PRICE_FORECAST_WORKERS: int = 1
+
+    # 商品の重複検出の設定
+    PRODUCT_SIMILARITY_THRESHOLD: float = 0.8
+    PRODUCT_DEDUP_CANDIDATES: int = 20
+    PRODUCT_NAME_INDEX_PATH: str = "data/product_name_index.pkl"
+
     # サードパーティAPI設定
     EXTERNAL_API_BASE_URL: str = ""
     EXTERNAL_API_KEY: str = ""
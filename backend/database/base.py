@@ -5,31 +5,40 @@ from core.config import settings
 import time
 from sqlalchemy.exc import SQLAlchemyError
 
-def create_engine_with_retry(url, max_retries=5, delay=5):
+def create_database_engine(url):
     """
-    データベース接続を再試行する関数
-    
+    データベースエンジンを作成する関数
+
+    作成時には接続しない（モデルをインポートするだけのテストやツールはデータベースを必要としない）。
+    接続できるかどうかは起動時に wait_for_database() で確認する。
+
     Args:
         url (str): データベース接続URL
-        max_retries (int): 最大再試行回数
-        delay (int): 再試行間の待機時間（秒）
-    
+
     Returns:
         Engine: SQLAlchemyエンジン
     """
+    return create_engine(
+        url,
+        pool_pre_ping=True,          # 接続プールの健全性をチェック
+        pool_size=10,                # コネクションプールのサイズ
+        max_overflow=20,             # 追加のコネクション許容数
+        pool_timeout=30,             # 接続タイムアウト
+    )
+
+def wait_for_database(max_retries=5, delay=5):
+    """
+    データベースに接続できるまで再試行する関数
+
+    Args:
+        max_retries (int): 最大再試行回数
+        delay (int): 再試行間の待機時間（秒）
+    """
     for attempt in range(max_retries):
         try:
-            engine = create_engine(
-                url,
-                pool_pre_ping=True,          # 接続プールの健全性をチェック
-                pool_size=10,                # コネクションプールのサイズ
-                max_overflow=20,             # 追加のコネクション許容数
-                pool_timeout=30,             # 接続タイムアウト
-            )
-            # 接続テストを修正
             with engine.connect() as connection:
                 connection.execute(text("SELECT 1"))
-            return engine
+            return
         except SQLAlchemyError as e:
             if attempt < max_retries - 1:
                 print(f"データベース接続エラー、再試行します（{attempt + 1}/{max_retries}）: {e}")
@@ -39,7 +48,7 @@ def create_engine_with_retry(url, max_retries=5, delay=5):
                 raise
 
 # データベースエンジンの作成
-engine = create_engine_with_retry(str(settings.DATABASE_URL))
+engine = create_database_engine(str(settings.DATABASE_URL))
 
 # セッションファクトリーの作成
 SessionLocal = sessionmaker(
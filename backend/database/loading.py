@@ -0,0 +1,32 @@
+"""
+読み取り系エンドポイントのクエリで先に読み込む関連
+
+レスポンスのスキーマが参照する関連をクエリと一緒に読み込み、レスポンスの組み立て中に
+行ごとのSELECT（N+1）が発行されないようにする。結果の件数によらずクエリ数は一定になる。
+多対一の関連は joinedload（同じSELECTで結合）、一対多の関連は selectinload（IN で1回）を使う。
+"""
+from typing import Sequence
+
+from sqlalchemy.orm import Query, joinedload, selectinload
+from sqlalchemy.orm.interfaces import LoaderOption
+
+from database.models import Product
+
+# ProductResponse（external_sources）
+PRODUCT_RESPONSE = (selectinload(Product.external_sources),)
+
+# Product.current_price を参照する一覧（latest_price）
+PRODUCT_PRICE = (joinedload(Product.latest_price),)
+
+def shape(query: Query, loads: Sequence[LoaderOption]) -> Query:
+    """
+    レスポンスのスキーマに必要な関連を先に読み込むクエリにする
+
+    Args:
+        query (Query): クエリ
+        loads (Sequence[LoaderOption]): 読み込む関連（PRODUCT_RESPONSE など）
+
+    Returns:
+        Query: 関連を先に読み込むクエリ
+    """
+    return query.options(*loads)
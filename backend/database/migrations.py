@@ -1,30 +1,56 @@
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from .base import Base, DATABASE_URL
-from .models import User, Product, PriceHistory, PriceAlert, SearchHistory, ScrapingLog
+from database.base import Base, SessionLocal, engine as default_engine
+from database.models import Product
 
 def create_tables():
     """
     全テーブルを作成する関数
     """
-    # エンジンの作成
-    engine = create_engine(DATABASE_URL)
-    
+    from services import model_events
+
+    # 全文検索の索引などのテーブル作成時のDDLを登録してから作成する（アプリの起動時と同じ）
+    model_events.install(SessionLocal)
+
     # すべてのテーブルを作成
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=default_engine)
     print("データベーステーブルを作成しました。")
 
 def drop_tables():
     """
     全テーブルを削除する関数
     """
-    # エンジンの作成
-    engine = create_engine(DATABASE_URL)
-    
     # すべてのテーブルを削除
-    Base.metadata.drop_all(bind=engine)
+    Base.metadata.drop_all(bind=default_engine)
     print("データベーステーブルを削除しました。")
 
+def rebuild_search_index(engine=None):
+    """
+    全商品の全文検索用の文書と索引を作り直す関数
+
+    既存のデータベースには検索用文書の列と索引（PostgresのGIN索引、SQLiteのFTS5の仮想テーブルとトリガー）を
+    先に追加する。何度実行してもよい。
+
+    Args:
+        engine (Engine, optional): データベースエンジン（省略時はアプリのエンジン）
+
+    Returns:
+        int: 検索用の文書を作り直した商品数
+    """
+    from repositories.product_repository import ProductRepository
+    from services import product_search
+
+    engine = engine or default_engine
+    with engine.begin() as connection:
+        product_search.ensure_search_schema(connection, Product.__table__)
+
+    db = sessionmaker(bind=engine)()
+    try:
+        count = ProductRepository(db).rebuild_search_documents()
+    finally:
+        db.close()
+    print(f"{count}件の商品の検索用の文書を作り直しました。")
+    return count
+
 def reset_database():
     """
     データベースを完全にリセット
@@ -44,7 +70,9 @@ if __name__ == "__main__":
             drop_tables()
         elif command == "reset":
             reset_database()
+        elif command == "search":
+            rebuild_search_index()
         else:
-            print("使用法: python migrations.py [create|drop|reset]")
+            print("使用法: python -m database.migrations [create|drop|reset|search]")
     else:
-        print("使用法: python migrations.py [create|drop|reset]")
+        print("使用法: python -m database.migrations [create|drop|reset|search]")
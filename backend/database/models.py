@@ -1,9 +1,11 @@
 import uuid
+from typing import Optional
 from sqlalchemy import (
     Column, Integer, String, Float, 
     DateTime, Boolean, ForeignKey, Text, 
-    UniqueConstraint
+    UniqueConstraint, JSON, event, or_, select
 )
+from sqlalchemy.engine import Connection
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy.dialects.postgresql import UUID
@@ -36,13 +38,28 @@ class Product(Base):
     name = Column(String, nullable=False)
     category = Column(String)
     description = Column(Text)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # 商品名索引（services.product_name_index）が新しい商品だけを読み込むために索引を付ける
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    # 全文検索用の文書（商品名・カテゴリの bigram、保存時に services.product_search が作成する）
+    search_document = Column(Text)
     
     # リレーションシップ
     price_histories = relationship("PriceHistory", back_populates="product")
+    # 最新価格が必要な一覧は database.loading.PRODUCT_PRICE で同じSELECTに結合する
+    latest_price = relationship("ProductLatestPrice", back_populates="product", uselist=False)
     price_alerts = relationship("PriceAlert", back_populates="product")
     external_sources = relationship("ProductExternalSource", back_populates="product")
 
+    @property
+    def current_price(self) -> Optional[float]:
+        """
+        最新価格（価格履歴の追加時に更新される product_latest_price から取得）
+
+        Returns:
+            Optional[float]: 最新価格、価格履歴がない場合はNone
+        """
+        return self.latest_price.price if self.latest_price is not None else None
+
 class ProductExternalSource(Base):
     """
     商品の外部ソース情報
@@ -78,6 +95,115 @@ class PriceHistory(Base):
     # リレーションシップ
     product = relationship("Product", back_populates="price_histories")
 
+class ProductLatestPrice(Base):
+    """
+    商品ごとの最新価格モデル
+
+    価格履歴の追加と同じトランザクションで更新するため、
+    最新価格の参照は価格履歴を集計せずに主キーで引ける。
+    """
+    __tablename__ = 'product_latest_price'
+
+    product_id = Column(UUID(as_uuid=True), ForeignKey('products.id'), primary_key=True)
+    price_history_id = Column(Integer)
+    price = Column(Float, nullable=False)
+    source = Column(String)
+    scraped_at = Column(DateTime(timezone=True))
+
+    # リレーションシップ
+    product = relationship("Product", back_populates="latest_price")
+
+LATEST_PRICE_COLUMNS = ('product_id', 'price_history_id', 'price', 'source', 'scraped_at')
+
+def latest_price_upsert(connection: Connection, history_select):
+    """
+    価格履歴のSELECT結果で最新価格を追加・更新するINSERT文を作成
+
+    記録済みより古い価格履歴では上書きしない。
+
+    Args:
+        connection (Connection): 実行に使う接続（方言の判定に使う）
+        history_select: LATEST_PRICE_COLUMNS の順で列を返すSELECT
+
+    Returns:
+        Insert: ON CONFLICT 付きのINSERT文
+    """
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    statement = dialect_insert(ProductLatestPrice).from_select(list(LATEST_PRICE_COLUMNS), history_select)
+    return statement.on_conflict_do_update(
+        index_elements=[ProductLatestPrice.product_id],
+        set_={column: statement.excluded[column] for column in LATEST_PRICE_COLUMNS[1:]},
+        where=or_(
+            ProductLatestPrice.scraped_at.is_(None),
+            statement.excluded.scraped_at >= ProductLatestPrice.scraped_at,
+        ),
+    )
+
+def price_history_columns():
+    """
+    LATEST_PRICE_COLUMNS に対応する価格履歴の列
+
+    Returns:
+        tuple: 価格履歴の列
+    """
+    return (
+        PriceHistory.product_id,
+        PriceHistory.id,
+        PriceHistory.price,
+        PriceHistory.source,
+        PriceHistory.scraped_at,
+    )
+
+@event.listens_for(PriceHistory, 'after_insert')
+def update_latest_price(mapper, connection: Connection, target: PriceHistory) -> None:
+    """
+    価格履歴の追加時に、同じトランザクションで最新価格を更新する
+
+    scraped_at はDB側の既定値のため、挿入した行をSELECTして書き込む。
+    """
+    history_select = select(*price_history_columns()).where(PriceHistory.id == target.id)
+    connection.execute(latest_price_upsert(connection, history_select))
+
+class ProductPriceStats(Base):
+    """
+    商品ごとの価格の逐次統計モデル（RunningPriceStats を保存する）
+
+    価格履歴の追加と同じトランザクションで O(1) で更新するため（services.model_events で登録する）、
+    統計の参照は価格履歴を読み直さずに主キーで引ける。
+    """
+    __tablename__ = 'product_price_stats'
+
+    product_id = Column(UUID(as_uuid=True), ForeignKey('products.id'), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)
+    min_price = Column(Float)
+    max_price = Column(Float)
+    ewma = Column(Float)
+    last_price = Column(Float)
+    histogram_values = Column(JSON)  # 中央値推定用ヒストグラムのビンの価格
+    histogram_counts = Column(JSON)  # 中央値推定用ヒストグラムのビンの件数
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class PriceForecast(Base):
+    """
+    商品ごとの予測価格
+
+    一括予測ジョブ（services.price_forecast）が全商品分をまとめて書き込み、
+    予測エンドポイントはモデルを実行せずにこのテーブルを読む。
+    """
+    __tablename__ = 'price_forecasts'
+
+    product_id = Column(UUID(as_uuid=True), ForeignKey('products.id'), primary_key=True)
+    predicted_price = Column(Float, nullable=False)
+    current_price = Column(Float)  # 予測に使った最新価格
+    horizon_days = Column(Integer, nullable=False)
+    generated_at = Column(DateTime(timezone=True), nullable=False)
+
 class PriceAlert(Base):
     """
     価格アラートモデル
@@ -11,11 +11,13 @@ from api.endpoints import (
 
 # コンフィグとDB初期化
 from core.config import settings
-from database.base import engine, Base, get_db
+from database.base import engine, Base, SessionLocal, get_db, wait_for_database
 from sqlalchemy.orm import Session
 
 # 初期データ投入用
 from services.product_service import initialize_test_data
+from services import model_events
+from services.product_suggest import get_suggest_index
 
 # アプリケーションの初期化
 app = FastAPI(
@@ -42,12 +44,21 @@ app.include_router(recommendations_router)
 # データベーステーブルの作成
 @app.on_event("startup")
 def startup():
+    # データベースが起動するまで待つ
+    wait_for_database()
+
+    # 全文検索の索引・入力補完の索引・価格の逐次統計を保存時に更新するイベント（テーブルの作成前に登録する）
+    model_events.install(SessionLocal)
+
     # テーブルの作成
     Base.metadata.create_all(bind=engine)
     
     # テスト用データの初期化
     db = next(get_db())
     initialize_test_data(db)
+    
+    # 最初の入力補完のリクエストで全商品を読まずに済むよう、索引を作っておく
+    get_suggest_index(db)
 
 # ヘルスチェックエンドポイント
 @app.get("/health")
@@ -6,8 +6,20 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 import joblib
 import os
+import threading
 from typing import Dict, Any, Optional
 
+# モデルの特徴量（この順で特徴量行列の列を並べる）
+FEATURES = [
+    'original_price', 
+    'discount_rate', 
+    'days_since_last_sale', 
+    'seasonal_factor'
+]
+
+# predict_batch で1回にスケーリング・予測する行数
+PREDICT_CHUNK_SIZE = 10000
+
 class PricePredictor:
     """
     価格予測モデルのクラス
@@ -41,18 +53,10 @@ class PricePredictor:
         Returns:
             tuple: 特徴量とターゲット変数
         """
-        # 特徴量の選択
-        features = [
-            'original_price', 
-            'discount_rate', 
-            'days_since_last_sale', 
-            'seasonal_factor'
-        ]
-        
         # 欠損値の処理
-        data = data.dropna(subset=features + ['price'])
+        data = data.dropna(subset=FEATURES + ['price'])
         
-        X = data[features]
+        X = data[FEATURES]
         y = data['price']
         
         return X, y
@@ -102,20 +106,12 @@ class PricePredictor:
             Optional[float]: 予測価格、予測不能な場合はNone
         """
         try:
-            # 必要な特徴量の確認
-            required_features = [
-                'original_price', 
-                'discount_rate', 
-                'days_since_last_sale', 
-                'seasonal_factor'
-            ]
-            
             # 特徴量の欠損チェック
-            if not all(f in features for f in required_features):
+            if not all(f in features for f in FEATURES):
                 return None
             
             # 特徴量の抽出とスケーリング
-            X = pd.DataFrame([features])
+            X = pd.DataFrame([features], columns=FEATURES)
             X_scaled = self.scaler.transform(X)
             
             # 予測
@@ -127,6 +123,27 @@ class PricePredictor:
             print(f"価格予測中のエラー: {e}")
             return None
     
+    def predict_batch(self, X: np.ndarray, chunk_size: int = PREDICT_CHUNK_SIZE) -> np.ndarray:
+        """
+        複数の商品の価格をまとめて予測
+        
+        1行ずつ predict を呼ぶと行ごとにデータフレームの作成とスケーリングが発生するため、
+        特徴量行列を chunk_size 行ずつスケーリングして予測する。
+        
+        Args:
+            X (np.ndarray): FEATURES の順に列を並べた特徴量行列
+            chunk_size (int): 1回に予測する行数
+        
+        Returns:
+            np.ndarray: 行ごとの予測価格
+        """
+        X = np.asarray(X, dtype=np.float64)
+        predictions = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), chunk_size):
+            chunk = pd.DataFrame(X[start:start + chunk_size], columns=FEATURES)
+            predictions[start:start + chunk_size] = self.model.predict(self.scaler.transform(chunk))
+        return predictions
+    
     def save_model(self, path: str = 'price_predictor_model.joblib'):
         """
         モデルの保存
@@ -141,13 +158,13 @@ class PricePredictor:
     
     def load_model(self, path: str):
         """
-        モデルのロード
+        モデルのロード（NumPy配列はメモリマップで読み込み、プロセス間でページを共有する）
         
         Args:
             path (str): モデル読み込みパス
         """
         try:
-            loaded_data = joblib.load(path)
+            loaded_data = joblib.load(path, mmap_mode='r')
             self.model = loaded_data['model']
             self.scaler = loaded_data['scaler']
         except Exception as e:
@@ -158,6 +175,23 @@ class PricePredictor:
                 random_state=42
             )
 
+_shared_predictor: Optional[PricePredictor] = None
+_shared_predictor_lock = threading.Lock()
+
+def get_price_predictor() -> PricePredictor:
+    """
+    設定のパスから読み込んだ共有の価格予測モデル（リクエストごとにモデルを作り直さない）
+    
+    Returns:
+        PricePredictor: 価格予測モデル
+    """
+    global _shared_predictor
+    with _shared_predictor_lock:
+        if _shared_predictor is None:
+            from core.config import settings
+            _shared_predictor = PricePredictor(settings.PRICE_PREDICTOR_MODEL_PATH)
+        return _shared_predictor
+
 # モデルの使用例
 def generate_sample_data() -> pd.DataFrame:
     """
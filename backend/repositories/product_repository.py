@@ -1,8 +1,14 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import bindparam, func, insert, select, update
 
-from database.models import Product, PriceHistory
+from database import loading
+from database.models import (
+    Product, PriceHistory, ProductLatestPrice, ProductPriceStats, PriceForecast,
+    LATEST_PRICE_COLUMNS, price_history_columns
+)
+from services.price_analysis import RunningPriceStats
+from services import price_forecast, product_search
 from repositories.base import BaseRepository
 from core.exceptions import ProductNotFoundError
 
@@ -40,6 +46,24 @@ class ProductRepository(BaseRepository[Product]):
         """
         return self.db.query(Product).filter(Product.id == product_id).first()
 
+    def get_by_ids(self, product_ids: List[int]) -> List[Product]:
+        """
+        複数の商品を1回のクエリで取得
+
+        Args:
+            product_ids (List[int]): 取得する商品のID
+
+        Returns:
+            List[Product]: 見つかった商品のリスト（存在しないIDは含まない）
+        """
+        if not product_ids:
+            return []
+        return (
+            loading.shape(self.db.query(Product), loading.PRODUCT_PRICE)
+            .filter(Product.id.in_(product_ids))
+            .all()
+        )
+
     def get_by_external_id(self, external_id: str, source_site: str) -> Optional[Product]:
         """
         外部IDとソースサイトによる商品の取得
@@ -124,20 +148,22 @@ class ProductRepository(BaseRepository[Product]):
         Returns:
             List[Product]: 検索結果の商品リスト
         """
-        search_query = self.db.query(Product)
+        # 結果の最新価格（current_price）は同じSELECTで読み込む
+        search_query = loading.shape(self.db.query(Product), loading.PRODUCT_PRICE)
 
-        # 名前での検索
+        # 名前・カテゴリの全文検索（関連度順）
         if query:
-            search_query = search_query.filter(
-                func.lower(Product.name).like(f"%{query.lower()}%")
-            )
+            search_query = product_search.match_products(self.db, search_query, query, Product)
+
+        # 価格範囲での検索（最新価格は product_latest_price から引く）
+        if min_price is not None or max_price is not None:
+            search_query = search_query.join(ProductLatestPrice)
 
-        # 価格範囲での検索
         if min_price is not None:
-            search_query = search_query.filter(Product.current_price >= min_price)
+            search_query = search_query.filter(ProductLatestPrice.price >= min_price)
         
         if max_price is not None:
-            search_query = search_query.filter(Product.current_price <= max_price)
+            search_query = search_query.filter(ProductLatestPrice.price <= max_price)
 
         return search_query.all()
 
@@ -157,3 +183,170 @@ class ProductRepository(BaseRepository[Product]):
             .order_by(PriceHistory.recorded_at.desc())
             .all()
         )
+
+    def get_price_histories(self, product_ids: List[int]) -> Dict[int, List[PriceHistory]]:
+        """
+        複数の商品の価格履歴を1回のクエリで取得
+
+        Args:
+            product_ids (List[int]): 価格履歴を取得する商品のID
+
+        Returns:
+            Dict[int, List[PriceHistory]]: 商品IDごとの価格履歴（get_price_history と同じく新しい順）
+        """
+        histories: Dict[int, List[PriceHistory]] = {product_id: [] for product_id in product_ids}
+        if not product_ids:
+            return histories
+
+        query = (
+            self.db.query(PriceHistory)
+            .filter(PriceHistory.product_id.in_(product_ids))
+            .order_by(PriceHistory.product_id, PriceHistory.scraped_at.desc(), PriceHistory.id.desc())
+        )
+        for history in query:
+            histories[history.product_id].append(history)
+        return histories
+
+    def get_price_forecast(self, product_id: int) -> Optional[PriceForecast]:
+        """
+        一括予測ジョブが書き込んだ商品の予測価格を取得
+
+        Args:
+            product_id (int): 商品ID
+
+        Returns:
+            Optional[PriceForecast]: 予測価格、まだ予測していない場合はNone
+        """
+        return price_forecast.get_price_forecast(self.db, product_id)
+
+    def refresh_price_forecasts(
+        self,
+        model_path: str,
+        horizon_days: int = 30,
+        chunk_size: int = price_forecast.PREDICT_CHUNK_SIZE,
+        n_jobs: int = 1
+    ) -> int:
+        """
+        全商品の価格をまとめて予測し、予測価格を書き直す
+
+        Args:
+            model_path (str): 学習済みモデルのパス
+            horizon_days (int): 予測日数
+            chunk_size (int): 1回に予測する行数
+            n_jobs (int): 予測の並列数
+
+        Returns:
+            int: 予測した商品数
+        """
+        try:
+            count = price_forecast.run_price_forecast(
+                self.db.connection(), model_path,
+                horizon_days=horizon_days, chunk_size=chunk_size, n_jobs=n_jobs
+            )
+            self.commit()
+        except Exception as e:
+            self.rollback()
+            raise e
+
+        return count
+
+    def rebuild_search_documents(self, batch_size: int = 10000) -> int:
+        """
+        全商品の全文検索用の文書を作り直す（検索語の分割方法の変更時や既存データの移行用）
+
+        Args:
+            batch_size (int): 1回に読み込む商品数
+
+        Returns:
+            int: 更新した商品数
+        """
+        products = select(Product.id, Product.name, Product.category)
+        count = 0
+        try:
+            for rows in self.db.execute(products, execution_options={'yield_per': batch_size}).partitions():
+                self.db.execute(
+                    update(Product.__table__).where(Product.__table__.c.id == bindparam('product_id')),
+                    [
+                        {'product_id': product_id, 'search_document': product_search.search_document(name, category)}
+                        for product_id, name, category in rows
+                    ]
+                )
+                count += len(rows)
+            product_search.rebuild_sqlite_fts(self.db.connection())
+            self.commit()
+        except Exception as e:
+            self.rollback()
+            raise e
+
+        return count
+
+    def rebuild_latest_prices(self) -> int:
+        """
+        商品ごとの最新価格を価格履歴から作り直す（書き込み漏れの修復用）
+
+        Returns:
+            int: 最新価格を記録した商品数
+        """
+        ranked = select(
+            *price_history_columns(),
+            func.row_number().over(
+                partition_by=PriceHistory.product_id,
+                order_by=(PriceHistory.scraped_at.desc(), PriceHistory.id.desc())
+            ).label('rank')
+        ).subquery()
+        latest = select(*list(ranked.c)[:len(LATEST_PRICE_COLUMNS)]).where(ranked.c.rank == 1)
+
+        try:
+            self.db.query(ProductLatestPrice).delete(synchronize_session=False)
+            self.db.execute(
+                insert(ProductLatestPrice).from_select(list(LATEST_PRICE_COLUMNS), latest)
+            )
+            self.commit()
+        except Exception as e:
+            self.rollback()
+            raise e
+
+        return self.db.query(func.count(ProductLatestPrice.product_id)).scalar()
+
+    def rebuild_price_stats(self, batch_size: int = 10000) -> int:
+        """
+        商品ごとの価格の逐次統計を価格履歴から作り直す（書き込み漏れの修復用）
+
+        価格履歴は商品・取得日時順に batch_size 行ずつ読み込み、商品ごとに統計を更新する。
+
+        Args:
+            batch_size (int): 1回に読み込む行数
+
+        Returns:
+            int: 統計を記録した商品数
+        """
+        histories = (
+            select(PriceHistory.product_id, PriceHistory.price)
+            .where(PriceHistory.product_id.isnot(None))
+            .order_by(PriceHistory.product_id, PriceHistory.scraped_at, PriceHistory.id)
+        )
+
+        try:
+            self.db.query(ProductPriceStats).delete(synchronize_session=False)
+            records = []
+            product_id, stats = None, None
+            for rows in self.db.execute(histories, execution_options={'yield_per': batch_size}).partitions():
+                for row_product_id, price in rows:
+                    if row_product_id != product_id:
+                        if stats is not None:
+                            records.append({'product_id': product_id, **stats.to_record()})
+                        product_id, stats = row_product_id, RunningPriceStats()
+                    stats.update(price)
+                if len(records) >= batch_size:
+                    self.db.execute(insert(ProductPriceStats), records)
+                    records = []
+            if stats is not None:
+                records.append({'product_id': product_id, **stats.to_record()})
+            if records:
+                self.db.execute(insert(ProductPriceStats), records)
+            self.commit()
+        except Exception as e:
+            self.rollback()
+            raise e
+
+        return self.db.query(func.count(ProductPriceStats.product_id)).scalar()
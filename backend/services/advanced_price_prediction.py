@@ -1,28 +1,29 @@
 import numpy as np
 import pandas as pd
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 from datetime import datetime, timedelta
 import statistics
 from sklearn.linear_model import LinearRegression
 from sklearn.preprocessing import PolynomialFeatures
 
 class AdvancedPricePredictionModel:
-    def __init__(self, historical_prices: List[Dict]):
+    def __init__(self, historical_prices: Union[List[Dict], pd.DataFrame]):
         """
         高度な価格予測モデル
         
         Args:
-            historical_prices (List[Dict]): 価格履歴データ
-                各エントリは {'date': str, 'price': float} の形式
+            historical_prices (Union[List[Dict], pd.DataFrame]): 価格履歴データ
+                各エントリは {'date': str, 'price': float} の形式、または date, price 列のデータフレーム
+                （price_export.read_price_frame・load_price_frame の戻り値をそのまま渡せる）
         """
         self.historical_prices = self._preprocess_data(historical_prices)
     
-    def _preprocess_data(self, historical_prices: List[Dict]) -> pd.DataFrame:
+    def _preprocess_data(self, historical_prices: Union[List[Dict], pd.DataFrame]) -> pd.DataFrame:
         """
         データの前処理と特徴量エンジニアリング
         
         Args:
-            historical_prices (List[Dict]): 生の価格履歴
+            historical_prices (Union[List[Dict], pd.DataFrame]): 生の価格履歴
         
         Returns:
             pd.DataFrame: 前処理されたデータフレーム
@@ -173,12 +174,12 @@ class AdvancedPricePredictionModel:
         
         return recommendation
 
-def comprehensive_price_analysis(historical_prices: List[Dict]) -> Dict:
+def comprehensive_price_analysis(historical_prices: Union[List[Dict], pd.DataFrame]) -> Dict:
     """
     総合的な価格分析
     
     Args:
-        historical_prices (List[Dict]): 価格履歴データ
+        historical_prices (Union[List[Dict], pd.DataFrame]): 価格履歴データ
     
     Returns:
         Dict: 包括的な価格分析結果
@@ -1,8 +1,10 @@
+import time
 import numpy as np
 import pandas as pd
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional, Tuple, Union
 from datetime import datetime, timedelta
 
+from joblib import Parallel, delayed
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, PolynomialFeatures
 from sklearn.pipeline import Pipeline
@@ -10,18 +12,91 @@ from sklearn.linear_model import Ridge, Lasso
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 
+from services import model_registry
+from services.model_registry import ModelRegistry
+
+# 特徴量セットのバージョン（特徴量を変えたら上げ、保存済みのモデルを使わないようにする）
+FEATURE_SET_VERSION = 1
+
+# モデルの特徴量
+FEATURE_COLUMNS = [
+    'days_since_start', 'price_7d_ma', 'price_30d_ma',
+    'price_change', 'price_change_pct',
+    'month', 'day_of_week',
+    'price_lag_1', 'price_lag_7', 'price_lag_14', 'price_lag_30',
+    'external_factor'
+]
+
+# モデルを並列に学習するプロセス数（-1 で全コア）
+DEFAULT_N_JOBS = -1
+
+def build_candidate_models() -> Dict[str, Any]:
+    """
+    学習する候補モデルを生成
+
+    Returns:
+        Dict[str, Any]: モデル名ごとの未学習のモデル
+    """
+    return {
+        'ridge_regression': Pipeline([
+            ('scaler', StandardScaler()),
+            ('poly', PolynomialFeatures(degree=2)),
+            ('regressor', Ridge(alpha=1.0))
+        ]),
+        'lasso_regression': Pipeline([
+            ('scaler', StandardScaler()),
+            ('poly', PolynomialFeatures(degree=2)),
+            ('regressor', Lasso(alpha=1.0))
+        ]),
+        'random_forest': RandomForestRegressor(
+            n_estimators=100,
+            random_state=42
+        ),
+        'gradient_boosting': GradientBoostingRegressor(
+            n_estimators=100,
+            random_state=42
+        )
+    }
+
+def _fit_and_evaluate(
+    name: str,
+    model: Any,
+    X_train: pd.DataFrame,
+    X_test: pd.DataFrame,
+    y_train: pd.Series,
+    y_test: pd.Series
+) -> Tuple[str, Any, Dict[str, float]]:
+    """
+    1つのモデルを学習して評価（ワーカープロセスで実行する）
+
+    Returns:
+        Tuple[str, Any, Dict[str, float]]: (モデル名, 学習済みモデル, 評価指標と学習時間)
+    """
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    train_seconds = time.perf_counter() - started
+    y_pred = model.predict(X_test)
+
+    return name, model, {
+        'mse': mean_squared_error(y_test, y_pred),
+        'mae': mean_absolute_error(y_test, y_pred),
+        'r2': r2_score(y_test, y_pred),
+        'train_seconds': train_seconds
+    }
+
 class AdvancedPricePredictionModel:
-    def __init__(self, historical_data: List[Dict]):
+    def __init__(self, historical_data: Union[List[Dict], pd.DataFrame]):
         """
         高度な価格予測モデル
         
         Args:
-            historical_data (List[Dict]): 価格履歴データ
+            historical_data (Union[List[Dict], pd.DataFrame]): 価格履歴データ
+                （date, price 列のデータフレームも渡せる）
         """
         self.df = self._preprocess_data(historical_data)
         self.models = {}
     
-    def _preprocess_data(self, historical_data: List[Dict]) -> pd.DataFrame:
+    def _preprocess_data(self, historical_data: Union[List[Dict], pd.DataFrame]) -> pd.DataFrame:
         """
         データの前処理と特徴量エンジニアリング
         
@@ -64,105 +139,95 @@ class AdvancedPricePredictionModel:
         Returns:
             tuple: X_train, X_test, y_train, y_test
         """
-        # 特徴量の選択
-        feature_columns = [
-            'days_since_start', 'price_7d_ma', 'price_30d_ma', 
-            'price_change', 'price_change_pct', 
-            'month', 'day_of_week', 
-            'price_lag_1', 'price_lag_7', 'price_lag_14', 'price_lag_30',
-            'external_factor'
-        ]
-        
-        X = self.df[feature_columns]
+        X = self.df[FEATURE_COLUMNS]
         y = self.df['price']
         
         return train_test_split(X, y, test_size=0.2, random_state=42)
     
-    def train_models(self):
+    def train_models(self, model_names: Optional[List[str]] = None, n_jobs: int = DEFAULT_N_JOBS):
         """
-        複数の機械学習モデルをトレーニング
+        複数の機械学習モデルを並列にトレーニング
+        
+        各モデルは joblib（loky）のワーカープロセスで学習し、評価指標と合わせて
+        学習にかかった時間（train_seconds）を返す。
+        
+        Args:
+            model_names (Optional[List[str]]): 学習するモデル名（省略時は全モデル）
+            n_jobs (int): 並列数（-1 で全コア、1 で並列化しない）
+        
+        Returns:
+            Dict: モデル名ごとの評価指標と学習時間
         """
         X_train, X_test, y_train, y_test = self._prepare_features_and_target()
-        
-        # モデル定義
-        models = {
-            'ridge_regression': Pipeline([
-                ('scaler', StandardScaler()),
-                ('poly', PolynomialFeatures(degree=2)),
-                ('regressor', Ridge(alpha=1.0))
-            ]),
-            'lasso_regression': Pipeline([
-                ('scaler', StandardScaler()),
-                ('poly', PolynomialFeatures(degree=2)),
-                ('regressor', Lasso(alpha=1.0))
-            ]),
-            'random_forest': RandomForestRegressor(
-                n_estimators=100, 
-                random_state=42
-            ),
-            'gradient_boosting': GradientBoostingRegressor(
-                n_estimators=100, 
-                random_state=42
-            )
-        }
+        candidates = build_candidate_models()
+        if model_names is not None:
+            unknown = set(model_names) - set(candidates)
+            if unknown:
+                raise ValueError(f"モデル {', '.join(sorted(unknown))} が見つかりません")
+            candidates = {name: candidates[name] for name in model_names}
         
         # モデルのトレーニングと評価
+        fitted = Parallel(n_jobs=min(n_jobs, len(candidates)) if n_jobs > 0 else n_jobs, backend='loky')(
+            delayed(_fit_and_evaluate)(name, model, X_train, X_test, y_train, y_test)
+            for name, model in candidates.items()
+        )
+        
         results = {}
-        for name, model in models.items():
-            model.fit(X_train, y_train)
-            y_pred = model.predict(X_test)
-            
-            results[name] = {
-                'mse': mean_squared_error(y_test, y_pred),
-                'mae': mean_absolute_error(y_test, y_pred),
-                'r2': r2_score(y_test, y_pred)
-            }
-            
-            # 最適なモデルを保存
+        for name, model, metrics in fitted:
+            results[name] = metrics
             self.models[name] = model
         
         return results
     
-    def predict_price(self, days_ahead: int = 30, model_name: str = 'gradient_boosting'):
+    def _future_features(self, days_ahead: int):
         """
-        指定されたモデルで将来の価格を予測
+        最新のデータポイントを基準に将来の特徴量を生成
         
         Args:
             days_ahead (int): 予測する日数
-            model_name (str): 使用するモデル名
         
         Returns:
-            Dict: 価格予測結果
+            tuple: (将来の日付, 特徴量のデータフレーム)
         """
-        if model_name not in self.models:
-            raise ValueError(f"モデル {model_name} が見つかりません")
-        
-        # 最新のデータポイントを基準に将来の特徴量を生成
         last_row = self.df.iloc[-1]
         future_dates = pd.date_range(
             start=last_row['date'] + timedelta(days=1), 
             periods=days_ahead
         )
         
-        future_features = []
-        for i, date in enumerate(future_dates):
-            future_feature = {
-                'days_since_start': (date - self.df['date'].min()).days,
-                'price_7d_ma': last_row['price_7d_ma'],
-                'price_30d_ma': last_row['price_30d_ma'],
-                'price_change': last_row['price_change'],
-                'price_change_pct': last_row['price_change_pct'],
-                'month': date.month,
-                'day_of_week': date.dayofweek,
-                'price_lag_1': last_row['price'],
-                'price_lag_7': last_row['price_lag_7'],
-                'price_lag_14': last_row['price_lag_14'],
-                'price_lag_30': last_row['price_lag_30'],
-                'external_factor': np.random.normal(1, 0.1)
-            }
-            future_features.append(future_feature)
+        # 最新の値を繰り返す列と日付から求める列をまとめて作る
+        future_df = pd.DataFrame({
+            'days_since_start': (future_dates - self.df['date'].min()).days,
+            'price_7d_ma': last_row['price_7d_ma'],
+            'price_30d_ma': last_row['price_30d_ma'],
+            'price_change': last_row['price_change'],
+            'price_change_pct': last_row['price_change_pct'],
+            'month': future_dates.month,
+            'day_of_week': future_dates.dayofweek,
+            'price_lag_1': last_row['price'],
+            'price_lag_7': last_row['price_lag_7'],
+            'price_lag_14': last_row['price_lag_14'],
+            'price_lag_30': last_row['price_lag_30'],
+            'external_factor': np.random.normal(1, 0.1, days_ahead)
+        }, columns=FEATURE_COLUMNS)
+        
+        return future_dates, future_df
+    
+    def predict_price(self, days_ahead: int = 30, model_name: str = 'gradient_boosting'):
+        """
+        指定されたモデルで将来の価格を予測
+        
+        Args:
+            days_ahead (int): 予測する日数
+            model_name (str): 使用するモデル名
         
-        future_df = pd.DataFrame(future_features)
+        Returns:
+            Dict: 価格予測結果
+        """
+        if model_name not in self.models:
+            raise ValueError(f"モデル {model_name} が見つかりません")
+        
+        future_dates, future_df = self._future_features(days_ahead)
         
         # モデルによる予測
         predictions = self.models[model_name].predict(future_df)
@@ -173,44 +238,78 @@ class AdvancedPricePredictionModel:
             'predicted_prices': predictions.tolist()
         }
     
-    def ensemble_prediction(self):
+    def ensemble_prediction(self, days_ahead: int = 30):
         """
         アンサンブル予測
         
+        将来の特徴量は1度だけ作り、全モデルで同じものを使って予測する。
+        
+        Args:
+            days_ahead (int): 予測する日数
+        
         Returns:
             Dict: アンサンブル予測結果
         """
+        future_dates, future_df = self._future_features(days_ahead)
+        dates = future_dates.tolist()
+        
+        predictions = np.empty((len(self.models), days_ahead))
         ensemble_predictions = {}
-        for model_name in self.models.keys():
-            ensemble_predictions[model_name] = self.predict_price(model_name=model_name)
+        for index, (model_name, model) in enumerate(self.models.items()):
+            predictions[index] = model.predict(future_df)
+            ensemble_predictions[model_name] = {
+                'model': model_name,
+                'dates': dates,
+                'predicted_prices': predictions[index].tolist()
+            }
         
         # 各モデルの予測を平均化
-        averaged_predictions = np.mean([
-            pred['predicted_prices'] for pred in ensemble_predictions.values()
-        ], axis=0)
+        averaged_predictions = predictions.mean(axis=0)
         
         return {
             'ensemble_prediction': averaged_predictions.tolist(),
             'individual_predictions': ensemble_predictions
         }
 
-def comprehensive_price_prediction(historical_data: List[Dict]) -> Dict:
+def comprehensive_price_prediction(
+    historical_data: Union[List[Dict], pd.DataFrame],
+    scope: Optional[str] = None,
+    registry: Optional[ModelRegistry] = None,
+    days_ahead: int = 30
+) -> Dict:
     """
     価格予測の包括的な分析
     
+    scope を指定した場合、学習済みモデルをレジストリから使い、
+    学習時から価格が十分に増えたときだけ再学習する。
+    
     Args:
-        historical_data (List[Dict]): 価格履歴データ
+        historical_data (Union[List[Dict], pd.DataFrame]): 価格履歴データ
+        scope (Optional[str]): モデルの対象（'product:<ID>' や 'category:<名前>'）
+        registry (Optional[ModelRegistry]): モデルレジストリ（省略時は共有のレジストリ）
+        days_ahead (int): 予測する日数
     
     Returns:
         Dict: 価格予測結果
     """
     model = AdvancedPricePredictionModel(historical_data)
     
-    # モデルのトレーニング
-    model_performance = model.train_models()
+    # モデルのトレーニング（レジストリがあれば学習済みモデルを使う）
+    if scope is not None:
+        registry = registry or model_registry.get_model_registry()
+        
+        def train():
+            performance = model.train_models()
+            return dict(model.models), performance
+        
+        registered = registry.get_or_train(scope, FEATURE_SET_VERSION, len(historical_data), train)
+        model.models = dict(registered.models)
+        model_performance = registered.metrics
+    else:
+        model_performance = model.train_models()
     
     # 価格予測
-    predictions = model.ensemble_prediction()
+    predictions = model.ensemble_prediction(days_ahead)
     
     return {
         'model_performance': model_performance,
@@ -0,0 +1,22 @@
+"""
+モデルの保存・セッションのコミットに連動する処理の登録
+
+database.models はサービスに依存しないため、全文検索用の文書と索引・入力補完の索引・
+価格の逐次統計の更新はここでまとめて登録する。アプリ・ワーカーの起動時（テーブルの作成前）に
+install() を呼ぶ。セッションのイベントは渡したファクトリーのセッションだけに登録する。
+"""
+from typing import Any
+
+from database.models import Product
+from services import price_analysis, product_search, product_suggest
+
+def install(session_factory: Any) -> None:
+    """
+    モデル・セッションのイベントを登録する（2回目以降は何もしない）
+
+    Args:
+        session_factory: イベントを登録するセッションのファクトリー（sessionmaker）またはセッション
+    """
+    product_search.install(Product)
+    product_suggest.install(Product, session_factory)
+    price_analysis.install_price_stats(session_factory)
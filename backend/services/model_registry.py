@@ -0,0 +1,237 @@
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import joblib
+
+# 新しい価格がこの件数以上増えたらモデルを再学習する
+DEFAULT_RETRAIN_THRESHOLD = 50
+
+# メモリに保持する学習済みモデルの最大数
+DEFAULT_CACHE_SIZE = 32
+
+@dataclass
+class RegisteredModel:
+    """
+    登録された学習済みモデル
+
+    Attributes:
+        scope (str): モデルの対象（'product:<ID>' や 'category:<名前>'）
+        feature_version (int): 学習に使った特徴量セットのバージョン
+        watermark (int): 学習に使った価格の件数
+        models (Dict[str, Any]): モデル名ごとの学習済みモデル
+        metrics (Dict[str, Any]): モデル名ごとの評価指標
+        trained_at (datetime): 学習日時
+    """
+    scope: str
+    feature_version: int
+    watermark: int
+    models: Dict[str, Any]
+    metrics: Dict[str, Any] = field(default_factory=dict)
+    trained_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+class ModelRegistry:
+    """
+    学習済みモデルのレジストリ
+
+    モデルは (対象, 特徴量セットのバージョン) ごとに joblib で1ファイルに保存し、
+    読み込み時はNumPy配列をメモリマップする。よく使うモデルはLRUでメモリに保持し、
+    学習時から価格が retrain_threshold 件以上増えるまでは再学習しない。
+    """
+    def __init__(
+        self,
+        root: str,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        retrain_threshold: int = DEFAULT_RETRAIN_THRESHOLD,
+    ):
+        """
+        初期化メソッド
+
+        Args:
+            root (str): モデルを保存するディレクトリ
+            cache_size (int): メモリに保持するモデルの最大数
+            retrain_threshold (int): 再学習する新しい価格の件数
+        """
+        self.root = root
+        self.cache_size = cache_size
+        self.retrain_threshold = retrain_threshold
+        # (対象, バージョン) -> (ファイルの更新時刻, モデル)
+        self._cache: 'OrderedDict[Tuple[str, int], Tuple[int, RegisteredModel]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._train_locks: Dict[Tuple[str, int], threading.Lock] = {}
+        self.stats = {'hits': 0, 'loads': 0, 'trainings': 0}
+
+    def path(self, scope: str, feature_version: int) -> str:
+        """
+        モデルの保存先のパス
+
+        Args:
+            scope (str): モデルの対象
+            feature_version (int): 特徴量セットのバージョン
+
+        Returns:
+            str: ファイルパス
+        """
+        filename = re.sub(r'[^0-9A-Za-z_.-]', '_', scope)
+        return os.path.join(self.root, f'v{feature_version}', f'{filename}.joblib')
+
+    def get(self, scope: str, feature_version: int) -> Optional[RegisteredModel]:
+        """
+        学習済みモデルを取得（メモリになければファイルからメモリマップで読み込む）
+
+        他のプロセスがファイルを更新していた場合は読み込み直す。
+
+        Args:
+            scope (str): モデルの対象
+            feature_version (int): 特徴量セットのバージョン
+
+        Returns:
+            Optional[RegisteredModel]: 学習済みモデル、未登録の場合はNone
+        """
+        key = (scope, feature_version)
+        path = self.path(scope, feature_version)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            with self._lock:
+                self._cache.pop(key, None)
+            return None
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] == mtime:
+                self._cache.move_to_end(key)
+                self.stats['hits'] += 1
+                return cached[1]
+
+        registered = joblib.load(path, mmap_mode='r')
+        with self._lock:
+            self.stats['loads'] += 1
+            self._remember(key, mtime, registered)
+        return registered
+
+    def put(
+        self,
+        scope: str,
+        feature_version: int,
+        watermark: int,
+        models: Dict[str, Any],
+        metrics: Optional[Dict[str, Any]] = None,
+    ) -> RegisteredModel:
+        """
+        学習済みモデルを登録（ファイルは一時ファイルに書いてから置き換える）
+
+        Args:
+            scope (str): モデルの対象
+            feature_version (int): 特徴量セットのバージョン
+            watermark (int): 学習に使った価格の件数
+            models (Dict[str, Any]): モデル名ごとの学習済みモデル
+            metrics (Optional[Dict[str, Any]]): モデル名ごとの評価指標
+
+        Returns:
+            RegisteredModel: 登録したモデル
+        """
+        registered = RegisteredModel(scope, feature_version, watermark, models, metrics or {})
+        path = self.path(scope, feature_version)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # メモリマップできるよう圧縮せずに保存する
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        try:
+            joblib.dump(registered, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            self._remember((scope, feature_version), os.stat(path).st_mtime_ns, registered)
+        return registered
+
+    def get_or_train(
+        self,
+        scope: str,
+        feature_version: int,
+        watermark: int,
+        train: Callable[[], Tuple[Dict[str, Any], Dict[str, Any]]],
+    ) -> RegisteredModel:
+        """
+        学習済みモデルを取得し、ない場合や新しい価格が十分に増えた場合だけ学習して登録
+
+        同じモデルの学習は同時に1つだけ行う。
+
+        Args:
+            scope (str): モデルの対象
+            feature_version (int): 特徴量セットのバージョン
+            watermark (int): 現在の価格の件数
+            train (Callable): (モデル名ごとのモデル, 評価指標) を返す学習関数
+
+        Returns:
+            RegisteredModel: 学習済みモデル
+        """
+        registered = self.get(scope, feature_version)
+        if registered is not None and not self.needs_training(registered, watermark):
+            return registered
+
+        key = (scope, feature_version)
+        with self._lock:
+            train_lock = self._train_locks.setdefault(key, threading.Lock())
+        with train_lock:
+            # 待っている間に他のスレッドが学習していれば、それを使う
+            registered = self.get(scope, feature_version)
+            if registered is not None and not self.needs_training(registered, watermark):
+                return registered
+            models, metrics = train()
+            with self._lock:
+                self.stats['trainings'] += 1
+            return self.put(scope, feature_version, watermark, models, metrics)
+
+    def needs_training(self, registered: RegisteredModel, watermark: int) -> bool:
+        """
+        再学習が必要か（学習時から価格が retrain_threshold 件以上増えた、または減った）
+
+        Args:
+            registered (RegisteredModel): 登録済みのモデル
+            watermark (int): 現在の価格の件数
+
+        Returns:
+            bool: 再学習が必要な場合True
+        """
+        return watermark - registered.watermark >= self.retrain_threshold or watermark < registered.watermark
+
+    def _remember(self, key: Tuple[str, int], mtime: int, registered: RegisteredModel) -> None:
+        """
+        モデルをLRUに追加し、上限を超えた古いものを捨てる（ロックを取得して呼び出す）
+        """
+        self._cache[key] = (mtime, registered)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+_default_registry: Optional[ModelRegistry] = None
+_default_registry_lock = threading.Lock()
+
+def get_model_registry() -> ModelRegistry:
+    """
+    設定のディレクトリを使う共有のレジストリ
+
+    Returns:
+        ModelRegistry: モデルレジストリ
+    """
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            from core.config import settings
+
+            _default_registry = ModelRegistry(
+                settings.MODEL_REGISTRY_DIR,
+                cache_size=settings.MODEL_CACHE_SIZE,
+                retrain_threshold=settings.MODEL_RETRAIN_THRESHOLD,
+            )
+        return _default_registry
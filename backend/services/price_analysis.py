@@ -1,9 +1,14 @@
-from typing import List, Dict, Optional
-from dataclasses import dataclass, asdict
+from typing import Any, List, Dict, Mapping, Optional, Sequence, Tuple
+from dataclasses import dataclass, asdict, field, fields
 from datetime import datetime, timedelta
+import bisect
 import statistics
 import math
 
+from sqlalchemy import bindparam, event, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
 @dataclass
 class PriceInfo:
     site_name: str
@@ -170,3 +175,251 @@ def process_price_data(products: List[Dict]) -> Dict:
         'significant_discounts': comparator.identify_significant_discounts(),
         'recommendation': comparator.price_recommendation()
     }
+
+# 指数移動平均（EWMA）の平滑化係数（新しい価格の重み）
+EWMA_ALPHA = 0.2
+
+# 中央値を推定するヒストグラムのビンの最大数（異なる価格がこの数以下なら中央値は厳密値）
+HISTOGRAM_BINS = 64
+
+@dataclass
+class RunningPriceStats:
+    """
+    価格履歴の逐次統計
+
+    価格を1件追加するごとに O(1) で更新でき、履歴を読み直さずに統計を返す。
+    平均・分散は Welford 法で求める。中央値は最大 HISTOGRAM_BINS 個のビン（価格と件数）の
+    ストリーミングヒストグラムで推定し、ビンがあふれたら最も近い2つのビンを件数で加重平均して統合する。
+    価格は同じ値が続きやすいため、異なる価格がビンの数以下の間は中央値も厳密値になる。
+    EWMA と直近の価格は追加した順に更新する。
+    """
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    ewma: Optional[float] = None
+    last_price: Optional[float] = None
+    histogram_values: List[float] = field(default_factory=list)
+    histogram_counts: List[int] = field(default_factory=list)
+
+    @classmethod
+    def from_prices(cls, prices: List[float]) -> 'RunningPriceStats':
+        """
+        価格のリストから逐次統計を作成
+
+        Args:
+            prices (List[float]): 追加順の価格
+
+        Returns:
+            RunningPriceStats: 逐次統計
+        """
+        stats = cls()
+        for price in prices:
+            stats.update(price)
+        return stats
+
+    @classmethod
+    def from_record(cls, record: Any) -> 'RunningPriceStats':
+        """
+        保存した統計（属性またはキーで各フィールドを持つ行）から復元
+
+        Args:
+            record (Any): ORMのオブジェクトまたは行のマッピング
+
+        Returns:
+            RunningPriceStats: 逐次統計
+        """
+        get = record.__getitem__ if isinstance(record, Mapping) else lambda name: getattr(record, name)
+        values = {item.name: get(item.name) for item in fields(cls)}
+        values['histogram_values'] = list(values['histogram_values'] or [])
+        values['histogram_counts'] = list(values['histogram_counts'] or [])
+        return cls(**values)
+
+    def to_record(self) -> Dict[str, Any]:
+        """
+        保存用の辞書（フィールド名と値）
+
+        Returns:
+            Dict[str, Any]: フィールド名と値の辞書
+        """
+        return asdict(self)
+
+    def update(self, price: float) -> None:
+        """
+        価格を1件追加
+
+        Args:
+            price (float): 追加する価格
+        """
+        price = float(price)
+        self.count += 1
+
+        # Welford 法による平均・分散の更新
+        delta = price - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (price - self.mean)
+
+        self.min_price = price if self.min_price is None else min(self.min_price, price)
+        self.max_price = price if self.max_price is None else max(self.max_price, price)
+        self.ewma = price if self.ewma is None else EWMA_ALPHA * price + (1 - EWMA_ALPHA) * self.ewma
+        self.last_price = price
+        self._update_histogram(price)
+
+    def _update_histogram(self, price: float) -> None:
+        """
+        中央値推定用のヒストグラムに価格を追加（ビン数に比例する O(HISTOGRAM_BINS)）
+        """
+        values, counts = self.histogram_values, self.histogram_counts
+        index = bisect.bisect_left(values, price)
+        if index < len(values) and values[index] == price:
+            counts[index] += 1
+            return
+        values.insert(index, price)
+        counts.insert(index, 1)
+        if len(values) <= HISTOGRAM_BINS:
+            return
+
+        # 値の差が最も小さい隣り合うビンを統合する
+        merge = min(range(len(values) - 1), key=lambda i: values[i + 1] - values[i])
+        count = counts[merge] + counts[merge + 1]
+        values[merge] = (values[merge] * counts[merge] + values[merge + 1] * counts[merge + 1]) / count
+        counts[merge] = count
+        del values[merge + 1]
+        del counts[merge + 1]
+
+    @property
+    def variance(self) -> float:
+        """
+        標本分散（2件未満は0）
+        """
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self) -> float:
+        """
+        標本標準偏差（2件未満は0）
+        """
+        return math.sqrt(max(self.variance, 0.0))
+
+    @property
+    def median(self) -> Optional[float]:
+        """
+        中央値（異なる価格が HISTOGRAM_BINS 以下なら厳密値、それより多い場合はヒストグラムによる推定値）
+        """
+        if self.count == 0:
+            return None
+        # 各ビンを「件数分の同じ価格」とみなし、中央の1〜2件の平均を取る
+        middle = {(self.count - 1) // 2, self.count // 2}
+        values = []
+        seen = 0
+        for value, count in zip(self.histogram_values, self.histogram_counts):
+            values.extend(value for position in middle if seen <= position < seen + count)
+            seen += count
+        return sum(values) / len(values)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        統計の概要
+
+        Returns:
+            Dict[str, Any]: 件数・平均・分散・標準偏差・最安値・最高値・EWMA・中央値・直近の価格
+        """
+        return {
+            'count': self.count,
+            'mean': self.mean if self.count else None,
+            'variance': self.variance,
+            'stdev': self.stdev,
+            'min_price': self.min_price,
+            'max_price': self.max_price,
+            'ewma': self.ewma,
+            'median': self.median,
+            'last_price': self.last_price,
+        }
+
+def get_price_stats(db, product_id) -> Optional[RunningPriceStats]:
+    """
+    商品の逐次統計を主キーで取得（価格履歴の追加時に更新される product_price_stats から）
+
+    Args:
+        db: データベースセッション
+        product_id: 商品ID
+
+    Returns:
+        Optional[RunningPriceStats]: 逐次統計、価格履歴がない場合はNone
+    """
+    from database.models import ProductPriceStats
+
+    record = db.get(ProductPriceStats, product_id)
+    return RunningPriceStats.from_record(record) if record is not None else None
+
+def update_price_stats(connection: Connection, prices: Sequence[Tuple[Any, float]]) -> None:
+    """
+    追加した価格履歴を商品ごとの逐次統計にまとめて反映する
+
+    件数・商品数によらず、統計の行の作成（既存なら何もしない）・ロックしての読み込み・
+    書き戻しの3文で済む。呼び出し側のトランザクション内で実行する。
+
+    Args:
+        connection (Connection): 実行に使う接続
+        prices (Sequence[Tuple[Any, float]]): 追加順の (product_id, price)
+    """
+    from database.models import ProductPriceStats
+
+    by_product: Dict[Any, List[float]] = {}
+    for product_id, price in prices:
+        if product_id is not None:
+            by_product.setdefault(product_id, []).append(price)
+    if not by_product:
+        return
+
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    table = ProductPriceStats.__table__
+    empty = RunningPriceStats().to_record()
+    connection.execute(
+        dialect_insert(table).on_conflict_do_nothing(index_elements=[table.c.product_id]),
+        [{'product_id': product_id, **empty} for product_id in by_product]
+    )
+    # 同時に更新するトランザクションとデッドロックしないよう、商品IDの順にロックする
+    records = connection.execute(
+        select(table)
+        .where(table.c.product_id.in_(list(by_product)))
+        .order_by(table.c.product_id)
+        .with_for_update()
+    ).mappings().all()
+
+    updates = []
+    for record in records:
+        stats = RunningPriceStats.from_record(record)
+        for price in by_product[record['product_id']]:
+            stats.update(price)
+        updates.append({'stats_product_id': record['product_id'], **stats.to_record()})
+    connection.execute(
+        update(table).where(table.c.product_id == bindparam('stats_product_id')), updates
+    )
+
+def _update_flushed_price_stats(session: Session, flush_context: Any) -> None:
+    """
+    フラッシュで追加された価格履歴を、同じトランザクションで逐次統計に反映する
+    """
+    from database.models import PriceHistory
+
+    histories = sorted(
+        (obj for obj in session.new if isinstance(obj, PriceHistory)), key=lambda history: history.id
+    )
+    if histories:
+        update_price_stats(session.connection(), [(history.product_id, history.price) for history in histories])
+
+def install_price_stats(session_factory: Any) -> None:
+    """
+    セッションのフラッシュ時に、追加した価格履歴を逐次統計に反映させる
+
+    Args:
+        session_factory: イベントを登録するセッションのファクトリー（sessionmaker）またはセッション
+    """
+    if not event.contains(session_factory, 'after_flush', _update_flushed_price_stats):
+        event.listen(session_factory, 'after_flush', _update_flushed_price_stats)
@@ -1,11 +1,19 @@
 from typing import List, Dict, Optional
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
-from database.models import Product, PriceHistory
+import numpy as np
+
+from database.models import Product
 from repositories.product_repository import ProductRepository
-from ml_models.price_predictor import PricePredictor
+from ml_models.price_predictor import FEATURES, PricePredictor, get_price_predictor
+from services import price_export, price_forecast
+from services.ml_price_prediction import comprehensive_price_prediction
+from core.config import settings
 from core.utils import sanitize_price
 
+# 価格履歴から予測モデルを学習するのに必要な件数（特徴量に30件前までの価格を使うため）
+MIN_HISTORY_FOR_MODEL = 60
+
 class PriceComparisonService:
     """
     価格比較サービス
@@ -20,10 +28,10 @@ class PriceComparisonService:
 
         Args:
             product_repository (ProductRepository): 商品リポジトリ
-            price_predictor (Optional[PricePredictor]): 価格予測モデル
+            price_predictor (Optional[PricePredictor]): 価格予測モデル（省略時は共有の学習済みモデル）
         """
         self.product_repository = product_repository
-        self.price_predictor = price_predictor or PricePredictor()
+        self.price_predictor = price_predictor or get_price_predictor()
     
     def compare_product_prices(
         self, 
@@ -40,17 +48,20 @@ class PriceComparisonService:
         """
         comparison_results = []
         
+        # 商品は1回のクエリで取得し、価格履歴は列（時刻・価格の配列）でまとめて読み込む
+        products = {product.id: product for product in self.product_repository.get_by_ids(product_ids)}
+        price_arrays = self._load_price_arrays(list(products))
+        no_prices = np.array([], dtype=np.float64)
+        
         for product_id in product_ids:
-            product = self.product_repository.get_by_id(product_id)
+            product = products.get(product_id)
             
             if not product:
                 continue
             
-            # 価格履歴の取得
-            price_history = self.product_repository.get_price_history(product_id)
-            
             # 価格分析
-            price_analysis = self._analyze_price_history(price_history)
+            _, prices = price_arrays.get(str(product_id), (None, no_prices))
+            price_analysis = self._analyze_price_history(prices)
             
             comparison_results.append({
                 'product_id': product.id,
@@ -63,20 +74,37 @@ class PriceComparisonService:
         
         return comparison_results
     
+    def _load_price_arrays(self, product_ids: List) -> price_export.PriceArrays:
+        """
+        商品の価格履歴を列で読み込む（Parquetのエクスポートがあればそこから、なければデータベースから）
+
+        Args:
+            product_ids (List): 商品ID
+
+        Returns:
+            price_export.PriceArrays: 商品IDの文字列ごとの時刻順の (時刻, 価格)
+        """
+        return price_export.read_price_arrays(
+            self.product_repository.db.connection(),
+            product_ids,
+            settings.PRICE_EXPORT_DIR,
+            buckets=settings.PRICE_EXPORT_BUCKETS,
+        )
+    
     def _analyze_price_history(
         self, 
-        price_history: List[PriceHistory]
+        prices: np.ndarray
     ) -> Dict:
         """
         価格履歴の分析
 
         Args:
-            price_history (List[PriceHistory]): 価格履歴
+            prices (np.ndarray): 時刻順の価格
 
         Returns:
             Dict: 価格分析結果
         """
-        if not price_history:
+        if not len(prices):
             return {
                 'lowest_price': None,
                 'highest_price': None,
@@ -84,16 +112,13 @@ class PriceComparisonService:
                 'price_trend': 'no_data'
             }
         
-        # 価格の抽出
-        prices = [history.price for history in price_history]
-        
         # 基本的な統計情報
-        lowest_price = min(prices)
-        highest_price = max(prices)
-        average_price = sum(prices) / len(prices)
+        lowest_price = float(prices.min())
+        highest_price = float(prices.max())
+        average_price = float(prices.mean())
         
         # 価格トレンドの判定
-        price_trend = self._determine_price_trend(price_history)
+        price_trend = self._determine_price_trend(prices)
         
         return {
             'lowest_price': lowest_price,
@@ -104,25 +129,25 @@ class PriceComparisonService:
     
     def _determine_price_trend(
         self, 
-        price_history: List[PriceHistory]
+        prices: np.ndarray
     ) -> str:
         """
         価格トレンドの判定
 
         Args:
-            price_history (List[PriceHistory]): 価格履歴
+            prices (np.ndarray): 時刻順の価格
 
         Returns:
             str: 価格トレンド ('rising', 'falling', 'stable', 'no_data')
         """
-        if len(price_history) < 2:
+        if len(prices) < 2:
             return 'no_data'
         
         # 最新の価格と1週間前の価格を比較
-        recent_prices = price_history[:min(7, len(price_history))]
+        recent_prices = prices[-7:]
         
-        first_price = recent_prices[-1].price
-        last_price = recent_prices[0].price
+        first_price = recent_prices[0]
+        last_price = recent_prices[-1]
         price_change_percentage = (last_price - first_price) / first_price * 100
         
         if price_change_percentage > 5:
@@ -140,57 +165,78 @@ class PriceComparisonService:
         """
         将来の価格予測
 
+        一括予測ジョブの予測価格は予測日数が同じ場合だけ返し、予測日数が異なる・まだ予測していない
+        商品はその場で予測する。
+
         Args:
             product_id (int): 商品ID
             prediction_days (int, optional): 予測日数
 
         Returns:
-            Dict: 価格予測結果
+            Dict: 価格予測結果（horizon_days は予測価格の予測日数）
         """
         product = self.product_repository.get_by_id(product_id)
         
         if not product:
             return {'error': '商品が見つかりません'}
         
-        # 価格履歴の取得
-        price_history = self.product_repository.get_price_history(product_id)
-        
-        # 予測のための特徴量の準備
-        features = {
-            'original_price': product.original_price or product.current_price,
-            'current_price': product.current_price,
-            'days_since_last_sale': (datetime.utcnow() - price_history[0].recorded_at).days if price_history else 0,
-            'seasonal_factor': self._calculate_seasonal_factor()
-        }
-        
-        # 価格予測の実行
-        predicted_price = self.price_predictor.predict(features)
+        # 一括予測ジョブの予測価格を使う
+        forecast = self.product_repository.get_price_forecast(product_id)
+        if forecast is not None and forecast.horizon_days == prediction_days:
+            return {
+                'current_price': product.current_price,
+                'predicted_price': forecast.predicted_price,
+                'prediction_days': prediction_days,
+                'horizon_days': forecast.horizon_days,
+                'generated_at': forecast.generated_at
+            }
         
         return {
             'current_price': product.current_price,
-            'predicted_price': predicted_price,
-            'prediction_days': prediction_days
+            'predicted_price': self._predict_price(product_id, prediction_days),
+            'prediction_days': prediction_days,
+            'horizon_days': prediction_days,
+            'generated_at': None
         }
     
-    def _calculate_seasonal_factor(self) -> float:
+    def _predict_price(self, product_id: int, prediction_days: int) -> Optional[float]:
         """
-        季節性係数の計算
+        商品の prediction_days 日後の価格をその場で予測
+
+        価格履歴（Parquetのエクスポートと、その後の価格をデータベースから列で読み込む）が十分にあれば
+        履歴から学習したモデル（商品ごとにモデルレジストリで共有）を使う。
+        足りなければ一括予測と同じ特徴量のモデルを使うが、このモデルの予測日数は
+        一括予測の予測日数（PRICE_FORECAST_HORIZON_DAYS）のみのため、それ以外では予測しない。
+
+        Args:
+            product_id (int): 商品ID
+            prediction_days (int): 予測日数
 
         Returns:
-            float: 季節性係数
+            Optional[float]: 予測価格、予測できない場合はNone
         """
-        current_month = datetime.utcnow().month
-        
-        # 季節ごとの係数
-        seasonal_factors = {
-            # 冬（12,1,2）
-            12: 0.9, 1: 0.8, 2: 0.85,
-            # 春（3,4,5）
-            3: 1.1, 4: 1.2, 5: 1.15,
-            # 夏（6,7,8）
-            6: 1.3, 7: 1.4, 8: 1.35,
-            # 秋（9,10,11）
-            9: 1.0, 10: 0.95, 11: 0.9
-        }
-        
-        return seasonal_factors.get(current_month, 1.0)
+        historical_data = price_export.read_price_frame(
+            self.product_repository.db.connection(),
+            product_id,
+            settings.PRICE_EXPORT_DIR,
+            buckets=settings.PRICE_EXPORT_BUCKETS,
+        )
+        if len(historical_data) >= MIN_HISTORY_FOR_MODEL:
+            result = comprehensive_price_prediction(
+                historical_data, scope=f'product:{product_id}', days_ahead=prediction_days
+            )
+            return result['predictions']['ensemble_prediction'][-1]
+        
+        if prediction_days != settings.PRICE_FORECAST_HORIZON_DAYS:
+            return None
+        
+        # 一括予測と同じ特徴量で予測する
+        _, current_prices, original_prices, scraped_at = price_forecast.load_forecast_inputs(
+            self.product_repository.db.connection(), [product_id]
+        )
+        if not len(current_prices):
+            return None
+        X = price_forecast.build_feature_matrix(
+            current_prices, original_prices, scraped_at, datetime.now(timezone.utc)
+        )
+        return self.price_predictor.predict(dict(zip(FEATURES, X[0])))
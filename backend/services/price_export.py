@@ -0,0 +1,388 @@
+import os
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+# 商品IDのハッシュで分けるパーティション数（エクスポートと読み込みで同じ値を使う）
+DEFAULT_BUCKETS = 64
+
+# 1回に読み込んで書き出す行数
+DEFAULT_BATCH_SIZE = 100_000
+
+TIMESTAMP_TYPE = pa.timestamp('us', tz='UTC')
+
+# エクスポートするParquetの列（product_bucket と month はパーティションのディレクトリになる）
+PRICE_HISTORY_SCHEMA = pa.schema([
+    ('product_id', pa.string()),
+    ('price', pa.float64()),
+    ('source', pa.string()),
+    ('scraped_at', TIMESTAMP_TYPE),
+    ('product_bucket', pa.int32()),
+    ('month', pa.string()),
+])
+
+PARTITIONING = ds.partitioning(
+    pa.schema([('product_bucket', pa.int32()), ('month', pa.string())]),
+    flavor='hive',
+)
+
+LOAD_COLUMNS = ['product_id', 'price', 'source', 'scraped_at']
+
+ProductId = Union[str, uuid.UUID]
+
+PriceArrays = Dict[str, Tuple[np.ndarray, np.ndarray]]
+
+def product_bucket(product_id: ProductId, buckets: int = DEFAULT_BUCKETS) -> int:
+    """
+    商品IDのパーティション番号（プロセスをまたいで同じ値になるハッシュ）
+
+    Args:
+        product_id (ProductId): 商品ID
+        buckets (int): パーティション数
+
+    Returns:
+        int: パーティション番号
+    """
+    return zlib.crc32(str(product_id).encode()) % buckets
+
+def _utc(value: datetime) -> datetime:
+    """タイムゾーン付きの時刻をUTCに揃える（タイムゾーンなしの時刻はUTCとみなす）"""
+    return value.astimezone(timezone.utc) if value.tzinfo is not None else value
+
+def rows_to_batch(rows: Sequence[Tuple], buckets: int = DEFAULT_BUCKETS) -> pa.RecordBatch:
+    """
+    価格履歴の行を列形式のレコードバッチに変換
+
+    Args:
+        rows (Sequence[Tuple]): (product_id, price, source, scraped_at) の行
+        buckets (int): パーティション数
+
+    Returns:
+        pa.RecordBatch: PRICE_HISTORY_SCHEMA のレコードバッチ
+    """
+    product_ids, prices, sources, scraped_at = zip(*rows) if rows else ((), (), (), ())
+    product_ids = [str(product_id) for product_id in product_ids]
+
+    bucket_cache: Dict[str, int] = {}
+    bucket_numbers = []
+    for product_id in product_ids:
+        bucket = bucket_cache.get(product_id)
+        if bucket is None:
+            bucket = bucket_cache[product_id] = product_bucket(product_id, buckets)
+        bucket_numbers.append(bucket)
+
+    timestamps = pa.array(scraped_at, type=TIMESTAMP_TYPE)
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(product_ids, type=pa.string()),
+            pa.array(prices, type=pa.float64()),
+            pa.array(sources, type=pa.string()),
+            timestamps,
+            pa.array(bucket_numbers, type=pa.int32()),
+            pc.strftime(timestamps, format='%Y-%m'),
+        ],
+        schema=PRICE_HISTORY_SCHEMA,
+    )
+
+def write_price_batches(batches: Iterable[pa.RecordBatch], root: str) -> None:
+    """
+    レコードバッチを商品ハッシュ・月ごとのParquetファイルに書き出す
+
+    書き出した月のパーティションにある既存のファイルは置き換える。
+
+    Args:
+        batches (Iterable[pa.RecordBatch]): PRICE_HISTORY_SCHEMA のレコードバッチ
+        root (str): 出力先のディレクトリ
+    """
+    ds.write_dataset(
+        batches,
+        root,
+        schema=PRICE_HISTORY_SCHEMA,
+        format='parquet',
+        partitioning=PARTITIONING,
+        basename_template=f'part-{uuid.uuid4().hex}-{{i}}.parquet',
+        existing_data_behavior='delete_matching',
+    )
+
+def export_price_histories(
+    connection,
+    root: str,
+    since: Optional[datetime] = None,
+    buckets: int = DEFAULT_BUCKETS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> int:
+    """
+    価格履歴をORMを介さずに読み込み、Parquetのデータセットに書き出す
+
+    行はサーバー側カーソルで batch_size 行ずつ読み込むため、履歴全体をメモリに載せない。
+    since を指定した場合は、その月の初めから後のパーティションだけを書き直す。
+
+    Args:
+        connection: データベース接続
+        root (str): 出力先のディレクトリ
+        since (Optional[datetime]): この月以降の価格履歴だけを書き出す
+        buckets (int): 商品IDのハッシュで分けるパーティション数
+        batch_size (int): 1回に読み込む行数
+
+    Returns:
+        int: 書き出した行数
+    """
+    from sqlalchemy import select
+    from database.models import PriceHistory
+
+    query = select(PriceHistory.product_id, PriceHistory.price, PriceHistory.source, PriceHistory.scraped_at)
+    if since is not None:
+        # 月のパーティションを丸ごと置き換えるため、月の初めから書き出す
+        month_start = _utc(since).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        query = query.where(PriceHistory.scraped_at >= month_start)
+    result = connection.execution_options(yield_per=batch_size).execute(query)
+
+    exported = 0
+
+    def batches() -> Iterator[pa.RecordBatch]:
+        nonlocal exported
+        for rows in result.partitions():
+            exported += len(rows)
+            yield rows_to_batch(rows, buckets)
+
+    write_price_batches(batches(), root)
+    return exported
+
+def load_price_table(
+    root: str,
+    product_ids: Iterable[ProductId],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    buckets: int = DEFAULT_BUCKETS,
+) -> pa.Table:
+    """
+    指定した商品の価格履歴をArrowのテーブルとして読み込む
+
+    商品ハッシュと月のパーティションで読むファイルを絞り込む。
+
+    Args:
+        root (str): export_price_histories の出力先
+        product_ids (Iterable[ProductId]): 商品IDのリスト
+        start (Optional[datetime]): この時刻以降の履歴だけを読み込む
+        end (Optional[datetime]): この時刻より前の履歴だけを読み込む
+        buckets (int): エクスポート時のパーティション数
+
+    Returns:
+        pa.Table: 商品ID・時刻順の product_id, price, source, scraped_at の列
+    """
+    product_ids = sorted({str(product_id) for product_id in product_ids})
+    bucket_numbers = sorted({product_bucket(product_id, buckets) for product_id in product_ids})
+
+    condition = ds.field('product_bucket').isin(bucket_numbers) & ds.field('product_id').isin(product_ids)
+    if start is not None:
+        start = _utc(start)
+        condition &= ds.field('month') >= start.strftime('%Y-%m')
+        condition &= ds.field('scraped_at') >= pa.scalar(start, type=TIMESTAMP_TYPE)
+    if end is not None:
+        end = _utc(end)
+        condition &= ds.field('month') <= end.strftime('%Y-%m')
+        condition &= ds.field('scraped_at') < pa.scalar(end, type=TIMESTAMP_TYPE)
+
+    dataset = ds.dataset(root, schema=PRICE_HISTORY_SCHEMA, format='parquet', partitioning=PARTITIONING)
+    table = dataset.to_table(columns=LOAD_COLUMNS, filter=condition)
+    return table.sort_by([('product_id', 'ascending'), ('scraped_at', 'ascending')])
+
+def load_price_arrays(
+    root: str,
+    product_ids: Iterable[ProductId],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    buckets: int = DEFAULT_BUCKETS,
+) -> PriceArrays:
+    """
+    指定した商品の価格履歴を商品ごとのNumPy配列として読み込む
+
+    Args:
+        root (str): export_price_histories の出力先
+        product_ids (Iterable[ProductId]): 商品IDのリスト
+        start (Optional[datetime]): この時刻以降の履歴だけを読み込む
+        end (Optional[datetime]): この時刻より前の履歴だけを読み込む
+        buckets (int): エクスポート時のパーティション数
+
+    Returns:
+        PriceArrays: 商品IDごとの時刻順の (時刻(datetime64[us]), 価格(float64))
+    """
+    table = load_price_table(root, product_ids, start, end, buckets)
+    if table.num_rows == 0:
+        return {}
+
+    ids = table.column('product_id').to_numpy()
+    timestamps = table.column('scraped_at').cast(pa.timestamp('us')).to_numpy()
+    prices = table.column('price').to_numpy()
+
+    # 商品ID順に並んでいるため、商品ごとの範囲は先頭位置で分けられる
+    unique_ids, starts = np.unique(ids, return_index=True)
+    ends = np.append(starts[1:], len(ids))
+    return {
+        product_id: (timestamps[first:last], prices[first:last])
+        for product_id, first, last in zip(unique_ids, starts, ends)
+    }
+
+def load_price_frame(
+    root: str,
+    product_id: ProductId,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    buckets: int = DEFAULT_BUCKETS,
+) -> pd.DataFrame:
+    """
+    1商品の価格履歴を予測モデルの入力形式（date, price 列）のデータフレームとして読み込む
+
+    Args:
+        root (str): export_price_histories の出力先
+        product_id (ProductId): 商品ID
+        start (Optional[datetime]): この時刻以降の履歴だけを読み込む
+        end (Optional[datetime]): この時刻より前の履歴だけを読み込む
+        buckets (int): エクスポート時のパーティション数
+
+    Returns:
+        pd.DataFrame: 時刻順の date, price 列
+    """
+    timestamps, prices = load_price_arrays(root, [product_id], start, end, buckets).get(
+        str(product_id), (np.array([], dtype='datetime64[us]'), np.array([], dtype=np.float64))
+    )
+    return pd.DataFrame({'date': timestamps, 'price': prices})
+
+def export_exists(root: str) -> bool:
+    """
+    export_price_histories の出力先にParquetファイルがあるか
+
+    Args:
+        root (str): export_price_histories の出力先
+
+    Returns:
+        bool: 書き出し済みのファイルがあればTrue
+    """
+    if not os.path.isdir(root):
+        return False
+    return any(name.endswith('.parquet') for _, _, names in os.walk(root) for name in names)
+
+def query_price_arrays(
+    connection,
+    product_ids: Iterable[ProductId],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> PriceArrays:
+    """
+    指定した商品の価格履歴をデータベースから列だけ読み込み、load_price_arrays と同じ形式にする
+
+    ORMのオブジェクトを作らず、時刻と価格の列だけを読む。
+
+    Args:
+        connection: データベース接続
+        product_ids (Iterable[ProductId]): 商品IDのリスト
+        start (Optional[datetime]): この時刻以降の履歴だけを読み込む
+        end (Optional[datetime]): この時刻より前の履歴だけを読み込む
+
+    Returns:
+        PriceArrays: 商品IDごとの時刻順の (時刻(datetime64[us]、UTC), 価格(float64))
+    """
+    from sqlalchemy import select
+    from database.models import PriceHistory
+
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    query = (
+        select(PriceHistory.product_id, PriceHistory.scraped_at, PriceHistory.price)
+        .where(PriceHistory.product_id.in_(product_ids))
+        .order_by(PriceHistory.product_id, PriceHistory.scraped_at, PriceHistory.id)
+    )
+    if start is not None:
+        query = query.where(PriceHistory.scraped_at >= start)
+    if end is not None:
+        query = query.where(PriceHistory.scraped_at < end)
+
+    columns: Dict[str, Tuple[list, list]] = {}
+    for product_id, scraped_at, price in connection.execute(query):
+        timestamps, prices = columns.setdefault(str(product_id), ([], []))
+        timestamps.append(_utc(scraped_at).replace(tzinfo=None))
+        prices.append(price)
+    return {
+        product_id: (np.array(timestamps, dtype='datetime64[us]'), np.array(prices, dtype=np.float64))
+        for product_id, (timestamps, prices) in columns.items()
+    }
+
+def read_price_arrays(
+    connection,
+    product_ids: Iterable[ProductId],
+    root: str,
+    start: Optional[datetime] = None,
+    buckets: int = DEFAULT_BUCKETS,
+) -> PriceArrays:
+    """
+    学習・分析用に価格履歴を商品ごとのNumPy配列として読み込む
+
+    エクスポートがあればParquetから読み、各商品の書き出し済みの最後の時刻より後の価格だけを
+    データベースから読み足す。エクスポートがなければデータベースから列だけを読み込む。
+
+    Args:
+        connection: データベース接続
+        product_ids (Iterable[ProductId]): 商品IDのリスト
+        root (str): export_price_histories の出力先
+        start (Optional[datetime]): この時刻以降の履歴だけを読み込む
+        buckets (int): エクスポート時のパーティション数
+
+    Returns:
+        PriceArrays: 商品IDごとの時刻順の (時刻(datetime64[us]、UTC), 価格(float64))
+    """
+    product_ids = list(product_ids)
+    if not export_exists(root):
+        return query_price_arrays(connection, product_ids, start)
+
+    arrays = load_price_arrays(root, product_ids, start, buckets=buckets)
+    since = start
+    if len(arrays) == len({str(product_id) for product_id in product_ids}):
+        # 全商品が書き出し済みなら、最も古い書き出し済みの最後の時刻から後だけを読む
+        exported_until = min(timestamps[-1] for timestamps, _ in arrays.values())
+        since = exported_until.astype(datetime).replace(tzinfo=timezone.utc)
+    recent = query_price_arrays(connection, product_ids, since)
+
+    for product_id, (timestamps, prices) in recent.items():
+        exported = arrays.get(product_id)
+        if exported is None:
+            arrays[product_id] = (timestamps, prices)
+            continue
+        newer = timestamps > exported[0][-1]
+        arrays[product_id] = (
+            np.concatenate([exported[0], timestamps[newer]]),
+            np.concatenate([exported[1], prices[newer]]),
+        )
+    return arrays
+
+def read_price_frame(
+    connection,
+    product_id: ProductId,
+    root: str,
+    start: Optional[datetime] = None,
+    buckets: int = DEFAULT_BUCKETS,
+) -> pd.DataFrame:
+    """
+    1商品の価格履歴を read_price_arrays で読み込み、予測モデルの入力形式（date, price 列）にする
+
+    Args:
+        connection: データベース接続
+        product_id (ProductId): 商品ID
+        root (str): export_price_histories の出力先
+        start (Optional[datetime]): この時刻以降の履歴だけを読み込む
+        buckets (int): エクスポート時のパーティション数
+
+    Returns:
+        pd.DataFrame: 時刻順の date, price 列
+    """
+    timestamps, prices = read_price_arrays(connection, [product_id], root, start, buckets).get(
+        str(product_id), (np.array([], dtype='datetime64[us]'), np.array([], dtype=np.float64))
+    )
+    return pd.DataFrame({'date': timestamps, 'price': prices})
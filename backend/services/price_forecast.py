@@ -0,0 +1,264 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from joblib import Parallel, delayed
+
+from ml_models.price_predictor import FEATURES, PREDICT_CHUNK_SIZE, PricePredictor
+
+# 1回に書き込む予測の行数
+WRITE_CHUNK_SIZE = 5000
+
+# 月ごとの季節性係数
+SEASONAL_FACTORS = {
+    # 冬（12,1,2）
+    12: 0.9, 1: 0.8, 2: 0.85,
+    # 春（3,4,5）
+    3: 1.1, 4: 1.2, 5: 1.15,
+    # 夏（6,7,8）
+    6: 1.3, 7: 1.4, 8: 1.35,
+    # 秋（9,10,11）
+    9: 1.0, 10: 0.95, 11: 0.9
+}
+
+# ワーカープロセスごとに読み込んだモデル（パス -> モデル）
+_predictors: Dict[str, PricePredictor] = {}
+
+def seasonal_factor(month: int) -> float:
+    """
+    季節性係数
+
+    Args:
+        month (int): 月
+
+    Returns:
+        float: 季節性係数
+    """
+    return SEASONAL_FACTORS.get(month, 1.0)
+
+def build_feature_matrix(
+    current_prices: np.ndarray,
+    original_prices: np.ndarray,
+    last_scraped_at: np.ndarray,
+    now: datetime
+) -> np.ndarray:
+    """
+    全商品の特徴量行列を作成（列は FEATURES の順）
+
+    Args:
+        current_prices (np.ndarray): 最新価格
+        original_prices (np.ndarray): 元の価格（これまでの最高価格、不明な場合はNaN）
+        last_scraped_at (np.ndarray): 最新価格の取得日時（datetime64、不明な場合はNaT）
+        now (datetime): 予測の基準日時
+
+    Returns:
+        np.ndarray: 特徴量行列
+    """
+    current_prices = np.asarray(current_prices, dtype=np.float64)
+    original_prices = np.asarray(original_prices, dtype=np.float64)
+    original_prices = np.where(np.isnan(original_prices), current_prices, original_prices)
+
+    discount_rate = np.zeros_like(current_prices)
+    np.divide(
+        (original_prices - current_prices) * 100, original_prices,
+        out=discount_rate, where=original_prices > 0
+    )
+
+    reference = np.datetime64(now.astimezone(timezone.utc).replace(tzinfo=None), 'us')
+    elapsed = reference - np.asarray(last_scraped_at, dtype='datetime64[us]')
+    # 取得日時が不明な場合は0日とする
+    elapsed[np.isnat(elapsed)] = np.timedelta64(0, 'us')
+    days_since_last_sale = np.maximum(elapsed // np.timedelta64(1, 'D'), 0)
+
+    X = np.empty((len(current_prices), len(FEATURES)), dtype=np.float64)
+    X[:, FEATURES.index('original_price')] = original_prices
+    X[:, FEATURES.index('discount_rate')] = discount_rate
+    X[:, FEATURES.index('days_since_last_sale')] = days_since_last_sale
+    X[:, FEATURES.index('seasonal_factor')] = seasonal_factor(now.month)
+    return X
+
+def _predict_chunk(model_path: str, X: np.ndarray, chunk_size: int) -> np.ndarray:
+    """
+    特徴量行列の一部を予測（ワーカープロセスで実行し、モデルはプロセスごとに1回だけ読み込む）
+    """
+    predictor = _predictors.get(model_path)
+    if predictor is None:
+        predictor = _predictors[model_path] = PricePredictor(model_path)
+    return predictor.predict_batch(X, chunk_size)
+
+def predict_prices(
+    X: np.ndarray,
+    model_path: str,
+    chunk_size: int = PREDICT_CHUNK_SIZE,
+    n_jobs: int = 1
+) -> np.ndarray:
+    """
+    特徴量行列を chunk_size 行ずつ予測
+
+    n_jobs が1より大きい場合（-1 で全コア）、チャンクを joblib（loky）のワーカープロセスに分けて予測する。
+    各ワーカーは model_path のモデルをメモリマップで読み込む。
+
+    Args:
+        X (np.ndarray): 特徴量行列
+        model_path (str): 学習済みモデルのパス
+        chunk_size (int): 1回に予測する行数
+        n_jobs (int): 並列数
+
+    Returns:
+        np.ndarray: 行ごとの予測価格
+    """
+    if n_jobs == 1 or len(X) <= chunk_size:
+        return _predict_chunk(model_path, X, chunk_size)
+
+    chunks = Parallel(n_jobs=n_jobs, backend='loky')(
+        delayed(_predict_chunk)(model_path, X[start:start + chunk_size], chunk_size)
+        for start in range(0, len(X), chunk_size)
+    )
+    return np.concatenate(chunks)
+
+def load_forecast_inputs(
+    connection,
+    product_ids: Optional[Sequence] = None
+) -> Tuple[List, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    予測に使う商品ごとの最新価格・最高価格・最新価格の取得日時を1回のクエリで取得
+
+    価格履歴のない商品は含まない。
+
+    Args:
+        connection: データベース接続
+        product_ids (Optional[Sequence]): 対象の商品ID（省略時は全商品）
+
+    Returns:
+        Tuple[List, np.ndarray, np.ndarray, np.ndarray]: (商品ID, 最新価格, 最高価格, 取得日時)
+    """
+    from sqlalchemy import select
+    from database.models import ProductLatestPrice, ProductPriceStats
+
+    query = (
+        select(
+            ProductLatestPrice.product_id,
+            ProductLatestPrice.price,
+            ProductPriceStats.max_price,
+            ProductLatestPrice.scraped_at
+        )
+        .outerjoin(ProductPriceStats, ProductPriceStats.product_id == ProductLatestPrice.product_id)
+        .order_by(ProductLatestPrice.product_id)
+    )
+    if product_ids is not None:
+        query = query.where(ProductLatestPrice.product_id.in_(list(product_ids)))
+    rows = connection.execute(query).all()
+
+    count = len(rows)
+    ids = [row[0] for row in rows]
+    current_prices = np.fromiter((row[1] for row in rows), dtype=np.float64, count=count)
+    original_prices = np.fromiter(
+        (np.nan if row[2] is None else row[2] for row in rows), dtype=np.float64, count=count
+    )
+    scraped_at = np.array(
+        [None if row[3] is None else row[3].astimezone(timezone.utc).replace(tzinfo=None) for row in rows],
+        dtype='datetime64[us]'
+    ) if count else np.empty(0, dtype='datetime64[us]')
+    return ids, current_prices, original_prices, scraped_at
+
+def write_forecasts(
+    connection,
+    product_ids: List,
+    predictions: np.ndarray,
+    current_prices: np.ndarray,
+    horizon_days: int,
+    generated_at: datetime,
+    chunk_size: int = WRITE_CHUNK_SIZE
+) -> int:
+    """
+    予測価格を price_forecasts に追加・更新
+
+    Args:
+        connection: データベース接続
+        product_ids (List): 商品ID
+        predictions (np.ndarray): 予測価格
+        current_prices (np.ndarray): 予測に使った最新価格
+        horizon_days (int): 予測日数
+        generated_at (datetime): 予測日時
+        chunk_size (int): 1回に書き込む行数
+
+    Returns:
+        int: 書き込んだ行数
+    """
+    from database.models import PriceForecast
+
+    if connection.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    table = PriceForecast.__table__
+    statement = dialect_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.product_id],
+        set_={
+            column: statement.excluded[column]
+            for column in ('predicted_price', 'current_price', 'horizon_days', 'generated_at')
+        }
+    )
+
+    predicted = predictions.tolist()
+    current = current_prices.tolist()
+    for start in range(0, len(product_ids), chunk_size):
+        connection.execute(statement, [
+            {
+                'product_id': product_id,
+                'predicted_price': predicted[index],
+                'current_price': current[index],
+                'horizon_days': horizon_days,
+                'generated_at': generated_at
+            }
+            for index, product_id in enumerate(product_ids[start:start + chunk_size], start)
+        ])
+    return len(product_ids)
+
+def run_price_forecast(
+    connection,
+    model_path: str,
+    horizon_days: int = 30,
+    chunk_size: int = PREDICT_CHUNK_SIZE,
+    n_jobs: int = 1,
+    now: Optional[datetime] = None
+) -> int:
+    """
+    全商品の価格をまとめて予測し、price_forecasts に書き込む
+
+    Args:
+        connection: データベース接続（トランザクション内で呼び出す）
+        model_path (str): 学習済みモデルのパス
+        horizon_days (int): 予測日数
+        chunk_size (int): 1回に予測する行数
+        n_jobs (int): 予測の並列数
+        now (Optional[datetime]): 予測の基準日時（省略時は現在）
+
+    Returns:
+        int: 予測した商品数
+    """
+    now = now or datetime.now(timezone.utc)
+    product_ids, current_prices, original_prices, scraped_at = load_forecast_inputs(connection)
+    if not product_ids:
+        return 0
+
+    X = build_feature_matrix(current_prices, original_prices, scraped_at, now)
+    predictions = predict_prices(X, model_path, chunk_size=chunk_size, n_jobs=n_jobs)
+    return write_forecasts(connection, product_ids, predictions, current_prices, horizon_days, now)
+
+def get_price_forecast(db, product_id):
+    """
+    商品の予測価格を主キーで取得（一括予測ジョブが書き込んだ price_forecasts から）
+
+    Args:
+        db: データベースセッション
+        product_id: 商品ID
+
+    Returns:
+        Optional[PriceForecast]: 予測価格、まだ予測していない場合はNone
+    """
+    from database.models import PriceForecast
+
+    return db.get(PriceForecast, product_id)
@@ -0,0 +1,303 @@
+import heapq
+import os
+import pickle
+import tempfile
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# n-gram の文字数
+NGRAM_SIZE = 3
+
+# 類似度を計算する候補の数
+DEFAULT_CANDIDATES = 20
+
+# 取り込み済みの作成日時より少し前から読み直す幅（作成日時より後にコミットされた商品を取りこぼさないため）
+REFRESH_OVERLAP = timedelta(minutes=1)
+
+# 保存形式のバージョン（形式を変えたら上げ、古いファイルは読み込まない）
+INDEX_FORMAT_VERSION = 1
+
+def normalize_for_index(name: str) -> str:
+    """
+    索引用に商品名を正規化（NFKCで全角・半角を揃え、小文字にして空白をまとめる）
+
+    Args:
+        name (str): 商品名
+
+    Returns:
+        str: 正規化された商品名
+    """
+    return ' '.join(unicodedata.normalize('NFKC', name).lower().split())
+
+def name_ngrams(name: str, n: int = NGRAM_SIZE) -> Set[str]:
+    """
+    商品名の文字 n-gram（短い名前も n-gram を持つよう前後に境界文字を付ける）
+
+    Args:
+        name (str): 商品名
+        n (int): n-gram の文字数
+
+    Returns:
+        Set[str]: n-gram の集合
+    """
+    padded = f'\x02{normalize_for_index(name)}\x03'
+    return {padded[i:i + n] for i in range(max(len(padded) - n + 1, 1))}
+
+class ProductNameIndex:
+    """
+    重複検出用の商品名の n-gram 索引
+
+    カテゴリごとに n-gram -> 商品ID の転置リストを持ち、登録する商品と n-gram を多く共有する
+    上位の候補だけについて類似度を計算する。商品の作成日時の最大値を記録しておき、
+    refresh で他のプロセスが登録した商品を取り込む。
+    """
+    def __init__(self, ngram_size: int = NGRAM_SIZE):
+        """
+        初期化メソッド
+
+        Args:
+            ngram_size (int): n-gram の文字数
+        """
+        self.ngram_size = ngram_size
+        # カテゴリ -> 商品ID -> 商品名
+        self._names: Dict[Optional[str], Dict[Any, str]] = defaultdict(dict)
+        # カテゴリ -> n-gram -> 商品ID の集合
+        self._postings: Dict[Optional[str], Dict[str, Set[Any]]] = defaultdict(lambda: defaultdict(set))
+        # 商品ID -> カテゴリ
+        self._categories: Dict[Any, Optional[str]] = {}
+        # 商品ID -> n-gram の数
+        self._gram_counts: Dict[Any, int] = {}
+        self.watermark: Optional[datetime] = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._categories)
+
+    def add(self, product_id: Any, name: str, category: Optional[str], created_at: Optional[datetime] = None) -> None:
+        """
+        商品を索引に追加（登録済みの場合は名前・カテゴリを置き換える）
+
+        Args:
+            product_id (Any): 商品ID
+            name (str): 商品名
+            category (Optional[str]): カテゴリ
+            created_at (Optional[datetime]): 商品の作成日時
+        """
+        with self._lock:
+            self.remove(product_id)
+            self._categories[product_id] = category
+            self._names[category][product_id] = name
+            postings = self._postings[category]
+            grams = name_ngrams(name, self.ngram_size)
+            for gram in grams:
+                postings[gram].add(product_id)
+            self._gram_counts[product_id] = len(grams)
+            if created_at is not None:
+                # タイムゾーンを保存しないDB（SQLite）の作成日時はUTCとして比べる
+                if created_at.tzinfo is None:
+                    created_at = created_at.replace(tzinfo=timezone.utc)
+                if self.watermark is None or created_at > self.watermark:
+                    self.watermark = created_at
+
+    def remove(self, product_id: Any) -> None:
+        """
+        商品を索引から削除
+
+        Args:
+            product_id (Any): 商品ID
+        """
+        with self._lock:
+            if product_id not in self._categories:
+                return
+            category = self._categories.pop(product_id)
+            name = self._names[category].pop(product_id)
+            del self._gram_counts[product_id]
+            postings = self._postings[category]
+            for gram in name_ngrams(name, self.ngram_size):
+                ids = postings.get(gram)
+                if ids is not None:
+                    ids.discard(product_id)
+                    if not ids:
+                        del postings[gram]
+
+    def candidates(self, name: str, category: Optional[str], k: int = DEFAULT_CANDIDATES) -> List[Tuple[Any, str]]:
+        """
+        n-gram の Jaccard 係数が高い順に上位 k 件の候補を取得
+
+        Args:
+            name (str): 商品名
+            category (Optional[str]): カテゴリ
+            k (int): 候補の数
+
+        Returns:
+            List[Tuple[Any, str]]: (商品ID, 商品名) のリスト
+        """
+        with self._lock:
+            postings = self._postings.get(category)
+            if not postings:
+                return []
+            grams = name_ngrams(name, self.ngram_size)
+            shared = Counter()
+            for gram in grams:
+                ids = postings.get(gram)
+                if ids:
+                    shared.update(ids)
+            gram_counts = self._gram_counts
+            top = heapq.nlargest(
+                k, shared.items(),
+                key=lambda item: item[1] / (len(grams) + gram_counts[item[0]] - item[1])
+            )
+            names = self._names[category]
+            return [(product_id, names[product_id]) for product_id, _ in top]
+
+    def find(
+        self,
+        name: str,
+        category: Optional[str],
+        threshold: float,
+        similarity: Callable[[str, str], float],
+        k: int = DEFAULT_CANDIDATES
+    ) -> Optional[Tuple[Any, float]]:
+        """
+        上位 k 件の候補のうち、類似度が閾値以上で最も高い商品を取得
+
+        Args:
+            name (str): 商品名
+            category (Optional[str]): カテゴリ
+            threshold (float): 類似度の閾値
+            similarity (Callable[[str, str], float]): (既存の商品名, 新しい商品名) の類似度
+            k (int): 類似度を計算する候補の数
+
+        Returns:
+            Optional[Tuple[Any, float]]: (商品ID, 類似度)、該当がなければNone
+        """
+        best = None
+        for product_id, existing_name in self.candidates(name, category, k):
+            score = similarity(existing_name, name)
+            if score >= threshold and (best is None or score > best[1]):
+                best = (product_id, score)
+        return best
+
+    def refresh(self, rows: Iterable[Tuple[Any, str, Optional[str], Optional[datetime]]]) -> int:
+        """
+        (商品ID, 商品名, カテゴリ, 作成日時) の行を取り込む
+
+        Args:
+            rows (Iterable): 商品の行
+
+        Returns:
+            int: 取り込んだ行数
+        """
+        count = 0
+        with self._lock:
+            for product_id, name, category, created_at in rows:
+                self.add(product_id, name, category, created_at)
+                count += 1
+        return count
+
+    def save(self, path: str) -> None:
+        """
+        索引をファイルに保存（一時ファイルに書いてから置き換える）
+
+        転置リストは商品名から作り直せるため、商品名と作成日時の最大値だけを保存する。
+
+        Args:
+            path (str): 保存先のパス
+        """
+        with self._lock:
+            state = {
+                'version': INDEX_FORMAT_VERSION,
+                'ngram_size': self.ngram_size,
+                'watermark': self.watermark,
+                'names': {category: dict(names) for category, names in self._names.items() if names},
+            }
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path: str) -> Optional['ProductNameIndex']:
+        """
+        保存した索引を読み込む
+
+        Args:
+            path (str): 保存先のパス
+
+        Returns:
+            Optional[ProductNameIndex]: 索引、ファイルがない・壊れている・形式が異なる場合は
+                None（呼び出し側でDBから作り直す）
+        """
+        try:
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+            if state.get('version') != INDEX_FORMAT_VERSION:
+                return None
+
+            index = cls(state['ngram_size'])
+            for category, names in state['names'].items():
+                for product_id, name in names.items():
+                    index.add(product_id, name, category)
+            index.watermark = state['watermark']
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, KeyError, AttributeError) as e:
+            # 書き込み途中のファイルなど
+            print(f"商品名索引を読み込めないため、DBから作り直します（{path}）: {e}")
+            return None
+        return index
+
+_shared_index: Optional[ProductNameIndex] = None
+_shared_index_lock = threading.Lock()
+
+def get_product_name_index(db) -> ProductNameIndex:
+    """
+    共有の商品名索引（初回は保存したファイルから読み込み、以降に登録された商品を取り込む）
+
+    Args:
+        db: データベースセッション
+
+    Returns:
+        ProductNameIndex: 商品名索引
+    """
+    global _shared_index
+    with _shared_index_lock:
+        if _shared_index is None:
+            from core.config import settings
+
+            _shared_index = ProductNameIndex.load(settings.PRODUCT_NAME_INDEX_PATH) or ProductNameIndex()
+        refresh_from_database(_shared_index, db)
+        return _shared_index
+
+def refresh_from_database(index: ProductNameIndex, db, batch_size: int = 10000) -> int:
+    """
+    索引の作成日時の最大値（から REFRESH_OVERLAP 前）以降に作成された商品を取り込む（索引が空の場合は全商品）
+
+    Args:
+        index (ProductNameIndex): 商品名索引
+        db: データベースセッション
+        batch_size (int): 1回に読み込む行数
+
+    Returns:
+        int: 取り込んだ商品数
+    """
+    from sqlalchemy import select
+    from database.models import Product
+
+    query = select(Product.id, Product.name, Product.category, Product.created_at)
+    if index.watermark is not None:
+        query = query.where(Product.created_at >= index.watermark - REFRESH_OVERLAP)
+
+    count = 0
+    for rows in db.execute(query, execution_options={'yield_per': batch_size}).partitions():
+        count += index.refresh(rows)
+    return count
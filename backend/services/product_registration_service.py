@@ -1,10 +1,19 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import insert, select, tuple_
 from sqlalchemy.orm import Session
 import difflib
 import uuid
+from datetime import datetime, timezone
 
 from database.models import Product, ProductExternalSource
+from core.config import settings
 from core.exceptions import DataProcessingError
+from services.product_name_index import ProductNameIndex, get_product_name_index
+from services.product_search import search_document
+from services.product_suggest import apply_product_changes
+
+# 一括登録で1回のトランザクションにまとめる商品数
+BULK_CHUNK_SIZE = 1000
 
 class ProductRegistrationService:
     """
@@ -47,35 +56,46 @@ class ProductRegistrationService:
         cls, 
         db: Session, 
         product_data: Dict, 
-        similarity_threshold: float = 0.8
+        similarity_threshold: Optional[float] = None,
+        index: Optional[ProductNameIndex] = None
     ) -> Optional[Product]:
         """
         既存の商品を検索し、類似商品を見つける
         
+        商品名の n-gram 索引で同じカテゴリの候補を上位 PRODUCT_DEDUP_CANDIDATES 件に絞り、
+        候補についてだけ類似度を計算して、閾値以上で最も類似度の高い商品を返す。
+        
         Args:
             db (Session): データベースセッション
             product_data (Dict): 新規商品データ
-            similarity_threshold (float): 類似度の閾値
+            similarity_threshold (Optional[float]): 類似度の閾値（省略時は PRODUCT_SIMILARITY_THRESHOLD）
+            index (Optional[ProductNameIndex]): 商品名索引（省略時は共有の索引）
         
         Returns:
             Optional[Product]: 類似商品が見つかった場合はその商品、なければNone
         """
+        if similarity_threshold is None:
+            similarity_threshold = settings.PRODUCT_SIMILARITY_THRESHOLD
+        
         try:
-            # カテゴリと名前で絞り込み
-            similar_products = db.query(Product).filter(
-                Product.category == product_data.get('category')
-            ).all()
+            if index is None:
+                index = get_product_name_index(db)
             
-            for existing_product in similar_products:
-                similarity = cls.calculate_name_similarity(
-                    existing_product.name, 
-                    product_data['name']
-                )
-                
-                if similarity >= similarity_threshold:
-                    return existing_product
+            match = index.find(
+                product_data['name'],
+                product_data.get('category'),
+                similarity_threshold,
+                cls.calculate_name_similarity,
+                k=settings.PRODUCT_DEDUP_CANDIDATES
+            )
+            if match is None:
+                return None
             
-            return None
+            existing_product = db.get(Product, match[0])
+            if existing_product is None:
+                # 削除された商品は索引からも取り除く
+                index.remove(match[0])
+            return existing_product
         
         except Exception as e:
             raise DataProcessingError(f"商品検索中にエラー: {e}")
@@ -84,7 +104,8 @@ class ProductRegistrationService:
     def register_product(
         cls, 
         db: Session, 
-        product_data: Dict
+        product_data: Dict,
+        index: Optional[ProductNameIndex] = None
     ) -> Product:
         """
         商品を登録（新規または既存）
@@ -92,21 +113,23 @@ class ProductRegistrationService:
         Args:
             db (Session): データベースセッション
             product_data (Dict): 商品データ
+            index (Optional[ProductNameIndex]): 商品名索引（省略時は共有の索引）
         
         Returns:
             Product: 登録された（または既存の）商品
         """
         try:
+            if index is None:
+                index = get_product_name_index(db)
+            
             # 既存の類似商品を検索
-            existing_product = cls.find_existing_product(db, product_data)
+            existing_product = cls.find_existing_product(db, product_data, index=index)
             
             if existing_product:
                 # 既存商品に外部ソース情報を追加
                 external_source = ProductExternalSource(
                     product_id=existing_product.id,
-                    source_name=product_data.get('source', 'unknown'),
-                    external_product_id=product_data.get('external_id', str(uuid.uuid4())),
-                    product_url=product_data.get('url')
+                    **cls._external_source_values(product_data)
                 )
                 db.add(external_source)
                 db.commit()
@@ -124,43 +147,223 @@ class ProductRegistrationService:
             # 外部ソース情報の追加
             external_source = ProductExternalSource(
                 product_id=new_product.id,
-                source_name=product_data.get('source', 'unknown'),
-                external_product_id=product_data.get('external_id', str(uuid.uuid4())),
-                product_url=product_data.get('url')
+                **cls._external_source_values(product_data)
             )
             db.add(external_source)
             
             db.commit()
+            
+            # 後続の登録で重複として見つかるよう索引に追加
+            index.add(new_product.id, new_product.name, new_product.category, new_product.created_at)
             return new_product
         
         except Exception as e:
             db.rollback()
             raise DataProcessingError(f"商品登録中にエラー: {e}")
 
+    @staticmethod
+    def _external_source_values(product_data: Dict) -> Dict:
+        """
+        商品データから外部ソース情報の列の値を作成
+
+        Args:
+            product_data (Dict): 商品データ
+
+        Returns:
+            Dict: 外部ソース情報の列の値（product_id を除く）
+        """
+        return {
+            'source_name': product_data.get('source', 'unknown'),
+            'external_product_id': product_data.get('external_id', str(uuid.uuid4())),
+            'product_url': product_data.get('url')
+        }
+
+    @staticmethod
+    def _products_by_external_source(db: Session, keys: Sequence[Tuple[str, str]]) -> Dict[Tuple[str, str], uuid.UUID]:
+        """
+        登録済みの外部ソースの商品IDを1回のクエリで取得
+
+        Args:
+            db (Session): データベースセッション
+            keys (Sequence[Tuple[str, str]]): (ソース名, 外部商品ID) のリスト
+
+        Returns:
+            Dict[Tuple[str, str], uuid.UUID]: (ソース名, 外部商品ID) ごとの商品ID
+        """
+        if not keys:
+            return {}
+        rows = db.execute(
+            select(
+                ProductExternalSource.source_name,
+                ProductExternalSource.external_product_id,
+                ProductExternalSource.product_id
+            ).where(
+                tuple_(ProductExternalSource.source_name, ProductExternalSource.external_product_id).in_(set(keys))
+            )
+        )
+        return {(source_name, external_id): product_id for source_name, external_id, product_id in rows}
+
+    @staticmethod
+    def _insert_external_sources(db: Session):
+        """
+        外部ソース情報のINSERT文（_source_external_id_uc に違反する行は挿入しない）
+
+        Args:
+            db (Session): データベースセッション（方言の判定に使う）
+
+        Returns:
+            Insert: ON CONFLICT DO NOTHING 付きのINSERT文
+        """
+        table = ProductExternalSource.__table__
+        if db.get_bind().dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            statement = dialect_insert(table).on_conflict_do_nothing(constraint='_source_external_id_uc')
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            statement = dialect_insert(table).on_conflict_do_nothing(
+                index_elements=[table.c.source_name, table.c.external_product_id]
+            )
+        return statement.returning(table.c.source_name, table.c.external_product_id)
+
+    @classmethod
+    def _bulk_register_chunk(
+        cls,
+        db: Session,
+        products_data: List[Dict],
+        index: ProductNameIndex
+    ) -> List[Product]:
+        """
+        商品データのチャンクを1回のトランザクションで登録
+
+        既存の外部ソース・類似商品への対応付けはメモリ上で行い（チャンク内の重複も含む）、
+        新規の商品と外部ソース情報はそれぞれ1回の executemany で挿入する。
+        他のプロセスが同時に同じ外部ソースを登録した場合は、その商品に対応付け直す。
+
+        Args:
+            db (Session): データベースセッション
+            products_data (List[Dict]): 商品データのリスト
+            index (ProductNameIndex): 商品名索引
+
+        Returns:
+            List[Product]: 商品データごとの登録された（または既存の）商品
+        """
+        sources = [cls._external_source_values(product_data) for product_data in products_data]
+        keys = [(source['source_name'], source['external_product_id']) for source in sources]
+        known = cls._products_by_external_source(db, keys)
+
+        product_ids = []
+        new_products = []
+        source_rows = []
+        # 作成日時はDBの既定値に任せず、索引の作成日時の最大値と揃える
+        created_at = datetime.now(timezone.utc)
+        for product_data, source, key in zip(products_data, sources, keys):
+            product_id = known.get(key)
+            if product_id is None:
+                match = index.find(
+                    product_data['name'],
+                    product_data.get('category'),
+                    settings.PRODUCT_SIMILARITY_THRESHOLD,
+                    cls.calculate_name_similarity,
+                    k=settings.PRODUCT_DEDUP_CANDIDATES
+                )
+                if match is not None:
+                    product_id = match[0]
+                else:
+                    # 同じチャンクの後続の商品データと重複として対応付けられるよう、すぐに索引に追加する
+                    product_id = uuid.uuid4()
+                    category = product_data.get('category', 'その他')
+                    new_products.append({
+                        'id': product_id,
+                        'name': product_data['name'],
+                        'category': category,
+                        'description': product_data.get('description', ''),
+                        # 一括INSERTでは保存時のイベントが動かないため、全文検索用の文書もここで作る
+                        'search_document': search_document(product_data['name'], category),
+                        'created_at': created_at
+                    })
+                    index.add(product_id, product_data['name'], category, created_at)
+                known[key] = product_id
+                source_rows.append({**source, 'product_id': product_id})
+            product_ids.append(product_id)
+
+        new_product_ids = {row['id'] for row in new_products}
+        try:
+            if new_products:
+                db.execute(insert(Product), new_products)
+            if source_rows:
+                inserted = set(map(tuple, db.execute(cls._insert_external_sources(db), source_rows)))
+                conflicted = [
+                    (row['source_name'], row['external_product_id']) for row in source_rows
+                    if (row['source_name'], row['external_product_id']) not in inserted
+                ]
+                if conflicted:
+                    existing = cls._products_by_external_source(db, conflicted)
+                    product_ids = [existing.get(key, product_id) for key, product_id in zip(keys, product_ids)]
+                    # 対応付け直して参照されなくなった新規商品は削除する
+                    orphans = new_product_ids - set(product_ids)
+                    if orphans:
+                        db.query(Product).filter(Product.id.in_(orphans)).delete(synchronize_session=False)
+                        for product_id in orphans:
+                            index.remove(product_id)
+            db.commit()
+        except Exception:
+            db.rollback()
+            for product_id in new_product_ids:
+                index.remove(product_id)
+            raise
+
+        # 一括INSERTでは保存時のイベントが動かないため、入力補完の索引にもここで反映する
+        registered_ids = set(product_ids)
+        apply_product_changes(
+            ('upsert', row['id'], row['name'], row['category'])
+            for row in new_products if row['id'] in registered_ids
+        )
+
+        products = {
+            product.id: product
+            for product in db.query(Product).filter(Product.id.in_(registered_ids))
+        }
+        return [products[product_id] for product_id in product_ids if product_id in products]
+
     @classmethod
     def bulk_register_products(
         cls, 
         db: Session, 
-        products_data: List[Dict]
+        products_data: List[Dict],
+        chunk_size: int = BULK_CHUNK_SIZE
     ) -> List[Product]:
         """
         複数の商品を一括登録
         
+        chunk_size 件ずつ1回のトランザクションで登録する。チャンクの登録に失敗した場合は、
+        そのチャンクだけ1件ずつ登録し直し、登録できない商品データを読み飛ばす。
+        
         Args:
             db (Session): データベースセッション
             products_data (List[Dict]): 商品データのリスト
+            chunk_size (int): 1回のトランザクションで登録する商品数
         
         Returns:
             List[Product]: 登録された商品のリスト
         """
         registered_products = []
+        index = get_product_name_index(db)
         
-        for product_data in products_data:
+        for start in range(0, len(products_data), chunk_size):
+            chunk = products_data[start:start + chunk_size]
             try:
-                registered_product = cls.register_product(db, product_data)
-                registered_products.append(registered_product)
-            except DataProcessingError as e:
-                # ログ出力や個別のエラーハンドリング
-                print(f"商品登録エラー: {e}")
+                registered_products.extend(cls._bulk_register_chunk(db, chunk, index))
+            except Exception as e:
+                print(f"商品の一括登録エラー、1件ずつ登録し直します: {e}")
+                for product_data in chunk:
+                    try:
+                        registered_product = cls.register_product(db, product_data, index=index)
+                        registered_products.append(registered_product)
+                    except DataProcessingError as e:
+                        # ログ出力や個別のエラーハンドリング
+                        print(f"商品登録エラー: {e}")
+        
+        # 次回の起動時に全商品を読み直さずに済むよう索引を保存
+        index.save(settings.PRODUCT_NAME_INDEX_PATH)
         
         return registered_products
@@ -0,0 +1,227 @@
+import re
+from typing import List
+
+from sqlalchemy import DDL, column, event, func, inspect, literal_column, or_, table
+from sqlalchemy.orm import Query
+
+from core.utils import normalize_text
+
+# 全文検索に使う語（英数字・かな・漢字の並び）
+WORD_PATTERN = re.compile(r'[^\W_]+')
+
+# SQLiteで検索用文書を索引する FTS5 の仮想テーブル
+SQLITE_FTS_TABLE = 'products_fts'
+
+# Postgresで検索用文書の tsvector を作る設定（語は bigram に分けてあるため辞書で変形しない）
+POSTGRES_TEXT_SEARCH_CONFIG = 'simple'
+
+products_fts = table(SQLITE_FTS_TABLE, column('rowid'), column('search_document'))
+
+def search_tokens(text: str) -> List[str]:
+    """
+    検索用の語に分割
+
+    normalize_text で全角・半角を揃えて小文字にし、英数字・かな・漢字の並びごとに文字 bigram に分ける
+    （1文字の並びはそのまま使う）。分かち書きをしない日本語も部分一致で検索できる。
+
+    Args:
+        text (str): 文字列
+
+    Returns:
+        List[str]: 検索用の語
+    """
+    tokens = []
+    for word in WORD_PATTERN.findall(normalize_text(text)):
+        if len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+def search_document(name: str, category: str = None) -> str:
+    """
+    商品名・カテゴリから検索用文書（bigram を空白で区切った文字列）を作成
+
+    Args:
+        name (str): 商品名
+        category (str): カテゴリ
+
+    Returns:
+        str: 検索用文書
+    """
+    return ' '.join(search_tokens(name or '') + search_tokens(category or ''))
+
+def postgres_vector(document):
+    """
+    Postgresの検索用文書の tsvector（GIN 索引と検索条件で同じ式を使う）
+
+    Args:
+        document: 検索用文書の列
+
+    Returns:
+        検索用文書の tsvector の式
+    """
+    return func.to_tsvector(literal_column(f"'{POSTGRES_TEXT_SEARCH_CONFIG}'::regconfig"), document)
+
+def match_products(db, query: Query, text: str, product_model) -> Query:
+    """
+    商品の検索クエリに全文検索の条件と関連度順の並びを追加
+
+    検索語が1文字の場合は bigram で検索できないため、商品名・カテゴリの部分一致で絞り込む。
+
+    Args:
+        db: データベースセッション（方言の判定に使う）
+        query (Query): 商品のクエリ
+        text (str): 検索語
+        product_model: 商品モデル
+
+    Returns:
+        Query: 絞り込んで関連度順に並べたクエリ
+    """
+    tokens = search_tokens(text or '')
+    if not tokens:
+        return query
+    if len(tokens) == 1 and len(tokens[0]) == 1:
+        pattern = f'%{tokens[0]}%'
+        return query.filter(or_(product_model.name.ilike(pattern), product_model.category.ilike(pattern)))
+
+    unique_tokens = list(dict.fromkeys(tokens))
+    if db.get_bind().dialect.name == 'postgresql':
+        vector = postgres_vector(product_model.search_document)
+        ts_query = func.to_tsquery(
+            literal_column(f"'{POSTGRES_TEXT_SEARCH_CONFIG}'::regconfig"),
+            ' & '.join(f"'{token}'" for token in unique_tokens)
+        )
+        return query.filter(vector.op('@@')(ts_query)).order_by(func.ts_rank(vector, ts_query).desc(), product_model.id)
+
+    fts_match = ' '.join(f'"{token}"' for token in unique_tokens)
+    return (
+        query
+        .join(products_fts, products_fts.c.rowid == literal_column(f'{product_model.__tablename__}.rowid'))
+        .filter(literal_column(SQLITE_FTS_TABLE).match(fts_match))
+        .order_by(func.bm25(literal_column(SQLITE_FTS_TABLE)), product_model.id)
+    )
+
+def _update_search_document(mapper, connection, target) -> None:
+    """
+    商品の保存時に全文検索用の文書を作り直す
+    """
+    target.search_document = search_document(target.name, target.category)
+
+def install(product_model) -> None:
+    """
+    商品モデルに全文検索の索引と、保存時に検索用文書を作り直すイベントを登録する（テーブルの作成前に呼ぶ）
+
+    Postgresでは検索用文書の tsvector の GIN 索引、SQLiteでは FTS5 の仮想テーブルを使う。
+
+    Args:
+        product_model: 商品モデル
+    """
+    if event.contains(product_model, 'before_insert', _update_search_document):
+        return
+    event.listen(product_model, 'before_insert', _update_search_document)
+    event.listen(product_model, 'before_update', _update_search_document)
+    register_postgres_index(product_model.__table__)
+    register_sqlite_fts(product_model.__table__)
+
+def postgres_index_statements(product_table) -> List[str]:
+    """
+    Postgresの検索用文書の tsvector の GIN 索引を作成するDDL（postgres_vector と同じ式、何度実行してもよい）
+
+    Args:
+        product_table: 商品テーブル
+
+    Returns:
+        List[str]: DDL
+    """
+    return [
+        f"CREATE INDEX IF NOT EXISTS ix_{product_table.name}_search_document ON {product_table.name} "
+        f"USING gin (to_tsvector('{POSTGRES_TEXT_SEARCH_CONFIG}'::regconfig, search_document))"
+    ]
+
+def sqlite_fts_statements(product_table) -> List[str]:
+    """
+    SQLiteの FTS5 の仮想テーブルと同期用のトリガーを作成するDDL（何度実行してもよい）
+
+    Args:
+        product_table: 商品テーブル
+
+    Returns:
+        List[str]: DDL
+    """
+    name = product_table.name
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} "
+        f"USING fts5(search_document, content='{name}', content_rowid='rowid')",
+        f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ai AFTER INSERT ON {name} BEGIN "
+        f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, search_document) VALUES (new.rowid, new.search_document); END",
+        f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ad AFTER DELETE ON {name} BEGIN "
+        f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, search_document) "
+        f"VALUES ('delete', old.rowid, old.search_document); END",
+        f"CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_au AFTER UPDATE ON {name} BEGIN "
+        f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, search_document) "
+        f"VALUES ('delete', old.rowid, old.search_document); "
+        f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, search_document) VALUES (new.rowid, new.search_document); END",
+    ]
+
+def register_postgres_index(product_table) -> None:
+    """
+    Postgresでは商品テーブルの作成時に検索用文書の tsvector の GIN 索引を作成する
+
+    Args:
+        product_table: 商品テーブル
+    """
+    for statement in postgres_index_statements(product_table):
+        event.listen(product_table, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+def register_sqlite_fts(product_table) -> None:
+    """
+    SQLiteでは商品テーブルの作成時に FTS5 の仮想テーブルと同期用のトリガーを作成する
+
+    Args:
+        product_table: 商品テーブル
+    """
+    for statement in sqlite_fts_statements(product_table):
+        event.listen(product_table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    event.listen(
+        product_table, 'before_drop',
+        DDL(f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}").execute_if(dialect='sqlite')
+    )
+
+def ensure_search_schema(connection, product_table) -> None:
+    """
+    既存のデータベースに全文検索用の列と索引を追加する（何度実行してもよい）
+
+    テーブルの作成時の登録（register_postgres_index・register_sqlite_fts）は新しいテーブルにしか
+    効かないため、既存のテーブルには検索用文書を作り直す前にこれを実行する。
+
+    Args:
+        connection: データベース接続
+        product_table: 商品テーブル
+    """
+    name = product_table.name
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql(f"ALTER TABLE {name} ADD COLUMN IF NOT EXISTS search_document TEXT")
+        statements = postgres_index_statements(product_table)
+    elif connection.dialect.name == 'sqlite':
+        # SQLiteの ALTER TABLE には IF NOT EXISTS がないため、列の有無を調べてから追加する
+        if 'search_document' not in {column['name'] for column in inspect(connection).get_columns(name)}:
+            connection.exec_driver_sql(f"ALTER TABLE {name} ADD COLUMN search_document TEXT")
+        statements = sqlite_fts_statements(product_table)
+    else:
+        return
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+    # 作成したばかりの FTS5 の仮想テーブルは既存の商品を含まないため、更新のトリガーが削除する行と
+    # 食い違わないよう、現在の商品テーブルから作り直しておく
+    rebuild_sqlite_fts(connection)
+
+def rebuild_sqlite_fts(connection) -> None:
+    """
+    SQLiteの FTS5 の仮想テーブルを商品テーブルから作り直す
+
+    Args:
+        connection: データベース接続
+    """
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql(f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')")
@@ -1,11 +1,12 @@
 from typing import List, Dict, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
 from sqlalchemy.sql.expression import cast
 from sqlalchemy.types import String
 
+from database import loading
 from database.models import Product, ProductExternalSource
 from api.schemas import ProductResponse
+from services import product_search
 
 class ProductSearchService:
     @staticmethod
@@ -14,31 +15,32 @@ class ProductSearchService:
         query: str, 
         min_price: Optional[float] = None, 
         max_price: Optional[float] = None, 
-        category: Optional[str] = None
+        category: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: int = 0
     ) -> List[ProductResponse]:
         """
         商品検索メソッド
         
+        商品名・カテゴリの全文検索索引で絞り込み、関連度の高い順に返す。
+        
         Args:
             db (Session): データベースセッション
             query (str): 検索クエリ
             min_price (Optional[float]): 最小価格
             max_price (Optional[float]): 最大価格
             category (Optional[str]): 商品カテゴリ
+            limit (Optional[int]): 取得する最大件数（省略時は全件）
+            offset (int): 読み飛ばす件数
         
         Returns:
             List[ProductResponse]: 検索結果の商品リスト
         """
-        # ベースクエリの構築
-        base_query = db.query(Product)
+        # ベースクエリの構築（外部ソース情報は商品の件数によらず1回のクエリでまとめて読み込む）
+        base_query = loading.shape(db.query(Product), loading.PRODUCT_RESPONSE)
         
-        # 名前・カテゴリによる検索
-        base_query = base_query.filter(
-            or_(
-                Product.name.ilike(f'%{query}%'),
-                Product.category.ilike(f'%{query}%')
-            )
-        )
+        # 名前・カテゴリによる検索（関連度順）
+        base_query = product_search.match_products(db, base_query, query, Product)
         
         # カテゴリフィルター
         if category:
@@ -53,6 +55,12 @@ class ProductSearchService:
         # 価格が設定されている場合、価格履歴との結合が必要
         # (実際の実装では価格履歴テーブルとのJOINが必要)
         
+        # ページング
+        if offset:
+            base_query = base_query.offset(offset)
+        if limit is not None:
+            base_query = base_query.limit(limit)
+        
         # 商品を取得
         products = base_query.all()
         
@@ -0,0 +1,378 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from core.utils import normalize_text
+from services.product_search import WORD_PATTERN, search_tokens
+
+# 前方一致のキーは (商品の番号 << OFFSET_BITS | 語の先頭の位置) で正規化した商品名の部分文字列を指す
+OFFSET_BITS = 16
+OFFSET_MASK = (1 << OFFSET_BITS) - 1
+
+# 追加分のキーがこの数を超えたら、ソート済みの配列に併合する
+MERGE_THRESHOLD = 65536
+
+# 無効にした商品が全体のこの割合を超えたら（COMPACT_MIN_DEAD 件以上）、番号を振り直して取り除く
+COMPACT_DEAD_RATIO = 0.25
+COMPACT_MIN_DEAD = 1024
+
+# 部分一致で確かめる候補の最大数（入力ごとの処理時間の上限）
+MAX_INFIX_SCAN = 20000
+
+# 候補の既定の数
+DEFAULT_LIMIT = 10
+
+# 他のプロセスが登録した商品を取り込む間隔
+REFRESH_INTERVAL = timedelta(seconds=60)
+
+# 取り込み済みの作成日時より少し前から読み直す幅
+REFRESH_OVERLAP = timedelta(minutes=1)
+
+# コミット待ちの商品の変更をセッションに記録するキー
+SESSION_CHANGES_KEY = 'product_suggest_changes'
+
+ProductRow = Tuple[Any, str, Optional[str]]
+
+def word_starts(normalized_name: str) -> List[int]:
+    """
+    正規化した商品名の語の先頭の位置
+
+    Args:
+        normalized_name (str): 正規化した商品名
+
+    Returns:
+        List[int]: 語の先頭の位置（OFFSET_MASK まで）
+    """
+    return [match.start() for match in WORD_PATTERN.finditer(normalized_name) if match.start() <= OFFSET_MASK]
+
+class ProductSuggestIndex:
+    """
+    入力補完用の商品の転置索引（プロセス内）
+
+    商品名の語の先頭から始まる部分文字列の順に並べたキーの配列を二分探索して前方一致の候補を求め、
+    足りない場合は商品名・カテゴリの bigram の転置リストで部分一致の候補を求める。
+    キーは文字列を持たず正規化した商品名の位置を指すため、100万件でもメモリに収まる。
+    追加したキーは小さなソート済みの配列に入れておき、MERGE_THRESHOLD を超えたら併合する。
+    削除・変更した商品は無効にして、併合時にキーを取り除く。無効にした商品が増えたら
+    番号を振り直し、商品名・bigram の転置リストからも取り除く。
+    """
+    def __init__(self):
+        """
+        初期化メソッド
+        """
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self) -> None:
+        """
+        索引を空にする（ロックは作り直さない。待っているスレッドが同じロックで排他されるようにする）
+        """
+        # 併合済みのキーと追加分のキー
+        self._keys = array('Q')
+        self._pending_keys: List[int] = []
+        # 商品の番号 -> (商品ID, 商品名, カテゴリ)、無効にした商品は None
+        self._products: List[Optional[ProductRow]] = []
+        # 商品の番号 -> 正規化した商品名（無効にした商品のキーが残っている間も使う）
+        self._names: List[str] = []
+        self._ordinals: Dict[Any, int] = {}
+        self._dead = 0
+        # bigram -> 商品の番号（昇順）
+        self._bigrams: Dict[str, array] = defaultdict(lambda: array('I'))
+        self.watermark: Optional[datetime] = None
+        self.refreshed_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._ordinals)
+
+    def build(self, rows: Iterable[Tuple[Any, str, Optional[str], Optional[datetime]]]) -> int:
+        """
+        (商品ID, 商品名, カテゴリ, 作成日時) の行から索引を作り直す
+
+        Args:
+            rows (Iterable): 商品の行
+
+        Returns:
+            int: 索引した商品数
+        """
+        with self._lock:
+            self._reset()
+            keys = []
+            for product_id, name, category, created_at in rows:
+                keys.extend(self._append(product_id, name, category, created_at))
+            keys.sort(key=self._key_text)
+            self._keys = array('Q', keys)
+            return len(self._ordinals)
+
+    def add(self, product_id: Any, name: str, category: Optional[str], created_at: Optional[datetime] = None) -> None:
+        """
+        商品を追加（登録済みの場合、名前・カテゴリが変わっていれば置き換える）
+
+        Args:
+            product_id (Any): 商品ID
+            name (str): 商品名
+            category (Optional[str]): カテゴリ
+            created_at (Optional[datetime]): 商品の作成日時
+        """
+        with self._lock:
+            ordinal = self._ordinals.get(product_id)
+            if ordinal is not None and self._products[ordinal] == (product_id, name, category):
+                self._advance_watermark(created_at)
+                return
+            self.remove(product_id)
+            for key in self._append(product_id, name, category, created_at):
+                self._pending_keys.insert(bisect_left(self._pending_keys, self._key_text(key), key=self._key_text), key)
+            if len(self._pending_keys) > MERGE_THRESHOLD:
+                self._merge()
+
+    def remove(self, product_id: Any) -> None:
+        """
+        商品を無効にする
+
+        Args:
+            product_id (Any): 商品ID
+        """
+        with self._lock:
+            ordinal = self._ordinals.pop(product_id, None)
+            if ordinal is None:
+                return
+            self._products[ordinal] = None
+            self._dead += 1
+            if self._dead >= COMPACT_MIN_DEAD and self._dead > len(self._products) * COMPACT_DEAD_RATIO:
+                self._compact()
+
+    def suggest(self, text: str, limit: int = DEFAULT_LIMIT) -> List[Dict[str, Any]]:
+        """
+        入力中の文字列の候補の商品を取得
+
+        語の先頭からの前方一致を先に、足りない分を新しい商品から順に部分一致で返す。
+
+        Args:
+            text (str): 入力中の文字列
+            limit (int): 候補の最大数
+
+        Returns:
+            List[Dict[str, Any]]: 候補の商品（product_id, name, category）
+        """
+        query = normalize_text(text or '')
+        if not query or limit <= 0:
+            return []
+
+        with self._lock:
+            ordinals = self._prefix_matches(query, limit)
+            if len(ordinals) < limit:
+                ordinals.extend(self._infix_matches(query, limit - len(ordinals), set(ordinals)))
+            return [
+                {'product_id': product_id, 'name': name, 'category': category}
+                for product_id, name, category in (self._products[ordinal] for ordinal in ordinals)
+            ]
+
+    def _append(self, product_id: Any, name: str, category: Optional[str], created_at: Optional[datetime]) -> List[int]:
+        """
+        商品に番号を振って bigram の転置リストに追加し、前方一致のキーを返す（ロックを取得して呼び出す）
+        """
+        ordinal = len(self._products)
+        normalized_name = normalize_text(name or '')
+        self._products.append((product_id, name, category))
+        self._names.append(normalized_name)
+        self._ordinals[product_id] = ordinal
+        for token in set(search_tokens(f'{normalized_name} {category or ""}')):
+            self._bigrams[token].append(ordinal)
+        self._advance_watermark(created_at)
+        return [ordinal << OFFSET_BITS | offset for offset in word_starts(normalized_name)]
+
+    def _key_text(self, key: int) -> str:
+        """
+        キーが指す正規化した商品名の部分文字列
+        """
+        return self._names[key >> OFFSET_BITS][key & OFFSET_MASK:]
+
+    def _advance_watermark(self, created_at: Optional[datetime]) -> None:
+        if created_at is not None and (self.watermark is None or created_at > self.watermark):
+            self.watermark = created_at
+
+    def _merge(self) -> None:
+        """
+        追加分のキーを併合し、無効にした商品のキーを取り除く（ロックを取得して呼び出す）
+        """
+        products = self._products
+        self._keys = array('Q', (
+            key for key in heapq.merge(self._keys, self._pending_keys, key=self._key_text)
+            if products[key >> OFFSET_BITS] is not None
+        ))
+        self._pending_keys = []
+
+    def _compact(self) -> None:
+        """
+        無効にした商品を取り除き、残りの商品に追加した順のまま番号を振り直す（ロックを取得して呼び出す）
+        """
+        rows = [row for row in self._products if row is not None]
+        watermark, refreshed_at = self.watermark, self.refreshed_at
+        self.build((product_id, name, category, None) for product_id, name, category in rows)
+        self.watermark, self.refreshed_at = watermark, refreshed_at
+
+    def _prefix_matches(self, query: str, limit: int) -> List[int]:
+        """
+        語の先頭からの前方一致の候補（キーの順）
+        """
+        matches = []
+        for keys in (self._keys, self._pending_keys):
+            found = 0
+            position = bisect_left(keys, query, key=self._key_text)
+            while found < limit and position < len(keys):
+                key = keys[position]
+                position += 1
+                text = self._key_text(key)
+                if not text.startswith(query):
+                    break
+                if self._products[key >> OFFSET_BITS] is not None:
+                    matches.append((text, key >> OFFSET_BITS))
+                    found += 1
+
+        result, seen = [], set()
+        for _, ordinal in sorted(matches):
+            if ordinal not in seen:
+                seen.add(ordinal)
+                result.append(ordinal)
+        return result[:limit]
+
+    def _infix_matches(self, query: str, limit: int, exclude: set) -> List[int]:
+        """
+        商品名・カテゴリの部分一致の候補（新しい商品から順）
+        """
+        tokens = set(search_tokens(query))
+        if not tokens or any(len(token) < 2 for token in tokens):
+            return []
+        postings = []
+        for token in tokens:
+            posting = self._bigrams.get(token)
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+        rarest, others = postings[0], postings[1:]
+
+        matches = []
+        for scanned, ordinal in enumerate(reversed(rarest)):
+            if scanned >= MAX_INFIX_SCAN or len(matches) >= limit:
+                break
+            if ordinal in exclude or self._products[ordinal] is None:
+                continue
+            if not all(_contains(posting, ordinal) for posting in others):
+                continue
+            if query in self._names[ordinal] or query in normalize_text(self._products[ordinal][2] or ''):
+                matches.append(ordinal)
+        return matches
+
+def _contains(posting: array, ordinal: int) -> bool:
+    position = bisect_left(posting, ordinal)
+    return position < len(posting) and posting[position] == ordinal
+
+_shared_index: Optional[ProductSuggestIndex] = None
+_shared_index_lock = threading.Lock()
+
+def get_suggest_index(db) -> ProductSuggestIndex:
+    """
+    共有の入力補完索引（初回は全商品から作り、REFRESH_INTERVAL ごとに新しい商品を取り込む）
+
+    DBの読み込みはロックの外で行い、他のリクエストは読み込み中も現在の索引で補完する。
+
+    Args:
+        db: データベースセッション
+
+    Returns:
+        ProductSuggestIndex: 入力補完索引
+    """
+    global _shared_index
+    index = _shared_index
+    if index is None:
+        # 作ってから差し替える（同時に作った場合は先に差し替えたものを使う）
+        index = ProductSuggestIndex()
+        index.build(_product_rows(db))
+        index.refreshed_at = time.monotonic()
+        with _shared_index_lock:
+            if _shared_index is None:
+                _shared_index = index
+            return _shared_index
+
+    # 取り込みは期限切れに気づいた1つのリクエストだけが行う
+    with _shared_index_lock:
+        now = time.monotonic()
+        due = now - index.refreshed_at >= REFRESH_INTERVAL.total_seconds()
+        if due:
+            index.refreshed_at = now
+    if due:
+        watermark = index.watermark
+        for row in _product_rows(db, None if watermark is None else watermark - REFRESH_OVERLAP):
+            index.add(*row)
+    return index
+
+def _product_rows(db, since: Optional[datetime] = None, batch_size: int = 10000):
+    """
+    商品の (商品ID, 商品名, カテゴリ, 作成日時) の行（since 以降に作成されたもの）
+    """
+    from sqlalchemy import select
+    from database.models import Product
+
+    query = select(Product.id, Product.name, Product.category, Product.created_at)
+    if since is not None:
+        query = query.where(Product.created_at >= since)
+    for rows in db.execute(query, execution_options={'yield_per': batch_size}).partitions():
+        yield from rows
+
+def apply_product_changes(changes: Iterable[Tuple[str, Any, Optional[str], Optional[str]]]) -> None:
+    """
+    コミットした商品の変更を共有の索引に反映（索引をまだ作っていない場合は何もしない）
+
+    Args:
+        changes (Iterable): ('upsert' または 'delete', 商品ID, 商品名, カテゴリ) の変更
+    """
+    index = _shared_index
+    if index is None:
+        return
+    for operation, product_id, name, category in changes:
+        if operation == 'delete':
+            index.remove(product_id)
+        else:
+            index.add(product_id, name, category)
+
+def _record(operation: str):
+    def listener(mapper, connection, target) -> None:
+        session = object_session(target)
+        if session is not None:
+            session.info.setdefault(SESSION_CHANGES_KEY, []).append(
+                (operation, target.id, target.name, target.category)
+            )
+    return listener
+
+_record_upsert = _record('upsert')
+_record_delete = _record('delete')
+
+def _apply_committed_changes(session: Session) -> None:
+    apply_product_changes(session.info.pop(SESSION_CHANGES_KEY, ()))
+
+def _discard_rolled_back_changes(session: Session, previous_transaction) -> None:
+    session.info.pop(SESSION_CHANGES_KEY, None)
+
+def install(product_model, session_factory: Any) -> None:
+    """
+    商品の追加・変更・削除をセッションに記録し、コミット後に共有の索引に反映させる
+
+    Args:
+        product_model: 商品モデル
+        session_factory: イベントを登録するセッションのファクトリー（sessionmaker）またはセッション
+    """
+    if not event.contains(product_model, 'after_insert', _record_upsert):
+        event.listen(product_model, 'after_insert', _record_upsert)
+        event.listen(product_model, 'after_update', _record_upsert)
+        event.listen(product_model, 'after_delete', _record_delete)
+    if not event.contains(session_factory, 'after_commit', _apply_committed_changes):
+        event.listen(session_factory, 'after_commit', _apply_committed_changes)
+        event.listen(session_factory, 'after_soft_rollback', _discard_rolled_back_changes)
@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.signals import worker_process_init
 from scraping.scrapers import scrape_products
 from typing import List, Dict
 import redis
@@ -48,12 +49,39 @@ def get_cached_products(query: str) -> List[Dict]:
     
     return []
 
+@worker_process_init.connect
+def install_model_events(**kwargs) -> None:
+    """
+    ワーカープロセスごとに、データベースの起動を待ってモデルの保存・セッションのコミットに連動する処理を登録する
+    """
+    from database.base import SessionLocal, wait_for_database
+    from services import model_events
+
+    wait_for_database()
+    model_events.install(SessionLocal)
+
 # Celeryの設定
 app.conf.beat_schedule = {
     'cleanup-cache': {
         'task': 'clean_expired_cache',
         'schedule': 3600.0,  # 1時間ごと
     },
+    'rebuild-latest-prices': {
+        'task': 'rebuild_latest_prices',
+        'schedule': 7 * 24 * 3600.0,  # 1週間ごと
+    },
+    'rebuild-price-stats': {
+        'task': 'rebuild_price_stats',
+        'schedule': 7 * 24 * 3600.0,  # 1週間ごと
+    },
+    'export-price-histories': {
+        'task': 'export_price_histories',
+        'schedule': 24 * 3600.0,  # 1日ごと
+    },
+    'refresh-price-forecasts': {
+        'task': 'refresh_price_forecasts',
+        'schedule': 24 * 3600.0,  # 1日ごと
+    },
 }
 
 @app.task(name='clean_expired_cache')
@@ -63,3 +91,69 @@ def clean_expired_cache():
     """
     # Redisの自動キャッシュ管理に委ねるため、特別な処理は不要
     pass
+
+@app.task(name='rebuild_latest_prices')
+def rebuild_latest_prices() -> int:
+    """
+    商品ごとの最新価格テーブルを価格履歴から作り直す
+    """
+    from database.base import SessionLocal
+    from repositories.product_repository import ProductRepository
+
+    db = SessionLocal()
+    try:
+        return ProductRepository(db).rebuild_latest_prices()
+    finally:
+        db.close()
+
+@app.task(name='rebuild_price_stats')
+def rebuild_price_stats() -> int:
+    """
+    商品ごとの価格の逐次統計を価格履歴から作り直す
+    """
+    from database.base import SessionLocal
+    from repositories.product_repository import ProductRepository
+
+    db = SessionLocal()
+    try:
+        return ProductRepository(db).rebuild_price_stats()
+    finally:
+        db.close()
+
+@app.task(name='export_price_histories')
+def export_price_histories(full: bool = False) -> int:
+    """
+    価格履歴を分析・学習用のParquetデータセットに書き出す
+
+    通常は前日を含む月から後だけを書き直し（月初めには前月分も書き直す）、full=True の場合は全期間を書き出す。
+    """
+    from datetime import datetime, timedelta, timezone
+    from core.config import settings
+    from database.base import engine
+    from services.price_export import export_price_histories as export
+
+    since = None if full else datetime.now(timezone.utc) - timedelta(days=1)
+    with engine.connect() as connection:
+        return export(connection, settings.PRICE_EXPORT_DIR, since=since, buckets=settings.PRICE_EXPORT_BUCKETS)
+
+@app.task(name='refresh_price_forecasts')
+def refresh_price_forecasts(n_jobs: int = None) -> int:
+    """
+    全商品の価格をまとめて予測し、予測エンドポイントが読む price_forecasts を書き直す
+
+    特徴量行列を PRICE_FORECAST_CHUNK_SIZE 行ずつ予測し、n_jobs（省略時は PRICE_FORECAST_WORKERS）プロセスで分担する。
+    """
+    from core.config import settings
+    from database.base import SessionLocal
+    from repositories.product_repository import ProductRepository
+
+    db = SessionLocal()
+    try:
+        return ProductRepository(db).refresh_price_forecasts(
+            settings.PRICE_PREDICTOR_MODEL_PATH,
+            horizon_days=settings.PRICE_FORECAST_HORIZON_DAYS,
+            chunk_size=settings.PRICE_FORECAST_CHUNK_SIZE,
+            n_jobs=n_jobs or settings.PRICE_FORECAST_WORKERS,
+        )
+    finally:
+        db.close()
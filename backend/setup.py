@@ -15,6 +15,7 @@ setup(
         'requests',
         'numpy',
         'pandas',
+        'pyarrow',
         'scikit-learn',
     ],
     test_suite='tests',
@@ -3,6 +3,9 @@ import sys
 import os
 from typing import Generator
 
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.ext.compiler import compiles
+
 # プロジェクトルートをパスに追加
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
@@ -12,6 +15,13 @@ from tests.utils.test_helpers import (
     generate_random_string
 )
 
+@compiles(UUID, 'sqlite')
+def compile_uuid_for_sqlite(type_, compiler, **kw):
+    """
+    テスト用のSQLiteではUUID型の列を文字列の列として作成する
+    """
+    return 'CHAR(32)'
+
 @pytest.fixture(scope='function')
 def mock_product():
     """
@@ -86,3 +96,42 @@ def temp_db_connection():
     finally:
         session.close()
         engine.dispose()
+
+@pytest.fixture(scope='function')
+def sqlite_engine():
+    """
+    テスト用のインメモリSQLiteエンジン（PostgreSQLなしで動かすテスト用）
+
+    Yields:
+        Engine: 1つの接続を共有するエンジン
+    """
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+
+    engine = create_engine(
+        'sqlite://',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool
+    )
+    yield engine
+    engine.dispose()
+
+@pytest.fixture(scope='function')
+def sqlite_session_factory(sqlite_engine):
+    """
+    モデルのイベントを登録し、テーブルを作成したSQLiteのセッションファクトリー
+
+    アプリの起動時と同じく、model_events.install() をテーブルの作成前に呼ぶ。
+
+    Yields:
+        sessionmaker: セッションファクトリー
+    """
+    from sqlalchemy.orm import sessionmaker
+    from database.base import Base
+    from services import model_events
+
+    session_factory = sessionmaker(bind=sqlite_engine)
+    model_events.install(session_factory)
+    Base.metadata.create_all(bind=sqlite_engine)
+    yield session_factory
+    Base.metadata.drop_all(bind=sqlite_engine)
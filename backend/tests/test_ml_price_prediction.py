@@ -101,3 +101,47 @@ def test_error_handling():
     
     with pytest.raises(ValueError):
         model.predict_price(model_name='non_existent_model')
+
+def test_parallel_training_matches_sequential(sample_price_history):
+    """
+    並列に学習したモデルが順に学習したものと同じ結果になり、学習時間を返すことのテスト
+    """
+    parallel = AdvancedPricePredictionModel(sample_price_history)
+    sequential = AdvancedPricePredictionModel(sample_price_history)
+    parallel_performance = parallel.train_models(n_jobs=2)
+    sequential_performance = sequential.train_models(n_jobs=1)
+
+    assert set(parallel_performance) == {'ridge_regression', 'lasso_regression', 'random_forest', 'gradient_boosting'}
+    for model_name, metrics in parallel_performance.items():
+        assert metrics['train_seconds'] >= 0
+        for key in ('mse', 'mae', 'r2'):
+            assert metrics[key] == pytest.approx(sequential_performance[model_name][key])
+
+def test_train_selected_models(sample_price_history):
+    """
+    指定したモデルだけを学習できることのテスト
+    """
+    model = AdvancedPricePredictionModel(sample_price_history)
+
+    assert set(model.train_models(model_names=['ridge_regression'], n_jobs=1)) == {'ridge_regression'}
+    assert set(model.models) == {'ridge_regression'}
+    with pytest.raises(ValueError):
+        model.train_models(model_names=['non_existent_model'])
+
+def test_ensemble_averages_models_on_shared_features(sample_price_history):
+    """
+    アンサンブル予測が同じ将来の特徴量での各モデルの予測の平均になることのテスト
+    """
+    model = AdvancedPricePredictionModel(sample_price_history)
+    model.train_models(model_names=['ridge_regression', 'gradient_boosting'], n_jobs=1)
+
+    result = model.ensemble_prediction(days_ahead=14)
+    individual = result['individual_predictions']
+
+    assert set(individual) == {'ridge_regression', 'gradient_boosting'}
+    assert individual['ridge_regression']['dates'] == individual['gradient_boosting']['dates']
+    np.testing.assert_allclose(
+        result['ensemble_prediction'],
+        np.mean([prediction['predicted_prices'] for prediction in individual.values()], axis=0)
+    )
+    assert len(result['ensemble_prediction']) == 14
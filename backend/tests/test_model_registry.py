@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from datetime import datetime, timedelta
+
+from services.ml_price_prediction import FEATURE_SET_VERSION, comprehensive_price_prediction
+from services.model_registry import ModelRegistry
+
+@pytest.fixture
+def registry(tmp_path):
+    """
+    一時ディレクトリに保存するモデルレジストリ
+    """
+    return ModelRegistry(str(tmp_path / 'models'), cache_size=2, retrain_threshold=10)
+
+def price_history(days: int):
+    """
+    days 日分の価格履歴
+    """
+    base_date = datetime(2024, 1, 1)
+    rng = np.random.default_rng(0)
+    return [
+        {'date': (base_date + timedelta(days=i)).strftime('%Y-%m-%d'), 'price': 1000 + i * 5 + rng.normal(0, 10)}
+        for i in range(days)
+    ]
+
+def test_put_and_load_memory_mapped_model(registry):
+    """
+    保存したモデルを別のレジストリからメモリマップで読み込めることのテスト
+    """
+    weights = np.arange(100_000, dtype=np.float64)
+    registry.put('product:1', 1, 120, {'linear': {'weights': weights}}, {'linear': {'mse': 1.0}})
+
+    loaded = ModelRegistry(registry.root).get('product:1', 1)
+
+    assert loaded.watermark == 120
+    assert loaded.metrics == {'linear': {'mse': 1.0}}
+    assert isinstance(loaded.models['linear']['weights'], np.memmap)
+    np.testing.assert_array_equal(loaded.models['linear']['weights'], weights)
+    assert ModelRegistry(registry.root).get('product:1', 2) is None
+
+def test_lru_keeps_hot_models_and_reloads_changed_files(registry):
+    """
+    よく使うモデルはメモリから返し、あふれたものや他で更新されたものは読み込み直すことのテスト
+    """
+    for product_id in (1, 2, 3):
+        registry.put(f'product:{product_id}', 1, 100, {'model': product_id})
+
+    assert registry.get('product:3', 1).models == {'model': 3}
+    assert registry.stats == {'hits': 1, 'loads': 0, 'trainings': 0}
+    # 上限2件のため、最初のモデルはファイルから読み込む
+    assert registry.get('product:1', 1).models == {'model': 1}
+    assert registry.stats['loads'] == 1
+
+    # 別のプロセスが再学習した場合
+    ModelRegistry(registry.root).put('product:3', 1, 200, {'model': 'retrained'})
+    assert registry.get('product:3', 1).models == {'model': 'retrained'}
+    assert registry.stats['loads'] == 2
+
+def test_retrains_only_after_enough_new_prices(registry):
+    """
+    新しい価格が再学習の件数に達するまでは学習済みモデルを使うことのテスト
+    """
+    trainings = []
+
+    def train():
+        trainings.append(1)
+        return {'model': len(trainings)}, {}
+
+    assert registry.get_or_train('category:家電', 1, 100, train).models == {'model': 1}
+    assert registry.get_or_train('category:家電', 1, 109, train).models == {'model': 1}
+    assert registry.get_or_train('category:家電', 1, 110, train).models == {'model': 2}
+    # 特徴量セットのバージョンが変わったら別のモデルとして学習する
+    assert registry.get_or_train('category:家電', 2, 110, train).models == {'model': 3}
+    assert registry.get('category:家電', 1).watermark == 110
+
+def test_prediction_reuses_registered_models(registry):
+    """
+    価格予測がレジストリの学習済みモデルを使い、毎回学習しないことのテスト
+    """
+    first = comprehensive_price_prediction(price_history(100), scope='product:1', registry=registry)
+    second = comprehensive_price_prediction(price_history(105), scope='product:1', registry=registry)
+
+    assert registry.stats['trainings'] == 1
+    assert second['model_performance'] == first['model_performance']
+    assert len(second['predictions']['ensemble_prediction']) == 30
+    assert registry.get('product:1', FEATURE_SET_VERSION).watermark == 100
+
+    comprehensive_price_prediction(price_history(110), scope='product:1', registry=registry)
+    assert registry.stats['trainings'] == 2
+
+def test_prediction_with_scope_uses_shared_registry(registry, monkeypatch):
+    """
+    scope だけを指定した価格予測が共有のレジストリを使うことのテスト
+    """
+    from services import model_registry
+
+    monkeypatch.setattr(model_registry, 'get_model_registry', lambda: registry)
+
+    result = comprehensive_price_prediction(price_history(100), scope='product:2', days_ahead=7)
+    comprehensive_price_prediction(price_history(100), scope='product:2')
+
+    assert registry.stats['trainings'] == 1
+    assert len(result['predictions']['ensemble_prediction']) == 7
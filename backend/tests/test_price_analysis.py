@@ -1,4 +1,9 @@
+import json
+import random
+import statistics
+import pandas as pd
 import pytest
+from services.price_analysis import EWMA_ALPHA, HISTOGRAM_BINS, RunningPriceStats
 from services.price_utils import PriceUtils
 from core.exceptions import PriceAnalysisError, ValidationError
 
@@ -40,3 +45,81 @@ def test_round_price():
     assert PriceUtils.round_price(10.456) == 10.46
     assert PriceUtils.round_price(10.454) == 10.45
     assert PriceUtils.round_price(-10.456) == -10.46
+
+def random_prices(seed: int):
+    """
+    シードごとに件数・分布の異なる価格のリスト（同値を多く含むもの・一定のものも含む）
+    """
+    rng = random.Random(seed)
+    count = rng.choice([1, 2, 3, 5, 6, 10, 50, 500, 2000])
+    kind = seed % 4
+    if kind == 0:
+        return [rng.gauss(1000, 150) for _ in range(count)]
+    if kind == 1:
+        return [rng.uniform(100, 50000) for _ in range(count)]
+    if kind == 2:
+        return [float(rng.choice([980, 1000, 1000, 1200])) for _ in range(count)]
+    return [rng.lognormvariate(7, 0.5) for _ in range(count)]
+
+@pytest.mark.parametrize('seed', range(60))
+def test_running_stats_match_batch_statistics(seed):
+    """
+    逐次統計が価格履歴全体から求めた統計と一致することのテスト
+    """
+    prices = random_prices(seed)
+    stats = RunningPriceStats.from_prices(prices)
+
+    assert stats.count == len(prices)
+    assert stats.min_price == min(prices)
+    assert stats.max_price == max(prices)
+    assert stats.last_price == prices[-1]
+    assert stats.mean == pytest.approx(statistics.fmean(prices), rel=1e-12)
+    if len(prices) > 1:
+        assert stats.variance == pytest.approx(statistics.variance(prices), rel=1e-9, abs=1e-6)
+        assert stats.stdev == pytest.approx(statistics.stdev(prices), rel=1e-9, abs=1e-6)
+    else:
+        assert stats.variance == 0.0
+    expected_ewma = pd.Series(prices).ewm(alpha=EWMA_ALPHA, adjust=False).mean().iloc[-1]
+    assert stats.ewma == pytest.approx(expected_ewma, rel=1e-12)
+
+@pytest.mark.parametrize('seed', range(60))
+def test_running_median_estimate(seed):
+    """
+    中央値が、異なる価格がビンの数以下なら厳密値、それより多い場合は順位がほぼ中央の値になることのテスト
+    """
+    prices = random_prices(seed)
+    median = RunningPriceStats.from_prices(prices).median
+
+    if len(set(prices)) <= HISTOGRAM_BINS:
+        assert median == pytest.approx(statistics.median(prices), rel=1e-12)
+    assert min(prices) <= median <= max(prices)
+    if len(prices) >= 500:
+        below = sum(price < median for price in prices) / len(prices)
+        at_or_below = sum(price <= median for price in prices) / len(prices)
+        assert below <= 0.55 and at_or_below >= 0.45
+
+@pytest.mark.parametrize('seed', range(20))
+def test_running_stats_survive_storage_between_updates(seed):
+    """
+    途中で保存・復元しても、続けて更新した場合と同じ統計になることのテスト
+    """
+    prices = random_prices(seed)
+    expected = RunningPriceStats.from_prices(prices)
+
+    stats = RunningPriceStats()
+    for price in prices:
+        # 1件ごとにDBへの保存（JSON列を含む）と読み込みを模す
+        stats = RunningPriceStats.from_record(json.loads(json.dumps(stats.to_record())))
+        stats.update(price)
+
+    assert stats == expected
+    assert stats.summary()['median'] == expected.median
+
+def test_empty_running_stats():
+    """
+    価格がない場合の統計のテスト
+    """
+    summary = RunningPriceStats().summary()
+    assert summary['count'] == 0
+    assert summary['mean'] is None and summary['median'] is None
+
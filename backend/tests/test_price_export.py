@@ -0,0 +1,159 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from services.advanced_price_prediction import AdvancedPricePredictionModel
+from database.models import PriceHistory, Product
+from services.price_export import (
+    load_price_arrays,
+    load_price_frame,
+    load_price_table,
+    product_bucket,
+    read_price_arrays,
+    read_price_frame,
+    rows_to_batch,
+    write_price_batches,
+)
+
+PRODUCT_IDS = [uuid.UUID(int=i) for i in range(1, 6)]
+
+@pytest.fixture
+def price_rows():
+    """
+    5商品・約3か月分の価格履歴の行（時刻順ではない）
+    """
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for day in range(90):
+        for index, product_id in enumerate(PRODUCT_IDS):
+            rows.append((product_id, 1000.0 * (index + 1) + day, 'Amazon', base + timedelta(days=day, hours=index)))
+    return rows[::-1]
+
+@pytest.fixture
+def dataset_root(tmp_path, price_rows):
+    """
+    価格履歴を書き出したデータセットのディレクトリ
+    """
+    root = str(tmp_path / 'price_history')
+    batches = [rows_to_batch(price_rows[start:start + 100], buckets=4) for start in range(0, len(price_rows), 100)]
+    write_price_batches(iter(batches), root)
+    return root
+
+def test_export_partitions_by_product_hash_and_month(dataset_root, tmp_path):
+    """
+    商品ハッシュ・月ごとのディレクトリに書き出されることのテスト
+    """
+    partitions = {path.parent.relative_to(dataset_root).as_posix() for path in tmp_path.rglob('*.parquet')}
+    buckets = {product_bucket(product_id, 4) for product_id in PRODUCT_IDS}
+
+    assert partitions == {
+        f'product_bucket={bucket}/month={month}' for bucket in buckets for month in ('2024-01', '2024-02', '2024-03')
+    }
+
+def test_load_price_table_filters_products_and_range(dataset_root, price_rows):
+    """
+    商品と期間で絞り込んだ価格履歴が時刻順に読み込まれることのテスト
+    """
+    start = datetime(2024, 2, 1, tzinfo=timezone.utc)
+    end = datetime(2024, 3, 1, tzinfo=timezone.utc)
+    table = load_price_table(dataset_root, PRODUCT_IDS[:2], start=start, end=end, buckets=4)
+
+    expected = sorted(
+        (str(product_id), scraped_at, price)
+        for product_id, price, _, scraped_at in price_rows
+        if product_id in PRODUCT_IDS[:2] and start <= scraped_at < end
+    )
+    actual = list(zip(
+        table.column('product_id').to_pylist(),
+        table.column('scraped_at').to_pylist(),
+        table.column('price').to_pylist(),
+    ))
+    assert actual == expected
+
+def test_load_price_arrays_returns_columns_per_product(dataset_root, price_rows):
+    """
+    商品ごとのNumPy配列が元の価格履歴と一致することのテスト
+    """
+    arrays = load_price_arrays(dataset_root, PRODUCT_IDS + [uuid.uuid4()], buckets=4)
+
+    assert set(arrays) == {str(product_id) for product_id in PRODUCT_IDS}
+    for product_id in PRODUCT_IDS:
+        timestamps, prices = arrays[str(product_id)]
+        expected = sorted((scraped_at, price) for pid, price, _, scraped_at in price_rows if pid == product_id)
+        assert prices.dtype == np.float64
+        assert np.all(np.diff(timestamps) > np.timedelta64(0))
+        np.testing.assert_array_equal(prices, [price for _, price in expected])
+        expected_timestamps = [scraped_at.replace(tzinfo=None) for scraped_at, _ in expected]
+        np.testing.assert_array_equal(timestamps, np.array(expected_timestamps, dtype='datetime64[us]'))
+
+def test_rewriting_a_month_replaces_its_partitions(dataset_root, price_rows):
+    """
+    同じ月を書き出し直すと、その月の既存ファイルが置き換えられることのテスト
+    """
+    march = [(pid, price * 2, source, scraped_at) for pid, price, source, scraped_at in price_rows
+             if scraped_at.month == 3]
+    write_price_batches(iter([rows_to_batch(march, buckets=4)]), dataset_root)
+
+    timestamps, prices = load_price_arrays(dataset_root, PRODUCT_IDS[:1], buckets=4)[str(PRODUCT_IDS[0])]
+    in_march = timestamps >= np.datetime64('2024-03-01')
+    assert len(prices) == 90
+    np.testing.assert_array_equal(prices[in_march], (1000.0 + np.arange(90)[in_march]) * 2)
+    np.testing.assert_array_equal(prices[~in_march], 1000.0 + np.arange(90)[~in_march])
+
+def test_load_price_frame_feeds_prediction_model(dataset_root):
+    """
+    読み込んだデータフレームをそのまま予測モデルに渡せることのテスト
+    """
+    frame = load_price_frame(dataset_root, PRODUCT_IDS[0], buckets=4)
+    model = AdvancedPricePredictionModel(frame)
+
+    assert list(frame.columns) == ['date', 'price']
+    assert len(model.historical_prices) == 90
+    assert model.linear_regression_prediction()['model_type'] == 'linear_regression'
+    assert load_price_frame(dataset_root, uuid.uuid4(), buckets=4).empty
+
+def assert_same_arrays(actual, expected):
+    assert set(actual) == set(expected)
+    for product_id, (timestamps, prices) in expected.items():
+        np.testing.assert_array_equal(actual[product_id][0], timestamps)
+        np.testing.assert_array_equal(actual[product_id][1], prices)
+
+def test_read_price_arrays_adds_prices_after_the_export(sqlite_session_factory, tmp_path, price_rows):
+    """
+    エクスポートがなければデータベースから列で読み、あれば書き出し後の価格だけをデータベースから読み足すことのテスト
+    """
+    new_product = uuid.UUID(int=99)
+    session = sqlite_session_factory()
+    session.add_all([Product(id=product_id, name=f'商品 {product_id}') for product_id in PRODUCT_IDS + [new_product]])
+    rows = price_rows + [(new_product, 500.0, 'Amazon', datetime(2024, 3, 20, tzinfo=timezone.utc))]
+    session.add_all([
+        PriceHistory(product_id=product_id, price=price, source=source, scraped_at=scraped_at)
+        for product_id, price, source, scraped_at in rows
+    ])
+    session.commit()
+    root = str(tmp_path / 'price_history')
+    product_ids = PRODUCT_IDS + [new_product]
+
+    from_database = read_price_arrays(session.connection(), product_ids, root, buckets=4)
+    timestamps, prices = from_database[str(PRODUCT_IDS[0])]
+    assert len(prices) == 90
+    assert np.all(np.diff(timestamps) > np.timedelta64(0))
+    np.testing.assert_array_equal(from_database[str(new_product)][1], [500.0])
+
+    # 2月までを書き出した後に追加された価格はデータベースから読み足す
+    exported = [row for row in price_rows if row[3] < datetime(2024, 3, 1, tzinfo=timezone.utc)]
+    write_price_batches(iter([rows_to_batch(exported, buckets=4)]), root)
+    assert_same_arrays(read_price_arrays(session.connection(), product_ids, root, buckets=4), from_database)
+
+    start = datetime(2024, 2, 15, tzinfo=timezone.utc)
+    since_start = read_price_arrays(session.connection(), PRODUCT_IDS, root, start=start, buckets=4)
+    timestamps, prices = since_start[str(PRODUCT_IDS[0])]
+    assert timestamps[0] == np.datetime64('2024-02-15T00:00')
+    np.testing.assert_array_equal(prices, 1000.0 + np.arange(45, 90))
+
+    frame = read_price_frame(session.connection(), PRODUCT_IDS[1], root, buckets=4)
+    assert list(frame.columns) == ['date', 'price']
+    np.testing.assert_array_equal(frame['price'], from_database[str(PRODUCT_IDS[1])][1])
+    session.close()
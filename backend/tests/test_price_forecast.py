@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from ml_models.price_predictor import FEATURES, PricePredictor, generate_sample_data
+from services.price_forecast import build_feature_matrix, predict_prices
+
+@pytest.fixture(scope='module')
+def model_path(tmp_path_factory):
+    """
+    サンプルデータで学習して保存したモデルのパス
+    """
+    predictor = PricePredictor()
+    predictor.train(generate_sample_data())
+    path = str(tmp_path_factory.mktemp('models') / 'price_predictor_model.joblib')
+    predictor.save_model(path)
+    return path
+
+def test_build_feature_matrix():
+    """
+    最新価格・最高価格・取得日時から特徴量行列が作られることのテスト
+    """
+    now = datetime(2024, 7, 10, 12, tzinfo=timezone.utc)
+    X = build_feature_matrix(
+        np.array([800.0, 1000.0, 500.0]),
+        np.array([1000.0, np.nan, 0.0]),
+        np.array(['2024-07-01T12:00', 'NaT', '2024-07-10T13:00'], dtype='datetime64[us]'),
+        now
+    )
+
+    assert X.shape == (3, len(FEATURES))
+    np.testing.assert_allclose(X[:, FEATURES.index('original_price')], [1000.0, 1000.0, 0.0])
+    np.testing.assert_allclose(X[:, FEATURES.index('discount_rate')], [20.0, 0.0, 0.0])
+    np.testing.assert_allclose(X[:, FEATURES.index('days_since_last_sale')], [9, 0, 0])
+    np.testing.assert_allclose(X[:, FEATURES.index('seasonal_factor')], 1.4)
+
+def test_batch_prediction_matches_single_predictions(model_path):
+    """
+    まとめて予測した価格が1件ずつの予測と一致することのテスト
+    """
+    rng = np.random.default_rng(0)
+    X = np.column_stack([
+        rng.uniform(1000, 50000, 250),
+        rng.uniform(0, 50, 250),
+        rng.integers(0, 365, 250),
+        rng.uniform(0.5, 2, 250),
+    ])
+    predictor = PricePredictor(model_path)
+
+    expected = [predictor.predict(dict(zip(FEATURES, row))) for row in X[:20]]
+    np.testing.assert_allclose(predictor.predict_batch(X[:20], chunk_size=7), expected)
+
+    sequential = predict_prices(X, model_path, chunk_size=100)
+    parallel = predict_prices(X, model_path, chunk_size=100, n_jobs=2)
+    assert sequential.shape == (250,)
+    np.testing.assert_allclose(sequential[:20], expected)
+    np.testing.assert_allclose(parallel, sequential)
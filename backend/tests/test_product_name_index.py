@@ -0,0 +1,109 @@
+import difflib
+import random
+import uuid
+
+from services.product_name_index import ProductNameIndex, name_ngrams
+
+def similarity(name1: str, name2: str) -> float:
+    """
+    ProductRegistrationService.calculate_name_similarity と同じ類似度
+    """
+    return difflib.SequenceMatcher(None, name1.lower().strip(), name2.lower().strip()).ratio()
+
+def generate_names(count: int, seed: int = 0):
+    """
+    ブランド・シリーズ・型番を組み合わせた商品名
+    """
+    rng = random.Random(seed)
+    brands = ['Apple', 'Sony', 'パナソニック', 'シャープ', 'Anker', 'ロジクール', 'Canon', '象印']
+    series = ['ワイヤレスイヤホン', 'ノートPC', 'モバイルバッテリー', '電気ケトル', 'マウス', 'デジタルカメラ']
+    return [
+        f"{rng.choice(brands)} {rng.choice(series)} {rng.choice('ABCDEFGHJK')}{rng.randint(100, 9999)}"
+        for _ in range(count)
+    ]
+
+def test_ngrams_are_nfkc_normalized():
+    """
+    全角・半角や大文字・小文字、空白の違いが n-gram に影響しないことのテスト
+    """
+    assert name_ngrams('ＡＢＣ　ｉＰｈｏｎｅ') == name_ngrams('abc  iphone')
+    assert name_ngrams('ab')  # 短い名前も n-gram を持つ
+
+def test_find_keeps_brute_force_match_decisions():
+    """
+    上位の候補だけを比較しても、全件と比較した場合と同じ判定になることのテスト
+    """
+    rng = random.Random(1)
+    existing = generate_names(1000)
+    index = ProductNameIndex()
+    for position, name in enumerate(existing):
+        index.add(position, name, '家電')
+
+    queries = [name.replace(' ', '', 1) if rng.random() < 0.5 else name + ' 新品' for name in rng.sample(existing, 100)]
+    queries += generate_names(100, seed=2)
+    for query in queries:
+        best = max(similarity(name, query) for name in existing)
+        match = index.find(query, '家電', 0.8, similarity)
+
+        assert (match is not None) == (best >= 0.8)
+        if match is not None:
+            assert similarity(existing[match[0]], query) == match[1] >= 0.8
+
+def test_categories_are_separate_and_removed_products_are_not_matched():
+    """
+    カテゴリが異なる商品や削除した商品とは一致しないことのテスト
+    """
+    index = ProductNameIndex()
+    index.add(1, 'Sony ワイヤレスイヤホン WF-1000XM5', '家電')
+    index.add(2, 'Sony ワイヤレスイヤホン WF-1000XM5', None)
+
+    assert index.find('sony ワイヤレスイヤホン WF-1000XM5', '家電', 0.8, similarity) == (1, 1.0)
+    assert index.find('Sony ワイヤレスイヤホン WF-1000XM5', 'おもちゃ', 0.8, similarity) is None
+
+    index.remove(1)
+    assert index.find('Sony ワイヤレスイヤホン WF-1000XM5', '家電', 0.8, similarity) is None
+    assert len(index) == 1
+
+def test_save_and_load(tmp_path):
+    """
+    保存した索引を読み込むと同じ候補と作成日時の最大値が得られることのテスト
+    """
+    from datetime import datetime, timezone
+
+    index = ProductNameIndex()
+    product_ids = [uuid.uuid4() for _ in range(50)]
+    created_at = datetime(2024, 5, 1, tzinfo=timezone.utc)
+    for product_id, name in zip(product_ids, generate_names(50)):
+        index.add(product_id, name, 'その他', created_at)
+
+    path = str(tmp_path / 'index' / 'product_name_index.pkl')
+    index.save(path)
+    loaded = ProductNameIndex.load(path)
+
+    assert len(loaded) == 50
+    assert loaded.watermark == created_at
+    for name in generate_names(10, seed=3):
+        assert loaded.candidates(name, 'その他') == index.candidates(name, 'その他')
+    assert ProductNameIndex.load(str(tmp_path / 'missing.pkl')) is None
+
+def test_load_returns_none_for_broken_files(tmp_path):
+    """
+    壊れた・書き込み途中・キーの欠けたファイルは読み込まず、Noneを返す（DBから作り直す）ことのテスト
+    """
+    import pickle
+    from services.product_name_index import INDEX_FORMAT_VERSION
+
+    index = ProductNameIndex()
+    index.add(uuid.uuid4(), 'Sony ワイヤレスイヤホン', '家電')
+    path = tmp_path / 'product_name_index.pkl'
+    index.save(str(path))
+    saved = path.read_bytes()
+
+    path.write_bytes(saved[:len(saved) // 2])
+    assert ProductNameIndex.load(str(path)) is None
+    path.write_bytes(b'')
+    assert ProductNameIndex.load(str(path)) is None
+    path.write_bytes(b'not a pickle')
+    assert ProductNameIndex.load(str(path)) is None
+    path.write_bytes(pickle.dumps({'version': INDEX_FORMAT_VERSION, 'ngram_size': 3}))
+    assert ProductNameIndex.load(str(path)) is None
@@ -0,0 +1,96 @@
+import uuid
+
+from database.migrations import rebuild_search_index
+from database.models import Product
+from services.product_search import SQLITE_FTS_TABLE, search_document, search_tokens
+from services.product_service import ProductSearchService
+
+def test_search_tokens_split_japanese_into_bigrams():
+    """
+    分かち書きのない日本語が bigram に分割されることのテスト
+    """
+    assert search_tokens('イヤホン') == ['イヤ', 'ヤホ', 'ホン']
+    assert search_tokens('象 ケトル') == ['象', 'ケト', 'トル']
+
+def test_search_tokens_normalize_width_case_and_punctuation():
+    """
+    全角・半角、大文字・小文字、記号の違いが検索語に影響しないことのテスト
+    """
+    assert search_tokens('ＷＦ－１０００ＸＭ５') == search_tokens('wf-1000xm5') == ['wf', '10', '00', '00', '0x', 'xm', 'm5']
+    assert search_tokens('  ') == []
+
+def test_search_document_contains_every_query_bigram_of_a_substring():
+    """
+    商品名・カテゴリの部分文字列で検索すると、その bigram がすべて検索用文書に含まれることのテスト
+    """
+    document = set(search_document('Sony ワイヤレスイヤホン WF-1000XM5', '家電').split())
+
+    for query in ('ワイヤレス', 'イヤホン', 'sony', 'ｗｆ', '家電', '1000'):
+        assert set(search_tokens(query)) <= document
+    assert not set(search_tokens('ヘッドホン')) <= document
+
+def add_products(session, names):
+    """
+    商品名のリストから家電カテゴリの商品を追加し、名前から商品を引ける辞書を返す
+    """
+    products = {name: Product(name=name, category='家電') for name in names}
+    session.add_all(products.values())
+    session.commit()
+    return products
+
+def test_match_products_ranks_and_pages_with_sqlite_fts(sqlite_session_factory):
+    """
+    SQLiteの FTS5 で、すべての bigram を含む商品だけが関連度順に返り、limit・offset で区切られることのテスト
+    """
+    session = sqlite_session_factory()
+    add_products(session, [
+        'Sony ワイヤレスイヤホン WF-1000XM5 ノイズキャンセリング 充電ケース付き ブラック',
+        'イヤホン',
+        'Anker イヤホン Soundcore',
+        'Sony ヘッドホン WH-1000XM5',
+        '象印 電気ケトル',
+    ])
+
+    names = [product.name for product in ProductSearchService.search_products(session, 'イヤホン')]
+    # 短い文書ほど bm25 の関連度が高い
+    assert names == [
+        'イヤホン',
+        'Anker イヤホン Soundcore',
+        'Sony ワイヤレスイヤホン WF-1000XM5 ノイズキャンセリング 充電ケース付き ブラック',
+    ]
+    assert [product.name for product in ProductSearchService.search_products(session, 'イヤホン', limit=2)] == names[:2]
+    assert [
+        product.name for product in ProductSearchService.search_products(session, 'イヤホン', limit=2, offset=2)
+    ] == names[2:]
+    assert [product.name for product in ProductSearchService.search_products(session, 'ＳＯＮＹ 1000')] == [
+        'Sony ヘッドホン WH-1000XM5',
+        'Sony ワイヤレスイヤホン WF-1000XM5 ノイズキャンセリング 充電ケース付き ブラック',
+    ]
+    session.close()
+
+def test_rebuild_search_index_adds_the_index_to_an_existing_database(sqlite_engine, sqlite_session_factory):
+    """
+    検索用文書の列と FTS5 の仮想テーブル・トリガーがない既存のデータベースに追加し、検索できるようにすることのテスト
+    """
+    with sqlite_engine.begin() as connection:
+        connection.exec_driver_sql(f'DROP TABLE {SQLITE_FTS_TABLE}')
+        for suffix in ('ai', 'ad', 'au'):
+            connection.exec_driver_sql(f'DROP TRIGGER {SQLITE_FTS_TABLE}_{suffix}')
+        connection.exec_driver_sql('ALTER TABLE products DROP COLUMN search_document')
+        connection.execute(Product.__table__.insert(), [
+            {'id': uuid.uuid4(), 'name': name, 'category': '家電'}
+            for name in ('Sony ワイヤレスイヤホン', 'Anker モバイルバッテリー')
+        ])
+
+    assert rebuild_search_index(sqlite_engine) == 2
+    # 2回目も失敗しない
+    assert rebuild_search_index(sqlite_engine) == 2
+
+    session = sqlite_session_factory()
+    assert [product.name for product in ProductSearchService.search_products(session, 'イヤホン')] == [
+        'Sony ワイヤレスイヤホン'
+    ]
+    # 追加したトリガーで新しい商品も索引される
+    add_products(session, ['Sony ワイヤレスイヤホン WF-C700N'])
+    assert len(ProductSearchService.search_products(session, 'ワイヤレス')) == 2
+    session.close()
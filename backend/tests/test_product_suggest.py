@@ -0,0 +1,103 @@
+from services import product_suggest
+from services.product_suggest import ProductSuggestIndex
+
+def build_index():
+    """
+    テスト用の入力補完索引
+    """
+    index = ProductSuggestIndex()
+    index.build([
+        (1, 'Sony ワイヤレスイヤホン WF-1000XM5', '家電', None),
+        (2, 'Apple AirPods Pro', '家電', None),
+        (3, 'Anker モバイルバッテリー', 'スマホアクセサリー', None),
+        (4, '象印 電気ケトル', 'キッチン家電', None),
+    ])
+    return index
+
+def suggested_ids(index, text, limit=10):
+    return [suggestion['product_id'] for suggestion in index.suggest(text, limit)]
+
+def test_prefix_completion_at_word_starts():
+    """
+    商品名の語の先頭からの前方一致で、全角・半角や大文字・小文字を区別せずに補完されることのテスト
+    """
+    index = build_index()
+
+    assert suggested_ids(index, 'ＳＯＮ') == [1]
+    assert suggested_ids(index, 'wf-10') == [1]
+    assert suggested_ids(index, 'a') == [2, 3]  # 'airpods pro', 'anker ...', 'apple ...' の順
+    assert suggested_ids(index, 'a', limit=1) == [2]
+    assert index.suggest('  ') == []
+
+def test_infix_completion_with_bigrams():
+    """
+    分かち書きのない日本語やカテゴリの部分一致でも補完されることのテスト
+    """
+    index = build_index()
+
+    assert suggested_ids(index, 'イヤホン') == [1]
+    assert suggested_ids(index, 'ケトル') == [4]
+    assert suggested_ids(index, 'キッチン') == [4]
+    assert suggested_ids(index, 'ヘッドホン') == []
+
+def test_incremental_updates_and_merge(monkeypatch):
+    """
+    追加・変更・削除した商品が併合の前後で補完に反映されることのテスト
+    """
+    monkeypatch.setattr(product_suggest, 'MERGE_THRESHOLD', 4)
+    index = build_index()
+
+    index.add(5, 'Sony ヘッドホン WH-1000XM5', '家電')
+    assert suggested_ids(index, 'sony') == [5, 1]
+    assert suggested_ids(index, 'ヘッドホン') == [5]
+
+    index.add(1, 'Sony イヤホン WF-C700N', '家電')
+    index.remove(2)
+    for product_id in range(6, 10):
+        index.add(product_id, f'Panasonic 炊飯器 SR-{product_id}', 'キッチン家電')
+
+    assert not index._pending_keys
+    assert suggested_ids(index, 'wf-') == [1]
+    assert suggested_ids(index, 'ワイヤレス') == []
+    assert suggested_ids(index, 'airpods') == []
+    assert suggested_ids(index, 'panasonic', limit=3) == [6, 7, 8]
+    assert len(index) == 8
+
+def test_committed_changes_are_applied_to_the_shared_index(monkeypatch):
+    """
+    コミットした商品の変更だけが共有の索引に反映されることのテスト
+    """
+    index = build_index()
+    monkeypatch.setattr(product_suggest, '_shared_index', index)
+
+    product_suggest.apply_product_changes([
+        ('upsert', 10, 'Nintendo Switch', 'ゲーム'),
+        ('delete', 4, None, None),
+    ])
+
+    assert suggested_ids(index, 'ninten') == [10]
+    assert suggested_ids(index, '象印') == []
+
+def test_removed_products_are_compacted(monkeypatch):
+    """
+    無効にした商品が増えると番号を振り直して取り除き、補完の結果と順序は変わらないことのテスト
+    """
+    monkeypatch.setattr(product_suggest, 'COMPACT_MIN_DEAD', 2)
+    index = build_index()
+    watermark, lock = index.watermark, index._lock
+
+    index.add(5, 'Sony ヘッドホン WH-1000XM5', '家電')
+    index.add(1, 'Sony イヤホン WF-C700N', '家電')
+    assert len(index._names) == 6
+    index.remove(3)
+
+    # 6件中2件が無効（25%超）になったため、残り4件に振り直す
+    assert len(index._names) == len(index) == 4
+    assert index._dead == 0
+    assert index.watermark == watermark
+    # 振り直しの間に待っていたスレッドも同じロックで排他される
+    assert index._lock is lock
+    assert suggested_ids(index, 'sony') == [1, 5]
+    assert suggested_ids(index, 'anker') == []
+    assert suggested_ids(index, 'イヤホン') == [1]
+    assert suggested_ids(index, '家電') == [1, 5, 4, 2]
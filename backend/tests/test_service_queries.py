@@ -0,0 +1,200 @@
+"""
+データベースを使うサービスのテスト
+
+PostgreSQLなしで動かせるよう、conftest.py のインメモリSQLite（sqlite_session_factory）を使う。
+"""
+import pytest
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from core.config import settings
+from database.models import PriceForecast, PriceHistory, Product, ProductExternalSource
+from repositories.product_repository import ProductRepository
+from services import price_comparison_service, product_name_index
+from services.price_analysis import RunningPriceStats, get_price_stats
+from services.price_comparison_service import PriceComparisonService
+from services.product_registration_service import ProductRegistrationService
+from services.product_service import ProductSearchService
+from tests.utils.test_helpers import count_statements
+
+@pytest.fixture
+def test_engine(sqlite_engine, sqlite_session_factory):
+    """テスト用のデータベースエンジン（テーブル作成済みのインメモリSQLite）"""
+    return sqlite_engine
+
+@pytest.fixture
+def test_session(sqlite_session_factory):
+    """テスト用のデータベースセッションを作成"""
+    session = sqlite_session_factory()
+    yield session
+    session.close()
+
+@pytest.fixture
+def product_repository(test_session):
+    """商品リポジトリのフィクスチャ"""
+    return ProductRepository(test_session)
+
+@pytest.fixture
+def empty_price_export(tmp_path, monkeypatch):
+    """価格履歴のエクスポートがない状態（価格履歴はデータベースから読む）"""
+    monkeypatch.setattr(settings, 'PRICE_EXPORT_DIR', str(tmp_path / 'price_history'))
+
+def test_bulk_register_products_deduplicates_within_batch(test_session, tmp_path, monkeypatch):
+    """商品の一括登録で、バッチ内の重複と登録済みの外部ソースが同じ商品に対応付けられることのテスト"""
+    monkeypatch.setattr(settings, 'PRODUCT_NAME_INDEX_PATH', str(tmp_path / 'product_name_index.pkl'))
+    monkeypatch.setattr(product_name_index, '_shared_index', None)
+
+    products_data = [
+        {'name': 'Sony WH-1000XM5 ヘッドホン', 'category': '家電', 'source': 'Amazon', 'external_id': 'A1'},
+        {'name': 'sony wh-1000xm5 ヘッドホン', 'category': '家電', 'source': '楽天市場', 'external_id': 'R1'},
+        {'name': 'Sony WH-1000XM5 ヘッドホン', 'category': '家電', 'source': 'Amazon', 'external_id': 'A1'},
+        {'name': 'Anker PowerCore 10000', 'category': '家電', 'source': 'Amazon', 'external_id': 'A2'},
+    ]
+    registered = ProductRegistrationService.bulk_register_products(test_session, products_data, chunk_size=3)
+
+    assert [product.id for product in registered[:3]] == [registered[0].id] * 3
+    assert registered[3].id != registered[0].id
+    assert test_session.query(Product).count() == 2
+    assert test_session.query(ProductExternalSource).count() == 3
+    # 一括登録した商品の作成日時で索引の取り込み済みの位置が進む（登録前のDBは空）
+    assert product_name_index._shared_index.watermark is not None
+
+    # 2回目は登録済みの外部ソースに対応付けられ、何も追加されない
+    again = ProductRegistrationService.bulk_register_products(test_session, products_data)
+    assert [product.id for product in again] == [product.id for product in registered]
+    assert test_session.query(Product).count() == 2
+    assert test_session.query(ProductExternalSource).count() == 3
+
+def test_search_products_statement_count_does_not_grow_with_results(test_engine, test_session):
+    """商品検索のクエリ数が検索結果の件数によらず一定であることのテスト"""
+    def add_products(start, count):
+        for i in range(start, start + count):
+            product = Product(name=f'ワイヤレスイヤホン {i}', category='家電')
+            test_session.add(product)
+            test_session.flush()
+            for source_name in ('Amazon', '楽天市場'):
+                test_session.add(ProductExternalSource(
+                    product_id=product.id, source_name=source_name,
+                    external_product_id=f'{source_name}-{i}', product_url=f'https://example.com/{i}'
+                ))
+        test_session.commit()
+
+    add_products(0, 2)
+    test_session.expire_all()
+    with count_statements(test_engine) as statements:
+        results = ProductSearchService.search_products(test_session, 'イヤホン')
+    assert len(results) == 2
+    few = len(statements)
+
+    add_products(2, 48)
+    test_session.expire_all()
+    with count_statements(test_engine) as statements:
+        results = ProductSearchService.search_products(test_session, 'イヤホン')
+    assert len(results) == 50
+    assert all(len(result.external_sources) == 2 for result in results)
+    # 商品と外部ソース情報（selectinload）の2回
+    assert len(statements) == few == 2
+
+def test_get_by_ids_loads_latest_prices_with_products(test_engine, test_session, product_repository):
+    """複数商品の取得では最新価格も同じSELECTで読み込み、current_price の参照でクエリを発行しないことのテスト"""
+    products = [Product(name=f'商品 {i}', category='家電') for i in range(10)]
+    test_session.add_all(products)
+    test_session.flush()
+    test_session.add_all([
+        PriceHistory(product_id=product.id, price=1000 + i, source='Amazon')
+        for i, product in enumerate(products)
+    ])
+    test_session.commit()
+    product_ids = [product.id for product in products]
+    test_session.expire_all()
+
+    with count_statements(test_engine) as statements:
+        prices = sorted(product.current_price for product in product_repository.get_by_ids(product_ids))
+
+    assert prices == [1000 + i for i in range(10)]
+    assert len(statements) == 1
+
+def test_price_stats_are_updated_once_per_flush(test_engine, test_session):
+    """価格履歴の追加をまとめてフラッシュすると、件数・商品数によらず3文で逐次統計が更新されることのテスト"""
+    products = [Product(name=f'商品 {i}', category='家電') for i in range(3)]
+    test_session.add_all(products)
+    test_session.flush()
+    prices = {product.id: [1000.0 + i * 10 + j for j in range(5)] for i, product in enumerate(products)}
+
+    for j in range(2):
+        test_session.add_all([
+            PriceHistory(product_id=product_id, price=price, source='Amazon')
+            for product_id, values in prices.items() for price in values[j * 3:(j + 1) * 3]
+        ])
+        with count_statements(test_engine) as statements:
+            test_session.flush()
+        assert sum('product_price_stats' in statement for statement in statements) == 3
+    test_session.commit()
+
+    for product_id, values in prices.items():
+        assert get_price_stats(test_session, product_id) == RunningPriceStats.from_prices(values)
+
+def test_price_analysis_reads_price_columns(test_session, product_repository, empty_price_export):
+    """価格比較の価格分析が、データベースから列で読み込んだ時刻順の価格から求められることのテスト"""
+    products = [Product(name=f'商品 {i}', category='家電') for i in range(2)]
+    test_session.add_all(products)
+    test_session.flush()
+    start = datetime(2024, 1, 1)
+    test_session.add_all([
+        PriceHistory(product_id=products[0].id, price=price, source='Amazon', scraped_at=start + timedelta(days=i))
+        for i, price in enumerate([1200.0, 1000.0, 1100.0, 1000.0, 1050.0, 1100.0, 1150.0, 1200.0])
+    ])
+    test_session.commit()
+    service = PriceComparisonService(product_repository, price_predictor=object())
+
+    price_arrays = service._load_price_arrays([product.id for product in products])
+
+    assert list(price_arrays) == [str(products[0].id)]
+    _, prices = price_arrays[str(products[0].id)]
+    assert service._analyze_price_history(prices) == {
+        'lowest_price': 1000.0, 'highest_price': 1200.0, 'average_price': 1100.0, 'price_trend': 'rising'
+    }
+    assert service._analyze_price_history(np.array([]))['price_trend'] == 'no_data'
+
+def test_stored_forecast_is_used_only_for_its_horizon(test_session, product_repository, monkeypatch,
+                                                      empty_price_export):
+    """一括予測の予測価格は予測日数が同じ場合だけ返し、異なる予測日数はその場で予測することのテスト"""
+    class FixedPredictor:
+        def predict(self, features):
+            return 900.0
+
+    predictions = []
+
+    def predict_from_history(historical_data, scope=None, registry=None, days_ahead=30):
+        predictions.append((len(historical_data), scope, days_ahead))
+        return {'predictions': {'ensemble_prediction': [850.0] * days_ahead}}
+
+    monkeypatch.setattr(price_comparison_service, 'comprehensive_price_prediction', predict_from_history)
+    product = Product(name='テスト商品', category='家電')
+    test_session.add(product)
+    test_session.flush()
+    test_session.add(PriceForecast(
+        product_id=product.id, predicted_price=950.0, current_price=1000.0,
+        horizon_days=30, generated_at=datetime.utcnow()
+    ))
+    test_session.commit()
+    service = PriceComparisonService(product_repository, price_predictor=FixedPredictor())
+
+    stored = service.predict_future_price(product.id, prediction_days=30)
+    assert (stored['predicted_price'], stored['horizon_days']) == (950.0, 30)
+
+    # 履歴が足りない商品は、一括予測の予測日数以外では予測しない
+    short = service.predict_future_price(product.id, prediction_days=7)
+    assert (short['predicted_price'], short['horizon_days'], short['generated_at']) == (None, 7, None)
+
+    start = datetime.utcnow() - timedelta(days=price_comparison_service.MIN_HISTORY_FOR_MODEL)
+    test_session.add_all([
+        PriceHistory(product_id=product.id, price=1000.0 - i, source='Amazon', scraped_at=start + timedelta(days=i))
+        for i in range(price_comparison_service.MIN_HISTORY_FOR_MODEL)
+    ])
+    test_session.commit()
+
+    on_the_fly = service.predict_future_price(product.id, prediction_days=7)
+    assert (on_the_fly['predicted_price'], on_the_fly['horizon_days']) == (850.0, 7)
+    assert predictions == [(price_comparison_service.MIN_HISTORY_FOR_MODEL, f'product:{product.id}', 7)]
@@ -1,9 +1,6 @@
 import pytest
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
 
-from database.base import Base
 from database.models import User, Product, PriceHistory
 from repositories.user_repository import UserRepository
 from repositories.product_repository import ProductRepository
@@ -12,22 +9,15 @@ from services.price_alert_service import PriceAlertService
 from services.search_service import SearchService
 from services.price_comparison_service import PriceComparisonService
 
-# テスト用のインメモリSQLiteデータベース
-TEST_DATABASE_URL = "sqlite:///:memory:"
-
 @pytest.fixture(scope="function")
-def test_engine():
-    """テスト用のデータベースエンジンを作成"""
-    engine = create_engine(TEST_DATABASE_URL)
-    Base.metadata.create_all(bind=engine)
-    yield engine
-    Base.metadata.drop_all(bind=engine)
+def test_engine(sqlite_engine, sqlite_session_factory):
+    """テスト用のデータベースエンジン（テーブル作成済みのインメモリSQLite）"""
+    return sqlite_engine
 
 @pytest.fixture(scope="function")
-def test_session(test_engine):
+def test_session(sqlite_session_factory):
     """テスト用のデータベースセッションを作成"""
-    SessionLocal = sessionmaker(bind=test_engine)
-    session = SessionLocal()
+    session = sqlite_session_factory()
     yield session
     session.close()
 
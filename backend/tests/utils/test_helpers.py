@@ -1,8 +1,12 @@
 import pytest
-from typing import Dict, Any
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List
 import random
 import string
 
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
 def generate_random_string(length: int = 10) -> str:
     """
     ランダムな文字列を生成
@@ -107,3 +111,27 @@ def pytest_generate_tests(metafunc):
     """
     if 'mock_product' in metafunc.fixturenames:
         metafunc.parametrize('mock_product', [generate_mock_product() for _ in range(3)])
+
+@contextmanager
+def count_statements(engine: Engine) -> Iterator[List[str]]:
+    """
+    ブロック内でエンジンが発行したSQL文を記録する
+
+    リクエストごとのクエリ数が結果の件数によらず一定であること（N+1 がないこと）の確認に使う。
+
+    Args:
+        engine (Engine): データベースエンジン
+
+    Yields:
+        List[str]: 発行されたSQL文
+    """
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
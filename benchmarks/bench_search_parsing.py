@@ -0,0 +1,85 @@
+"""検索結果ページのパース速度ベンチマーク
+
+保存済みのHTMLフィクスチャを実際のページに近いサイズ（インラインJS込みで1〜2MB）に膨らませ、
+従来の BeautifulSoup(html.parser) + select_one と、サイトごとの抽出仕様（コンパイル済みセレクタ + lxml 逐次パース）を比較する。
+
+    python benchmarks/bench_search_parsing.py --repeat 20 --padding-kb 1024
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bs4 import BeautifulSoup
+
+from scraping import AmazonScraper, RakutenScraper, YahooShoppingScraper
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests', 'fixtures', 'html')
+
+SITES = {
+    'amazon': AmazonScraper,
+    'rakuten': RakutenScraper,
+    'yahoo': YahooShoppingScraper,
+}
+
+def build_page(site, repeat, padding_kb):
+    """フィクスチャの本文を repeat 回繰り返し、先頭にインラインスクリプトを足したページを作成"""
+    with open(os.path.join(FIXTURE_DIR, f'{site}_search.html'), encoding='utf-8') as f:
+        html = f.read()
+    match = re.search(r'(<body[^>]*>)(.*)(</body>)', html, re.S)
+    head, body_open, body, body_close = html[:match.start()], match.group(1), match.group(2), match.group(3)
+    line = 'window.P&&P.when("A").execute(function(A){A.state("s",{"k":"v","n":12345});});\n'
+    padding = line * (padding_kb * 1024 // len(line))
+    return f"{head}{body_open}<script>{padding}</script>{body * repeat}{body_close}</html>"
+
+def legacy_parse(spec, html, max_results):
+    """従来実装：ページ全体を html.parser で木にしてから項目ごとに select_one"""
+    soup = BeautifulSoup(html, 'html.parser')
+    results = []
+    for item in soup.select(spec.item_selector.css)[:max_results]:
+        fields = {}
+        for name, field in spec.fields.items():
+            elem = item.select_one(field.selectors[0])
+            if elem is None:
+                fields[name] = None
+            elif field.attr:
+                fields[name] = elem.get(field.attr)
+            else:
+                fields[name] = elem.text.strip()
+        results.append(fields)
+    return results
+
+def measure(func, iterations):
+    """1回あたりの平均実行時間（秒）"""
+    func()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10, help='フィクスチャ本文の繰り返し回数')
+    parser.add_argument('--padding-kb', type=int, default=1024, help='先頭に足すインラインスクリプトのサイズ(KB)')
+    parser.add_argument('--max-results', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=5)
+    args = parser.parse_args()
+
+    # フィクスチャには抽出に失敗する商品も含まれるため、エラーログは出さない
+    logging.disable(logging.ERROR)
+
+    print(f"{'site':<8} {'size':>8} {'legacy ms':>10} {'lxml ms':>9} {'speedup':>8}")
+    for site, scraper_class in SITES.items():
+        scraper = scraper_class()
+        html = build_page(site, args.repeat, args.padding_kb)
+        legacy = measure(lambda: legacy_parse(scraper.search_spec, html, args.max_results), args.iterations)
+        compiled = measure(lambda: scraper.parse_search_results(html, args.max_results), args.iterations)
+        size_kb = len(html.encode('utf-8')) // 1024
+        print(f"{site:<8} {size_kb:>6}KB {legacy * 1000:>10.1f} {compiled * 1000:>9.1f} {legacy / compiled:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,10 @@ from .base_scraper import BaseScraper
 from .amazon_scraper import AmazonScraper
 from .rakuten_scraper import RakutenScraper
 from .yahoo_shopping_scraper import YahooShoppingScraper
+from .fetch_engine import AsyncFetchEngine
+from .single_flight import SingleFlight
+from .result_cache import SearchResultCache, RedisTier, LRUCache, normalize_query
+from .extraction import ExtractionSpec, Field, parse_price
 
 __all__ = [
     'ScraperManager',
@@ -10,4 +14,13 @@ __all__ = [
     'AmazonScraper',
     'RakutenScraper',
     'YahooShoppingScraper',
+    'AsyncFetchEngine',
+    'SingleFlight',
+    'SearchResultCache',
+    'RedisTier',
+    'LRUCache',
+    'normalize_query',
+    'ExtractionSpec',
+    'Field',
+    'parse_price',
 ]
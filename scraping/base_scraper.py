@@ -1,42 +1,111 @@
-import requests
+import asyncio
 from abc import ABC, abstractmethod
 from bs4 import BeautifulSoup
 import logging
+from .fetch_engine import AsyncFetchEngine
 
 class BaseScraper(ABC):
     """スクレイピングの基底クラス"""
-    
-    def __init__(self, user_agent=None, timeout=10):
-        self.session = requests.Session()
+
+    # サイトごとの同時実行数制限に使うキー（サブクラスで上書き）
+    site_key = 'default'
+
+    # 検索結果に付けるサイト名（サブクラスで上書き）
+    source_name = None
+
+    # 抽出仕様（ExtractionSpec、サブクラスで上書き）
+    search_spec = None      # 検索結果ページの1件分
+    price_page_spec = None  # 価格更新用の商品ページ
+
+    def __init__(self, user_agent=None, timeout=10, fetch_engine=None):
         self.timeout = timeout
+        self.fetch_engine = fetch_engine or AsyncFetchEngine(timeout=timeout)
         self.headers = {
             'User-Agent': user_agent or 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Accept-Language': 'ja,en-US;q=0.9,en;q=0.8'
         }
         self.logger = logging.getLogger(self.__class__.__name__)
-    
+
+    async def async_get_html(self, url):
+        """ページのHTML文字列を非同期取得（失敗時はNone）"""
+        return await self.fetch_engine.fetch_text(url, headers=self.headers, site=self.site_key)
+
+    async def async_get_page(self, url):
+        """ページの非同期取得と BeautifulSoup オブジェクトの作成"""
+        html = await self.async_get_html(url)
+        if html is None:
+            return None
+        try:
+            # パースはCPU処理のため、イベントループを塞がないようスレッドで実行
+            return await asyncio.to_thread(BeautifulSoup, html, 'html.parser')
+        except Exception as e:
+            self.logger.error(f"Error parsing {url}: {str(e)}")
+            return None
+
     def get_page(self, url):
         """ページの取得と BeautifulSoup オブジェクトの作成"""
+        return self.fetch_engine.run_sync(self.async_get_page(url))
+
+    def get_html(self, url):
+        """ページのHTML文字列を取得（同期API、失敗時はNone）"""
+        return self.fetch_engine.run_sync(self.async_get_html(url))
+
+    def parse_search_results(self, html, max_results=10, include_shipping=True):
+        """検索結果ページのHTMLから商品情報を抽出
+
+        lxmlで逐次パースし、max_results 件分の要素を読んだ時点でパースを打ち切る。
+        """
+        results = []
+        for item in self.search_spec.iter_items(html, limit=max_results):
+            product_info = self.extract_product_info(item, include_shipping)
+            if product_info:
+                product_info['source'] = self.source_name
+                results.append(product_info)
+        return results
+
+    async def async_search_results(self, url, max_results=10, include_shipping=True):
+        """検索結果ページを取得して商品情報を抽出"""
+        html = await self.async_get_html(url)
+        if html is None:
+            return []
         try:
-            response = self.session.get(url, headers=self.headers, timeout=self.timeout)
-            response.raise_for_status()
-            return BeautifulSoup(response.text, 'html.parser')
+            # パースはCPU処理のため、イベントループを塞がないようスレッドで実行
+            return await asyncio.to_thread(self.parse_search_results, html, max_results, include_shipping)
         except Exception as e:
-            self.logger.error(f"Error fetching {url}: {str(e)}")
-            return None
-    
+            self.logger.error(f"Error parsing {url}: {str(e)}")
+            return []
+
     @abstractmethod
-    def search(self, query, max_results=10, include_shipping=True, **kwargs):
+    async def async_search(self, query, max_results=10, include_shipping=True, **kwargs):
         """商品検索の実装（サブクラスで実装必須）"""
         pass
-    
-    @abstractmethod
+
+    def search(self, query, max_results=10, include_shipping=True, **kwargs):
+        """商品検索（同期API）"""
+        return self.fetch_engine.run_sync(
+            self.async_search(query, max_results, include_shipping, **kwargs)
+        )
+
     def extract_product_info(self, item, include_shipping=True):
-        """商品情報の抽出（サブクラスで実装必須）"""
-        pass
-        
-    def search_by_barcode(self, barcode, max_results=10, include_shipping=True, **kwargs):
+        """商品情報の抽出（item は検索結果1件分のlxml要素）"""
+        try:
+            return self.search_spec.extract(item, include_shipping=include_shipping)
+        except Exception as e:
+            self.logger.error(f"Error extracting product info: {str(e)}")
+            return None
+
+    def extract_price_info(self, html):
+        """商品ページのHTMLから価格と送料を抽出（取得できない項目はNone）"""
+        return self.price_page_spec.extract_document(html)
+
+    async def async_search_by_barcode(self, barcode, max_results=10, include_shipping=True, **kwargs):
         """バーコードから商品を検索するデフォルト実装"""
         # デフォルトでは通常検索を使用、サブクラスで必要に応じてオーバーライド
         self.logger.info(f"バーコード検索にデフォルト実装を使用: {barcode}")
-        return self.search(barcode, max_results, include_shipping, **kwargs)
+        return await self.async_search(barcode, max_results, include_shipping, **kwargs)
+
+    def search_by_barcode(self, barcode, max_results=10, include_shipping=True, **kwargs):
+        """バーコードから商品を検索（同期API）"""
+        return self.fetch_engine.run_sync(
+            self.async_search_by_barcode(barcode, max_results, include_shipping, **kwargs)
+        )
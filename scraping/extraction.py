@@ -0,0 +1,131 @@
+import re
+from .parsing import CompiledSelector, iter_matches, parse_document, text_of
+
+PRICE_PATTERN = re.compile(r'\d[\d,]*')
+
+def parse_price(text):
+    """価格表示のテキストから最初の数値を取り出す（'￥3,980' → 3980、数値がなければNone）"""
+    if not text:
+        return None
+    match = PRICE_PATTERN.search(text)
+    return int(match.group(0).replace(',', '')) if match else None
+
+class Field:
+    """抽出項目の宣言
+
+    selector はCSSセレクタ、または候補のタプル（先に一致した候補を使う）。
+    attr を指定すると属性値、指定しなければ要素以下のテキスト（前後の空白を除去）を値とする。
+    属性が存在しない場合は KeyError とし、attr_optional=True の場合のみ default を返す。
+    exists=True の場合は一致する要素があるかどうかを値とする。
+    when には extract() に渡すオプション名を指定でき、その値が偽なら抽出せず default を返す。
+    """
+
+    def __init__(self, selector, attr=None, process=None, exists=False, attr_optional=False,
+                 when=None, default=None):
+        self.selectors = (selector,) if isinstance(selector, str) else tuple(selector)
+        self.attr = attr
+        self.process = process
+        self.exists = exists
+        self.attr_optional = attr_optional
+        self.when = when
+        self.default = default
+
+    def value(self, element):
+        """一致した要素から値を作る（要素がない場合はNone）"""
+        if self.exists:
+            return element is not None
+        if element is None:
+            return self.default
+        if self.attr is None:
+            value = text_of(element).strip()
+        elif self.attr_optional:
+            value = element.get(self.attr)
+            if value is None:
+                return self.default
+        else:
+            value = element.attrib[self.attr]
+        return self.process(value) if self.process else value
+
+class ExtractionSpec:
+    """サイトごとの宣言的な抽出仕様と、それを実行するコンパイル済み抽出器
+
+    セレクタは仕様の作成時に一度だけXPathへコンパイルし、複数の項目で同じセレクタを使う場合も
+    要素ごとに1回だけ評価する。
+    item には一覧ページで1件分の要素に一致するセレクタを指定する（詳細ページでは不要）。
+    required の項目が取れなかった場合、残りの項目は抽出せずNoneを返す。
+    finalize(fields, **options) で項目をまとめて最終的な辞書を作る。
+    """
+
+    def __init__(self, fields, item=None, required=(), finalize=None):
+        self.fields = dict(fields)
+        self.item_selector = CompiledSelector(item) if item else None
+        self.required = tuple(required)
+        self.finalize = finalize
+
+        # 同じセレクタは一度だけコンパイルし、必須項目から順に評価する
+        self._selectors = {}
+        for field in self.fields.values():
+            for css in field.selectors:
+                if css not in self._selectors:
+                    self._selectors[css] = CompiledSelector(css)
+        order = list(self.required) + [name for name in self.fields if name not in self.required]
+        self._plan = [
+            (name, self.fields[name], [self._selectors[css] for css in self.fields[name].selectors])
+            for name in order
+        ]
+
+    def extract(self, node, **options):
+        """要素から項目を抽出（必須項目がなければNone）"""
+        first_match = {}
+        fields = {}
+        for name, field, selectors in self._plan:
+            if field.when is not None and not options.get(field.when, True):
+                fields[name] = field.default
+                continue
+            element = None
+            for selector in selectors:
+                if selector.css not in first_match:
+                    first_match[selector.css] = selector.select_one(node)
+                element = first_match[selector.css]
+                if element is not None:
+                    break
+            fields[name] = field.value(element)
+            if name in self.required and fields[name] is None:
+                return None
+        return self.finalize(fields, **options) if self.finalize else fields
+
+    def iter_items(self, html, limit=None):
+        """一覧ページから1件分の要素を順に返す（limit 件でパースを打ち切る）"""
+        return iter_matches(html, self.item_selector, limit=limit)
+
+    def extract_document(self, html, **options):
+        """詳細ページなど、文書全体を1件として抽出"""
+        return self.extract(parse_document(html), **options)
+
+def product_from_fields(fields, include_shipping=True):
+    """検索結果・商品ページの項目から商品情報の辞書を作る"""
+    shipping_info = None
+    if include_shipping:
+        if fields.get('shipping') is not None:
+            shipping_info = fields['shipping']
+        else:
+            shipping_info = "Prime対象" if fields.get('prime') else "送料情報なし"
+
+    return {
+        'name': fields['name'],
+        'url': fields.get('url'),
+        'price': parse_price(fields.get('price_text')),
+        'price_text': fields.get('price_text'),
+        'img_url': fields.get('img_url'),
+        'shipping': shipping_info,
+    }
+
+def price_from_fields(fields, **options):
+    """価格更新用に、商品ページの項目から価格と送料を取り出す"""
+    price = parse_price(fields.get('price_text'))
+    shipping_text = fields.get('shipping_text')
+    return {
+        'price': float(price) if price is not None else None,
+        # 「無料配送」などのテキストから送料を解析
+        'shipping_fee': 0 if shipping_text and '無料' in shipping_text else None,
+    }
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import threading
+import aiohttp
+
+class _LoopState:
+    """イベントループごとに保持するセッションとセマフォ・レートリミッタ"""
+
+    def __init__(self, session):
+        self.session = session
+        self.semaphores = {}
+        self.rate_limiters = {}
+
+class RateLimiter:
+    """リクエストの開始間隔を一定以上に保つレートリミッタ（rate は1秒あたりの回数）"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        """次に使える時刻を予約し、その時刻まで待つ"""
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+class AsyncFetchEngine:
+    """asyncioベースのページ取得エンジン
+
+    ホストごとにkeep-aliveのコネクションプールを共有し、サイトごとの同時リクエスト数を制限する。
+    site_rate_limits を指定したサイトは、1秒あたりのリクエスト数も制限する。
+    aiohttpのセッションはイベントループに紐づくため、ループごとに状態を持つ。
+    同期APIからの呼び出しは専用のバックグラウンドループで実行する。
+    """
+
+    def __init__(self, timeout=10, limit=100, limit_per_host=10, keepalive_timeout=30,
+                 site_concurrency=None, default_site_concurrency=4, site_rate_limits=None):
+        self.timeout = timeout
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.site_concurrency = dict(site_concurrency or {})
+        self.default_site_concurrency = default_site_concurrency
+        self.site_rate_limits = dict(site_rate_limits or {})
+        self.logger = logging.getLogger(__name__)
+
+        self._states = {}
+        self._lock = threading.Lock()
+        self._sync_loop = None
+        self._sync_thread = None
+
+    def _get_state(self):
+        """実行中のイベントループに対応する状態を取得（なければ作成）"""
+        loop = asyncio.get_running_loop()
+        state = self._states.get(loop)
+        if state is None or state.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            state = _LoopState(session)
+            self._states[loop] = state
+        return state
+
+    def _get_semaphore(self, state, site):
+        """サイトごとの同時実行数を制限するセマフォを取得"""
+        semaphore = state.semaphores.get(site)
+        if semaphore is None:
+            limit = self.site_concurrency.get(site, self.default_site_concurrency)
+            semaphore = asyncio.Semaphore(limit)
+            state.semaphores[site] = semaphore
+        return semaphore
+
+    def _get_rate_limiter(self, state, site):
+        """サイトごとのレートリミッタを取得（制限がなければNone）"""
+        if site not in self.site_rate_limits:
+            return None
+        limiter = state.rate_limiters.get(site)
+        if limiter is None:
+            limiter = RateLimiter(self.site_rate_limits[site])
+            state.rate_limiters[site] = limiter
+        return limiter
+
+    async def fetch_text(self, url, headers=None, site=None):
+        """ページを取得してHTML文字列を返す（失敗時はNone）"""
+        state = self._get_state()
+        site = site or 'default'
+        semaphore = self._get_semaphore(state, site)
+        limiter = self._get_rate_limiter(state, site)
+        try:
+            if limiter is not None:
+                await limiter.acquire()
+            async with semaphore:
+                async with state.session.get(url, headers=headers) as response:
+                    response.raise_for_status()
+                    return await response.text()
+        except Exception as e:
+            self.logger.error(f"Error fetching {url}: {str(e)}")
+            return None
+
+    def run_sync(self, coro):
+        """同期コードからコルーチンを実行して結果を返す
+
+        呼び出し元でイベントループが動いていても使えるよう、専用スレッドのループで実行する。
+        """
+        loop = self._get_sync_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def _get_sync_loop(self):
+        """同期API用のバックグラウンドイベントループを取得（なければ起動）"""
+        with self._lock:
+            if self._sync_loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='fetch-engine-loop', daemon=True)
+                thread.start()
+                self._sync_loop = loop
+                self._sync_thread = thread
+            return self._sync_loop
+
+    async def aclose(self):
+        """実行中のイベントループに紐づくセッションを閉じる"""
+        loop = asyncio.get_running_loop()
+        state = self._states.pop(loop, None)
+        if state is not None and not state.session.closed:
+            await state.session.close()
+
+    def close(self):
+        """同期API用のループとセッションを閉じる"""
+        with self._lock:
+            loop, thread = self._sync_loop, self._sync_thread
+            self._sync_loop = None
+            self._sync_thread = None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
@@ -0,0 +1,105 @@
+import io
+from cssselect import GenericTranslator, parse as parse_css
+from cssselect.parser import CombinedSelector
+from lxml import etree
+
+class _MatchTranslator(GenericTranslator):
+    """要素自身がセレクタに一致するかを判定するXPathを生成
+
+    結合子の左辺を祖先・兄弟要素の条件に変換する（例: 'h2 a' → self::a[ancestor::h2]）。
+    """
+
+    def xpath_descendant_combinator(self, left, right):
+        return right.add_condition(f"ancestor::{left}")
+
+    def xpath_child_combinator(self, left, right):
+        return right.add_condition(f"parent::{left}")
+
+    def xpath_direct_adjacent_combinator(self, left, right):
+        return right.add_condition(f"preceding-sibling::*[1][self::{left}]")
+
+    def xpath_indirect_adjacent_combinator(self, left, right):
+        return right.add_condition(f"preceding-sibling::{left}")
+
+_translator = GenericTranslator()
+_match_translator = _MatchTranslator()
+_string_value = etree.XPath('string()')
+
+def _rightmost_tag(css):
+    """セレクタが最終的に一致する要素のタグ名（'*' の場合はNone）"""
+    tags = set()
+    for selector in parse_css(css):
+        tree = selector.parsed_tree
+        while True:
+            if isinstance(tree, CombinedSelector):
+                tree = tree.subselector
+            elif hasattr(tree, 'selector'):
+                tree = tree.selector
+            else:
+                break
+        tags.add(tree.element)
+    if len(tags) != 1 or None in tags:
+        return None
+    return tags.pop()
+
+class CompiledSelector:
+    """一度だけXPathにコンパイルしたCSSセレクタ
+
+    lxmlの要素に対して BeautifulSoup の select / select_one と同じく子孫要素のみを検索する。
+    """
+
+    def __init__(self, css):
+        self.css = css
+        self.xpath = _translator.css_to_xpath(css, prefix='descendant::')
+        self._select = etree.XPath(self.xpath)
+        self._select_first = etree.XPath(f'({self.xpath})[1]')
+        self._match = etree.XPath(_match_translator.css_to_xpath(css, prefix='self::'))
+        self.tag = _rightmost_tag(css)
+
+    def select(self, element):
+        """一致するすべての子孫要素（文書順）"""
+        return self._select(element)
+
+    def select_one(self, element):
+        """最初に一致する子孫要素（なければNone）"""
+        found = self._select_first(element)
+        return found[0] if found else None
+
+    def matches(self, element):
+        """要素自身がセレクタに一致するか"""
+        return bool(self._match(element))
+
+    def __repr__(self):
+        return f"CompiledSelector({self.css!r})"
+
+def text_of(element):
+    """要素以下のテキストを連結して返す（BeautifulSoup の .text 相当）"""
+    return str(_string_value(element))
+
+def _to_bytes(html):
+    return html.encode('utf-8') if isinstance(html, str) else html
+
+def parse_document(html):
+    """HTML文書全体をlxmlでパースしてルート要素を返す"""
+    return etree.fromstring(_to_bytes(html), etree.HTMLParser(encoding='utf-8', no_network=True))
+
+def iter_matches(html, selector, limit=None):
+    """HTMLを逐次パースし、セレクタに一致する要素を出現順に返す
+
+    要素は閉じタグまで読み込んだ時点で返すため子孫要素は揃っている。
+    limit 件見つかった時点でパースを打ち切り、ページの残りは読まない。
+    """
+    if limit is not None and limit <= 0:
+        return
+    found = 0
+    events = etree.iterparse(
+        io.BytesIO(_to_bytes(html)), events=('end',), tag=selector.tag,
+        html=True, encoding='utf-8', no_network=True,
+    )
+    for _, element in events:
+        if not selector.matches(element):
+            continue
+        yield element
+        found += 1
+        if limit is not None and found >= limit:
+            return
@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# サイトごとの鮮度（秒）。Amazonは価格変動が速いため短めにする
+DEFAULT_SITE_TTLS = {
+    'amazon': 300,
+    'rakuten': 1800,
+    'yahoo': 900,
+}
+
+def normalize_query(query):
+    """検索クエリを正規化（全角半角の統一・小文字化・空白の圧縮）"""
+    query = unicodedata.normalize('NFKC', query).lower()
+    return re.sub(r'\s+', ' ', query).strip()
+
+class _Entry:
+    """キャッシュエントリ（値と鮮度期限・失効期限）"""
+
+    __slots__ = ('value', 'fresh_until', 'expires_at')
+
+    def __init__(self, value, fresh_until, expires_at):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.expires_at = expires_at
+
+class LRUCache:
+    """TTL付きの上限ありインプロセスLRUキャッシュ
+
+    run_sync のバックグラウンドループとアプリのループから同時に使われるため、ロックで保護する。
+    """
+
+    def __init__(self, max_entries=1024, clock=time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """エントリを取得（失効済みの場合はNone）"""
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        """エントリを保存し、上限を超えた分を古い順に破棄"""
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+class RedisTier:
+    """Redisによる第2層キャッシュ
+
+    redis.asyncio のクライアントはイベントループに紐づくため、URL指定時はループごとに作成する。
+    接続に失敗した場合は retry_interval 秒の間Redisを使わずに処理を続ける。
+    """
+
+    def __init__(self, redis_url=None, client=None, key_prefix='scrape', retry_interval=30, clock=time.time):
+        self.redis_url = redis_url
+        self.client = client
+        self.key_prefix = key_prefix
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+        self._clients = {}
+        self._disabled_until = 0
+
+    @property
+    def available(self):
+        return self.clock() >= self._disabled_until
+
+    def _get_client(self):
+        if self.client is not None:
+            return self.client
+        import redis.asyncio as aioredis
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = aioredis.from_url(self.redis_url)
+            self._clients[loop] = client
+        return client
+
+    def _mark_unavailable(self, error):
+        self.logger.warning(f"Redis cache unavailable, falling back to in-process cache: {error}")
+        self._disabled_until = self.clock() + self.retry_interval
+
+    async def get(self, key):
+        """エントリを取得（存在しない・接続できない場合はNone）"""
+        if not self.available:
+            return None
+        try:
+            raw = await self._get_client().get(f"{self.key_prefix}:{key}")
+        except Exception as e:
+            self._mark_unavailable(e)
+            return None
+        if raw is None:
+            return None
+        payload = json.loads(raw)
+        return _Entry(payload['value'], payload['fresh_until'], payload['expires_at'])
+
+    async def set(self, key, entry):
+        """エントリを保存（失効期限をRedisのTTLとして設定）"""
+        if not self.available:
+            return
+        ttl = max(1, int(entry.expires_at - self.clock()))
+        payload = json.dumps({
+            'value': entry.value,
+            'fresh_until': entry.fresh_until,
+            'expires_at': entry.expires_at,
+        }, ensure_ascii=False)
+        try:
+            await self._get_client().set(f"{self.key_prefix}:{key}", payload, ex=ttl)
+        except Exception as e:
+            self._mark_unavailable(e)
+
+    async def aclose(self):
+        """実行中のイベントループに紐づくクライアントを閉じる"""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+class SearchResultCache:
+    """検索結果の2層キャッシュ（インプロセスLRU + Redis）
+
+    鮮度期限内はそのまま返し、期限切れ後も stale_ttl の間は古い結果を返しつつ
+    バックグラウンドで再取得する（stale-while-revalidate）。
+    """
+
+    def __init__(self, redis_tier=None, max_entries=1024, site_ttls=None, default_ttl=600,
+                 stale_ttl=300, clock=time.time):
+        self.local = LRUCache(max_entries=max_entries, clock=clock)
+        self.redis_tier = redis_tier
+        self.site_ttls = {**DEFAULT_SITE_TTLS, **(site_ttls or {})}
+        self.default_ttl = default_ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self.logger = logging.getLogger(__name__)
+        self._refreshing = {}
+
+        self.metrics = {
+            'local_hits': 0,
+            'redis_hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'refresh_errors': 0,
+        }
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """環境変数 REDIS_URL が設定されていればRedis層付きで作成"""
+        redis_url = os.getenv("REDIS_URL")
+        redis_tier = RedisTier(redis_url=redis_url) if redis_url else None
+        return cls(redis_tier=redis_tier, **kwargs)
+
+    def ttl_for(self, sites):
+        """対象サイトの鮮度TTL（複数サイトの場合は最短）"""
+        return min(self.site_ttls.get(site, self.default_ttl) for site in sites)
+
+    @staticmethod
+    def make_key(kind, query, sites, max_results, **kwargs):
+        """検索条件からキャッシュキーを作成"""
+        params = json.dumps(sorted(kwargs.items()), ensure_ascii=False, default=str)
+        digest = hashlib.sha1(f"{normalize_query(query)}|{params}".encode('utf-8')).hexdigest()
+        return f"{kind}:{','.join(sorted(sites))}:{int(max_results)}:{digest}"
+
+    async def get_or_fetch(self, key, sites, fetch):
+        """キャッシュを参照し、なければ fetch() で取得して保存
+
+        fetch は引数なしでコルーチンを返す呼び出し可能オブジェクト。
+        """
+        now = self.clock()
+        entry = self.local.get(key)
+        if entry is not None:
+            self.metrics['local_hits'] += 1
+        elif self.redis_tier is not None:
+            entry = await self.redis_tier.get(key)
+            if entry is not None and entry.expires_at > now:
+                self.metrics['redis_hits'] += 1
+                self.local.set(key, entry)
+            else:
+                entry = None
+
+        if entry is None:
+            self.metrics['misses'] += 1
+            value = await fetch()
+            await self._store(key, sites, value)
+            return value
+
+        if entry.fresh_until <= now:
+            # 期限切れだが猶予期間内: 古い値を返して裏で更新
+            self.metrics['stale_hits'] += 1
+            self._schedule_refresh(key, sites, fetch)
+
+        return entry.value
+
+    async def _store(self, key, sites, value):
+        """結果を両方の層に保存（空の結果は一時的な失敗の可能性があるため保存しない）"""
+        if not value:
+            return
+        now = self.clock()
+        fresh_until = now + self.ttl_for(sites)
+        entry = _Entry(value, fresh_until, fresh_until + self.stale_ttl)
+        self.local.set(key, entry)
+        if self.redis_tier is not None:
+            await self.redis_tier.set(key, entry)
+
+    def _schedule_refresh(self, key, sites, fetch):
+        """同一キーの再取得が重複しないようにバックグラウンド更新を登録"""
+        if key in self._refreshing:
+            return
+        self.metrics['refreshes'] += 1
+        self._refreshing[key] = asyncio.ensure_future(self._refresh(key, sites, fetch))
+
+    async def _refresh(self, key, sites, fetch):
+        try:
+            value = await fetch()
+            await self._store(key, sites, value)
+        except Exception as e:
+            self.metrics['refresh_errors'] += 1
+            self.logger.error(f"Error refreshing cache entry {key}: {str(e)}")
+        finally:
+            self._refreshing.pop(key, None)
+
+    def invalidate(self, key):
+        """インプロセス層からエントリを削除"""
+        self.local.delete(key)
+
+    def stats(self):
+        """ヒット・ミスの集計を返す"""
+        lookups = self.metrics['local_hits'] + self.metrics['redis_hits'] + self.metrics['misses']
+        hits = lookups - self.metrics['misses']
+        return {
+            **self.metrics,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+            'local_entries': len(self.local),
+            'redis_available': self.redis_tier.available if self.redis_tier is not None else False,
+        }
+
+    async def aclose(self):
+        if self.redis_tier is not None:
+            await self.redis_tier.aclose()
@@ -1,91 +1,129 @@
-import concurrent.futures
+import asyncio
 import logging
 from .amazon_scraper import AmazonScraper
 from .rakuten_scraper import RakutenScraper
 from .yahoo_shopping_scraper import YahooShoppingScraper
+from .fetch_engine import AsyncFetchEngine
 
 class ScraperManager:
     """複数のスクレイパーを管理するクラス"""
-    
-    def __init__(self, max_workers=3, timeout=10):
+
+    def __init__(self, max_workers=3, timeout=10, fetch_engine=None, site_concurrency=None, cache=None):
+        # max_workers は後方互換のため残し、サイトごとの同時リクエスト数の既定値として使う
         self.max_workers = max_workers
         self.timeout = timeout
         self.logger = logging.getLogger(__name__)
-        
+
+        # 検索結果キャッシュ（SearchResultCache、Noneの場合はキャッシュしない）
+        self.cache = cache
+
+        # 全スクレイパーでコネクションプールを共有するフェッチエンジン
+        self.fetch_engine = fetch_engine or AsyncFetchEngine(
+            timeout=timeout,
+            site_concurrency=site_concurrency,
+            default_site_concurrency=max_workers,
+        )
+
         # スクレイパーの初期化
         self.scrapers = {
-            'amazon': AmazonScraper(timeout=timeout),
-            'rakuten': RakutenScraper(timeout=timeout),
-            'yahoo': YahooShoppingScraper(timeout=timeout),
+            'amazon': AmazonScraper(timeout=timeout, fetch_engine=self.fetch_engine),
+            'rakuten': RakutenScraper(timeout=timeout, fetch_engine=self.fetch_engine),
+            'yahoo': YahooShoppingScraper(timeout=timeout, fetch_engine=self.fetch_engine),
         }
-    
-    def search_all(self, query, max_results_per_site=10, **kwargs):
-        """すべてのサイトで並列に検索を実行"""
+
+    async def _gather_sites(self, calls, log_label):
+        """サイトごとのコルーチンを並行実行し、結果を価格順にまとめる"""
+        site_names = list(calls.keys())
+        outcomes = await asyncio.gather(*calls.values(), return_exceptions=True)
+
         all_results = []
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_site = {
-                executor.submit(scraper.search, query, max_results_per_site, **kwargs): site_name
-                for site_name, scraper in self.scrapers.items()
-            }
-            
-            for future in concurrent.futures.as_completed(future_to_site):
-                site_name = future_to_site[future]
-                try:
-                    results = future.result()
-                    self.logger.info(f"Got {len(results)} results from {site_name}")
-                    all_results.extend(results)
-                except Exception as e:
-                    self.logger.error(f"Error searching {site_name}: {str(e)}")
-        
+        for site_name, outcome in zip(site_names, outcomes):
+            if isinstance(outcome, Exception):
+                self.logger.error(f"Error searching {site_name} ({log_label}): {str(outcome)}")
+                continue
+            self.logger.info(f"Got {len(outcome)} results from {site_name} ({log_label})")
+            all_results.extend(outcome)
+
         # 価格の安い順にソート（価格情報がない商品は最後に）
         all_results.sort(key=lambda x: x.get('price', float('inf')) or float('inf'))
-        
+
         return all_results
-    
-    def search_site(self, site_name, query, max_results=10, **kwargs):
+
+    async def _cached(self, kind, query, sites, max_results, kwargs, fetch):
+        """キャッシュが設定されていればキャッシュ経由で取得"""
+        if self.cache is None:
+            return await fetch()
+        key = self.cache.make_key(kind, query, sites, max_results, **kwargs)
+        return await self.cache.get_or_fetch(key, sites, fetch)
+
+    async def async_search_all(self, query, max_results_per_site=10, **kwargs):
+        """すべてのサイトで並行に検索を実行"""
+        return await self._cached(
+            'search', query, list(self.scrapers), max_results_per_site, kwargs,
+            lambda: self._search_all(query, max_results_per_site, **kwargs)
+        )
+
+    async def _search_all(self, query, max_results_per_site=10, **kwargs):
+        calls = {
+            site_name: scraper.async_search(query, max_results_per_site, **kwargs)
+            for site_name, scraper in self.scrapers.items()
+        }
+        return await self._gather_sites(calls, query)
+
+    def search_all(self, query, max_results_per_site=10, **kwargs):
+        """すべてのサイトで並行に検索を実行（同期API）"""
+        return self.fetch_engine.run_sync(self.async_search_all(query, max_results_per_site, **kwargs))
+
+    async def async_search_site(self, site_name, query, max_results=10, **kwargs):
         """特定のサイトのみで検索を実行"""
         if site_name not in self.scrapers:
             self.logger.error(f"Unknown site: {site_name}")
             return []
-            
+
+        return await self._cached(
+            'search', query, [site_name], max_results, kwargs,
+            lambda: self._search_site(site_name, query, max_results, **kwargs)
+        )
+
+    async def _search_site(self, site_name, query, max_results=10, **kwargs):
         try:
-            return self.scrapers[site_name].search(query, max_results, **kwargs)
+            return await self.scrapers[site_name].async_search(query, max_results, **kwargs)
         except Exception as e:
             self.logger.error(f"Error searching {site_name}: {str(e)}")
             return []
-    
-    def search_by_barcode(self, barcode, max_results=10, **kwargs):
+
+    def search_site(self, site_name, query, max_results=10, **kwargs):
+        """特定のサイトのみで検索を実行（同期API）"""
+        return self.fetch_engine.run_sync(self.async_search_site(site_name, query, max_results, **kwargs))
+
+    async def async_search_by_barcode(self, barcode, max_results=10, **kwargs):
         """バーコードで商品を検索"""
         self.logger.info(f"バーコード検索: {barcode}")
-        
+        return await self._cached(
+            'barcode', barcode, list(self.scrapers), max_results, kwargs,
+            lambda: self._search_by_barcode(barcode, max_results, **kwargs)
+        )
+
+    async def _search_by_barcode(self, barcode, max_results=10, **kwargs):
         # JANコードはISBNを含む13桁の数字
         # ASINは通常10桁の英数字
-        # それぞれに適した検索方法を使用
-        
-        all_results = []
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_site = {}
-            
-            # サイトごとに適切な検索メソッドを使用
-            for site_name, scraper in self.scrapers.items():
-                if hasattr(scraper, 'search_by_barcode'):
-                    future_to_site[executor.submit(scraper.search_by_barcode, barcode, max_results, **kwargs)] = site_name
-                else:
-                    # バーコード検索をサポートしていない場合は通常検索を使用
-                    future_to_site[executor.submit(scraper.search, barcode, max_results, **kwargs)] = site_name
-            
-            for future in concurrent.futures.as_completed(future_to_site):
-                site_name = future_to_site[future]
-                try:
-                    results = future.result()
-                    self.logger.info(f"バーコード {barcode} の検索: {site_name} から {len(results)} 件の結果")
-                    all_results.extend(results)
-                except Exception as e:
-                    self.logger.error(f"バーコード検索エラー ({site_name}): {str(e)}")
-        
-        # 価格の安い順にソート
-        all_results.sort(key=lambda x: x.get('price', float('inf')) or float('inf'))
-        
-        return all_results
+        # それぞれのスクレイパーが適した検索方法を選択する
+        calls = {
+            site_name: scraper.async_search_by_barcode(barcode, max_results, **kwargs)
+            for site_name, scraper in self.scrapers.items()
+        }
+        return await self._gather_sites(calls, f"バーコード:{barcode}")
+
+    def search_by_barcode(self, barcode, max_results=10, **kwargs):
+        """バーコードで商品を検索（同期API）"""
+        return self.fetch_engine.run_sync(self.async_search_by_barcode(barcode, max_results, **kwargs))
+
+    async def aclose(self):
+        """実行中のイベントループに紐づくコネクションを閉じる"""
+        await self.fetch_engine.aclose()
+        if self.cache is not None:
+            await self.cache.aclose()
+
+    def close(self):
+        """同期API用のコネクションを閉じる"""
+        self.fetch_engine.close()
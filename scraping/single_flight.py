@@ -0,0 +1,51 @@
+import asyncio
+import logging
+
+class SingleFlight:
+    """同一キーの同時実行をまとめるクラス（シングルフライト）
+
+    同じキーの処理が実行中であれば新たに実行せず、実行中の結果を待って共有する。
+    呼び出し元がキャンセルされても共有中の処理は継続する。
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._inflight = {}
+
+        # 計測用カウンタ
+        self.hits = 0              # do() の呼び出し総数
+        self.joins = 0             # 実行中の処理に相乗りした回数
+        self.leader_executions = 0 # 実際に処理を実行した回数
+
+    async def do(self, key, func):
+        """キーに対応する処理を実行、または実行中の処理の結果を待つ
+
+        func は引数なしでコルーチンを返す呼び出し可能オブジェクト。
+        """
+        self.hits += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.leader_executions += 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.joins += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        """完了した処理を実行中リストから外す"""
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 待機者が全員キャンセルされた場合でも例外を回収しておく
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.debug(f"Single-flight call failed for {key}: {task.exception()}")
+
+    def stats(self):
+        """カウンタの現在値を返す"""
+        return {
+            'hits': self.hits,
+            'joins': self.joins,
+            'leader_executions': self.leader_executions,
+            'in_flight': len(self._inflight),
+        }
@@ -0,0 +1,75 @@
+import sys
+import os
+import pytest
+
+# プロジェクトルートをパスに追加
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# テストではインメモリSQLiteを使用（app.main のインポート時にDBファイルを作らない）
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+class FakeClock:
+    """テスト用の手動で進められる時計"""
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def api_engine(tmp_path):
+    """ルーターのテスト用のSQLiteエンジン"""
+    from sqlalchemy import create_engine
+    from app.models.database import Base
+    engine = create_engine(f"sqlite:///{tmp_path / 'api.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+@pytest.fixture
+def api_client(api_engine):
+    """products・alerts ルーターを api_engine のセッションで動かすテストクライアント"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from sqlalchemy.orm import sessionmaker
+    from app.models import get_db
+    from app.routers import alerts, products
+
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=api_engine)
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(products.router)
+    app.include_router(alerts.router)
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+@pytest.fixture
+def fired_alerts():
+    """アラートの即時発火を有効にし、発火したアラートIDを記録する（ブローカーには送らない）"""
+    from app.services.alert_index import alert_trigger
+    fired = []
+    alert_trigger.invalidate()
+    alert_trigger.install(dispatch=fired.extend)
+    yield fired
+    alert_trigger.wait()
+    alert_trigger.uninstall()
+    alert_trigger.dispatch = None
+
+@pytest.fixture
+def count_statements():
+    """エンジンが発行したSQL文を記録する（with count_statements(engine) as statements: ...）
+
+    backend のテストと同じヘルパーを使う。
+    """
+    from backend.tests.utils.test_helpers import count_statements
+    return count_statements
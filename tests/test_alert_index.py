@@ -0,0 +1,161 @@
+from datetime import datetime
+import threading
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base
+from app.models.models import User, Product, Price, PriceAlert
+from app.services.alert_index import AlertThresholdIndex, AlertTrigger, alert_trigger
+from app.tasks import alert as alert_tasks
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(alert_tasks, "SessionLocal", factory)
+    return factory
+
+@pytest.fixture
+def sent(monkeypatch):
+    notifications = []
+    monkeypatch.setattr(alert_tasks, "send_alert_notification",
+                        lambda *args: notifications.append(args) or True)
+    return notifications
+
+def seed(db):
+    db.add(User(id=1, email="user@example.com"))
+    db.add_all([Product(id=i, name=f"商品{i}", source="Amazon", url=f"http://example.com/{i}") for i in (1, 2)])
+    db.add_all([
+        PriceAlert(id=1, user_id=1, product_id=1, target_price=1000, is_active=True),
+        PriceAlert(id=2, user_id=1, product_id=1, target_price=800, is_active=True),
+        PriceAlert(id=3, user_id=1, product_id=2, target_price=1000, is_active=True),
+        PriceAlert(id=4, user_id=1, product_id=1, target_price=5000, is_active=False),
+    ])
+    db.commit()
+
+def add_price(db, product_id, total_price):
+    db.add(Price(product_id=product_id, price=total_price, total_price=total_price, timestamp=datetime.utcnow()))
+    db.commit()
+    alert_trigger.wait()
+
+def test_index_returns_thresholds_at_or_above_price():
+    index = AlertThresholdIndex()
+    index.load([(1, 10, 1000), (2, 10, 800), (3, 10, 1200), (4, 20, 5000)])
+
+    assert index.match(10, 1000) == [1, 3]
+    assert index.match(10, 1201) == []
+    assert index.match(99, 1) == []
+
+    # 目標価格の変更・削除
+    index.add(3, 10, 500)
+    index.remove(1)
+    assert index.match(10, 500) == [3, 2]
+
+    assert index.pop_matches(10, 600) == [2]
+    assert index.match(10, 0) == [3]
+    assert len(index) == 2
+
+def test_committed_price_fires_matching_alerts_once(session_factory, fired_alerts):
+    db = session_factory()
+    seed(db)
+
+    add_price(db, 1, 1200)
+    assert fired_alerts == []
+
+    add_price(db, 1, 900)
+    assert fired_alerts == [1]
+
+    # 発火済みのアラートは次の値下がりでは再発火しない
+    add_price(db, 1, 700)
+    assert fired_alerts == [1, 2]
+    db.close()
+
+def test_alert_changes_are_applied_to_loaded_index(session_factory, fired_alerts):
+    db = session_factory()
+    seed(db)
+    add_price(db, 2, 1500)  # インデックスを読み込ませる
+
+    db.add(PriceAlert(id=5, user_id=1, product_id=2, target_price=1400, is_active=True))
+    db.get(PriceAlert, 3).target_price = 1450
+    db.commit()
+    add_price(db, 2, 1420)
+    assert fired_alerts == [3]
+
+    db.delete(db.get(PriceAlert, 5))
+    db.commit()
+    add_price(db, 2, 1000)
+    assert fired_alerts == [3]
+
+    # ロールバックした価格では発火しない
+    db.add(PriceAlert(id=6, user_id=1, product_id=2, target_price=2000, is_active=True))
+    db.commit()
+    db.add(Price(product_id=2, price=1, total_price=1, timestamp=datetime.utcnow()))
+    db.flush()
+    db.rollback()
+    assert fired_alerts == [3]
+    db.close()
+
+def test_bulk_inserted_prices_are_checked_explicitly(session_factory, fired_alerts):
+    db = session_factory()
+    seed(db)
+    db.close()
+
+    assert alert_trigger.on_prices_inserted(db.get_bind(), [(1, 950), (2, 990), (2, None)]) == [1, 3]
+    assert fired_alerts == [1, 3]
+
+def test_fired_alerts_are_notified_once_and_sweep_skips_them(session_factory, sent, fired_alerts):
+    db = session_factory()
+    seed(db)
+    add_price(db, 1, 900)
+    add_price(db, 1, 1100)  # 通知前に価格が戻った
+    add_price(db, 2, 1000)
+    db.close()
+    assert fired_alerts == [1, 3]
+
+    result = alert_tasks.fire_price_alerts(fired_alerts)
+
+    # 最新価格で確認し直すため、価格が戻ったアラート1は通知しない
+    assert result == {"success": True, "notifications_sent": 1}
+    assert [(name, target, current) for _, name, _, target, current, _ in sent] == [("商品2", 1000, 1000)]
+
+    # 定期照合では通知済みのアラートを再通知しない
+    assert alert_tasks.check_price_alerts()["notifications_sent"] == 0
+    assert alert_tasks.fire_price_alerts([3])["notifications_sent"] == 0
+    assert len(sent) == 1
+
+def test_index_is_reloaded_outside_the_committing_thread(session_factory, clock):
+    """コミット時のインデックスの読み込み・再読み込みはバックグラウンドのスレッドで行う"""
+    fired = []
+    trigger = AlertTrigger(dispatch=fired.extend, refresh_interval=300, clock=clock)
+    trigger.install()
+    loading_threads = []
+
+    def record(conn, cursor, statement, *args):
+        if "FROM price_alerts" in statement:
+            loading_threads.append(threading.get_ident())
+
+    engine = session_factory.kw["bind"]
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        db = session_factory()
+        seed(db)
+        # 読み込み前の価格は保留され、読み込んだスレッドで照合される
+        add_price(db, 1, 900)
+        trigger.wait()
+        assert fired == [1]
+
+        # 期限切れでも読み込み済みのインデックスでその場で照合し、再読み込みは別スレッドで行う
+        clock.now += 301
+        db.add(Price(product_id=2, price=1000, total_price=1000, timestamp=datetime.utcnow()))
+        db.commit()
+        assert fired == [1, 3]
+        trigger.wait()
+        db.close()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+        trigger.uninstall()
+
+    assert len(loading_threads) == 2
+    assert threading.get_ident() not in loading_threads
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+import random
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base
+from app.models.models import Product, Price
+from app.services import batch_analysis
+from app.services.batch_analysis import analyze_products
+from app.services.price_history import analysis_result, prices_between, summarize_prices
+
+START = datetime(2024, 1, 1)
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+def add_history(db, counts, seed=0):
+    """商品ごとに counts[i] 件の価格を時刻順でなく追加する"""
+    rng = random.Random(seed)
+    prices = []
+    for product_id, count in enumerate(counts, start=1):
+        db.add(Product(id=product_id, name=f"商品{product_id}", source="Amazon", url=f"http://example.com/{product_id}"))
+        trend = rng.choice((-3, 0, 3))
+        for i in range(count):
+            timestamp = START + timedelta(hours=rng.randrange(24 * 60))
+            prices.append(Price(product_id=product_id, price=float(1000 + trend * i + rng.randrange(50)), timestamp=timestamp))
+    rng.shuffle(prices)
+    db.add_all(prices)
+    db.commit()
+
+def single_analysis(db, product_id, start):
+    values = [price for price, in prices_between(db, product_id, start).with_entities(Price.price)]
+    return analysis_result(summarize_prices(values)) if values else None
+
+def test_batch_analysis_matches_single_product_analysis(db, monkeypatch):
+    counts = [1, 2, 3, 4, 7, 30, 100, 0, 55, 9]
+    add_history(db, counts)
+    # 複数のクエリに分かれても結果は同じ
+    monkeypatch.setattr(batch_analysis, "QUERY_BATCH_SIZE", 3)
+
+    for start in (START, START + timedelta(days=30)):
+        product_ids = list(range(1, len(counts) + 2))
+        analyses = analyze_products(db, product_ids, start)
+
+        expected = {product_id: single_analysis(db, product_id, start) for product_id in product_ids}
+        assert set(analyses) == {product_id for product_id, result in expected.items() if result is not None}
+        for product_id, result in analyses.items():
+            assert result == pytest.approx(expected[product_id])
+
+def test_batch_analysis_of_no_products(db):
+    add_history(db, [5])
+    assert analyze_products(db, [], START) == {}
+    assert analyze_products(db, [2, 3], START) == {}
@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+from collections import Counter, defaultdict
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from scraping.fetch_engine import AsyncFetchEngine, RateLimiter
+
+class SiteServer:
+    """サイトごとの同時処理数と到着時刻を記録するテスト用HTTPサーバー（/<site>/<n>）
+
+    run_sync が呼び出し元のスレッドを止めても応答できるよう、専用スレッドのループで動かす。
+    """
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.in_flight = Counter()
+        self.max_in_flight = Counter()
+        self.arrivals = defaultdict(list)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.server = None
+
+    async def handle(self, request):
+        site = request.match_info['site']
+        if site == 'broken':
+            return web.Response(status=500)
+        self.arrivals[site].append(time.monotonic())
+        self.in_flight[site] += 1
+        self.max_in_flight[site] = max(self.max_in_flight[site], self.in_flight[site])
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight[site] -= 1
+        return web.Response(text=f"{site}:{request.match_info['n']}")
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get('/{site}/{n}', self.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    def start(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result()
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.server.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def url(self, site, n=0):
+        return str(self.server.make_url(f'/{site}/{n}'))
+
+@pytest.fixture
+def server():
+    server = SiteServer()
+    server.start()
+    yield server
+    server.stop()
+
+def test_site_concurrency_is_limited_per_site(server):
+    """サイトごとの同時リクエスト数が設定値を超えない"""
+    engine = AsyncFetchEngine(site_concurrency={'amazon': 2}, default_site_concurrency=3)
+
+    async def scenario():
+        try:
+            return await asyncio.gather(
+                *(engine.fetch_text(server.url('amazon', i), site='amazon') for i in range(8)),
+                *(engine.fetch_text(server.url('yahoo', i), site='yahoo') for i in range(8)),
+            )
+        finally:
+            await engine.aclose()
+
+    texts = asyncio.run(scenario())
+
+    assert texts == [f'amazon:{i}' for i in range(8)] + [f'yahoo:{i}' for i in range(8)]
+    assert server.max_in_flight == {'amazon': 2, 'yahoo': 3}
+
+def test_site_rate_limit_spaces_request_starts(server):
+    """site_rate_limits を指定したサイトはリクエストの開始間隔が 1/rate 以上になる"""
+    server.delay = 0
+    engine = AsyncFetchEngine(default_site_concurrency=10, site_rate_limits={'rakuten': 20})
+
+    async def scenario():
+        try:
+            await asyncio.gather(
+                *(engine.fetch_text(server.url('rakuten', i), site='rakuten') for i in range(5)),
+                *(engine.fetch_text(server.url('yahoo', i), site='yahoo') for i in range(5)),
+            )
+        finally:
+            await engine.aclose()
+
+    asyncio.run(scenario())
+
+    rakuten = sorted(server.arrivals['rakuten'])
+    assert rakuten[-1] - rakuten[0] >= 4 * 0.05 * 0.9
+    # 制限のないサイトは待たされない
+    yahoo = sorted(server.arrivals['yahoo'])
+    assert yahoo[-1] - yahoo[0] < 0.1
+
+def test_rate_limiter_reserves_consecutive_slots():
+    """同時に acquire しても1/rate 間隔の枠が順に割り当てられる"""
+    async def scenario():
+        limiter = RateLimiter(100)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        finished = []
+
+        async def acquire():
+            await limiter.acquire()
+            finished.append(loop.time() - start)
+
+        await asyncio.gather(*(acquire() for _ in range(4)))
+        return finished
+
+    finished = asyncio.run(scenario())
+
+    assert finished[0] < 0.005
+    assert finished[-1] >= 3 * 0.01 * 0.9
+
+def test_state_is_per_event_loop_and_closed_by_aclose():
+    """セッションはイベントループごとに作られ、aclose で閉じられる"""
+    engine = AsyncFetchEngine()
+
+    async def scenario():
+        state = engine._get_state()
+        assert engine._get_state() is state
+        await engine.aclose()
+        assert asyncio.get_running_loop() not in engine._states
+        return state
+
+    first = asyncio.run(scenario())
+    second = asyncio.run(scenario())
+
+    assert first is not second
+    assert first.session is not second.session
+    assert first.session.closed and second.session.closed
+
+def test_failed_fetch_returns_none(server):
+    """エラー応答は例外にせず None を返す"""
+    engine = AsyncFetchEngine()
+    try:
+        assert engine.run_sync(engine.fetch_text(server.url('broken'))) is None
+    finally:
+        engine.close()
+
+def test_run_sync_inside_running_loop_and_close(server):
+    """イベントループの中からでも run_sync でき、close でバックグラウンドのスレッドとセッションを閉じる"""
+    engine = AsyncFetchEngine()
+
+    async def caller():
+        return engine.run_sync(engine.fetch_text(server.url('amazon', 1), site='amazon'))
+
+    assert asyncio.run(caller()) == 'amazon:1'
+    # 2回目も同じバックグラウンドのループとセッションを使う
+    assert engine.run_sync(engine.fetch_text(server.url('amazon', 2), site='amazon')) == 'amazon:2'
+    loop, thread = engine._sync_loop, engine._sync_thread
+    session = engine._states[loop].session
+    assert thread.is_alive()
+
+    engine.close()
+
+    assert not thread.is_alive()
+    assert loop.is_closed()
+    assert session.closed
+    assert engine._states == {}
+    engine.close()  # 2回目は何もしない
@@ -0,0 +1,93 @@
+from datetime import datetime
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base
+from app.models import latest_price
+from app.models.latest_price import rebuild_latest_prices, upsert_latest_prices
+from app.models.migrations import backfill_latest_prices
+from app.models.models import Product, Price, ProductLatestPrice
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine)()
+    session.add_all([Product(id=i, name=f"商品{i}", source="Amazon", url=f"http://example.com/{i}") for i in (1, 2)])
+    session.commit()
+    yield session
+    session.close()
+
+@pytest.fixture(params=["on_conflict", "select_then_write"])
+def upsert_path(request, monkeypatch):
+    """ON CONFLICT のUPSERTと、それを使えない方言向けの読んでから書き込む経路の両方で試す"""
+    if request.param == "select_then_write":
+        monkeypatch.setattr(latest_price, "dialect_insert", lambda conn, table: None)
+    return request.param
+
+def add_price(db, product_id, total_price, day):
+    db.add(Price(product_id=product_id, price=total_price, total_price=total_price, timestamp=datetime(2024, 1, day)))
+
+def latest(db):
+    db.expire_all()
+    return {row.product_id: (row.total_price, row.timestamp.day) for row in db.query(ProductLatestPrice)}
+
+def test_inserting_prices_updates_latest_price_in_same_transaction(db, upsert_path):
+    add_price(db, 1, 1000, 1)
+    add_price(db, 2, 2000, 1)
+    db.commit()
+    assert latest(db) == {1: (1000, 1), 2: (2000, 1)}
+
+    add_price(db, 1, 900, 3)
+    db.commit()
+    # 遅れて届いた古い価格では上書きしない
+    add_price(db, 1, 1200, 2)
+    db.commit()
+    assert latest(db) == {1: (900, 3), 2: (2000, 1)}
+
+    # ロールバックした価格は最新価格にも残らない
+    add_price(db, 2, 1, 5)
+    db.flush()
+    db.rollback()
+    assert latest(db) == {1: (900, 3), 2: (2000, 1)}
+    assert db.get(Product, 1).latest_price.total_price == 900
+
+def test_bulk_rows_keep_the_newest_price_per_product(db, upsert_path):
+    rows = [
+        {"product_id": 1, "price": 1000, "shipping_fee": 0, "total_price": 1000, "timestamp": datetime(2024, 1, 2)},
+        {"product_id": 1, "price": 800, "shipping_fee": 0, "total_price": 800, "timestamp": datetime(2024, 1, 1)},
+        {"product_id": 2, "price": 500, "shipping_fee": None, "total_price": 500, "timestamp": datetime(2024, 1, 1)},
+    ]
+    upsert_latest_prices(db.connection(), rows)
+    db.commit()
+    assert latest(db) == {1: (1000, 2), 2: (500, 1)}
+
+def test_rebuild_repairs_table_from_history(engine, db):
+    add_price(db, 1, 1000, 1)
+    add_price(db, 1, 900, 2)
+    add_price(db, 2, 2000, 1)
+    db.commit()
+
+    # 書き込み漏れ・不整合を作る
+    db.execute(text("DELETE FROM product_latest_price WHERE product_id = 2"))
+    db.execute(text("UPDATE product_latest_price SET total_price = 1 WHERE product_id = 1"))
+    db.commit()
+    assert backfill_latest_prices(engine) == 0
+
+    with engine.begin() as conn:
+        assert rebuild_latest_prices(conn) == 2
+    assert latest(db) == {1: (900, 2), 2: (2000, 1)}
+
+def test_backfill_fills_empty_table(engine, db):
+    add_price(db, 1, 1000, 1)
+    db.commit()
+    db.execute(text("DELETE FROM product_latest_price"))
+    db.commit()
+
+    assert backfill_latest_prices(engine) == 1
+    assert latest(db) == {1: (1000, 1)}
@@ -0,0 +1,145 @@
+import email
+import smtplib
+import threading
+import time
+import warnings
+from datetime import datetime
+from email.header import decode_header, make_header
+import pytest
+
+from app.services.notification import AlertEmailRenderer, NotificationDispatcher, SMTPConnectionPool
+
+class FakeSMTP:
+    """宛先ごとに決めたエラーを返すテスト用SMTP接続（responses は宛先 → 例外のリスト）"""
+
+    def __init__(self, responses, opened):
+        self.responses = responses
+        self.opened = opened
+
+    def __call__(self, host, port, timeout=None):
+        self.opened.append((host, port))
+        return self
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def sendmail(self, sender, recipients, message):
+        errors = self.responses.get(recipients[0])
+        if errors:
+            raise errors.pop(0)
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def smtp_server():
+    """受信したメールを記録するローカルのSMTPデバッグサーバー"""
+    received = []
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        Controller = None
+
+    if Controller is not None:
+        class Handler:
+            async def handle_DATA(self, server, session, envelope):
+                received.append((envelope.rcpt_tos, envelope.content))
+                return '250 OK'
+
+        controller = Controller(Handler(), hostname='127.0.0.1', port=0)
+        controller.start()
+        yield '127.0.0.1', controller.server.sockets[0].getsockname()[1], received
+        controller.stop()
+        return
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', DeprecationWarning)
+        asyncore = pytest.importorskip('asyncore')
+        smtpd = pytest.importorskip('smtpd')
+
+    class Server(smtpd.SMTPServer):
+        def process_message(self, peer, mailfrom, rcpttos, data, **kwargs):
+            received.append((rcpttos, data))
+
+    socket_map = {}
+    server = Server(('127.0.0.1', 0), None, map=socket_map)
+    thread = threading.Thread(target=asyncore.loop, kwargs={'timeout': 0.05, 'map': socket_map}, daemon=True)
+    thread.start()
+    yield '127.0.0.1', server.socket.getsockname()[1], received
+    for channel in list(socket_map.values()):
+        channel.close()
+    thread.join(5)
+
+def make_dispatcher(factory, **kwargs):
+    pool = SMTPConnectionPool('smtp.example.com', 587, size=kwargs.get('workers', 1), factory=factory)
+    return NotificationDispatcher(pool, 'alert@example.com', backoff=0.01, poll_interval=0.01, **kwargs)
+
+def test_rendered_email_is_valid_mime():
+    renderer = AlertEmailRenderer('alert@example.com')
+    message = email.message_from_string(renderer.render(
+        'user@example.com', 'テスト商品', 'http://example.com/1', 1000, 900, datetime(2024, 1, 2, 3, 4)
+    ))
+
+    assert str(make_header(decode_header(message['Subject']))) == '【最安値アラート】テスト商品が目標価格に達しました'
+    assert message['To'] == 'user@example.com'
+    text, html = [part.get_payload(decode=True).decode('utf-8') for part in message.get_payload()]
+    assert '現在価格: 900円' in text and '確認日時: 2024年01月02日 03:04' in text
+    assert '<h2>テスト商品</h2>' in html and 'href="http://example.com/1"' in html
+
+def test_temporary_failures_are_retried_per_recipient():
+    opened = []
+    factory = FakeSMTP({
+        'slow@example.com': [smtplib.SMTPRecipientsRefused({'slow@example.com': (450, b'try later')})],
+        'gone@example.com': [smtplib.SMTPRecipientsRefused({'gone@example.com': (550, b'no such user')})],
+        'busy@example.com': [smtplib.SMTPRecipientsRefused({'busy@example.com': (451, b'busy')})] * 5,
+    }, opened)
+    dispatcher = make_dispatcher(factory, max_attempts=3)
+
+    for recipient in ('slow', 'gone', 'ok', 'busy'):
+        dispatcher.submit(f'{recipient}@example.com', 'message')
+    assert dispatcher.flush(5)
+    dispatcher.close()
+
+    # slow は2回目で送信、gone は恒久エラーで即失敗、busy は3回試して失敗
+    assert (dispatcher.sent, dispatcher.failed, dispatcher.retried) == (2, 2, 3)
+    assert len(opened) == 1
+
+def test_dropped_connection_is_reopened_without_losing_mail():
+    opened = []
+    factory = FakeSMTP({'a@example.com': [smtplib.SMTPServerDisconnected('gone')]}, opened)
+    dispatcher = make_dispatcher(factory, batch_size=10)
+
+    for recipient in ('a', 'b', 'c'):
+        dispatcher.submit(f'{recipient}@example.com', 'message')
+    assert dispatcher.flush(5)
+    dispatcher.close()
+
+    assert (dispatcher.sent, dispatcher.failed) == (3, 0)
+    assert len(opened) == 2
+
+def test_pooled_dispatcher_delivers_to_local_server(smtp_server):
+    host, port, received = smtp_server
+    pool = SMTPConnectionPool(host, port, starttls=False, user=None, size=4)
+    dispatcher = NotificationDispatcher(pool, 'alert@example.com', workers=4, queue_size=50, batch_size=25)
+    renderer = AlertEmailRenderer('alert@example.com')
+
+    started = time.perf_counter()
+    for i in range(200):
+        dispatcher.submit(f'user{i}@example.com', renderer.render(
+            f'user{i}@example.com', f'商品{i}', f'http://example.com/{i}', 1000, 900, datetime(2024, 1, 1)
+        ))
+    assert dispatcher.flush(30)
+    elapsed = time.perf_counter() - started
+    dispatcher.close()
+
+    assert dispatcher.sent == 200
+    assert sorted(rcpt for rcpts, _ in received for rcpt in rcpts) == sorted(f'user{i}@example.com' for i in range(200))
+    # 接続は使い回すため、開いた接続数はワーカー数を超えない
+    assert pool.connections_opened <= 4
+    print(f"200 emails in {elapsed:.2f}s over {pool.connections_opened} connections")
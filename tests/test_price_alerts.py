@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base
+from app.models.models import User, Product, Price, PriceAlert
+from app.tasks import alert as alert_tasks
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+@pytest.fixture
+def session_factory(engine, monkeypatch):
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(alert_tasks, "SessionLocal", factory)
+    return factory
+
+@pytest.fixture
+def sent(monkeypatch):
+    notifications = []
+    monkeypatch.setattr(alert_tasks, "send_alert_notification",
+                        lambda *args: notifications.append(args) or True)
+    return notifications
+
+def add_price(db, product_id, total_price, minutes_ago):
+    db.add(Price(product_id=product_id, price=total_price, total_price=total_price,
+                 timestamp=datetime(2024, 1, 1, 12, 0) - timedelta(minutes=minutes_ago)))
+
+def seed(db, products=4):
+    db.add(User(id=1, email="user@example.com"))
+    for i in range(1, products + 1):
+        db.add(Product(id=i, name=f"商品{i}", source="Amazon", url=f"http://example.com/{i}"))
+    # 商品1: 最新価格が目標以下
+    add_price(db, 1, 1200, 60)
+    add_price(db, 1, 900, 0)
+    # 商品2: 過去には目標以下だったが最新価格は目標より高い
+    add_price(db, 2, 800, 60)
+    add_price(db, 2, 1500, 0)
+    # 商品3: 価格情報なし
+    db.add_all([
+        PriceAlert(id=1, user_id=1, product_id=1, target_price=1000, is_active=True),
+        PriceAlert(id=2, user_id=1, product_id=2, target_price=1000, is_active=True),
+        PriceAlert(id=3, user_id=1, product_id=3, target_price=1000, is_active=True),
+        PriceAlert(id=4, user_id=1, product_id=1, target_price=1000, is_active=False),
+        PriceAlert(id=5, user_id=1, product_id=1, target_price=900, is_active=True),
+    ])
+    db.commit()
+
+def test_only_alerts_at_or_below_latest_price_fire_and_are_deactivated(session_factory, sent):
+    db = session_factory()
+    seed(db)
+    db.close()
+
+    result = alert_tasks.check_price_alerts()
+
+    assert result == {"success": True, "notifications_sent": 2, "total_alerts": 4}
+    assert [(email, name, target, current) for email, name, _, target, current, _ in sent] == [
+        ("user@example.com", "商品1", 1000, 900),
+        ("user@example.com", "商品1", 900, 900),
+    ]
+    db = session_factory()
+    assert {a.id: a.is_active for a in db.query(PriceAlert)} == {1: False, 2: True, 3: True, 4: False, 5: False}
+    db.close()
+
+    # 2回目は通知済みのアラートを再通知しない
+    assert alert_tasks.check_price_alerts()["notifications_sent"] == 0
+
+def test_statement_count_does_not_grow_with_alerts(engine, session_factory, sent):
+    db = session_factory()
+    seed(db, products=50)
+    for i in range(6, 200):
+        db.add(PriceAlert(id=i, user_id=1, product_id=(i % 50) + 1, target_price=100, is_active=True))
+    db.commit()
+    db.close()
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    alert_tasks.check_price_alerts()
+
+    # アラート件数のカウント・判定・一括UPDATE
+    assert len(statements) == 3
@@ -0,0 +1,65 @@
+from datetime import date, datetime
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base
+from app.models.migrations import create_price_indexes, month_partitions
+from app.models.models import Product, Price
+from app.services.price_history import prices_between, has_price_on
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+def add_prices(db, timestamps, product_id=1):
+    db.add(Product(id=product_id, name="商品", source="Amazon", url="http://example.com/1"))
+    for i, timestamp in enumerate(timestamps):
+        db.add(Price(product_id=product_id, price=1000 + i, total_price=1000 + i, timestamp=timestamp))
+    db.commit()
+
+def test_half_open_ranges_include_start_and_exclude_end(engine):
+    db = sessionmaker(bind=engine)()
+    add_prices(db, [
+        datetime(2024, 1, 1, 23, 59, 59, 999999),
+        datetime(2024, 1, 2, 0, 0),
+        datetime(2024, 1, 2, 23, 59, 59, 999999),
+        datetime(2024, 1, 3, 0, 0),
+    ])
+
+    assert has_price_on(db, 1, date(2024, 1, 2))
+    assert not has_price_on(db, 1, date(2024, 1, 4))
+    assert not has_price_on(db, 2, date(2024, 1, 2))
+    assert [p.timestamp for p in prices_between(db, 1, datetime(2024, 1, 2), datetime(2024, 1, 3))] == [
+        datetime(2024, 1, 2, 0, 0),
+        datetime(2024, 1, 2, 23, 59, 59, 999999),
+    ]
+    assert [p.price for p in prices_between(db, 1, datetime(2024, 1, 2))] == [1001, 1002, 1003]
+    db.close()
+
+def test_history_queries_use_composite_index(engine):
+    db = sessionmaker(bind=engine)()
+    query = prices_between(db, 1, datetime(2024, 1, 1), datetime(2024, 2, 1)).statement.compile(
+        engine, compile_kwargs={"literal_binds": True}
+    )
+    plan = " ".join(row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {query}")))
+    assert "ix_prices_product_id_timestamp (product_id=? AND timestamp>? AND timestamp<?)" in plan
+    db.close()
+
+def test_create_price_indexes_upgrades_existing_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_prices_product_id_timestamp"))
+
+    assert create_price_indexes(engine) == ["ix_prices_product_id_timestamp"]
+    assert create_price_indexes(engine) == []
+    assert "ix_prices_product_id_timestamp" in {index["name"] for index in inspect(engine).get_indexes("prices")}
+
+def test_month_partitions_cover_whole_months():
+    assert month_partitions(datetime(2024, 11, 15, 8, 0), date(2025, 2, 1)) == [
+        ("prices_2024_11", date(2024, 11, 1), date(2024, 12, 1)),
+        ("prices_2024_12", date(2024, 12, 1), date(2025, 1, 1)),
+        ("prices_2025_01", date(2025, 1, 1), date(2025, 2, 1)),
+        ("prices_2025_02", date(2025, 2, 1), date(2025, 3, 1)),
+    ]
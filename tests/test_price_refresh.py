@@ -0,0 +1,88 @@
+import asyncio
+import pydantic
+import pytest
+
+from app.services.price_refresh import PriceRefreshScheduler
+
+def test_concurrent_requests_refresh_once(clock):
+    """同じ商品への同時要求は1回の再取得にまとめられる"""
+    calls = []
+
+    async def refresh(product_id):
+        calls.append(product_id)
+        await asyncio.sleep(0.01)
+
+    async def scenario():
+        scheduler = PriceRefreshScheduler(refresh, min_interval=60, clock=clock)
+        results = [scheduler.request_refresh(1) for _ in range(50)]
+        scheduler.request_refresh(2)
+        await asyncio.sleep(0.05)
+        return scheduler, results
+
+    scheduler, results = asyncio.run(scenario())
+
+    assert results.count(True) == 1
+    assert sorted(calls) == [1, 2]
+    assert scheduler.stats()['in_flight'] == 0
+
+def test_min_interval_is_enforced(clock):
+    """最小間隔内の再要求は無視され、間隔経過後は再取得される"""
+    calls = []
+
+    async def refresh(product_id):
+        calls.append(product_id)
+
+    async def scenario():
+        scheduler = PriceRefreshScheduler(refresh, min_interval=60, clock=clock)
+        scheduler.request_refresh(1)
+        await asyncio.sleep(0)
+        clock.now += 30
+        assert scheduler.request_refresh(1) is False
+        clock.now += 31
+        assert scheduler.request_refresh(1) is True
+        await asyncio.sleep(0)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+
+    assert calls == [1, 1]
+    assert scheduler.skipped_recent == 1
+
+def test_failed_refresh_does_not_block_scheduler(clock):
+    """再取得が失敗しても実行中状態は解除される"""
+    async def refresh(product_id):
+        raise RuntimeError("scrape failed")
+
+    async def scenario():
+        scheduler = PriceRefreshScheduler(refresh, min_interval=0, clock=clock)
+        scheduler.request_refresh(1)
+        await asyncio.sleep(0)
+        return scheduler.request_refresh(1)
+
+    assert asyncio.run(scenario()) is True
+
+@pytest.mark.skipif(pydantic.VERSION.startswith("2"), reason="requirements.txt の pydantic 1（orm_mode）が必要")
+def test_price_history_reports_whether_refresh_was_scheduled(api_engine, api_client, monkeypatch):
+    """refresh=True でも最小間隔内なら再取得を登録せず、refresh_scheduled=False を返す"""
+    from sqlalchemy.orm import sessionmaker
+    from app.models.models import Product
+    from app.routers import products
+
+    calls = []
+
+    async def refresh(product_id):
+        calls.append(product_id)
+
+    monkeypatch.setattr(products, "price_refresh_scheduler", PriceRefreshScheduler(refresh, min_interval=60))
+    db = sessionmaker(bind=api_engine)()
+    db.add(Product(id=1, name="商品1", external_id="1", source="Amazon", url="http://example.com/1"))
+    db.commit()
+    db.close()
+
+    first = api_client.get("/products/price-history/1?refresh=true")
+    second = api_client.get("/products/price-history/1?refresh=true")
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["refresh_scheduled"] is True
+    assert second.json()["refresh_scheduled"] is False
+    assert calls == [1]
@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+import random
+import statistics
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base
+from app.models.models import Product, Price, PriceRollup
+from app.models.migrations import backfill_price_rollups
+from app.models import rollups
+from app.models.rollups import bucket_start, rebuild_price_rollups, upsert_price_rollups
+from app.services import price_history
+from app.services.price_history import choose_resolution, rollups_between, summarize_prices, summarize_rollups
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+@pytest.fixture
+def db(engine):
+    session = sessionmaker(bind=engine)()
+    session.add_all([Product(id=i, name=f"商品{i}", source="Amazon", url=f"http://example.com/{i}") for i in (1, 2)])
+    session.commit()
+    yield session
+    session.close()
+
+@pytest.fixture(params=["on_conflict", "select_then_write"])
+def upsert_path(request, monkeypatch):
+    """ON CONFLICT のUPSERTと、それを使えない方言向けの読んでから書き込む経路の両方で試す"""
+    if request.param == "select_then_write":
+        monkeypatch.setattr(rollups, "dialect_insert", lambda conn, table: None)
+    return request.param
+
+def random_rows(count, seed=0):
+    """2商品・約60日分の価格を時刻順に並べずに作る（同時刻の行も含む）"""
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    rows = []
+    for _ in range(count):
+        timestamp = start + timedelta(hours=rng.randrange(60 * 24))
+        rows.append({"product_id": rng.choice((1, 2)), "price": float(rng.randrange(800, 1200)), "timestamp": timestamp})
+    return rows
+
+def raw_rollups(db):
+    """価格履歴から直接求めた期間ごとの集計"""
+    buckets = {}
+    for price in db.query(Price).order_by(Price.timestamp, Price.id):
+        for resolution in ("day", "week"):
+            key = (price.product_id, resolution, bucket_start(price.timestamp, resolution))
+            buckets.setdefault(key, []).append(price.price)
+    return {key: (values[0], max(values), min(values), values[-1], len(values), sum(values))
+            for key, values in buckets.items()}
+
+def stored_rollups(db):
+    db.expire_all()
+    return {
+        (r.product_id, r.resolution, r.bucket_start):
+            (r.open_price, r.high_price, r.low_price, r.close_price, r.count, r.price_sum)
+        for r in db.query(PriceRollup)
+    }
+
+def test_inserted_prices_update_rollups_incrementally(db, upsert_path):
+    rows = random_rows(300)
+    # 複数のトランザクションに分けて挿入する
+    for start in range(0, len(rows), 50):
+        db.add_all([Price(total_price=row["price"], **row) for row in rows[start:start + 50]])
+        db.commit()
+
+    assert stored_rollups(db) == raw_rollups(db)
+
+    # ロールバックした価格は集計にも残らない
+    expected = stored_rollups(db)
+    db.add(Price(product_id=1, price=1, timestamp=datetime(2024, 1, 1)))
+    db.flush()
+    db.rollback()
+    assert stored_rollups(db) == expected
+
+def test_bulk_rows_match_raw_aggregates(db, upsert_path):
+    rows = random_rows(300, seed=1)
+    for start in range(0, len(rows), 70):
+        chunk = rows[start:start + 70]
+        db.execute(Price.__table__.insert(), chunk)
+        upsert_price_rollups(db.connection(), chunk)
+        db.commit()
+
+    assert stored_rollups(db) == raw_rollups(db)
+
+def test_rebuild_matches_incremental_rollups(engine, db):
+    db.add_all([Price(**row) for row in random_rows(200, seed=2)])
+    db.commit()
+    incremental = stored_rollups(db)
+
+    db.query(PriceRollup).delete()
+    db.commit()
+    assert backfill_price_rollups(engine) == len(incremental)
+    assert stored_rollups(db) == incremental
+
+    with engine.begin() as conn:
+        assert rebuild_price_rollups(conn, chunk_size=7) == len(incremental)
+    assert stored_rollups(db) == incremental
+
+@pytest.mark.parametrize("resolution", ["day", "week"])
+def test_rollup_stats_match_raw_stats(db, resolution):
+    db.add_all([Price(**row) for row in random_rows(300, seed=3)])
+    db.commit()
+    start = datetime(2024, 1, 8)
+
+    values = [p.price for p in db.query(Price).filter(Price.product_id == 1, Price.timestamp >= start)
+              .order_by(Price.timestamp, Price.id)]
+    raw = summarize_prices(values)
+    rolled = summarize_rollups(rollups_between(db, 1, resolution, start))
+
+    for key in ("min_price", "max_price", "count", "current_price"):
+        assert rolled[key] == raw[key]
+    assert rolled["avg_price"] == pytest.approx(raw["avg_price"])
+
+@pytest.mark.parametrize("resolution", ["day", "week"])
+@pytest.mark.parametrize("start, end", [
+    (datetime(2024, 1, 10, 13, 27), None),
+    (datetime(2024, 1, 3, 5), datetime(2024, 2, 20, 18, 30)),
+    (datetime(2024, 1, 9, 7), datetime(2024, 1, 11, 9)),  # 1つの週の中
+], ids=["unaligned-start", "unaligned-start-and-end", "within-one-week"])
+def test_rollup_stats_match_raw_stats_for_unaligned_windows(db, resolution, start, end):
+    """期間の途中から・途中までの範囲でも、範囲外の価格を含めずに生の価格と同じ統計になる"""
+    db.add_all([Price(**row) for row in random_rows(300, seed=4)])
+    db.commit()
+
+    query = db.query(Price).filter(Price.product_id == 1, Price.timestamp >= start)
+    if end is not None:
+        query = query.filter(Price.timestamp < end)
+    values = [p.price for p in query.order_by(Price.timestamp, Price.id)]
+    raw = summarize_prices(values)
+    rollups = rollups_between(db, 1, resolution, start, end)
+    rolled = summarize_rollups(rollups)
+
+    assert rollups[0].bucket_start == start
+    assert [r.bucket_start for r in rollups] == sorted(r.bucket_start for r in rollups)
+    for key in ("min_price", "max_price", "count", "current_price"):
+        assert rolled[key] == raw[key]
+    assert rolled["avg_price"] == pytest.approx(raw["avg_price"])
+
+def test_rollup_approximations_are_exact_with_one_price_per_bucket(db):
+    values = [1000.0, 980.0, 990.0, 950.0, 940.0, 900.0, 910.0]
+    db.add_all([Price(product_id=1, price=value, timestamp=datetime(2024, 1, 1 + i)) for i, value in enumerate(values)])
+    db.commit()
+
+    rolled = summarize_rollups(rollups_between(db, 1, "day", datetime(2024, 1, 1)))
+    raw = summarize_prices(values)
+    assert rolled == pytest.approx(raw)
+    assert raw["median_price"] == statistics.median(values)
+
+def test_default_windows_use_raw_prices():
+    """価格履歴（30日）・価格分析（90日）の既定の期間は生の価格を使う"""
+    assert choose_resolution(30) == choose_resolution(90) == "raw"
+
+def test_choose_resolution_uses_coarsest_sufficient_rollup(monkeypatch):
+    monkeypatch.setattr(price_history, "RAW_MAX_DAYS", 14)
+    monkeypatch.setattr(price_history, "DAILY_MAX_DAYS", 120)
+    assert [choose_resolution(days) for days in (7, 14, 15, 120, 121, 365)] == [
+        "raw", "raw", "day", "day", "week", "week"
+    ]
@@ -0,0 +1,105 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base
+from app.models.models import Product
+from app.tasks import app as celery_app
+from app.tasks import price_update
+from app.services.price_update_pipeline import PriceUpdatePipeline
+
+@pytest.fixture
+def session_factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(price_update, "SessionLocal", factory)
+    return factory
+
+@pytest.fixture
+def eager_celery():
+    celery_app.conf.task_always_eager = True
+    yield celery_app
+    celery_app.conf.task_always_eager = False
+
+@pytest.fixture
+def chunk_limits():
+    """チャンクごとのパイプラインのレート制限・同時リクエスト数"""
+    return []
+
+@pytest.fixture
+def chunk_calls(monkeypatch, chunk_limits):
+    """チャンクの処理を記録し、商品数をそのまま更新件数として返す（楽天の2チャンク目は失敗させる）"""
+    calls = []
+
+    def run_range(self, source, first_id, last_id):
+        calls.append((source, first_id, last_id))
+        chunk_limits.append((source, self.site_rate_limits, self.site_concurrency))
+        if source == '楽天市場' and first_id > 1:
+            raise RuntimeError("worker lost")
+        return {"updated_count": 2, "error_count": 0, "skipped_count": 1, "total_products": 3}
+
+    monkeypatch.setattr(PriceUpdatePipeline, "run_range", run_range)
+    return calls
+
+def add_products(session_factory):
+    db = session_factory()
+    sources = ['Amazon', '楽天市場', 'Yahoo!ショッピング', '不明なサイト']
+    for i in range(1, 13):
+        db.add(Product(id=i, name=f"商品{i}", source=sources[i % 4], url=f"http://example.com/{i}"))
+    db.commit()
+    db.close()
+
+def test_dispatch_partitions_by_site_and_aggregates_in_callback(session_factory, eager_celery, chunk_calls,
+                                                                 monkeypatch):
+    add_products(session_factory)
+    aggregated = []
+    aggregate = price_update.aggregate_price_update.run
+
+    def record_aggregate(lane_summaries):
+        summary = aggregate(lane_summaries)
+        aggregated.append(summary)
+        return summary
+
+    monkeypatch.setattr(price_update.aggregate_price_update, "run", record_aggregate)
+
+    result = price_update.dispatch_price_update(chunk_size=2, site_concurrency={'amazon': 1}, priority=5)
+
+    # 不明なサイトの商品は対象外、各サイト3件 → 2チャンクずつ
+    assert result["chunks"] == 6
+    # Amazonは1レーン、それ以外は既定の2レーン
+    assert result["lanes"] == 5
+    assert sorted(chunk_calls) == [
+        ('Amazon', 4, 8), ('Amazon', 12, 12),
+        ('Yahoo!ショッピング', 2, 6), ('Yahoo!ショッピング', 10, 10),
+        ('楽天市場', 1, 5), ('楽天市場', 9, 9),
+    ]
+    # 同じレーンのチャンクは順番に実行される
+    assert chunk_calls.index(('Amazon', 4, 8)) < chunk_calls.index(('Amazon', 12, 12))
+
+    # コールバックで全レーンの件数が集計され、失敗したチャンクは記録される
+    assert len(aggregated) == 1
+    summary = aggregated[0]
+    assert summary["chunks"] == 6
+    assert summary["updated_count"] == 10
+    assert summary["skipped_count"] == 5
+    assert summary["total_products"] == 15
+    assert summary["failed_chunks"] == [['楽天市場', 9, 9]]
+    assert summary["success"] is False
+
+def test_site_limits_are_divided_across_lanes(session_factory, eager_celery, chunk_calls, chunk_limits):
+    """サイトのレート制限・同時リクエスト数をレーン数で割り、実効レートを設定値に保つ"""
+    add_products(session_factory)
+
+    price_update.dispatch_price_update(chunk_size=2, site_concurrency={'amazon': 1})
+
+    assert sorted(set((source, tuple(rates.items()), tuple(concurrency.items()))
+                      for source, rates, concurrency in chunk_limits)) == [
+        ('Amazon', (('amazon', 1.0),), (('amazon', 4),)),
+        ('Yahoo!ショッピング', (('yahoo', 1.0),), (('yahoo', 2),)),
+        ('楽天市場', (('rakuten', 1.0),), (('rakuten', 2),)),
+    ]
+
+def test_dispatch_without_products_does_not_start_chord(session_factory, eager_celery, chunk_calls):
+    assert price_update.dispatch_price_update(chunk_size=2) == {"success": True, "chunks": 0, "lanes": 0}
+    assert chunk_calls == []
@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base
+from app.models.models import Product, Price, ProductLatestPrice, TaskCheckpoint
+from app.services.price_update_pipeline import PriceUpdatePipeline
+
+class FakeShop:
+    """商品ページを返すテスト用HTTPサーバー（/items/<id>）"""
+
+    def __init__(self, prices, hang_from=None, broken=()):
+        self.prices = prices
+        self.hang_from = hang_from
+        self.broken = set(broken)
+        self.requests = []
+
+    async def handle(self, request):
+        product_id = int(request.match_info['product_id'])
+        self.requests.append(product_id)
+        if self.hang_from is not None and product_id >= self.hang_from:
+            await asyncio.sleep(3600)
+        if product_id in self.broken:
+            return web.Response(status=500)
+        return web.Response(
+            text=f'<html><body><span class="a-price"><span class="a-offscreen">￥{self.prices[product_id]:,}</span>'
+                 '</span><div id="deliveryBlockMessage">無料配送</div></body></html>',
+            content_type='text/html',
+        )
+
+    async def serve(self, session_factory, pipeline, timeout=None):
+        """サーバーを起動し、商品URLをサーバーに向けてからパイプラインを実行"""
+        app = web.Application()
+        app.router.add_get('/items/{product_id}', self.handle)
+        server = TestServer(app)
+        await server.start_server()
+        try:
+            db = session_factory()
+            for product in db.query(Product):
+                product.url = str(server.make_url(f'/items/{product.id}'))
+            db.commit()
+            db.close()
+            return await asyncio.wait_for(pipeline.async_run(), timeout)
+        finally:
+            await server.close()
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def add_products(session_factory, count, source='Amazon'):
+    db = session_factory()
+    for i in range(1, count + 1):
+        db.add(Product(id=i, name=f"商品{i}", source=source, url=f"http://placeholder/items/{i}"))
+    db.commit()
+    db.close()
+
+def make_pipeline(session_factory, chunk_size=2):
+    return PriceUpdatePipeline(session_factory=session_factory, chunk_size=chunk_size,
+                               site_rate_limits={}, parse_workers=2)
+
+def test_pipeline_updates_all_products_in_batches(session_factory):
+    add_products(session_factory, 5)
+    shop = FakeShop({i: 1000 * i for i in range(1, 6)}, broken={4})
+
+    summary = asyncio.run(shop.serve(session_factory, make_pipeline(session_factory)))
+
+    assert summary["updated_count"] == 4
+    assert summary["error_count"] == 1
+    assert summary["total_products"] == 5
+    db = session_factory()
+    prices = {p.product_id: (p.price, p.shipping_fee, p.total_price) for p in db.query(Price)}
+    assert prices == {i: (1000.0 * i, 0, 1000.0 * i) for i in (1, 2, 3, 5)}
+    assert {p.product_id: p.total_price for p in db.query(ProductLatestPrice)} == {
+        i: 1000.0 * i for i in (1, 2, 3, 5)
+    }
+    # 最後まで処理したらチェックポイントは消える
+    assert db.query(TaskCheckpoint).count() == 0
+    db.close()
+
+def test_interrupted_run_resumes_after_last_written_chunk(session_factory):
+    add_products(session_factory, 5)
+    prices = {i: 1000 * i for i in range(1, 6)}
+
+    # 3件目以降の取得で止まったところで中断する
+    hanging_shop = FakeShop(prices, hang_from=3)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(hanging_shop.serve(session_factory, make_pipeline(session_factory), timeout=1))
+
+    db = session_factory()
+    assert db.get(TaskCheckpoint, 'update_all_prices').last_id == 2
+    db.close()
+
+    shop = FakeShop(prices)
+    summary = asyncio.run(shop.serve(session_factory, make_pipeline(session_factory)))
+
+    assert summary["resumed_from"] == 2
+    assert sorted(shop.requests) == [3, 4, 5]
+    db = session_factory()
+    assert sorted(p.product_id for p in db.query(Price)) == [1, 2, 3, 4, 5]
+    db.close()
@@ -0,0 +1,32 @@
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app.models.models import User, Product, Favorite, PriceAlert
+
+def seed(engine, first, last):
+    """ユーザー1に商品 first〜last のお気に入り・価格アラートを登録する"""
+    db = sessionmaker(bind=engine)()
+    if first == 1:
+        db.add(User(id=1, email="user@example.com", hashed_password="x"))
+    for i in range(first, last + 1):
+        db.add(Product(id=i, name=f"商品{i}", external_id=str(i), source="Amazon", url=f"http://example.com/{i}"))
+        db.add(Favorite(user_id=1, product_id=i))
+        db.add(PriceAlert(user_id=1, product_id=i, target_price=1000))
+    db.commit()
+    db.close()
+
+@pytest.mark.parametrize("path", ["/products/favorites?user_id=1", "/alerts/?user_id=1"])
+def test_statement_count_does_not_grow_with_results(api_engine, api_client, count_statements, path):
+    seed(api_engine, 1, 2)
+    with count_statements(api_engine) as statements:
+        response = api_client.get(path)
+    assert response.status_code == 200
+    assert [item["product"]["name"] for item in response.json()] == ["商品1", "商品2"]
+    few = len(statements)
+
+    seed(api_engine, 3, 50)
+    with count_statements(api_engine) as statements:
+        response = api_client.get(path)
+    assert len(response.json()) == 50
+    # 商品はお気に入り・アラートと同じSELECTで読み込む
+    assert len(statements) == few == 1
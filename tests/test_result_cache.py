@@ -0,0 +1,169 @@
+import asyncio
+import pytest
+
+from scraping.result_cache import SearchResultCache, RedisTier, LRUCache, _Entry
+
+class InMemoryRedis:
+    """redis.asyncio クライアントのインメモリ代替"""
+    def __init__(self, clock):
+        self.clock = clock
+        self.store = {}
+        self.fail = False
+
+    async def get(self, key):
+        if self.fail:
+            raise ConnectionError("redis down")
+        value = self.store.get(key)
+        if value is None or value[1] <= self.clock():
+            return None
+        return value[0]
+
+    async def set(self, key, value, ex=None):
+        if self.fail:
+            raise ConnectionError("redis down")
+        self.store[key] = (value, self.clock() + ex)
+
+@pytest.fixture
+def redis_client(clock):
+    return InMemoryRedis(clock)
+
+@pytest.fixture
+def cache(clock, redis_client):
+    tier = RedisTier(client=redis_client, clock=clock)
+    return SearchResultCache(redis_tier=tier, site_ttls={'amazon': 60, 'rakuten': 600}, stale_ttl=30, clock=clock)
+
+def make_fetcher(calls, value=None):
+    async def fetch():
+        calls.append(1)
+        return value or [{'name': f'商品{len(calls)}', 'price': 1000}]
+    return fetch
+
+def test_lru_evicts_oldest_entry(clock):
+    """上限を超えると最も古いエントリが破棄される"""
+    lru = LRUCache(max_entries=2, clock=clock)
+    lru.set('a', _Entry(1, 2000, 2000))
+    lru.set('b', _Entry(2, 2000, 2000))
+    lru.get('a')
+    lru.set('c', _Entry(3, 2000, 2000))
+
+    assert lru.get('b') is None
+    assert lru.get('a').value == 1
+    assert lru.get('c').value == 3
+
+def test_lru_is_safe_across_threads(clock):
+    """複数スレッドから同時に取得・保存・失効・破棄しても壊れない"""
+    import threading
+
+    lru = LRUCache(max_entries=8, clock=clock)
+    errors = []
+
+    def worker(offset):
+        try:
+            for i in range(5000):
+                key = (offset + i) % 16
+                lru.set(key, _Entry(i, 2000, 1000 if i % 3 == 0 else 2000))
+                lru.get(key)
+                lru.get((key + 1) % 16)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(lru) <= 8
+
+def test_miss_then_local_hit(cache):
+    """初回はミス、2回目はインプロセス層から返る"""
+    calls = []
+    fetch = make_fetcher(calls)
+
+    first = asyncio.run(cache.get_or_fetch('k', ['amazon'], fetch))
+    second = asyncio.run(cache.get_or_fetch('k', ['amazon'], fetch))
+
+    assert first == second
+    assert len(calls) == 1
+    assert cache.metrics['misses'] == 1
+    assert cache.metrics['local_hits'] == 1
+
+def test_redis_tier_shared_between_instances(cache, clock, redis_client):
+    """別プロセス相当のインスタンスでもRedis層から取得できる"""
+    calls = []
+    asyncio.run(cache.get_or_fetch('k', ['rakuten'], make_fetcher(calls)))
+
+    other = SearchResultCache(redis_tier=RedisTier(client=redis_client, clock=clock), clock=clock)
+    value = asyncio.run(other.get_or_fetch('k', ['rakuten'], make_fetcher(calls)))
+
+    assert value[0]['name'] == '商品1'
+    assert len(calls) == 1
+    assert other.metrics['redis_hits'] == 1
+
+def test_stale_while_revalidate(cache, clock):
+    """鮮度切れ後は古い値を返しつつ、裏で1回だけ再取得する"""
+    calls = []
+    fetch = make_fetcher(calls)
+
+    async def scenario():
+        await cache.get_or_fetch('k', ['amazon'], fetch)
+        clock.now += 61  # Amazonの鮮度(60秒)切れ、猶予期間内
+        stale = await asyncio.gather(*[cache.get_or_fetch('k', ['amazon'], fetch) for _ in range(5)])
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        fresh = await cache.get_or_fetch('k', ['amazon'], fetch)
+        return stale, fresh
+
+    stale, fresh = asyncio.run(scenario())
+
+    assert all(value[0]['name'] == '商品1' for value in stale)
+    assert fresh[0]['name'] == '商品2'
+    assert len(calls) == 2
+    assert cache.metrics['stale_hits'] == 5
+    assert cache.metrics['refreshes'] == 1
+
+def test_per_site_ttl_uses_shortest(cache, clock):
+    """複数サイトの結果は最も短いTTLで期限切れになる"""
+    calls = []
+    fetch = make_fetcher(calls)
+
+    asyncio.run(cache.get_or_fetch('k', ['amazon', 'rakuten'], fetch))
+    clock.now += 60 + 30 + 1  # 鮮度と猶予期間の両方を超過
+    asyncio.run(cache.get_or_fetch('k', ['amazon', 'rakuten'], fetch))
+
+    assert len(calls) == 2
+
+def test_empty_results_are_not_cached(cache):
+    """空の結果はキャッシュしない"""
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        return []
+
+    asyncio.run(cache.get_or_fetch('k', ['amazon'], fetch))
+    asyncio.run(cache.get_or_fetch('k', ['amazon'], fetch))
+
+    assert len(calls) == 2
+
+def test_redis_failure_falls_back_to_local(cache, redis_client):
+    """Redisに接続できなくてもインプロセス層で動作する"""
+    redis_client.fail = True
+    calls = []
+    fetch = make_fetcher(calls)
+
+    asyncio.run(cache.get_or_fetch('k', ['amazon'], fetch))
+    asyncio.run(cache.get_or_fetch('k', ['amazon'], fetch))
+
+    assert len(calls) == 1
+    assert cache.stats()['redis_available'] is False
+
+def test_make_key_normalizes_query():
+    """全角・大文字・余分な空白の違いは同じキーになる"""
+    key1 = SearchResultCache.make_key('search', 'ｉＰｈｏｎｅ  15', ['amazon'], 10, include_shipping=True)
+    key2 = SearchResultCache.make_key('search', 'iphone 15', ['amazon'], 10, include_shipping=True)
+    key3 = SearchResultCache.make_key('search', 'iphone 15', ['amazon'], 10, include_shipping=False)
+
+    assert key1 == key2
+    assert key1 != key3
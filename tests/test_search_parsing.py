@@ -0,0 +1,68 @@
+import json
+import os
+import pytest
+
+from scraping import AmazonScraper, RakutenScraper, YahooShoppingScraper
+from scraping.parsing import CompiledSelector, iter_matches
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'html')
+
+# 期待値は BeautifulSoup(html.parser) + select_one による従来実装の出力（価格は parse_price で統一）
+with open(os.path.join(FIXTURE_DIR, 'search_expected.json'), encoding='utf-8') as f:
+    EXPECTED = json.load(f)
+
+SCRAPERS = {
+    'amazon': AmazonScraper,
+    'rakuten': RakutenScraper,
+    'yahoo': YahooShoppingScraper,
+}
+
+def load_fixture(site):
+    with open(os.path.join(FIXTURE_DIR, f'{site}_search.html'), encoding='utf-8') as f:
+        return f.read()
+
+@pytest.mark.parametrize('site', sorted(SCRAPERS))
+@pytest.mark.parametrize('include_shipping', [True, False])
+def test_parse_matches_legacy_output(site, include_shipping):
+    scraper = SCRAPERS[site]()
+    results = scraper.parse_search_results(load_fixture(site), 10, include_shipping)
+    assert results == EXPECTED[f'{site}_{include_shipping}']
+
+@pytest.mark.parametrize('site', sorted(SCRAPERS))
+def test_max_results_counts_result_elements(site):
+    # 従来通り、抽出に失敗した要素も max_results の件数に含める
+    scraper = SCRAPERS[site]()
+    results = scraper.parse_search_results(load_fixture(site), 3, True)
+    assert results == EXPECTED[f'{site}_max3']
+
+def test_iter_matches_stops_after_limit():
+    html = '<div class="item">1</div><div class="item">2</div><div class="item">3</div><p>'
+    selector = CompiledSelector('div.item')
+    assert [e.text for e in iter_matches(html, selector, limit=2)] == ['1', '2']
+    assert list(iter_matches(html, selector, limit=0)) == []
+
+@pytest.mark.parametrize('site, html, expected', [
+    ('amazon', '<span class="a-price"><span class="a-offscreen">￥3,980</span></span>'
+               '<div id="deliveryBlockMessage">無料配送 明日</div>', {'price': 3980.0, 'shipping_fee': 0}),
+    ('rakuten', '<div class="price">12,800円</div><span class="shipping">送料別</span>',
+                {'price': 12800.0, 'shipping_fee': None}),
+    ('yahoo', '<span class="elPriceNumber">1,280</span>', {'price': 1280.0, 'shipping_fee': None}),
+    ('yahoo', '<p>売り切れ</p>', {'price': None, 'shipping_fee': None}),
+])
+def test_extract_price_info_from_product_page(site, html, expected):
+    assert SCRAPERS[site]().extract_price_info(f'<html><body>{html}</body></html>') == expected
+
+def test_amazon_product_page_spec_uses_fallback_selectors():
+    from scraping.amazon_scraper import PRODUCT_SPEC
+    html = ('<html><body><span id="productTitle"> テスト商品 </span>'
+            '<span id="price_inside_buybox">￥2,480</span><img id="imgBlkFront">'
+            '<i class="a-icon-prime"></i></body></html>')
+    assert PRODUCT_SPEC.extract_document(html, include_shipping=True) == {
+        'name': 'テスト商品',
+        'url': None,
+        'price': 2480,
+        'price_text': '￥2,480',
+        'img_url': None,
+        'shipping': 'Prime対象',
+    }
+    assert PRODUCT_SPEC.extract_document('<html><body><p>Not found</p></body></html>') is None
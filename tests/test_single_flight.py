@@ -0,0 +1,148 @@
+import asyncio
+import pytest
+
+from scraping.single_flight import SingleFlight
+
+class SlowCall:
+    """呼び出し回数を数え、release されるまで完了しない処理"""
+
+    def __init__(self, result='result', error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.finished = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        self.finished += 1
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+def test_concurrent_calls_share_one_execution_and_update_counters():
+    """同じキーの同時呼び出しは1回だけ実行し、リーダー・相乗りの回数を数える"""
+    async def scenario():
+        flight = SingleFlight()
+        call, other = SlowCall('a'), SlowCall('b')
+        waiters = [asyncio.ensure_future(flight.do('key', call)) for _ in range(5)]
+        waiters.append(asyncio.ensure_future(flight.do('other', other)))
+        await asyncio.sleep(0)
+        in_flight = flight.stats()['in_flight']
+        call.release.set()
+        other.release.set()
+        results = await asyncio.gather(*waiters)
+        return flight, call, other, in_flight, results
+
+    flight, call, other, in_flight, results = asyncio.run(scenario())
+
+    assert results == ['a'] * 5 + ['b']
+    assert (call.calls, other.calls) == (1, 1)
+    assert in_flight == 2
+    assert flight.stats() == {'hits': 6, 'joins': 4, 'leader_executions': 2, 'in_flight': 0}
+
+def test_completed_key_runs_again():
+    """完了した処理の結果は保持せず、次の呼び出しで再び実行する"""
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def func():
+            calls.append(1)
+            return len(calls)
+
+        return await flight.do('key', func), await flight.do('key', func), flight.stats()
+
+    first, second, stats = asyncio.run(scenario())
+
+    assert (first, second) == (1, 2)
+    assert stats == {'hits': 2, 'joins': 0, 'leader_executions': 2, 'in_flight': 0}
+
+def test_exception_is_shared_with_joiners():
+    """リーダーの処理の例外は相乗りした呼び出しにも同じ例外として伝わる"""
+    error = ValueError('scrape failed')
+
+    async def scenario():
+        flight = SingleFlight()
+        call = SlowCall(error=error)
+        waiters = [asyncio.ensure_future(flight.do('key', call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        call.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        return flight, call, results
+
+    flight, call, results = asyncio.run(scenario())
+
+    assert results == [error] * 3
+    assert call.calls == 1
+    assert flight.stats()['in_flight'] == 0
+
+@pytest.mark.parametrize('cancelled', [0, 1], ids=['leader', 'joiner'])
+def test_cancelled_caller_does_not_cancel_shared_call(cancelled):
+    """待機中の呼び出し元がキャンセルされても、共有中の処理と他の呼び出し元は影響を受けない"""
+    async def scenario():
+        flight = SingleFlight()
+        call = SlowCall()
+        waiters = [asyncio.ensure_future(flight.do('key', call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        waiters[cancelled].cancel()
+        await asyncio.sleep(0)
+        call.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        return call, results
+
+    call, results = asyncio.run(scenario())
+
+    assert isinstance(results[cancelled], asyncio.CancelledError)
+    assert [result for i, result in enumerate(results) if i != cancelled] == ['result', 'result']
+    assert (call.calls, call.finished) == (1, 1)
+
+def test_shared_call_finishes_after_every_caller_is_cancelled():
+    """呼び出し元が全員キャンセルされても処理は最後まで実行され、実行中リストから外れる"""
+    async def scenario():
+        flight = SingleFlight()
+        call = SlowCall()
+        waiters = [asyncio.ensure_future(flight.do('key', call)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        call.release.set()
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return flight, call
+
+    flight, call = asyncio.run(scenario())
+
+    assert call.finished == 1
+    assert flight.stats()['in_flight'] == 0
+
+def test_search_route_shares_one_scrape_for_site_names_in_any_case(monkeypatch):
+    """サイト名の大文字・小文字が違う同時検索は、小文字のサイト名での1回の検索を共有する"""
+    from app.routers import search
+
+    async def scenario():
+        call = SlowCall([{'name': '商品', 'url': 'http://example.com/1', 'price': 1000, 'source': 'Amazon'}])
+        sites = []
+
+        def async_search_site(site, query, max_results, **kwargs):
+            sites.append(site)
+            return call()
+
+        monkeypatch.setattr(search, 'search_flight', SingleFlight())
+        monkeypatch.setattr(search.scraper_manager, 'async_search_site', async_search_site)
+        requests = [
+            asyncio.ensure_future(search.search_products(
+                q='イヤホン', site=site, max_results=10, include_shipping=True, user_id=None, db=None
+            ))
+            for site in ('Amazon', 'amazon')
+        ]
+        await asyncio.sleep(0)
+        call.release.set()
+        return sites, await asyncio.gather(*requests)
+
+    sites, responses = asyncio.run(scenario())
+
+    assert sites == ['amazon']
+    assert [response.total_results for response in responses] == [1, 1]